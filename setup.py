@@ -63,6 +63,7 @@ setup(
         "console_scripts": [
             "ia-agent=cli.simple_cli:main",
             "ia-agent-config=cli.config_cli:main",
+            "ia-agent-memory-gc=cli.memory_cli:main",
         ],
     },
     include_package_data=True,
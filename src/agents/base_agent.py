@@ -4,7 +4,7 @@ IA Agent para Generación de Pruebas Unitarias .NET
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Union, Iterator
 from dataclasses import dataclass
 from enum import Enum
 import asyncio
@@ -12,6 +12,7 @@ from datetime import datetime
 
 from utils.config import Config
 from utils.logging import get_logger
+from ai.llm_manager import get_llm_manager, RequestPriority
 
 
 class AgentStatus(Enum):
@@ -172,6 +173,34 @@ class BaseAgent(ABC):
             self.logger.error(f"Error al ejecutar herramienta {tool_name}: {e}")
             raise
     
+    def _get_llm_priority(self) -> RequestPriority:
+        """Prioridad de las llamadas al LLM: la coordinación adelanta a la generación masiva"""
+        return RequestPriority.HIGH if self.role == AgentRole.COORDINATOR else RequestPriority.NORMAL
+    
+    def _get_llm_call_tags(self, template: Optional[str]) -> Dict[str, str]:
+        """Etiquetas de métricas de la llamada (sin template se usa el del contexto o "unknown")"""
+        return {"agent": self.name, "template": template}
+    
+    def _invoke_llm(self, prompt: str, use_cache: bool = True, template: Optional[str] = None,
+                    llm_type: Optional[str] = None) -> str:
+        """Invocar el LLM del agente a través del gestor de LLMs (con caché de respuestas)
+        
+        llm_type permite usar otro LLM del gestor (p. ej. "fast") en lugar del del agente.
+        """
+        manager = get_llm_manager()
+        llm = manager.get_llm(llm_type) if llm_type else getattr(self, 'llm', None)
+        return manager.invoke(
+            prompt, llm=llm, use_cache=use_cache, priority=self._get_llm_priority(),
+            call_tags=self._get_llm_call_tags(template)
+        )
+    
+    def _stream_llm(self, prompt: str, use_cache: bool = True, template: Optional[str] = None) -> Iterator[str]:
+        """Invocar el LLM del agente recibiendo la respuesta en fragmentos"""
+        return get_llm_manager().stream(
+            prompt, llm=getattr(self, 'llm', None), use_cache=use_cache, priority=self._get_llm_priority(),
+            call_tags=self._get_llm_call_tags(template)
+        )
+    
     def update_memory(self, key: str, value: Any):
         """Actualizar memoria del agente"""
         try:
@@ -371,8 +371,7 @@ Determina:
 Responde en formato JSON.
 """
             
-            response = self.llm.invoke(prompt)
-            assignment_analysis = response.content
+            assignment_analysis = self._invoke_llm(prompt, template="assign_task")
             
             # Procesar asignación
             selected_agent = self._select_best_agent(task_requirements, available_agents)
@@ -427,8 +426,7 @@ Determina:
 Proporciona un plan de colaboración detallado.
 """
             
-            response = self.llm.invoke(prompt)
-            coordination_plan = response.content
+            coordination_plan = self._invoke_llm(prompt, template="coordinate_agents")
             
             # Implementar plan de coordinación
             coordination_result = self._implement_coordination_plan(coordination_plan, available_agents)
@@ -463,8 +461,7 @@ El flujo debe incluir:
 Proporciona un flujo de trabajo detallado.
 """
             
-            response = self.llm.invoke(prompt)
-            workflow_plan = response.content
+            workflow_plan = self._invoke_llm(prompt, template="manage_workflow")
             
             # Implementar flujo de trabajo
             workflow_result = self._implement_workflow(workflow_plan, task_requirements, available_agents)
@@ -497,8 +494,7 @@ Determina:
 Proporciona una resolución detallada.
 """
             
-            response = self.llm.invoke(prompt)
-            conflict_resolution = response.content
+            conflict_resolution = self._invoke_llm(prompt, template="resolve_conflicts")
             
             return {
                 "success": True,
@@ -566,8 +562,7 @@ Crea una síntesis coherente que incluya:
 Proporciona una síntesis clara y accionable.
 """
             
-            response = self.llm.invoke(prompt)
-            synthesis = response.content
+            synthesis = self._invoke_llm(prompt, template="synthesize_results")
             
             return {
                 "success": True,
@@ -3,7 +3,7 @@ Agente Generador - Especializado en generación de código de pruebas
 IA Agent para Generación de Pruebas Unitarias .NET
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Callable, Iterator, Union
 from datetime import datetime
 from pathlib import Path
 
@@ -13,6 +13,10 @@ from langchain_openai import ChatOpenAI
 
 from agents.base_agent import ReActAgent, AgentRole, AgentTask
 from tools.file_tools import code_file_manager
+from ai.prompt_compression import csharp_compressor
+from ai.streaming import iter_code_lines
+from ai.speculative_generation import SpeculativeGenerator, DraftVerifier
+from ai.llm_manager import get_llm_manager
 from langchain_agents.memory.conversation_memory import ConversationMemory
 from langchain_agents.memory.vector_memory import VectorMemory
 from utils.config import Config
@@ -42,6 +46,12 @@ class GenerationAgent(ReActAgent):
             "mstest": self._get_mstest_template()
         }
         
+        # Generación especulativa de métodos de prueba (LLM rápido + verificación local)
+        self.speculative_generator = SpeculativeGenerator(DraftVerifier(
+            compile_check=self.config.ai.speculative_compile_check,
+            scratch_project=self.config.ai.speculative_scratch_project
+        ))
+        
         # Herramientas específicas del generador
         self.tools = {
             "generate_test_file": self._generate_test_file,
@@ -294,21 +304,45 @@ Thought: {agent_scratchpad}
             input_variables=["input", "agent_scratchpad", "tools", "tool_names", "chat_history"]
         )
     
+    def generate_tests(self, code: str, analysis: Optional[Dict[str, Any]] = None,
+                       framework: str = "xunit",
+                       on_chunk: Optional[Callable[[str], None]] = None,
+                       output_path: Optional[Union[str, Path]] = None) -> str:
+        """Generar archivo de pruebas para un código
+        
+        on_chunk recibe la respuesta a medida que llega; con output_path el
+        código de la respuesta se escribe en ese archivo línea a línea, sin
+        esperar a que termine.
+        """
+        code = csharp_compressor.compress(code, label="código bajo prueba").text
+        result = self._generate_test_file(code, framework, analysis or {}, on_chunk=on_chunk,
+                                          output_path=output_path)
+        if not result.get("success"):
+            raise RuntimeError(result.get("error", "Error al generar pruebas"))
+        
+        return result["test_code"]
+    
     # Métodos de herramientas específicas
     def _generate_test_file(self, target_component: str, framework: str, 
-                           analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+                           analysis_data: Dict[str, Any],
+                           on_chunk: Optional[Callable[[str], None]] = None,
+                           output_path: Optional[Union[str, Path]] = None) -> Dict[str, Any]:
         """Generar archivo completo de pruebas"""
         try:
             # Obtener template del framework
             template = self.test_templates.get(framework, self.test_templates["xunit"])
             
+            # Compactar datos de análisis y template para reducir tokens
+            analysis_text = csharp_compressor.compact_data(analysis_data, "datos de análisis").text
+            template = csharp_compressor.compress(template, strip_comments=False, label="template").text
+            
             # Generar código de prueba usando LLM
             prompt = f"""
 Genera un archivo completo de pruebas unitarias para el siguiente componente:
 
 Componente: {target_component}
 Framework: {framework}
-Datos de análisis: {analysis_data}
+Datos de análisis: {analysis_text}
 
 El archivo debe incluir:
 1. Using statements necesarios
@@ -323,8 +357,25 @@ Usa el siguiente template como base:
 {template}
 """
             
-            response = self.llm.invoke(prompt)
-            test_code = response.content
+            # Streaming para que los consumidores empiecen antes de completar la respuesta
+            chunks = []
+            
+            def received_chunks() -> Iterator[str]:
+                for chunk in self._stream_llm(prompt, template="generate_test_file"):
+                    chunks.append(chunk)
+                    if on_chunk:
+                        on_chunk(chunk)
+                    yield chunk
+            
+            if output_path:
+                # El archivo se escribe mientras la respuesta sigue llegando
+                code_file_manager.write_stream(
+                    output_path, (f"{line}\n" for line in iter_code_lines(received_chunks()))
+                )
+            else:
+                for _ in received_chunks():
+                    pass
+            test_code = "".join(chunks)
             
             # Guardar en memoria vectorial
             self.vector_memory.add_entry(
@@ -340,7 +391,8 @@ Usa el siguiente template como base:
                 "success": True,
                 "test_code": test_code,
                 "framework": framework,
-                "target_component": target_component
+                "target_component": target_component,
+                "output_path": str(output_path) if output_path else None
             }
             
         except Exception as e:
@@ -373,20 +425,46 @@ El método de prueba debe incluir:
 Usa el patrón Arrange-Act-Assert.
 """
             
-            response = self.llm.invoke(prompt)
-            test_method_code = response.content
+            if not self._use_speculative_generation():
+                test_method_code = self._invoke_llm(prompt, template="create_test_method")
+                return {
+                    "success": True,
+                    "test_method_code": test_method_code,
+                    "method_name": method_name,
+                    "framework": framework
+                }
+            
+            draft_llm_type = self.config.ai.speculative_draft_llm_type
+            result = self.speculative_generator.generate(
+                prompt,
+                draft=lambda p: self._invoke_llm(p, template="create_test_method", llm_type=draft_llm_type),
+                escalate=lambda p: self._invoke_llm(p, template="create_test_method"),
+                framework=framework
+            )
             
             return {
                 "success": True,
-                "test_method_code": test_method_code,
+                "test_method_code": result.code,
                 "method_name": method_name,
-                "framework": framework
+                "framework": framework,
+                "generation_tier": result.tier,
+                "draft_issues": result.verification.issues if result.verification else []
             }
             
         except Exception as e:
             self.logger.error(f"Error al crear método de prueba: {e}")
             return {"success": False, "error": str(e)}
     
+    def _use_speculative_generation(self) -> bool:
+        """Indica si los métodos de prueba se generan con borrador del LLM rápido"""
+        if not self.config.ai.speculative_generation_enabled:
+            return False
+        return get_llm_manager().llms.get(self.config.ai.speculative_draft_llm_type) is not None
+    
+    def get_speculative_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas de generación especulativa (tasa de escalado)"""
+        return self.speculative_generator.get_stats()
+    
     def _generate_mock_data(self, target_component: str, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
         """Generar datos de prueba y mocks"""
         try:
@@ -406,8 +484,7 @@ Genera:
 Usa Moq como framework de mocking.
 """
             
-            response = self.llm.invoke(prompt)
-            mock_data_code = response.content
+            mock_data_code = self._invoke_llm(prompt, template="generate_mock_data")
             
             return {
                 "success": True,
@@ -466,8 +543,7 @@ Asegúrate de que el código resultante:
 4. Tenga la estructura correcta
 """
             
-            response = self.llm.invoke(prompt)
-            templated_code = response.content
+            templated_code = self._invoke_llm(prompt, template="apply_test_template")
             
             return {
                 "success": True,
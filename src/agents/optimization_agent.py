@@ -12,6 +12,7 @@ from langchain_openai import ChatOpenAI
 
 from agents.base_agent import ReActAgent, AgentRole, AgentTask
 from tools.file_tools import code_file_manager
+from ai.prompt_compression import csharp_compressor
 from langchain_agents.memory.conversation_memory import ConversationMemory
 from langchain_agents.memory.vector_memory import VectorMemory
 from utils.config import Config
@@ -320,10 +321,11 @@ Thought: {agent_scratchpad}
                     content = code_file_manager.read_code_file(file_path)
                     
                     # Analizar y optimizar usando LLM
+                    prompt_code = csharp_compressor.compress(content, label=file_path).text
                     prompt = f"""
 Analiza el siguiente código de pruebas y sugiere optimizaciones de rendimiento:
 
-{content}
+{prompt_code}
 
 Identifica:
 1. Cuellos de botella de rendimiento
@@ -335,8 +337,7 @@ Identifica:
 Proporciona código optimizado y explicaciones.
 """
                     
-                    response = self.llm.invoke(prompt)
-                    optimized_code = response.content
+                    optimized_code = self._invoke_llm(prompt, template="optimize_test_performance")
                     
                     optimizations.append({
                         "file_path": file_path,
@@ -369,11 +370,12 @@ Proporciona código optimizado y explicaciones.
                 try:
                     content = code_file_manager.read_code_file(file_path)
                     
-                    # Refactorizar usando LLM
+                    # Refactorizar usando LLM (se conservan los comentarios del código a refactorizar)
+                    prompt_code = csharp_compressor.compress(content, strip_comments=False, label=file_path).text
                     prompt = f"""
 Refactoriza el siguiente código de pruebas para mejorar legibilidad y mantenibilidad:
 
-{content}
+{prompt_code}
 
 Aplica:
 1. Principios SOLID
@@ -385,8 +387,7 @@ Aplica:
 Proporciona código refactorizado con explicaciones.
 """
                     
-                    response = self.llm.invoke(prompt)
-                    refactored_code = response.content
+                    refactored_code = self._invoke_llm(prompt, template="refactor_test_code")
                     
                     refactoring_results.append({
                         "file_path": file_path,
@@ -420,14 +421,16 @@ Proporciona código refactorizado con explicaciones.
                     content = code_file_manager.read_code_file(file_path)
                     
                     # Analizar cobertura usando LLM
+                    prompt_code = csharp_compressor.compress(content, label=file_path).text
+                    coverage_text = csharp_compressor.compact_data(coverage_data, "datos de cobertura").text
                     prompt = f"""
 Analiza el siguiente código y sugiere pruebas adicionales para mejorar cobertura:
 
 Código:
-{content}
+{prompt_code}
 
 Datos de cobertura:
-{coverage_data}
+{coverage_text}
 
 Identifica:
 1. Líneas no cubiertas
@@ -439,8 +442,7 @@ Identifica:
 Genera pruebas adicionales para mejorar la cobertura.
 """
                     
-                    response = self.llm.invoke(prompt)
-                    additional_tests = response.content
+                    additional_tests = self._invoke_llm(prompt, template="improve_test_coverage")
                     
                     coverage_improvements.append({
                         "file_path": file_path,
@@ -488,8 +490,7 @@ Identifica:
 Proporciona código optimizado con explicaciones.
 """
                     
-                    response = self.llm.invoke(prompt)
-                    optimized_mocks = response.content
+                    optimized_mocks = self._invoke_llm(prompt, template="optimize_mock_usage")
                     
                     mock_optimizations.append({
                         "file_path": file_path,
@@ -540,8 +541,7 @@ Sugiere:
 Proporciona sugerencias específicas y accionables.
 """
                     
-                    response = self.llm.invoke(prompt)
-                    improvements = response.content
+                    improvements = self._invoke_llm(prompt, template="suggest_improvements")
                     
                     suggestions.append({
                         "file_path": file_path,
@@ -592,8 +592,7 @@ Identifica:
 Proporciona análisis detallado y recomendaciones.
 """
                     
-                    response = self.llm.invoke(prompt)
-                    analysis = response.content
+                    analysis = self._invoke_llm(prompt, template="analyze_performance")
                     
                     performance_analysis.append({
                         "file_path": file_path,
@@ -3,14 +3,21 @@ Módulo de IA avanzada
 IA Agent para Generación de Pruebas Unitarias .NET
 """
 
-from .llm_manager import LLMManager
+from .llm_manager import LLMManager, RequestPriority
 from .prompt_engineer import PromptEngineer
 from .context_manager import ContextManager
 from .ai_optimizer import AIOptimizer
+from .response_cache import ResponseCache
+from .streaming import CodeBlockStreamParser
+from .token_budget import TokenizerRegistry
 
 __all__ = [
     'LLMManager',
+    'RequestPriority',
     'PromptEngineer',
     'ContextManager',
-    'AIOptimizer'
+    'AIOptimizer',
+    'ResponseCache',
+    'CodeBlockStreamParser',
+    'TokenizerRegistry'
 ]
@@ -6,13 +6,30 @@ IA Agent para Generación de Pruebas Unitarias .NET
 from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass
 from datetime import datetime
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import asyncio
+import os
+import threading
 import time
 
 from utils.logging import get_logger
+from utils.config import get_config
+from utils.rolling_metrics import RollingMetricSet
+from ai.token_budget import (
+    tokenizer_registry, PromptSection, BudgetResult, SECTION_PRIORITIES, fit_sections
+)
+from ai.prompt_compression import csharp_compressor, CompressionResult
+from ai.response_scoring import ResponseScore, score_response, score_responses
 
 logger = get_logger("ai-optimizer")
 
+# Capacidad de las series de métricas y tamaño de la ventana "recientes"
+METRICS_CAPACITY = 1000
+RECENT_WINDOW = 10
+METRICS_HISTORY_SIZE = 100
+METRIC_FIELDS = ("response_time", "token_count", "quality_score", "cost_estimate", "estimated_latency")
+
 
 @dataclass
 class OptimizationMetrics:
@@ -22,6 +39,7 @@ class OptimizationMetrics:
     quality_score: float
     cost_estimate: float
     timestamp: datetime
+    estimated_latency: float = 0.0
 
 
 @dataclass
@@ -36,16 +54,28 @@ class OptimizationResult:
 class AIOptimizer:
     """Optimizador de IA para mejorar rendimiento y calidad"""
     
-    def __init__(self):
+    def __init__(self, model: Optional[str] = None):
         self.logger = logger
-        self.metrics_history: List[OptimizationMetrics] = []
+        self.model = model or get_config().ai.model
+        self.tokenizer = tokenizer_registry.get(self.model)
+        # Últimas métricas completas y series acotadas con agregados incrementales
+        self.metrics_history: deque = deque(maxlen=METRICS_HISTORY_SIZE)
+        self.rolling_metrics = RollingMetricSet(
+            capacity=METRICS_CAPACITY, count_windows=(RECENT_WINDOW,), time_windows=(3600,)
+        )
         self.optimization_rules = self._setup_optimization_rules()
+        self.last_budget: Optional[BudgetResult] = None
+        # Pool de procesos para lotes grandes (se crea al primer uso y se reutiliza)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_workers = 0
+        self._pool_lock = threading.Lock()
     
     def _setup_optimization_rules(self) -> Dict[str, Any]:
         """Configurar reglas de optimización"""
         return {
             "prompt_optimization": {
-                "max_length": 4000,
+                "max_tokens": 4000,
+                "compress_code": True,
                 "include_context": True,
                 "use_examples": True,
                 "clear_instructions": True
@@ -60,7 +90,10 @@ class AIOptimizer:
                 "timeout": 30,
                 "retry_attempts": 3,
                 "batch_processing": True,
-                "caching": True
+                "caching": True,
+                "parallel_batch_threshold": 256,
+                "batch_chunk_size": 64,
+                "max_workers": None
             }
         }
     
@@ -84,59 +117,84 @@ class AIOptimizer:
     
     def _apply_prompt_optimization(self, prompt: str, context: Dict[str, Any]) -> str:
         """Aplicar optimizaciones al prompt"""
-        optimized = prompt
+        sections = [PromptSection("instructions", prompt, SECTION_PRIORITIES["instructions"])]
         
-        # Agregar contexto relevante si no está presente
-        if "context" not in optimized.lower() and context:
-            context_section = "\n\n**Contexto adicional:**\n"
+        # Agregar contexto relevante si no está presente; las claves conocidas
+        # (code, analysis, template) son secciones propias con su prioridad
+        if "context" not in prompt.lower() and context:
+            extra_lines = []
             for key, value in context.items():
-                context_section += f"- {key}: {value}\n"
-            optimized += context_section
+                if key in SECTION_PRIORITIES and key != "instructions":
+                    value = self._compress_section(key, value)
+                    sections.append(PromptSection(key, f"**{key}:**\n{value}", SECTION_PRIORITIES[key]))
+                else:
+                    extra_lines.append(f"- {key}: {value}")
+            if extra_lines:
+                sections.append(PromptSection(
+                    "context", "**Contexto adicional:**\n" + "\n".join(extra_lines), SECTION_PRIORITIES["context"]
+                ))
         
         # Agregar ejemplos si no están presentes
-        if "ejemplo" not in optimized.lower() and "example" not in optimized.lower():
-            optimized += "\n\n**Ejemplo de respuesta esperada:**\nProporciona una respuesta estructurada y detallada."
+        if "ejemplo" not in prompt.lower() and "example" not in prompt.lower():
+            sections.append(PromptSection(
+                "example",
+                "**Ejemplo de respuesta esperada:**\nProporciona una respuesta estructurada y detallada.",
+                SECTION_PRIORITIES["example"]
+            ))
         
-        # Limitar longitud si es necesario
-        max_length = self.optimization_rules["prompt_optimization"]["max_length"]
-        if len(optimized) > max_length:
-            optimized = optimized[:max_length] + "\n\n[Prompt truncado para optimización]"
+        # Ajustar al presupuesto de tokens recortando primero las secciones de menor prioridad
+        return self.fit_prompt(sections).prompt
         
-        return optimized
+    def fit_prompt(self, sections: List[PromptSection], max_tokens: Optional[int] = None) -> BudgetResult:
+        """Ajustar secciones de un prompt al presupuesto de tokens del modelo"""
+        max_tokens = max_tokens or self.optimization_rules["prompt_optimization"]["max_tokens"]
+        result = fit_sections(sections, max_tokens, self.tokenizer)
+        
+        if result.trimmed_sections or result.dropped_sections:
+            self.logger.info(
+                f"Prompt ajustado a {result.total_tokens}/{max_tokens} tokens "
+                f"(recortadas: {result.trimmed_sections}, eliminadas: {result.dropped_sections})"
+            )
+        
+        self.last_budget = result
+        return result
+    
+    def _compress_section(self, name: str, value: Any) -> Any:
+        """Comprimir el código y los datos de una sección antes de presupuestarla"""
+        if not self.optimization_rules["prompt_optimization"]["compress_code"]:
+            return value
+        
+        if name in ("code", "template") and isinstance(value, str):
+            # Los comentarios del template guían la estructura de las pruebas
+            return csharp_compressor.compress(value, strip_comments=(name == "code"), label=name).text
+        if isinstance(value, (dict, list)):
+            return csharp_compressor.compact_data(value, label=name).text
+        
+        return value
+    
+    def compress_code(self, code: str, signatures_only: bool = False) -> CompressionResult:
+        """Comprimir código C# para incluirlo en un prompt"""
+        return csharp_compressor.compress(code, signatures_only=signatures_only)
+    
+    def count_tokens(self, text: str) -> int:
+        """Contar tokens con el tokenizador del modelo"""
+        return self.tokenizer.count(text)
     
     async def optimize_response(self, response: str, prompt: str) -> OptimizationResult:
         """Optimizar respuesta del LLM"""
         try:
             start_time = time.time()
             
-            # Analizar respuesta original
-            original_metrics = self._analyze_response(response)
-            
-            # Aplicar optimizaciones
-            optimized_response = self._apply_response_optimization(response, prompt)
-            
-            # Analizar respuesta optimizada
-            optimized_metrics = self._analyze_response(optimized_response)
-            
-            # Identificar mejoras
-            improvements = self._identify_improvements(original_metrics, optimized_metrics)
+            optimized_response, improvements, optimized_score = self._optimize_pair(prompt, response)
             
             # Crear resultado
-            result = OptimizationResult(
-                original_response=response,
-                optimized_response=optimized_response,
-                improvements=improvements,
-                metrics=OptimizationMetrics(
-                    response_time=time.time() - start_time,
-                    token_count=len(optimized_response.split()),
-                    quality_score=self._calculate_quality_score(optimized_response),
-                    cost_estimate=self._estimate_cost(optimized_response),
-                    timestamp=datetime.now()
-                )
+            result = self._build_result(
+                prompt, response, optimized_response, improvements, optimized_score,
+                self.count_tokens(prompt), self.count_tokens(optimized_response), time.time() - start_time
             )
             
             # Guardar métricas
-            self.metrics_history.append(result.metrics)
+            self._record_metrics(result.metrics)
             
             self.logger.info(f"Respuesta optimizada con {len(improvements)} mejoras")
             return result
@@ -150,13 +208,39 @@ class AIOptimizer:
                 improvements=[],
                 metrics=OptimizationMetrics(
                     response_time=0,
-                    token_count=len(response.split()),
+                    token_count=self.count_tokens(response),
                     quality_score=0.5,
                     cost_estimate=0,
                     timestamp=datetime.now()
                 )
             )
     
+    def _optimize_pair(self, prompt: str, response: str) -> Tuple[str, List[str], ResponseScore]:
+        """Optimizar una respuesta y puntuarla (una pasada de análisis por documento)"""
+        original_score = score_response(response)
+        optimized_response = self._apply_response_optimization(response, prompt)
+        optimized_score = score_response(optimized_response)
+        improvements = self._identify_improvements(original_score.to_analysis(), optimized_score.to_analysis())
+        return optimized_response, improvements, optimized_score
+    
+    def _build_result(self, prompt: str, response: str, optimized_response: str, improvements: List[str],
+                      score: ResponseScore, prompt_tokens: int, token_count: int,
+                      response_time: float) -> OptimizationResult:
+        """Construir resultado de optimización con sus métricas"""
+        return OptimizationResult(
+            original_response=response,
+            optimized_response=optimized_response,
+            improvements=improvements,
+            metrics=OptimizationMetrics(
+                response_time=response_time,
+                token_count=token_count,
+                quality_score=score.quality_score,
+                cost_estimate=tokenizer_registry.estimate_cost(self.model, prompt_tokens, token_count),
+                timestamp=datetime.now(),
+                estimated_latency=self.estimate_latency(token_count)
+            )
+        )
+    
     def _apply_response_optimization(self, response: str, prompt: str) -> str:
         """Aplicar optimizaciones a la respuesta"""
         optimized = response
@@ -212,39 +296,11 @@ class AIOptimizer:
     
     def _analyze_response(self, response: str) -> Dict[str, Any]:
         """Analizar respuesta para métricas"""
-        return {
-            "length": len(response),
-            "word_count": len(response.split()),
-            "has_code": "```" in response,
-            "has_explanations": any(word in response.lower() for word in ["explicación", "explanation", "porque", "because"]),
-            "structure_score": self._calculate_structure_score(response)
-        }
+        return score_response(response).to_analysis()
     
     def _calculate_structure_score(self, response: str) -> float:
-        """Calcular puntuación de estructura"""
-        score = 0.0
-        
-        # Puntos por tener código
-        if "```" in response:
-            score += 0.3
-        
-        # Puntos por tener explicaciones
-        if any(word in response.lower() for word in ["explicación", "explanation"]):
-            score += 0.2
-        
-        # Puntos por tener estructura clara
-        if any(marker in response for marker in ["**", "##", "###"]):
-            score += 0.2
-        
-        # Puntos por tener ejemplos
-        if any(word in response.lower() for word in ["ejemplo", "example", "caso"]):
-            score += 0.2
-        
-        # Puntos por tener conclusiones
-        if any(word in response.lower() for word in ["conclusión", "conclusion", "resumen", "summary"]):
-            score += 0.1
-        
-        return min(score, 1.0)
+        """Calcular puntuación de estructura (código, explicaciones, formato, ejemplos, conclusiones)"""
+        return score_response(response).structure_score
     
     def _identify_improvements(self, original: Dict[str, Any], optimized: Dict[str, Any]) -> List[str]:
         """Identificar mejoras realizadas"""
@@ -267,56 +323,107 @@ class AIOptimizer:
         return improvements
     
     def _calculate_quality_score(self, response: str) -> float:
-        """Calcular puntuación de calidad"""
-        score = 0.0
-        
-        # Puntuación base por estructura
-        score += self._calculate_structure_score(response)
-        
-        # Puntuación por completitud
-        if len(response) > 100:
-            score += 0.2
-        
-        # Puntuación por claridad
-        if not any(word in response.lower() for word in ["error", "undefined", "null"]):
-            score += 0.1
-        
-        # Puntuación por utilidad
-        if any(word in response.lower() for word in ["código", "code", "ejemplo", "example"]):
-            score += 0.2
-        
-        return min(score, 1.0)
+        """Calcular puntuación de calidad (estructura, completitud, claridad y utilidad)"""
+        return score_response(response).quality_score
     
-    def _estimate_cost(self, response: str) -> float:
-        """Estimar costo de la respuesta"""
-        # Estimación básica basada en tokens
-        token_count = len(response.split())
-        cost_per_token = 0.0001  # Estimación aproximada
-        return token_count * cost_per_token
+    def _estimate_cost(self, response: str, prompt: str = "") -> float:
+        """Estimar costo de la petición a partir de los tokens de entrada y salida"""
+        return tokenizer_registry.estimate_cost(
+            self.model, self.count_tokens(prompt), self.count_tokens(response)
+        )
     
-    def get_performance_metrics(self) -> Dict[str, Any]:
-        """Obtener métricas de rendimiento"""
-        if not self.metrics_history:
+    def estimate_latency(self, response_tokens: int) -> float:
+        """Estimar latencia de generación a partir de los tokens de salida"""
+        return tokenizer_registry.estimate_latency(self.model, response_tokens)
+    
+    def _record_metrics(self, metrics: OptimizationMetrics):
+        """Guardar métricas de una optimización en el historial acotado"""
+        self.metrics_history.append(metrics)
+        timestamp = metrics.timestamp.timestamp()
+        for name in METRIC_FIELDS:
+            self.rolling_metrics.add(name, getattr(metrics, name), timestamp)
+    
+    def get_performance_metrics(self, window: Optional[str] = None) -> Dict[str, Any]:
+        """Obtener métricas de rendimiento (por defecto, de las últimas 10 optimizaciones)
+        
+        window admite "last_10", "3600s" o "all" (todo el buffer).
+        """
+        if "response_time" not in self.rolling_metrics:
             return {"message": "No hay métricas disponibles"}
         
-        recent_metrics = self.metrics_history[-10:]  # Últimas 10 optimizaciones
+        window = window or f"last_{RECENT_WINDOW}"
+        series = {name: self.rolling_metrics.get(name) for name in METRIC_FIELDS}
         
         return {
-            "total_optimizations": len(self.metrics_history),
-            "average_response_time": sum(m.response_time for m in recent_metrics) / len(recent_metrics),
-            "average_quality_score": sum(m.quality_score for m in recent_metrics) / len(recent_metrics),
-            "average_token_count": sum(m.token_count for m in recent_metrics) / len(recent_metrics),
-            "total_cost_estimate": sum(m.cost_estimate for m in recent_metrics)
+            "total_optimizations": series["response_time"].lifetime_count,
+            "window": window,
+            "average_response_time": series["response_time"].mean(window),
+            "average_quality_score": series["quality_score"].mean(window),
+            "average_token_count": series["token_count"].mean(window),
+            "average_estimated_latency": series["estimated_latency"].mean(window),
+            "total_cost_estimate": series["cost_estimate"].total(window),
+            "response_time_percentiles": {
+                f"p{p}": series["response_time"].percentile(p, window) for p in (50, 95, 99)
+            },
+            "quality_score_percentiles": {
+                f"p{p}": series["quality_score"].percentile(p, window) for p in (50, 95, 99)
+            }
         }
     
-    def optimize_batch(self, prompts: List[str], contexts: List[Dict[str, Any]]) -> List[str]:
-        """Optimizar múltiples prompts en lote"""
+    def _batch_settings(self, max_workers: Optional[int]) -> Tuple[int, int, int]:
+        """Umbral de paralelismo, tamaño de bloque y procesos para lotes"""
+        rules = self.optimization_rules["performance_optimization"]
+        workers = max_workers or rules["max_workers"] or os.cpu_count() or 1
+        return rules["parallel_batch_threshold"], rules["batch_chunk_size"], workers
+    
+    def _get_pool(self, workers: int) -> ProcessPoolExecutor:
+        """Obtener el pool de procesos del optimizador, creándolo al primer uso"""
+        with self._pool_lock:
+            if self._pool is None or self._pool_workers != workers:
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False)
+                self._pool = ProcessPoolExecutor(max_workers=workers)
+                self._pool_workers = workers
+            return self._pool
+    
+    def close(self):
+        """Detener el pool de procesos"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+            self._pool_workers = 0
+        if pool is not None:
+            pool.shutdown()
+    
+    def _run_chunked(self, worker: Any, items: List[Any], max_workers: Optional[int]) -> List[Any]:
+        """Ejecutar un lote en bloques: en serie si es pequeño, en un pool de procesos si es grande
+        
+        Los procesos reciben las reglas del optimizador, no las de por defecto.
+        """
+        threshold, chunk_size, workers = self._batch_settings(max_workers)
+        if len(items) < threshold or workers < 2:
+            return worker(self, items)
+        
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
         try:
-            optimized_prompts = []
+            pool = self._get_pool(workers)
+            count = len(chunks)
+            results: List[Any] = []
+            for chunk_results in pool.map(_run_in_worker, [worker] * count, [self.model] * count,
+                                          [self.optimization_rules] * count, chunks):
+                results.extend(chunk_results)
+            return results
+        except Exception as e:
+            self.logger.warning(f"Pool de procesos no disponible, procesando lote en serie: {e}")
+            self.close()
+            return worker(self, items)
             
-            for prompt, context in zip(prompts, contexts):
-                optimized = self._apply_prompt_optimization(prompt, context)
-                optimized_prompts.append(optimized)
+    def optimize_batch(self, prompts: List[str], contexts: List[Dict[str, Any]],
+                       max_workers: Optional[int] = None) -> List[str]:
+        """Optimizar múltiples prompts en lote (los lotes grandes se reparten entre procesos)"""
+        try:
+            optimized_prompts = self._run_chunked(
+                _optimize_prompt_chunk, list(zip(prompts, contexts)), max_workers
+            )
             
             self.logger.info(f"Optimizados {len(prompts)} prompts en lote")
             return optimized_prompts
@@ -324,3 +431,83 @@ class AIOptimizer:
         except Exception as e:
             self.logger.error(f"Error en optimización en lote: {e}")
             return prompts
+
+    async def aoptimize_batch(self, prompts: List[str], contexts: List[Dict[str, Any]],
+                              max_workers: Optional[int] = None) -> List[str]:
+        """Optimizar prompts en lote sin bloquear el event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.optimize_batch, prompts, contexts, max_workers)
+    
+    def score_batch(self, responses: List[str], max_workers: Optional[int] = None) -> List[ResponseScore]:
+        """Puntuar estructura y calidad de muchas respuestas (p. ej. archivos de prueba generados)"""
+        threshold, chunk_size, workers = self._batch_settings(max_workers)
+        pool = self._get_pool(workers) if len(responses) >= threshold and workers >= 2 else None
+        return score_responses(responses, max_workers=workers, parallel_threshold=threshold,
+                               chunk_size=chunk_size, pool=pool)
+    
+    def optimize_responses_batch(self, prompts: List[str], responses: List[str],
+                                 max_workers: Optional[int] = None) -> List[OptimizationResult]:
+        """Optimizar y puntuar pares prompt/respuesta en lote"""
+        try:
+            start_time = time.time()
+            outputs = self._run_chunked(_optimize_response_chunk, list(zip(prompts, responses)), max_workers)
+            elapsed = time.time() - start_time
+            per_item = elapsed / len(outputs) if outputs else 0.0
+            
+            results = []
+            for prompt, response, output in zip(prompts, responses, outputs):
+                optimized_response, improvements, score, prompt_tokens, token_count = output
+                result = self._build_result(
+                    prompt, response, optimized_response, improvements, score,
+                    prompt_tokens, token_count, per_item
+                )
+                results.append(result)
+                self._record_metrics(result.metrics)
+            
+            self.logger.info(f"Optimizadas {len(results)} respuestas en lote en {elapsed:.2f}s")
+            return results
+            
+        except Exception as e:
+            self.logger.error(f"Error en optimización de respuestas en lote: {e}")
+            raise
+    
+    async def aoptimize_responses_batch(self, prompts: List[str], responses: List[str],
+                                        max_workers: Optional[int] = None) -> List[OptimizationResult]:
+        """Optimizar y puntuar pares prompt/respuesta en lote sin bloquear el event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.optimize_responses_batch, prompts, responses, max_workers)
+
+
+# Optimizador de cada proceso del pool (se crea una vez por proceso y modelo)
+_worker_optimizer: Optional[AIOptimizer] = None
+
+
+def _get_worker_optimizer(model: str, rules: Dict[str, Any]) -> AIOptimizer:
+    """Obtener el optimizador del proceso actual con las reglas del optimizador que envía el lote"""
+    global _worker_optimizer
+    if _worker_optimizer is None or _worker_optimizer.model != model:
+        _worker_optimizer = AIOptimizer(model)
+    _worker_optimizer.optimization_rules = rules
+    return _worker_optimizer
+
+
+def _run_in_worker(worker: Any, model: str, rules: Dict[str, Any], items: List[Any]) -> List[Any]:
+    """Procesar un bloque dentro de un proceso del pool"""
+    return worker(_get_worker_optimizer(model, rules), items)
+
+
+def _optimize_prompt_chunk(optimizer: AIOptimizer, items: List[Tuple[str, Dict[str, Any]]]) -> List[str]:
+    """Optimizar un bloque de prompts"""
+    return [optimizer._apply_prompt_optimization(prompt, context) for prompt, context in items]
+
+
+def _optimize_response_chunk(optimizer: AIOptimizer, items: List[Tuple[str, str]]) -> List[Tuple[Any, ...]]:
+    """Optimizar y puntuar un bloque de pares prompt/respuesta"""
+    outputs = []
+    for prompt, response in items:
+        optimized_response, improvements, score = optimizer._optimize_pair(prompt, response)
+        outputs.append((
+            optimized_response, improvements, score,
+            optimizer.count_tokens(prompt), optimizer.count_tokens(optimized_response)
+        ))
+    return outputs
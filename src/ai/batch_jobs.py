@@ -0,0 +1,515 @@
+"""
+Trabajos por lotes con la API batch de los proveedores
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import Dict, List, Any, Optional, Callable, Iterable, Tuple
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from pathlib import Path
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from utils.logging import get_logger
+
+logger = get_logger("batch-jobs")
+
+# Estados de un trabajo (los del proveedor se traducen a estos)
+JOB_CREATED = "created"          # Archivo de entrada escrito, sin enviar
+JOB_SUBMITTING = "submitting"    # Envío en curso (puede haber quedado a medias)
+JOB_SUBMITTED = "submitted"      # Aceptado por el proveedor, en proceso
+JOB_COMPLETED = "completed"      # Resultados descargados
+JOB_FAILED = "failed"            # Rechazado, expirado o cancelado por el proveedor
+
+PENDING_STATES = (JOB_CREATED, JOB_SUBMITTING, JOB_SUBMITTED)
+
+# Estados de la API batch de OpenAI
+PROVIDER_DONE_STATES = {"completed"}
+PROVIDER_FAILED_STATES = {"failed", "expired", "cancelled"}
+
+CHAT_COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+
+
+@dataclass
+class BatchRequest:
+    """Prompt de un trabajo por lotes asociado a la tarea que lo originó"""
+    custom_id: str
+    task_id: str
+    prompt: str
+
+
+@dataclass
+class BatchJobResult:
+    """Resultado de un prompt del trabajo"""
+    custom_id: str
+    task_id: str
+    content: Optional[str] = None
+    error: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    
+    @property
+    def success(self) -> bool:
+        """Indica si el prompt se generó sin errores"""
+        return self.error is None and self.content is not None
+
+
+@dataclass
+class BatchJob:
+    """Estado persistente de un trabajo por lotes"""
+    job_id: str
+    provider: str
+    model: str
+    temperature: float
+    max_tokens: int
+    request_count: int
+    state: str = JOB_CREATED
+    provider_batch_id: Optional[str] = None
+    provider_status: Optional[str] = None
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    submitted_at: Optional[str] = None
+    completed_at: Optional[str] = None
+    error: Optional[str] = None
+    tasks: Dict[str, str] = field(default_factory=dict)  # custom_id -> task_id
+    
+    @property
+    def pending(self) -> bool:
+        """Indica si el trabajo todavía no terminó"""
+        return self.state in PENDING_STATES
+
+
+class OpenAIBatchFormat:
+    """Formato JSON Lines de la API batch de OpenAI (también usado por proveedores compatibles)"""
+    
+    @staticmethod
+    def encode_request(request: BatchRequest, model: str, temperature: float, max_tokens: int) -> Dict[str, Any]:
+        """Línea del archivo de entrada para un prompt"""
+        return {
+            "custom_id": request.custom_id,
+            "method": "POST",
+            "url": CHAT_COMPLETIONS_ENDPOINT,
+            "body": {
+                "model": model,
+                "messages": [{"role": "user", "content": request.prompt}],
+                "temperature": temperature,
+                "max_tokens": max_tokens
+            }
+        }
+    
+    @staticmethod
+    def decode_result(line: Dict[str, Any], tasks: Dict[str, str]) -> BatchJobResult:
+        """Resultado a partir de una línea del archivo de salida"""
+        custom_id = line.get("custom_id", "")
+        result = BatchJobResult(custom_id=custom_id, task_id=tasks.get(custom_id, ""))
+        
+        error = line.get("error")
+        response = line.get("response") or {}
+        body = response.get("body") or {}
+        if error or response.get("status_code", 200) != 200:
+            error = error or body.get("error") or f"HTTP {response.get('status_code')}"
+            result.error = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+            return result
+        
+        try:
+            result.content = body["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            result.error = "Respuesta sin contenido"
+        
+        usage = body.get("usage") or {}
+        result.prompt_tokens = usage.get("prompt_tokens")
+        result.completion_tokens = usage.get("completion_tokens")
+        return result
+
+
+class BatchTransport(ABC):
+    """Transporte que envía archivos de lotes a un proveedor y descarga sus resultados"""
+    
+    # Proveedores cuyos modelos puede ejecutar el transporte (None: cualquiera)
+    providers: Optional[Tuple[str, ...]] = None
+    
+    def supports(self, provider: str) -> bool:
+        """Indica si el transporte puede ejecutar lotes de modelos del proveedor"""
+        return self.providers is None or provider in self.providers
+    
+    @abstractmethod
+    def submit(self, job: BatchJob, input_path: Path) -> str:
+        """Enviar el archivo de entrada; devuelve el identificador del lote en el proveedor"""
+        pass
+    
+    @abstractmethod
+    def find(self, job: BatchJob) -> Optional[str]:
+        """Buscar un lote ya enviado para el trabajo (reanudar un envío interrumpido)"""
+        pass
+    
+    @abstractmethod
+    def status(self, provider_batch_id: str) -> str:
+        """Estado del lote en el proveedor"""
+        pass
+    
+    @abstractmethod
+    def download(self, provider_batch_id: str, output_path: Path):
+        """Descargar el archivo de resultados"""
+        pass
+
+
+class FileDropTransport(BatchTransport):
+    """Transporte local que deja los lotes en carpetas, para pruebas sin red
+    
+    submit() copia la entrada a inbox/; un procesador (otro proceso o
+    process_pending() con un responder, p. ej. un LLM local) escribe la
+    salida en outbox/ con el mismo nombre.
+    """
+    
+    def __init__(self, root: str, responder: Optional[Callable[[str], Any]] = None):
+        self.logger = logger
+        self.root = Path(root)
+        self.inbox = self.root / "inbox"
+        self.outbox = self.root / "outbox"
+        self.inbox.mkdir(parents=True, exist_ok=True)
+        self.outbox.mkdir(parents=True, exist_ok=True)
+        self.responder = responder
+    
+    def submit(self, job: BatchJob, input_path: Path) -> str:
+        provider_batch_id = f"batch_{job.job_id}"
+        temp_path = self.inbox / f"{provider_batch_id}.tmp"
+        shutil.copyfile(input_path, temp_path)
+        os.replace(temp_path, self.inbox / f"{provider_batch_id}.jsonl")
+        return provider_batch_id
+    
+    def find(self, job: BatchJob) -> Optional[str]:
+        provider_batch_id = f"batch_{job.job_id}"
+        if (self.inbox / f"{provider_batch_id}.jsonl").exists():
+            return provider_batch_id
+        return None
+    
+    def status(self, provider_batch_id: str) -> str:
+        if self.responder is not None:
+            self.process_pending()
+        if (self.outbox / f"{provider_batch_id}.jsonl").exists():
+            return "completed"
+        if (self.inbox / f"{provider_batch_id}.jsonl").exists():
+            return "in_progress"
+        return "failed"
+    
+    def download(self, provider_batch_id: str, output_path: Path):
+        shutil.copyfile(self.outbox / f"{provider_batch_id}.jsonl", output_path)
+    
+    def process_pending(self, responder: Optional[Callable[[str], Any]] = None) -> int:
+        """Simular al proveedor: responder los lotes de inbox/ sin salida"""
+        responder = responder or self.responder
+        processed = 0
+        for input_path in sorted(self.inbox.glob("*.jsonl")):
+            output_path = self.outbox / input_path.name
+            if output_path.exists():
+                continue
+            
+            lines = []
+            with open(input_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        lines.append(self._respond(json.loads(line), responder))
+            
+            temp_path = output_path.with_suffix(".tmp")
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+            os.replace(temp_path, output_path)
+            processed += 1
+        
+        return processed
+    
+    @staticmethod
+    def _respond(request: Dict[str, Any], responder: Callable[[str], Any]) -> Dict[str, Any]:
+        """Línea de salida en formato OpenAI para una línea de entrada"""
+        line: Dict[str, Any] = {"id": f"req_{uuid.uuid4().hex[:12]}", "custom_id": request["custom_id"]}
+        try:
+            response = responder(request["body"]["messages"][-1]["content"])
+            usage = {
+                "prompt_tokens": getattr(response, "prompt_tokens", None),
+                "completion_tokens": getattr(response, "completion_tokens", None),
+            }
+            line["response"] = {
+                "status_code": 200,
+                "body": {
+                    "choices": [{"message": {"role": "assistant", "content": getattr(response, "content", str(response))}}],
+                    "usage": usage
+                }
+            }
+            line["error"] = None
+        except Exception as e:
+            line["response"] = None
+            line["error"] = {"code": type(e).__name__, "message": str(e)}
+        return line
+
+
+class OpenAIBatchTransport(BatchTransport):
+    """Transporte de la API batch de OpenAI (archivos + /v1/batches)"""
+    
+    providers = ("openai",)
+    
+    def __init__(self, client: Any, completion_window: str = "24h"):
+        self.client = client
+        self.completion_window = completion_window
+    
+    def submit(self, job: BatchJob, input_path: Path) -> str:
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=CHAT_COMPLETIONS_ENDPOINT,
+            completion_window=self.completion_window,
+            metadata={"job_id": job.job_id}
+        )
+        return batch.id
+    
+    def find(self, job: BatchJob) -> Optional[str]:
+        for batch in self.client.batches.list(limit=100):
+            if (getattr(batch, "metadata", None) or {}).get("job_id") == job.job_id:
+                return batch.id
+        return None
+    
+    def status(self, provider_batch_id: str) -> str:
+        return self.client.batches.retrieve(provider_batch_id).status
+    
+    def download(self, provider_batch_id: str, output_path: Path):
+        batch = self.client.batches.retrieve(provider_batch_id)
+        lines = []
+        for file_id in (batch.output_file_id, getattr(batch, "error_file_id", None)):
+            if file_id:
+                lines.append(self.client.files.content(file_id).text.rstrip("\n"))
+        output_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+class BatchJobStore:
+    """Trabajos persistidos en disco: un directorio por trabajo con job.json, input.jsonl y output.jsonl
+    
+    El estado se reescribe de forma atómica en cada transición, de modo que
+    tras reiniciar el proceso los trabajos pendientes se pueden reanudar.
+    """
+    
+    def __init__(self, path: str):
+        self.logger = logger
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+    
+    def job_dir(self, job_id: str) -> Path:
+        """Directorio del trabajo"""
+        return self.path / job_id
+    
+    def input_path(self, job_id: str) -> Path:
+        """Archivo de entrada del proveedor"""
+        return self.job_dir(job_id) / "input.jsonl"
+    
+    def output_path(self, job_id: str) -> Path:
+        """Archivo de resultados descargado"""
+        return self.job_dir(job_id) / "output.jsonl"
+    
+    def save(self, job: BatchJob):
+        """Guardar el estado del trabajo de forma atómica"""
+        job_dir = self.job_dir(job.job_id)
+        job_dir.mkdir(parents=True, exist_ok=True)
+        temp_path = job_dir / "job.json.tmp"
+        with self.lock:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(asdict(job), f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, job_dir / "job.json")
+    
+    def load(self, job_id: str) -> Optional[BatchJob]:
+        """Cargar un trabajo"""
+        job_file = self.job_dir(job_id) / "job.json"
+        if not job_file.exists():
+            return None
+        with open(job_file, "r", encoding="utf-8") as f:
+            return BatchJob(**json.load(f))
+    
+    def list_jobs(self, pending_only: bool = False) -> List[BatchJob]:
+        """Trabajos guardados, del más antiguo al más reciente"""
+        jobs = []
+        for job_file in self.path.glob("*/job.json"):
+            try:
+                job = self.load(job_file.parent.name)
+            except (ValueError, TypeError) as e:
+                self.logger.warning(f"Trabajo por lotes ilegible en {job_file}: {e}")
+                continue
+            if job is not None and (not pending_only or job.pending):
+                jobs.append(job)
+        return sorted(jobs, key=lambda job: job.created_at)
+
+
+class BatchJobRunner:
+    """Crea, envía, sondea y recoge trabajos por lotes a través de un transporte"""
+    
+    def __init__(self, store: BatchJobStore, transport: BatchTransport, max_requests: int = 50000):
+        self.logger = logger
+        self.store = store
+        self.transport = transport
+        self.max_requests = max_requests
+        self.format = OpenAIBatchFormat()
+    
+    @staticmethod
+    def build_requests(items: Iterable[Tuple[Any, str]]) -> List[BatchRequest]:
+        """Prompts con su tarea de origen (AgentTask o task_id) e identificador único"""
+        requests = []
+        counts: Dict[str, int] = {}
+        for task, prompt in items:
+            task_id = getattr(task, "task_id", task)
+            index = counts.get(task_id, 0)
+            counts[task_id] = index + 1
+            requests.append(BatchRequest(f"{task_id}:{index}", task_id, prompt))
+        return requests
+    
+    def create_jobs(self, requests: List[BatchRequest], provider: str, model: str,
+                    temperature: float, max_tokens: int) -> List[BatchJob]:
+        """Escribir los archivos de entrada (un trabajo por cada max_requests prompts)"""
+        jobs = []
+        for start in range(0, len(requests), self.max_requests):
+            chunk = requests[start:start + self.max_requests]
+            job = BatchJob(
+                job_id=f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}",
+                provider=provider, model=model, temperature=temperature, max_tokens=max_tokens,
+                request_count=len(chunk),
+                tasks={request.custom_id: request.task_id for request in chunk}
+            )
+            self.store.job_dir(job.job_id).mkdir(parents=True, exist_ok=True)
+            
+            temp_path = self.store.input_path(job.job_id).with_suffix(".tmp")
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for request in chunk:
+                    line = self.format.encode_request(request, model, temperature, max_tokens)
+                    f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            os.replace(temp_path, self.store.input_path(job.job_id))
+            
+            self.store.save(job)
+            jobs.append(job)
+        
+        return jobs
+    
+    def submit(self, job: BatchJob) -> BatchJob:
+        """Enviar un trabajo creado (o terminar un envío interrumpido)"""
+        if job.state == JOB_SUBMITTING:
+            # El proceso pudo caer tras enviar y antes de guardar el identificador
+            provider_batch_id = self.transport.find(job)
+            if provider_batch_id:
+                job.provider_batch_id = provider_batch_id
+                self._mark_submitted(job)
+                return job
+        elif job.state != JOB_CREATED:
+            return job
+        
+        job.state = JOB_SUBMITTING
+        self.store.save(job)
+        try:
+            job.provider_batch_id = self.transport.submit(job, self.store.input_path(job.job_id))
+        except Exception as e:
+            self.logger.error(f"Error al enviar trabajo por lotes {job.job_id}: {e}")
+            job.state = JOB_CREATED
+            job.error = str(e)
+            self.store.save(job)
+            raise
+        
+        self._mark_submitted(job)
+        return job
+    
+    def _mark_submitted(self, job: BatchJob):
+        """Registrar el envío aceptado por el proveedor"""
+        job.state = JOB_SUBMITTED
+        job.submitted_at = datetime.now().isoformat()
+        job.error = None
+        self.store.save(job)
+        self.logger.info(f"Trabajo por lotes {job.job_id} enviado ({job.request_count} prompts)")
+    
+    def poll(self, job: BatchJob) -> BatchJob:
+        """Consultar el estado en el proveedor y descargar los resultados al completarse"""
+        if job.state in (JOB_CREATED, JOB_SUBMITTING):
+            self.submit(job)
+        if job.state != JOB_SUBMITTED:
+            return job
+        
+        status = self.transport.status(job.provider_batch_id)
+        if status != job.provider_status:
+            job.provider_status = status
+            self.store.save(job)
+        
+        if status in PROVIDER_DONE_STATES:
+            self.transport.download(job.provider_batch_id, self.store.output_path(job.job_id))
+            job.state = JOB_COMPLETED
+            job.completed_at = datetime.now().isoformat()
+            self.store.save(job)
+            self.logger.info(f"Trabajo por lotes {job.job_id} completado")
+        elif status in PROVIDER_FAILED_STATES:
+            job.state = JOB_FAILED
+            job.error = f"Lote {status} en el proveedor"
+            self.store.save(job)
+            self.logger.error(f"Trabajo por lotes {job.job_id} terminó con estado {status}")
+        
+        return job
+    
+    def wait(self, job: BatchJob, poll_interval: float = 60.0, timeout: Optional[float] = None) -> BatchJob:
+        """Sondear hasta que el trabajo termine"""
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            job = self.poll(job)
+            if not job.pending:
+                return job
+            if deadline is not None and time.time() >= deadline:
+                raise TimeoutError(f"El trabajo por lotes {job.job_id} no terminó a tiempo")
+            time.sleep(poll_interval)
+    
+    def prompts(self, job: BatchJob) -> Dict[str, str]:
+        """Prompts del trabajo por custom_id (leídos del archivo de entrada)"""
+        prompts = {}
+        with open(self.store.input_path(job.job_id), "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    request = json.loads(line)
+                    prompts[request["custom_id"]] = request["body"]["messages"][-1]["content"]
+        return prompts
+    
+    def results(self, job: BatchJob) -> List[BatchJobResult]:
+        """Resultados del trabajo en el orden de entrada (los prompts sin respuesta quedan con error)"""
+        if job.state != JOB_COMPLETED:
+            return []
+        
+        by_id: Dict[str, BatchJobResult] = {}
+        with open(self.store.output_path(job.job_id), "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    result = self.format.decode_result(json.loads(line), job.tasks)
+                    by_id[result.custom_id] = result
+        
+        return [
+            by_id.get(custom_id) or BatchJobResult(custom_id, task_id, error="Sin resultado del proveedor")
+            for custom_id, task_id in job.tasks.items()
+        ]
+
+
+def results_by_task(results: Iterable[BatchJobResult]) -> Dict[str, List[BatchJobResult]]:
+    """Agrupar resultados por la tarea (AgentTask) que originó cada prompt"""
+    grouped: Dict[str, List[BatchJobResult]] = {}
+    for result in results:
+        grouped.setdefault(result.task_id, []).append(result)
+    return grouped
+
+
+def apply_results_to_tasks(tasks: Iterable[Any], results: Iterable[BatchJobResult]):
+    """Completar las AgentTask con sus respuestas (o el primer error)"""
+    grouped = results_by_task(results)
+    for task in tasks:
+        task_results = grouped.get(task.task_id)
+        if not task_results:
+            continue
+        
+        errors = [result.error for result in task_results if not result.success]
+        if errors:
+            task.status = "failed"
+            task.error = errors[0]
+        else:
+            task.status = "completed"
+            contents = [result.content for result in task_results]
+            task.result = contents[0] if len(contents) == 1 else contents
+        task.completed_at = datetime.now()
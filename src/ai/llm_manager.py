@@ -3,19 +3,220 @@ Gestor avanzado de LLMs
 IA Agent para Generación de Pruebas Unitarias .NET
 """
 
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Union, AsyncIterator, Iterator, Tuple, Callable
 from enum import Enum
 import asyncio
-from dataclasses import dataclass
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
 
 from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
 from langchain_community.llms import AzureOpenAI
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import google.generativeai as genai
+import httpx
 
 from utils.logging import get_logger
 from utils.config import get_config
+from ai.response_cache import ResponseCache, SemanticResponseCache, response_cache
+from ai.request_coalescing import SingleFlight
+from ai.batch_jobs import (
+    BatchJob, BatchJobResult, BatchJobRunner, BatchJobStore, BatchTransport,
+    FileDropTransport, OpenAIBatchTransport, JOB_COMPLETED
+)
+from ai.token_budget import tokenizer_registry
+from monitoring.metrics_collector import MetricsCollector, get_metrics_collector
+
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+# Límites del pool de conexiones HTTP compartido
+HTTP_MAX_CONNECTIONS = 64
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 32
+
+
+@dataclass
+class LLMResponse:
+    """Respuesta con la misma forma que los mensajes de LangChain"""
+    content: str
+    total_tokens: Optional[int] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+
+class SharedClientPool:
+    """Pool de clientes HTTP de larga vida compartidos entre wrappers de LLM"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_clients: Dict[Tuple[str, str], OpenAI] = {}
+        # Los clientes asíncronos quedan ligados al event loop que los crea
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Event loop de fondo para las llamadas síncronas
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+    
+    def _limits(self) -> httpx.Limits:
+        """Límites de conexiones del pool HTTP"""
+        return httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+        )
+    
+    def get_openai_client(self, api_key: str, base_url: str) -> OpenAI:
+        """Obtener cliente síncrono compatible con OpenAI"""
+        key = (api_key, base_url)
+        with self._lock:
+            client = self._sync_clients.get(key)
+            if client is None:
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    http_client=httpx.Client(limits=self._limits())
+                )
+                self._sync_clients[key] = client
+            return client
+    
+    def get_async_openai_client(self, api_key: str, base_url: str) -> AsyncOpenAI:
+        """Obtener cliente asíncrono compatible con OpenAI para el loop actual"""
+        loop = asyncio.get_running_loop()
+        key = (api_key, base_url)
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None:
+                client = AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    http_client=httpx.AsyncClient(limits=self._limits())
+                )
+                clients[key] = client
+            return client
+    
+    def get_executor(self) -> ThreadPoolExecutor:
+        """Obtener executor compartido para SDKs sin soporte asíncrono"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    thread_name_prefix="llm-io"
+                )
+            return self._executor
+    
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        """Obtener el event loop de fondo de larga vida
+        
+        Las llamadas síncronas se ejecutan siempre en este loop, de modo que sus
+        clientes asíncronos y semáforos se reutilizan en lugar de crearse (y
+        perderse) con un loop nuevo en cada llamada.
+        """
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True)
+                thread.start()
+                self._loop, self._loop_thread = loop, thread
+            return self._loop
+    
+    def run(self, coroutine: Any) -> Any:
+        """Ejecutar una corrutina en el loop de fondo y esperar su resultado"""
+        loop = self.get_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        
+        if running is loop:
+            # Esperar desde el propio loop lo bloquearía para siempre
+            coroutine.close()
+            raise RuntimeError(
+                "No se puede esperar una llamada síncrona desde el loop de fondo; usar la versión asíncrona"
+            )
+        
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+    
+    async def aclose_async_clients(self):
+        """Cerrar los clientes asíncronos del loop actual"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.pop(loop, {})
+        for client in clients.values():
+            await client.close()
+    
+    def close(self):
+        """Cerrar clientes síncronos, executor y el loop de fondo con sus clientes"""
+        with self._lock:
+            for client in self._sync_clients.values():
+                client.close()
+            self._sync_clients.clear()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            loop, thread = self._loop, self._loop_thread
+            self._loop = self._loop_thread = None
+        
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self.aclose_async_clients(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+
+# Instancia global del pool de clientes
+shared_client_pool = SharedClientPool()
+
+
+async def iterate_in_executor(iterator_factory: Callable[[], Iterator[Any]]) -> AsyncIterator[Any]:
+    """Consumir un iterador bloqueante en el executor compartido sin bloquear el event loop"""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    done = object()
+    
+    def emit(entry: Tuple[Any, Optional[Exception]]):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, entry)
+        except RuntimeError:
+            # El event loop ya se cerró
+            stop.set()
+    
+    def produce():
+        try:
+            for item in iterator_factory():
+                if stop.is_set():
+                    return
+                emit((item, None))
+        except Exception as e:
+            emit((done, e))
+            return
+        emit((done, None))
+    
+    loop.run_in_executor(shared_client_pool.get_executor(), produce)
+    try:
+        while True:
+            item, error = await queue.get()
+            if error is not None:
+                raise error
+            if item is done:
+                break
+            yield item
+    finally:
+        # Si el consumidor abandona el stream, el productor se detiene en el siguiente fragmento
+        stop.set()
 
 
 class DeepSeekLLM:
@@ -23,32 +224,40 @@ class DeepSeekLLM:
     
     def __init__(self, api_key: str, model: str = "deepseek-coder", 
                  temperature: float = 0.1, max_tokens: int = 4000, timeout: int = 30):
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.deepseek.com"
-        )
+        self.api_key = api_key
+        self.base_url = DEEPSEEK_BASE_URL
+        self.client = shared_client_pool.get_openai_client(api_key, self.base_url)
         self.model = model
         self.temperature = temperature
         self.max_tokens = max_tokens
         self.timeout = timeout
     
+    def _request_params(self, prompt: str) -> Dict[str, Any]:
+        """Parámetros de la petición de chat"""
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "timeout": self.timeout
+        }
+    
+    @staticmethod
+    def _to_response(response: Any) -> LLMResponse:
+        """Convertir respuesta de la API incluyendo el consumo de tokens"""
+        usage = getattr(response, 'usage', None)
+        return LLMResponse(
+            response.choices[0].message.content,
+            total_tokens=getattr(usage, 'total_tokens', None),
+            prompt_tokens=getattr(usage, 'prompt_tokens', None),
+            completion_tokens=getattr(usage, 'completion_tokens', None)
+        )
+    
     def invoke(self, prompt: str) -> Any:
         """Invocar modelo de forma síncrona"""
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=self.temperature,
-                max_tokens=self.max_tokens,
-                timeout=self.timeout
-            )
-            
-            # Crear objeto similar a LangChain
-            class MockResponse:
-                def __init__(self, content):
-                    self.content = content
-            
-            return MockResponse(response.choices[0].message.content)
+            response = self.client.chat.completions.create(**self._request_params(prompt))
+            return self._to_response(response)
             
         except Exception as e:
             logger.error(f"Error en DeepSeek invoke: {e}")
@@ -57,23 +266,37 @@ class DeepSeekLLM:
     async def ainvoke(self, prompt: str) -> Any:
         """Invocar modelo de forma asíncrona"""
         try:
-            response = await self.client.chat.completions.acreate(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=self.temperature,
-                max_tokens=self.max_tokens,
-                timeout=self.timeout
-            )
+            client = shared_client_pool.get_async_openai_client(self.api_key, self.base_url)
+            response = await client.chat.completions.create(**self._request_params(prompt))
+            return self._to_response(response)
             
-            # Crear objeto similar a LangChain
-            class MockResponse:
-                def __init__(self, content):
-                    self.content = content
+        except Exception as e:
+            logger.error(f"Error en DeepSeek ainvoke: {e}")
+            raise
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Invocar modelo entregando fragmentos de texto a medida que se generan"""
+        try:
+            response = self.client.chat.completions.create(**self._request_params(prompt), stream=True)
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
             
-            return MockResponse(response.choices[0].message.content)
+        except Exception as e:
+            logger.error(f"Error en DeepSeek stream: {e}")
+            raise
+    
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Invocar modelo en streaming de forma asíncrona"""
+        try:
+            client = shared_client_pool.get_async_openai_client(self.api_key, self.base_url)
+            response = await client.chat.completions.create(**self._request_params(prompt), stream=True)
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
             
         except Exception as e:
-            logger.error(f"Error en DeepSeek ainvoke: {e}")
+            logger.error(f"Error en DeepSeek astream: {e}")
             raise
 
 
@@ -88,24 +311,25 @@ class GeminiLLM:
         self.max_tokens = max_tokens
         self.timeout = timeout
     
+    def _generation_config(self) -> Any:
+        """Configuración de generación de Gemini"""
+        return genai.types.GenerationConfig(
+            temperature=self.temperature,
+            max_output_tokens=self.max_tokens,
+        )
+    
     def invoke(self, prompt: str) -> Any:
         """Invocar modelo de forma síncrona"""
         try:
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=self.temperature,
-                    max_output_tokens=self.max_tokens,
-                )
+            response = self.model.generate_content(prompt, generation_config=self._generation_config())
+            usage = getattr(response, 'usage_metadata', None)
+            return LLMResponse(
+                response.text,
+                total_tokens=getattr(usage, 'total_token_count', None),
+                prompt_tokens=getattr(usage, 'prompt_token_count', None),
+                completion_tokens=getattr(usage, 'candidates_token_count', None)
             )
             
-            # Crear objeto similar a LangChain
-            class MockResponse:
-                def __init__(self, content):
-                    self.content = content
-            
-            return MockResponse(response.text)
-            
         except Exception as e:
             logger.error(f"Error en Gemini invoke: {e}")
             raise
@@ -113,12 +337,38 @@ class GeminiLLM:
     async def ainvoke(self, prompt: str) -> Any:
         """Invocar modelo de forma asíncrona"""
         try:
-            # Gemini no tiene soporte asíncrono nativo, usar sync
-            return self.invoke(prompt)
+            # El cliente gRPC asíncrono de Gemini queda ligado a un único loop;
+            # la llamada bloqueante se delega al executor compartido
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(shared_client_pool.get_executor(), self.invoke, prompt)
             
         except Exception as e:
             logger.error(f"Error en Gemini ainvoke: {e}")
             raise
+    
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Invocar modelo entregando fragmentos de texto a medida que se generan"""
+        try:
+            response = self.model.generate_content(
+                prompt, generation_config=self._generation_config(), stream=True
+            )
+            for chunk in response:
+                if chunk.parts:
+                    yield chunk.text
+            
+        except Exception as e:
+            logger.error(f"Error en Gemini stream: {e}")
+            raise
+    
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Invocar modelo en streaming de forma asíncrona"""
+        try:
+            async for chunk in iterate_in_executor(lambda: self.stream(prompt)):
+                yield chunk
+            
+        except Exception as e:
+            logger.error(f"Error en Gemini astream: {e}")
+            raise
 
 logger = get_logger("llm-manager")
 
@@ -130,6 +380,7 @@ class LLMProvider(Enum):
     ANTHROPIC = "anthropic"
     DEEPSEEK = "deepseek"
     GEMINI = "gemini"
+    LOCAL = "local"
 
 
 @dataclass
@@ -144,6 +395,492 @@ class LLMConfig:
     endpoint: Optional[str] = None
 
 
+@dataclass
+class BatchResult:
+    """Resultado individual de una generación en lote"""
+    index: int
+    prompt: str
+    content: Optional[str] = None
+    error: Optional[str] = None
+    latency: float = 0.0
+    
+    @property
+    def success(self) -> bool:
+        """Indica si el prompt se generó sin errores"""
+        return self.error is None
+
+
+def get_llm_provider(llm: Any) -> str:
+    """Identificar el proveedor de una instancia de LLM"""
+    if isinstance(llm, DeepSeekLLM):
+        return LLMProvider.DEEPSEEK.value
+    if isinstance(llm, GeminiLLM):
+        return LLMProvider.GEMINI.value
+    if isinstance(llm, ChatAnthropic):
+        return LLMProvider.ANTHROPIC.value
+    if isinstance(llm, AzureOpenAI):
+        return LLMProvider.AZURE_OPENAI.value
+    if isinstance(llm, ChatOpenAI):
+        return LLMProvider.OPENAI.value
+    
+    return getattr(llm, 'provider', type(llm).__name__.lower())
+
+
+def get_llm_model_name(llm: Any) -> str:
+    """Obtener el nombre del modelo de una instancia de LLM"""
+    model = getattr(llm, 'model_name', None) or getattr(llm, 'model', None)
+    
+    # GeminiLLM guarda el GenerativeModel, no su nombre
+    if model is not None and not isinstance(model, str):
+        model = getattr(model, 'model_name', None)
+    
+    return model or 'unknown'
+
+
+# Etiquetas (agente, template...) de las llamadas en curso
+_llm_call_tags: contextvars.ContextVar = contextvars.ContextVar("llm_call_tags", default=None)
+
+
+@contextmanager
+def llm_call_context(**tags: Optional[str]):
+    """Etiquetar las llamadas a LLMs hechas dentro del bloque, p. ej. agent="..." y template="..." """
+    current = _llm_call_tags.get() or {}
+    token = _llm_call_tags.set({**current, **{key: str(value) for key, value in tags.items() if value}})
+    try:
+        yield
+    finally:
+        _llm_call_tags.reset(token)
+
+
+@dataclass
+class LLMCallRecord:
+    """Medición de una llamada a un LLM"""
+    provider: str
+    model: str
+    agent: str = "unknown"
+    template: str = "unknown"
+    streamed: bool = False
+    started_at: float = field(default_factory=time.perf_counter)
+    time_to_first_token: Optional[float] = None
+    latency: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retries: int = 0
+    cost: float = 0.0
+    success: bool = True
+    error: Optional[str] = None
+    
+    @property
+    def tags(self) -> Dict[str, str]:
+        """Etiquetas con las que se agregan las métricas"""
+        return {
+            "agent": self.agent,
+            "template": self.template,
+            "provider": self.provider,
+            "model": self.model,
+            "status": "success" if self.success else "error"
+        }
+
+
+class RequestPriority(Enum):
+    """Carriles de prioridad del planificador de peticiones"""
+    HIGH = 0      # Coordinación entre agentes
+    NORMAL = 1    # Peticiones interactivas
+    BULK = 2      # Generación masiva en lote
+
+
+# Intervalo de sondeo de los waiters que no están al frente de la cola
+SCHEDULER_POLL_INTERVAL = 0.01
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Indica si el error es un 429 / cuota agotada del proveedor"""
+    status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    if status == 429:
+        return True
+    
+    return type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Obtener segundos de espera indicados por el proveedor (retry-after-ms / retry-after)"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if headers:
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            try:
+                return float(retry_after_ms) / 1000.0
+            except ValueError:
+                pass
+        
+        retry_after = headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                try:
+                    # Formato fecha HTTP
+                    return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+    
+    # Gemini informa el retraso en el propio error
+    retry_delay = getattr(error, 'retry_delay', None)
+    if retry_delay is not None:
+        return getattr(retry_delay, 'total_seconds', lambda: float(retry_delay))()
+    
+    return None
+
+
+class ProviderRateLimiter:
+    """Presupuesto de peticiones (RPM) y tokens (TPM) por minuto de un proveedor
+    
+    Usa dos token buckets con ráfaga pequeña que se rellenan de forma continua
+    a un ritmo ligeramente inferior al límite, de modo que el caudal se mantiene
+    estable justo por debajo del máximo. Las peticiones esperan en una cola con
+    prioridad y solo la cabeza de la cola puede consumir presupuesto.
+    """
+    
+    def __init__(self, provider: str, rpm: int = 0, tpm: int = 0,
+                 headroom: float = 0.9, burst_seconds: float = 1.0):
+        self.provider = provider
+        self.rpm = rpm
+        self.tpm = tpm
+        self.headroom = headroom
+        
+        # Ritmo sostenido por segundo (0 = sin límite)
+        self._request_rate = rpm * headroom / 60.0
+        self._token_rate = tpm * headroom / 60.0
+        self._request_capacity = max(1.0, self._request_rate * burst_seconds)
+        self._token_capacity = max(1.0, self._token_rate * burst_seconds)
+        self._request_level = self._request_capacity
+        self._token_level = self._token_capacity
+        self._last_refill = time.monotonic()
+        
+        # Bloqueo por retry-after del proveedor
+        self._blocked_until = 0.0
+        
+        self._condition = threading.Condition(threading.RLock())
+        self._queue: List[List[int]] = []
+        self._sequence = itertools.count()
+        
+        # Estadísticas
+        self.granted = 0
+        self.throttled = 0
+        self.total_wait_time = 0.0
+        self.tokens_consumed = 0
+    
+    def _refill(self, now: float):
+        """Rellenar buckets según el tiempo transcurrido"""
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_level = min(self._request_capacity, self._request_level + elapsed * self._request_rate)
+        self._token_level = min(self._token_capacity, self._token_level + elapsed * self._token_rate)
+    
+    def _wait_time(self, tokens: int, now: float) -> float:
+        """Segundos hasta que haya presupuesto para la petición"""
+        wait = max(0.0, self._blocked_until - now)
+        
+        # Una petición mayor que la ráfaga se concede con el bucket lleno y deja deuda
+        if self._request_rate > 0:
+            needed = min(1.0, self._request_capacity) - self._request_level
+            if needed > 0:
+                wait = max(wait, needed / self._request_rate)
+        if self._token_rate > 0:
+            needed = min(float(tokens), self._token_capacity) - self._token_level
+            if needed > 0:
+                wait = max(wait, needed / self._token_rate)
+        
+        return wait
+    
+    def _enqueue(self, priority: RequestPriority) -> List[int]:
+        """Encolar ticket de espera"""
+        ticket = [priority.value, next(self._sequence)]
+        with self._condition:
+            heapq.heappush(self._queue, ticket)
+        return ticket
+    
+    def _dequeue(self, ticket: List[int]):
+        """Retirar ticket cancelado de la cola"""
+        with self._condition:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._condition.notify_all()
+    
+    def _try_grant(self, ticket: List[int], tokens: int) -> Optional[float]:
+        """Intentar conceder presupuesto; devuelve 0 si se concede, la espera o None si no es la cabeza"""
+        with self._condition:
+            if self._queue[0] is not ticket:
+                return None
+            
+            now = time.monotonic()
+            self._refill(now)
+            wait = self._wait_time(tokens, now)
+            if wait > 0:
+                return wait
+            
+            heapq.heappop(self._queue)
+            if self._request_rate > 0:
+                self._request_level -= 1.0
+            if self._token_rate > 0:
+                self._token_level -= tokens
+            self.granted += 1
+            self.tokens_consumed += tokens
+            self._condition.notify_all()
+            return 0.0
+    
+    def acquire(self, tokens: int, priority: RequestPriority = RequestPriority.NORMAL) -> float:
+        """Esperar (bloqueante) hasta tener presupuesto; devuelve el tiempo esperado"""
+        started = time.monotonic()
+        ticket = self._enqueue(priority)
+        try:
+            with self._condition:
+                while True:
+                    wait = self._try_grant(ticket, tokens)
+                    if wait == 0:
+                        break
+                    self._condition.wait(timeout=wait if wait is not None else SCHEDULER_POLL_INTERVAL)
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        
+        waited = time.monotonic() - started
+        self.total_wait_time += waited
+        return waited
+    
+    async def acquire_async(self, tokens: int, priority: RequestPriority = RequestPriority.NORMAL) -> float:
+        """Esperar sin bloquear el event loop hasta tener presupuesto"""
+        started = time.monotonic()
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                wait = self._try_grant(ticket, tokens)
+                if wait == 0:
+                    break
+                await asyncio.sleep(wait if wait is not None else SCHEDULER_POLL_INTERVAL)
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        
+        waited = time.monotonic() - started
+        self.total_wait_time += waited
+        return waited
+    
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Corregir el presupuesto de tokens con el consumo real informado por el proveedor"""
+        if actual_tokens is None or self._token_rate <= 0:
+            return
+        
+        with self._condition:
+            self._token_level += estimated_tokens - actual_tokens
+            self.tokens_consumed += actual_tokens - estimated_tokens
+    
+    def backoff(self, delay: float):
+        """Pausar el proveedor tras un 429 respetando retry-after"""
+        with self._condition:
+            self.throttled += 1
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            # Evitar ráfaga al terminar la pausa
+            self._request_level = min(self._request_level, 0.0)
+            self._condition.notify_all()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas del limitador"""
+        with self._condition:
+            return {
+                "provider": self.provider,
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "queued": len(self._queue),
+                "granted": self.granted,
+                "throttled": self.throttled,
+                "tokens_consumed": self.tokens_consumed,
+                "total_wait_time": self.total_wait_time,
+                "average_wait_time": self.total_wait_time / self.granted if self.granted else 0.0,
+                "blocked_for": max(0.0, self._blocked_until - time.monotonic())
+            }
+
+
+class RequestScheduler:
+    """Planificador de peticiones por proveedor con límites RPM/TPM y reintentos ante 429"""
+    
+    def __init__(self, rate_limits: Optional[Dict[str, Dict[str, int]]] = None,
+                 default_rpm: int = 0, default_tpm: int = 0, headroom: float = 0.9,
+                 max_retries: int = 3, backoff_base: float = 1.0):
+        self.logger = logger
+        self.rate_limits = dict(rate_limits or {})
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.headroom = headroom
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, ProviderRateLimiter] = {}
+    
+    def get_limiter(self, provider: str) -> ProviderRateLimiter:
+        """Obtener limitador del proveedor"""
+        with self._lock:
+            limiter = self._limiters.get(provider)
+            if limiter is None:
+                limits = self.rate_limits.get(provider, {})
+                limiter = ProviderRateLimiter(
+                    provider,
+                    rpm=limits.get("rpm", self.default_rpm),
+                    tpm=limits.get("tpm", self.default_tpm),
+                    headroom=self.headroom
+                )
+                self._limiters[provider] = limiter
+            return limiter
+    
+    def set_limits(self, provider: str, rpm: int = 0, tpm: int = 0):
+        """Establecer límites RPM/TPM de un proveedor"""
+        with self._lock:
+            self.rate_limits[provider] = {"rpm": rpm, "tpm": tpm}
+            self._limiters.pop(provider, None)
+        self.logger.info(f"Límites de {provider}: {rpm} RPM, {tpm} TPM")
+    
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Espera antes de reintentar: retry-after del proveedor o backoff exponencial con jitter"""
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return retry_after
+        return self.backoff_base * (2 ** attempt) * (0.5 + random.random() / 2)
+    
+    def call(self, provider: str, func: Callable[[], Any], tokens: int,
+             priority: RequestPriority = RequestPriority.NORMAL,
+             call_record: Optional[LLMCallRecord] = None) -> Any:
+        """Ejecutar llamada síncrona respetando el presupuesto del proveedor"""
+        limiter = self.get_limiter(provider)
+        
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire(tokens, priority)
+            try:
+                response = func()
+                limiter.record_usage(tokens, get_response_tokens(response))
+                return response
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                self.logger.warning(f"Límite de {provider} alcanzado, reintentando en {delay:.2f}s")
+                limiter.backoff(delay)
+                if call_record is not None:
+                    call_record.retries += 1
+    
+    async def acall(self, provider: str, func: Callable[[], Any], tokens: int,
+                    priority: RequestPriority = RequestPriority.NORMAL,
+                    call_record: Optional[LLMCallRecord] = None) -> Any:
+        """Ejecutar llamada asíncrona respetando el presupuesto del proveedor"""
+        limiter = self.get_limiter(provider)
+        
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire_async(tokens, priority)
+            try:
+                response = await func()
+                limiter.record_usage(tokens, get_response_tokens(response))
+                return response
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                self.logger.warning(f"Límite de {provider} alcanzado, reintentando en {delay:.2f}s")
+                limiter.backoff(delay)
+                if call_record is not None:
+                    call_record.retries += 1
+    
+    def stream(self, provider: str, func: Callable[[], Iterator[str]], tokens: int,
+               priority: RequestPriority = RequestPriority.NORMAL,
+               call_record: Optional[LLMCallRecord] = None) -> Iterator[str]:
+        """Ejecutar llamada en streaming; solo se reintenta si el 429 llega antes del primer fragmento"""
+        limiter = self.get_limiter(provider)
+        
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire(tokens, priority)
+            started = False
+            try:
+                for chunk in func():
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started or not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                self.logger.warning(f"Límite de {provider} alcanzado, reintentando en {delay:.2f}s")
+                limiter.backoff(delay)
+                if call_record is not None:
+                    call_record.retries += 1
+    
+    async def astream(self, provider: str, func: Callable[[], AsyncIterator[str]], tokens: int,
+                      priority: RequestPriority = RequestPriority.NORMAL,
+                      call_record: Optional[LLMCallRecord] = None) -> AsyncIterator[str]:
+        """Ejecutar llamada asíncrona en streaming respetando el presupuesto del proveedor"""
+        limiter = self.get_limiter(provider)
+        
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire_async(tokens, priority)
+            started = False
+            try:
+                async for chunk in func():
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started or not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                self.logger.warning(f"Límite de {provider} alcanzado, reintentando en {delay:.2f}s")
+                limiter.backoff(delay)
+                if call_record is not None:
+                    call_record.retries += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas por proveedor"""
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {limiter.provider: limiter.get_stats() for limiter in limiters}
+
+
+def get_response_tokens(response: Any) -> Optional[int]:
+    """Tokens consumidos según la respuesta (LLMResponse o mensaje de LangChain)"""
+    total_tokens = getattr(response, 'total_tokens', None)
+    if total_tokens is not None:
+        return total_tokens
+    
+    usage = getattr(response, 'usage_metadata', None)
+    if isinstance(usage, dict):
+        return usage.get('total_tokens')
+    
+    return None
+
+
+def get_response_usage(response: Any) -> Tuple[Optional[int], Optional[int]]:
+    """Tokens de prompt y de respuesta informados por el proveedor (None si no los informa)"""
+    prompt_tokens = getattr(response, 'prompt_tokens', None)
+    completion_tokens = getattr(response, 'completion_tokens', None)
+    
+    usage = getattr(response, 'usage_metadata', None)
+    if isinstance(usage, dict):
+        prompt_tokens = prompt_tokens if prompt_tokens is not None else usage.get('input_tokens')
+        completion_tokens = completion_tokens if completion_tokens is not None else usage.get('output_tokens')
+    
+    return (
+        prompt_tokens if isinstance(prompt_tokens, int) else None,
+        completion_tokens if isinstance(completion_tokens, int) else None
+    )
+
+
+def get_chunk_text(chunk: Any) -> str:
+    """Texto de un fragmento de streaming (str o AIMessageChunk de LangChain)"""
+    if isinstance(chunk, str):
+        return chunk
+    
+    content = getattr(chunk, 'content', '')
+    return content if isinstance(content, str) else ''
+
+
 class LLMManager:
     """Gestor avanzado de LLMs con múltiples proveedores"""
     
@@ -152,11 +889,55 @@ class LLMManager:
         self.config = get_config()
         self.llms: Dict[str, Any] = {}
         self.current_llm: Optional[Any] = None
+        
+        # Límites de peticiones simultáneas por proveedor
+        self.concurrency_limits: Dict[str, int] = dict(self.config.ai.provider_concurrency)
+        # Los semáforos de asyncio están ligados al loop en el que se usan
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._semaphores_lock = threading.Lock()
+        
+        # Presupuestos RPM/TPM por proveedor con carriles de prioridad
+        self.scheduler = RequestScheduler(
+            rate_limits=self.config.ai.provider_rate_limits,
+            default_rpm=self.config.ai.rate_limit_rpm,
+            default_tpm=self.config.ai.rate_limit_tpm,
+            headroom=self.config.ai.rate_limit_headroom,
+            max_retries=self.config.ai.rate_limit_max_retries
+        )
+        
+        # Caché persistente de respuestas
+        self.response_cache: ResponseCache = response_cache
+        
+        # Peticiones cubiertas (hedging) entre el LLM principal y el secundario
+        self._latencies: Dict[str, deque] = {}
+        self._latency_lock = threading.Lock()
+        self.hedging_stats = {"hedged": 0, "secondary_wins": 0, "failovers": 0}
+        self._hedging_lock = threading.Lock()
+        
+        # Prompts idénticos en vuelo comparten una sola petición
+        self.single_flight = SingleFlight()
+        
+        # Trabajos por lotes (API batch del proveedor), creados al primer uso
+        self._batch_runner: Optional[BatchJobRunner] = None
+        
+        # Instrumentación de cada llamada (latencia, tokens, costo, reintentos)
+        self.metrics_collector: Optional[MetricsCollector] = None
+        
+        # Nivel semántico opcional para prompts casi idénticos
+        self.semantic_cache: Optional[SemanticResponseCache] = None
+        if self.config.ai.semantic_cache_enabled:
+            self.enable_semantic_cache()
+        
         self._setup_default_llms()
     
     def _setup_default_llms(self):
         """Configurar LLMs por defecto"""
         try:
+            # Proveedor local simulado: sin red ni API keys
+            if self.config.ai.provider == LLMProvider.LOCAL.value:
+                self.use_local_llms()
+                return
+            
             # LLM principal basado en configuración
             if self.config.ai.provider == "openai":
                 self.llms["primary"] = ChatOpenAI(
@@ -281,6 +1062,41 @@ class LLMManager:
             self.logger.error(f"Error al configurar LLMs: {e}")
             raise
     
+    def use_local_llms(self, **profile_overrides: Any):
+        """Reemplazar los LLMs por el proveedor local simulado (pruebas de carga sin red)
+        
+        El perfil sale de la configuración ai.local_llm_*; profile_overrides
+        permite ajustar latencia, velocidad y errores sin cambiarla.
+        """
+        from ai.local_llm import LocalLLM, LocalLLMProfile, FixtureStore
+        
+        ai_config = self.config.ai
+        settings = {
+            "latency_distribution": ai_config.local_llm_latency_distribution,
+            "latency_mean": ai_config.local_llm_latency_mean,
+            "latency_stddev": ai_config.local_llm_latency_stddev,
+            "tokens_per_second": ai_config.local_llm_tokens_per_second,
+            "error_rate": ai_config.local_llm_error_rate,
+            "rate_limit_rate": ai_config.local_llm_rate_limit_rate,
+            "seed": ai_config.local_llm_seed,
+        }
+        settings.update(profile_overrides)
+        fixtures = FixtureStore(ai_config.local_llm_fixtures_path)
+        
+        # El LLM rápido responde en la mitad de tiempo y al doble de velocidad
+        fast_settings = dict(settings, seed=settings["seed"] + 1,
+                             latency_mean=settings["latency_mean"] / 2,
+                             latency_stddev=settings["latency_stddev"] / 2,
+                             tokens_per_second=settings["tokens_per_second"] * 2)
+        code_settings = dict(settings, seed=settings["seed"] + 2)
+        
+        self.llms["primary"] = LocalLLM("local-primary", LocalLLMProfile(**settings), fixtures)
+        self.llms["fast"] = LocalLLM("local-fast", LocalLLMProfile(**fast_settings), fixtures)
+        self.llms["code"] = LocalLLM("local-code", LocalLLMProfile(**code_settings), fixtures)
+        self.current_llm = self.llms["primary"]
+        
+        self.logger.info(f"LLMs locales simulados configurados ({len(fixtures)} respuestas grabadas)")
+    
     def get_llm(self, llm_type: str = "primary") -> Any:
         """Obtener LLM por tipo"""
         if llm_type not in self.llms:
@@ -297,34 +1113,861 @@ class LLMManager:
         else:
             self.logger.warning(f"LLM tipo '{llm_type}' no encontrado")
     
-    async def generate_async(self, prompt: str, llm_type: str = "primary") -> str:
+    def _get_cache_key(self, llm: Any, prompt: str) -> str:
+        """Clave de caché para un prompt dirigido a un LLM concreto"""
+        return ResponseCache.make_key(
+            provider=get_llm_provider(llm),
+            model=get_llm_model_name(llm),
+            temperature=getattr(llm, 'temperature', None) or 0.0,
+            max_tokens=getattr(llm, 'max_tokens', None) or 0,
+            prompt=prompt
+        )
+    
+    def _get_cache_scope(self, llm: Any) -> str:
+        """Ámbito del caché semántico: solo se reutilizan respuestas del mismo LLM y parámetros"""
+        return ResponseCache.make_key(
+            provider=get_llm_provider(llm),
+            model=get_llm_model_name(llm),
+            temperature=getattr(llm, 'temperature', None) or 0.0,
+            max_tokens=getattr(llm, 'max_tokens', None) or 0,
+            prompt=""
+        )
+    
+    def enable_semantic_cache(self, threshold: Optional[float] = None,
+                              encoder: Optional[Callable[[List[str]], Any]] = None) -> SemanticResponseCache:
+        """Habilitar el nivel semántico del caché de respuestas"""
+        self.semantic_cache = SemanticResponseCache(threshold=threshold, encoder=encoder)
+        self.logger.info(f"Caché semántico habilitado (umbral {self.semantic_cache.threshold})")
+        return self.semantic_cache
+    
+    def disable_semantic_cache(self):
+        """Deshabilitar el nivel semántico del caché de respuestas"""
+        self.semantic_cache = None
+        self.logger.info("Caché semántico deshabilitado")
+    
+    def _lookup_cache(self, llm: Any, prompt: str, use_cache: bool) -> Tuple[Optional[str], Optional[str]]:
+        """Buscar respuesta en el caché exacto y luego en el semántico; devuelve (respuesta, clave)"""
+        if not use_cache:
+            return None, None
+        
+        cache_key = None
+        if self.response_cache.enabled:
+            cache_key = self._get_cache_key(llm, prompt)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached, cache_key
+        
+        if self.semantic_cache is not None:
+            try:
+                cached, similarity = self.semantic_cache.lookup(self._get_cache_scope(llm), prompt)
+                if cached is not None:
+                    self.logger.debug(f"Respuesta reutilizada por similitud semántica: {similarity:.4f}")
+                    # Promover al caché exacto para las siguientes peticiones idénticas
+                    self._store_in_cache(cache_key, llm, cached)
+                    return cached, cache_key
+            except Exception as e:
+                self.logger.warning(f"Error en caché semántico: {e}")
+        
+        return None, cache_key
+    
+    def _store_in_cache(self, cache_key: Optional[str], llm: Any, content: str):
+        """Guardar respuesta en el caché si aplica"""
+        if cache_key is not None:
+            self.response_cache.put(
+                cache_key, content,
+                provider=get_llm_provider(llm),
+                model=get_llm_model_name(llm)
+            )
+    
+    def _store_response(self, cache_key: Optional[str], llm: Any, prompt: str, content: str,
+                        use_cache: bool):
+        """Guardar respuesta generada en ambos niveles del caché"""
+        if not use_cache:
+            return
+        
+        self._store_in_cache(cache_key, llm, content)
+        
+        if self.semantic_cache is not None:
+            try:
+                self.semantic_cache.add(self._get_cache_scope(llm), prompt, content)
+            except Exception as e:
+                self.logger.warning(f"Error al guardar en caché semántico: {e}")
+    
+    def _get_coalescing_key(self, llm: Any, prompt: str, coalesce: Optional[bool],
+                            use_cache: bool) -> Optional[str]:
+        """Clave single-flight del prompt normalizado y los parámetros del LLM; None si no se agrupa
+        
+        Por defecto solo se agrupan las llamadas que aceptan respuestas en caché:
+        quien pide use_cache=False espera una respuesta propia.
+        """
+        if coalesce is None:
+            coalesce = self.config.ai.request_coalescing_enabled and use_cache
+        if not coalesce:
+            return None
+        
+        return ResponseCache.make_key(
+            provider=get_llm_provider(llm),
+            model=get_llm_model_name(llm),
+            temperature=getattr(llm, 'temperature', None) or 0.0,
+            max_tokens=getattr(llm, 'max_tokens', None) or 0,
+            prompt=SemanticResponseCache.normalize_prompt(prompt)
+        )
+    
+    def get_coalescing_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas de prompts idénticos agrupados en vuelo"""
+        return self.single_flight.get_stats()
+    
+    def invoke(self, prompt: str, llm_type: str = "primary", llm: Optional[Any] = None,
+               use_cache: bool = True, priority: RequestPriority = RequestPriority.NORMAL,
+               hedge: Optional[bool] = None, call_tags: Optional[Dict[str, str]] = None,
+               coalesce: Optional[bool] = None) -> str:
+        """Generar respuesta de forma síncrona pasando por el caché de respuestas"""
+        try:
+            llm = llm or self.get_llm(llm_type)
+            
+            cached, cache_key = self._lookup_cache(llm, prompt, use_cache)
+            if cached is not None:
+                return cached
+            
+            tags = self._get_call_tags(call_tags)
+            
+            def generate() -> str:
+                target, key = llm, cache_key
+                partner = self._get_hedge_partner(target, hedge)
+                if partner is not None:
+                    response, target = self._invoke_hedged(target, partner, prompt, priority, tags)
+                    key = self._winner_cache_key(key, target, prompt)
+                else:
+                    response = self._call_llm(target, prompt, priority, tags)
+                content = response.content
+                self._store_response(key, target, prompt, content, use_cache)
+                return content
+            
+            coalescing_key = self._get_coalescing_key(llm, prompt, coalesce, use_cache)
+            if coalescing_key is None:
+                return generate()
+            return self.single_flight.do(coalescing_key, generate)
+            
+        except Exception as e:
+            self.logger.error(f"Error en generación: {e}")
+            raise
+    
+    async def generate_async(self, prompt: str, llm_type: str = "primary", llm: Optional[Any] = None,
+                             use_cache: bool = True,
+                             priority: RequestPriority = RequestPriority.NORMAL,
+                             hedge: Optional[bool] = None,
+                             call_tags: Optional[Dict[str, str]] = None,
+                             coalesce: Optional[bool] = None) -> str:
         """Generar respuesta de forma asíncrona"""
         try:
-            llm = self.get_llm(llm_type)
-            response = await llm.ainvoke(prompt)
-            return response.content
+            llm = llm or self.get_llm(llm_type)
+            loop = asyncio.get_running_loop()
+            
+            # El cálculo de embeddings del caché semántico no debe bloquear el event loop
+            if use_cache and self.semantic_cache is not None:
+                cached, cache_key = await loop.run_in_executor(
+                    shared_client_pool.get_executor(), self._lookup_cache, llm, prompt, use_cache
+                )
+            else:
+                cached, cache_key = self._lookup_cache(llm, prompt, use_cache)
+            if cached is not None:
+                return cached
+            
+            tags = self._get_call_tags(call_tags)
+            
+            async def generate() -> str:
+                target, key = llm, cache_key
+                partner = self._get_hedge_partner(target, hedge)
+                if partner is not None:
+                    response, target = await self._ainvoke_hedged(target, partner, prompt, priority, tags)
+                    key = self._winner_cache_key(key, target, prompt)
+                else:
+                    response = await self._acall_llm(target, prompt, priority, tags)
+                if use_cache and self.semantic_cache is not None:
+                    await loop.run_in_executor(
+                        shared_client_pool.get_executor(), self._store_response,
+                        key, target, prompt, response.content, use_cache
+                    )
+                else:
+                    self._store_response(key, target, prompt, response.content, use_cache)
+                return response.content
+            
+            coalescing_key = self._get_coalescing_key(llm, prompt, coalesce, use_cache)
+            if coalescing_key is None:
+                return await generate()
+            return await self.single_flight.ado(coalescing_key, generate)
             
         except Exception as e:
             self.logger.error(f"Error en generación asíncrona: {e}")
             raise
     
-    def generate_batch(self, prompts: List[str], llm_type: str = "primary") -> List[str]:
-        """Generar respuestas en lote"""
+    def _latency_key(self, llm: Any) -> str:
+        """Identificador del LLM para el historial de latencias"""
+        return f"{get_llm_provider(llm)}:{get_llm_model_name(llm)}"
+    
+    def _record_latency(self, llm: Any, latency: float):
+        """Registrar latencia del proveedor en una respuesta exitosa (sin la espera en el planificador)"""
+        key = self._latency_key(llm)
+        with self._latency_lock:
+            history = self._latencies.get(key)
+            if history is None:
+                history = deque(maxlen=self.config.ai.hedge_latency_window)
+                self._latencies[key] = history
+            history.append(latency)
+    
+    def get_latency_percentile(self, llm: Any, percentile: float) -> Optional[float]:
+        """Percentil de latencia observado de un LLM (None si no hay muestras suficientes)"""
+        with self._latency_lock:
+            history = sorted(self._latencies.get(self._latency_key(llm), ()))
+        
+        if len(history) < self.config.ai.hedge_min_samples:
+            return None
+        
+        index = min(len(history) - 1, int(round(percentile / 100.0 * (len(history) - 1))))
+        return history[index]
+    
+    def get_hedge_delay(self, llm: Any) -> float:
+        """Espera antes de lanzar la petición de cobertura al LLM secundario"""
+        threshold = self.get_latency_percentile(llm, self.config.ai.hedge_latency_percentile)
+        if threshold is None:
+            return self.config.ai.hedge_default_delay
+        
+        return max(self.config.ai.hedge_min_delay, threshold)
+    
+    def _get_hedge_partner(self, llm: Any, hedge: Optional[bool]) -> Optional[Any]:
+        """LLM secundario para cubrir peticiones al principal, si el hedging aplica"""
+        if hedge is None:
+            hedge = self.config.ai.hedging_enabled
+        if not hedge or llm is None or llm is not self.llms.get("primary"):
+            return None
+        
+        partner = self.llms.get(self.config.ai.hedge_llm_type)
+        if partner is None or partner is llm:
+            return None
+        
+        return partner
+    
+    def _winner_cache_key(self, cache_key: Optional[str], winner: Any, prompt: str) -> Optional[str]:
+        """Clave de caché del LLM que respondió (la respuesta se guarda bajo su propio modelo)"""
+        if cache_key is None:
+            return None
+        
+        return self._get_cache_key(winner, prompt)
+    
+    def _call_llm(self, llm: Any, prompt: str, priority: RequestPriority,
+                  tags: Optional[Dict[str, str]] = None) -> Any:
+        """Llamada síncrona al LLM a través del planificador, registrando su latencia"""
+        record = self._start_call(llm, prompt, tags)
+        provider_latency = 0.0
+        
+        def invoke():
+            nonlocal provider_latency
+            start = time.perf_counter()
+            response = llm.invoke(prompt)
+            provider_latency = time.perf_counter() - start
+            return response
+        
+        try:
+            response = self.scheduler.call(
+                record.provider, invoke,
+                tokens=self._estimate_request_tokens(llm, prompt, record.prompt_tokens),
+                priority=priority, call_record=record
+            )
+        except BaseException as e:
+            self._finish_call(record, error=e)
+            raise
+        
+        self._finish_call(record, response=response)
+        # El percentil de cobertura usa solo la latencia del proveedor: la cola del
+        # planificador lo inflaría justo cuando el sistema está saturado
+        self._record_latency(llm, provider_latency)
+        return response
+    
+    async def _acall_llm(self, llm: Any, prompt: str, priority: RequestPriority,
+                         tags: Optional[Dict[str, str]] = None) -> Any:
+        """Llamada asíncrona al LLM a través del planificador, registrando su latencia"""
+        record = self._start_call(llm, prompt, tags)
+        provider_latency = 0.0
+        
+        async def ainvoke():
+            nonlocal provider_latency
+            start = time.perf_counter()
+            response = await llm.ainvoke(prompt)
+            provider_latency = time.perf_counter() - start
+            return response
+        
+        try:
+            response = await self.scheduler.acall(
+                record.provider, ainvoke,
+                tokens=self._estimate_request_tokens(llm, prompt, record.prompt_tokens),
+                priority=priority, call_record=record
+            )
+        except BaseException as e:
+            self._finish_call(record, error=e)
+            raise
+        
+        self._finish_call(record, response=response)
+        # El percentil de cobertura usa solo la latencia del proveedor: la cola del
+        # planificador lo inflaría justo cuando el sistema está saturado
+        self._record_latency(llm, provider_latency)
+        return response
+    
+    def _invoke_hedged(self, primary: Any, secondary: Any, prompt: str,
+                       priority: RequestPriority, tags: Optional[Dict[str, str]] = None) -> Tuple[Any, Any]:
+        """Petición síncrona cubierta: si el principal no responde a tiempo se lanza el secundario
+        
+        Devuelve la respuesta y el LLM que la produjo. Las llamadas síncronas no se
+        pueden interrumpir: la petición perdedora se abandona y su resultado se descarta.
+        """
+        executor = shared_client_pool.get_executor()
+        delay = self.get_hedge_delay(primary)
+        
+        primary_future = executor.submit(self._call_llm, primary, prompt, priority, tags)
+        try:
+            return primary_future.result(timeout=delay), primary
+        except FuturesTimeoutError:
+            self._count_hedging("hedged")
+            self.logger.info(f"LLM principal sin respuesta tras {delay:.2f}s, lanzando petición de cobertura")
+        except Exception as e:
+            self._count_hedging("failovers")
+            self.logger.warning(f"Fallo del LLM principal, usando secundario: {e}")
+            return self._call_llm(secondary, prompt, priority, tags), secondary
+        
+        secondary_future = executor.submit(self._call_llm, secondary, prompt, priority, tags)
+        pending = {primary_future: primary, secondary_future: secondary}
+        last_error: Optional[Exception] = None
+        
+        while pending:
+            done, _ = wait_futures(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                llm = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                
+                for loser in pending:
+                    loser.cancel()
+                if llm is secondary:
+                    self._count_hedging("secondary_wins")
+                return response, llm
+        
+        raise last_error
+    
+    async def _ainvoke_hedged(self, primary: Any, secondary: Any, prompt: str,
+                              priority: RequestPriority,
+                              tags: Optional[Dict[str, str]] = None) -> Tuple[Any, Any]:
+        """Petición asíncrona cubierta: gana la primera respuesta y la otra se cancela"""
+        delay = self.get_hedge_delay(primary)
+        tasks: Dict[asyncio.Future, Any] = {}
+        
+        primary_task = asyncio.ensure_future(self._acall_llm(primary, prompt, priority, tags))
+        tasks[primary_task] = primary
         try:
-            llm = self.get_llm(llm_type)
-            responses = []
+            try:
+                response = await asyncio.wait_for(asyncio.shield(primary_task), timeout=delay)
+                return response, primary
+            except asyncio.TimeoutError:
+                self._count_hedging("hedged")
+                self.logger.info(f"LLM principal sin respuesta tras {delay:.2f}s, lanzando petición de cobertura")
+            except Exception as e:
+                self._count_hedging("failovers")
+                self.logger.warning(f"Fallo del LLM principal, usando secundario: {e}")
+                tasks.pop(primary_task)
+                return await self._acall_llm(secondary, prompt, priority, tags), secondary
+            
+            secondary_task = asyncio.ensure_future(self._acall_llm(secondary, prompt, priority, tags))
+            tasks[secondary_task] = secondary
+            last_error: Optional[BaseException] = None
             
-            for prompt in prompts:
-                response = llm.invoke(prompt)
-                responses.append(response.content)
+            while tasks:
+                done, _ = await asyncio.wait(list(tasks), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    llm = tasks.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        continue
+                    
+                    if llm is secondary:
+                        self._count_hedging("secondary_wins")
+                    return task.result(), llm
+            
+            raise last_error
+        
+        finally:
+            # Cancelar la petición perdedora (o ambas si se cancela la llamada)
+            for task in tasks:
+                task.cancel()
+    
+    def _count_hedging(self, key: str):
+        """Incrementar un contador de hedging (se llama desde hilos del executor)"""
+        with self._hedging_lock:
+            self.hedging_stats[key] += 1
+    
+    def get_hedging_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas de peticiones cubiertas y failover"""
+        with self._hedging_lock:
+            stats = dict(self.hedging_stats)
+        primary = self.llms.get("primary")
+        stats["hedge_delay"] = self.get_hedge_delay(primary) if primary is not None else None
+        return stats
+    
+    def _stream_source(self, llm: Any, prompt: str) -> Iterator[str]:
+        """Fragmentos del LLM; los LLM sin streaming entregan la respuesta completa"""
+        if hasattr(llm, 'stream'):
+            for chunk in llm.stream(prompt):
+                text = get_chunk_text(chunk)
+                if text:
+                    yield text
+        else:
+            yield llm.invoke(prompt).content
+    
+    async def _astream_source(self, llm: Any, prompt: str) -> AsyncIterator[str]:
+        """Fragmentos asíncronos del LLM"""
+        if hasattr(llm, 'astream'):
+            async for chunk in llm.astream(prompt):
+                text = get_chunk_text(chunk)
+                if text:
+                    yield text
+        else:
+            yield (await llm.ainvoke(prompt)).content
+    
+    def stream(self, prompt: str, llm_type: str = "primary", llm: Optional[Any] = None,
+               use_cache: bool = True, priority: RequestPriority = RequestPriority.NORMAL,
+               call_tags: Optional[Dict[str, str]] = None) -> Iterator[str]:
+        """Generar respuesta entregando fragmentos de texto a medida que llegan
+        
+        Una respuesta cacheada se entrega como un único fragmento. La respuesta
+        completa se guarda en el caché solo si el stream termina sin errores.
+        """
+        try:
+            llm = llm or self.get_llm(llm_type)
             
-            self.logger.info(f"Generadas {len(responses)} respuestas en lote")
-            return responses
+            cached, cache_key = self._lookup_cache(llm, prompt, use_cache)
+            if cached is not None:
+                yield cached
+                return
+            
+            chunks = []
+            record = self._start_call(llm, prompt, self._get_call_tags(call_tags), streamed=True)
+            try:
+                for chunk in self.scheduler.stream(
+                    record.provider, lambda: self._stream_source(llm, prompt),
+                    tokens=self._estimate_request_tokens(llm, prompt, record.prompt_tokens),
+                    priority=priority, call_record=record
+                ):
+                    self._mark_first_token(record)
+                    chunks.append(chunk)
+                    yield chunk
+            except BaseException as e:
+                self._finish_call(record, content="".join(chunks), error=e)
+                raise
+            
+            self._finish_call(record, content="".join(chunks))
+            self._store_response(cache_key, llm, prompt, "".join(chunks), use_cache)
+            
+        except Exception as e:
+            self.logger.error(f"Error en generación en streaming: {e}")
+            raise
+    
+    async def astream(self, prompt: str, llm_type: str = "primary", llm: Optional[Any] = None,
+                      use_cache: bool = True,
+                      priority: RequestPriority = RequestPriority.NORMAL,
+                      call_tags: Optional[Dict[str, str]] = None) -> AsyncIterator[str]:
+        """Generar respuesta en streaming de forma asíncrona"""
+        try:
+            llm = llm or self.get_llm(llm_type)
+            loop = asyncio.get_running_loop()
+            executor = shared_client_pool.get_executor()
+            
+            cached, cache_key = await loop.run_in_executor(
+                executor, self._lookup_cache, llm, prompt, use_cache
+            )
+            if cached is not None:
+                yield cached
+                return
+            
+            chunks = []
+            record = self._start_call(llm, prompt, self._get_call_tags(call_tags), streamed=True)
+            try:
+                async for chunk in self.scheduler.astream(
+                    record.provider, lambda: self._astream_source(llm, prompt),
+                    tokens=self._estimate_request_tokens(llm, prompt, record.prompt_tokens),
+                    priority=priority, call_record=record
+                ):
+                    self._mark_first_token(record)
+                    chunks.append(chunk)
+                    yield chunk
+            except BaseException as e:
+                self._finish_call(record, content="".join(chunks), error=e)
+                raise
+            
+            self._finish_call(record, content="".join(chunks))
+            
+            await loop.run_in_executor(
+                executor, self._store_response, cache_key, llm, prompt, "".join(chunks), use_cache
+            )
+            
+        except Exception as e:
+            self.logger.error(f"Error en generación asíncrona en streaming: {e}")
+            raise
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas del caché de respuestas"""
+        stats = self.response_cache.get_stats()
+        stats["semantic"] = self.semantic_cache.get_stats() if self.semantic_cache is not None else None
+        return stats
+    
+    def _estimate_request_tokens(self, llm: Any, prompt: str, prompt_tokens: Optional[int] = None) -> int:
+        """Tokens que la petición descuenta del presupuesto TPM: prompt más la salida máxima"""
+        if prompt_tokens is None:
+            prompt_tokens = tokenizer_registry.count_tokens(prompt, get_llm_model_name(llm))
+        return max(1, prompt_tokens) + (getattr(llm, 'max_tokens', None) or 0)
+    
+    def _get_call_tags(self, call_tags: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """Etiquetas de la llamada: las del contexto (llm_call_context) más las explícitas"""
+        tags = dict(_llm_call_tags.get() or {})
+        tags.update({key: str(value) for key, value in (call_tags or {}).items() if value})
+        return tags
+    
+    def _start_call(self, llm: Any, prompt: str, tags: Optional[Dict[str, str]] = None,
+                    streamed: bool = False) -> LLMCallRecord:
+        """Iniciar la medición de una llamada"""
+        tags = tags or {}
+        model = get_llm_model_name(llm)
+        return LLMCallRecord(
+            provider=get_llm_provider(llm),
+            model=model,
+            agent=tags.get("agent", "unknown"),
+            template=tags.get("template", "unknown"),
+            streamed=streamed,
+            prompt_tokens=tokenizer_registry.count_tokens(prompt, model)
+        )
+    
+    @staticmethod
+    def _mark_first_token(record: LLMCallRecord):
+        """Registrar el tiempo hasta el primer fragmento"""
+        if record.time_to_first_token is None:
+            record.time_to_first_token = time.perf_counter() - record.started_at
+    
+    def _finish_call(self, record: LLMCallRecord, response: Any = None, content: Optional[str] = None,
+                     error: Optional[BaseException] = None):
+        """Completar la medición de una llamada y publicarla en el recolector de métricas"""
+        record.latency = time.perf_counter() - record.started_at
+        # Sin streaming, el primer token llega con la respuesta completa
+        if record.time_to_first_token is None and error is None:
+            record.time_to_first_token = record.latency
+        
+        if error is not None:
+            record.success = False
+            record.error = f"{type(error).__name__}: {error}"
+        
+        prompt_tokens, completion_tokens = get_response_usage(response)
+        if prompt_tokens is not None:
+            record.prompt_tokens = prompt_tokens
+        if content is None and response is not None:
+            content = getattr(response, 'content', None)
+        if completion_tokens is None and isinstance(content, str):
+            completion_tokens = tokenizer_registry.count_tokens(content, record.model)
+        record.completion_tokens = completion_tokens or 0
+        record.cost = tokenizer_registry.estimate_cost(record.model, record.prompt_tokens, record.completion_tokens)
+        
+        self._record_call(record)
+    
+    def _record_call(self, record: LLMCallRecord):
+        """Publicar la medición de una llamada como métricas etiquetadas"""
+        if not self.config.ai.llm_metrics_enabled:
+            return
+        
+        try:
+            collector = self.metrics_collector or get_metrics_collector()
+            tags = record.tags
+            metadata = {"streamed": record.streamed}
+            if record.error:
+                metadata["error"] = record.error
+            
+            values = {
+                "llm_latency": record.latency,
+                "llm_prompt_tokens": record.prompt_tokens,
+                "llm_completion_tokens": record.completion_tokens,
+                "llm_cost": record.cost,
+                "llm_retries": record.retries
+            }
+            if record.time_to_first_token is not None:
+                values["llm_time_to_first_token"] = record.time_to_first_token
+            
+            for name, value in values.items():
+                collector.record_metric(name, float(value), tags=tags, metadata=metadata)
+                
+        except Exception as e:
+            self.logger.warning(f"Error al registrar métricas de la llamada: {e}")
+    
+    def set_metrics_collector(self, collector: Optional[MetricsCollector]):
+        """Usar un recolector de métricas propio (None = recolector compartido)"""
+        self.metrics_collector = collector
+    
+    def get_call_metrics(self, group_by: str = "agent", metric: str = "llm_latency",
+                         period_hours: int = 24) -> List[Dict[str, Any]]:
+        """Desglose p50/p95/p99 de una métrica de llamadas por agente, template, proveedor o modelo"""
+        collector = self.metrics_collector or get_metrics_collector()
+        return collector.get_metric_breakdown(metric, group_by, period_hours=period_hours)
+    
+    def set_rate_limits(self, provider: str, rpm: int = 0, tpm: int = 0):
+        """Establecer límites de peticiones y tokens por minuto de un proveedor"""
+        self.scheduler.set_limits(provider, rpm=rpm, tpm=tpm)
+    
+    def get_scheduler_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas del planificador de peticiones"""
+        return self.scheduler.get_stats()
+    
+    def get_provider(self, llm_type: str = "primary") -> str:
+        """Obtener proveedor del LLM por tipo"""
+        return get_llm_provider(self.get_llm(llm_type))
+    
+    def get_concurrency_limit(self, provider: str) -> int:
+        """Obtener límite de peticiones simultáneas de un proveedor"""
+        return self.concurrency_limits.get(provider, self.config.ai.max_concurrent_requests)
+    
+    def set_concurrency_limit(self, provider: str, limit: int):
+        """Establecer límite de peticiones simultáneas de un proveedor"""
+        if limit < 1:
+            raise ValueError("El límite de concurrencia debe ser mayor que 0")
+        
+        self.concurrency_limits[provider] = limit
+        with self._semaphores_lock:
+            for semaphores in self._semaphores.values():
+                semaphores.pop(provider, None)
+        self.logger.info(f"Límite de concurrencia para {provider}: {limit}")
+    
+    def _get_semaphore(self, provider: str) -> asyncio.Semaphore:
+        """Obtener semáforo del proveedor para el event loop actual"""
+        loop = asyncio.get_running_loop()
+        with self._semaphores_lock:
+            semaphores = self._semaphores.setdefault(loop, {})
+            semaphore = semaphores.get(provider)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.get_concurrency_limit(provider))
+                semaphores[provider] = semaphore
+            return semaphore
+    
+    async def _generate_indexed(self, index: int, prompt: str, llm_type: str,
+                                provider_semaphore: asyncio.Semaphore,
+                                batch_semaphore: Optional[asyncio.Semaphore],
+                                use_cache: bool = True,
+                                priority: RequestPriority = RequestPriority.BULK) -> BatchResult:
+        """Generar un prompt del lote capturando su error"""
+        result = BatchResult(index=index, prompt=prompt)
+        
+        # El límite del lote se adquiere primero para no retener cupos del proveedor
+        async with batch_semaphore or nullcontext():
+            async with provider_semaphore:
+                start_time = time.perf_counter()
+                try:
+                    result.content = await self.generate_async(prompt, llm_type, use_cache=use_cache,
+                                                                 priority=priority)
+                except Exception as e:
+                    result.error = str(e) or type(e).__name__
+                finally:
+                    result.latency = time.perf_counter() - start_time
+        
+        return result
+    
+    def _create_batch_tasks(self, prompts: List[str], llm_type: str,
+                            max_concurrency: Optional[int], use_cache: bool,
+                            priority: RequestPriority) -> List[asyncio.Task]:
+        """Crear tareas concurrentes para un lote de prompts"""
+        provider_semaphore = self._get_semaphore(self.get_provider(llm_type))
+        batch_semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        
+        return [
+            asyncio.create_task(
+                self._generate_indexed(index, prompt, llm_type, provider_semaphore,
+                                       batch_semaphore, use_cache, priority)
+            )
+            for index, prompt in enumerate(prompts)
+        ]
+    
+    async def agenerate_batch(self, prompts: List[str], llm_type: str = "primary",
+                              max_concurrency: Optional[int] = None,
+                              use_cache: bool = True,
+                              priority: RequestPriority = RequestPriority.BULK) -> List[BatchResult]:
+        """Generar respuestas en lote de forma concurrente, conservando el orden de entrada"""
+        if not prompts:
+            return []
+        
+        tasks = self._create_batch_tasks(prompts, llm_type, max_concurrency, use_cache, priority)
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        
+        failed = sum(1 for r in results if not r.success)
+        self.logger.info(f"Generadas {len(results) - failed}/{len(results)} respuestas en lote")
+        if failed:
+            self.logger.warning(f"{failed} prompts del lote fallaron")
+        
+        return results
+    
+    async def agenerate_batch_stream(self, prompts: List[str], llm_type: str = "primary",
+                                     max_concurrency: Optional[int] = None,
+                                     use_cache: bool = True,
+                                     priority: RequestPriority = RequestPriority.BULK) -> AsyncIterator[BatchResult]:
+        """Generar respuestas en lote entregando cada resultado al completarse"""
+        if not prompts:
+            return
+        
+        tasks = self._create_batch_tasks(prompts, llm_type, max_concurrency, use_cache, priority)
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    def generate_batch(self, prompts: List[str], llm_type: str = "primary",
+                       max_concurrency: Optional[int] = None,
+                       use_cache: bool = True,
+                       priority: RequestPriority = RequestPriority.BULK) -> List[Optional[str]]:
+        """Generar respuestas en lote (None en los prompts que fallaron)"""
+        try:
+            results = self._run_sync(
+                self.agenerate_batch(prompts, llm_type, max_concurrency, use_cache, priority)
+            )
+            return [r.content for r in results]
             
         except Exception as e:
             self.logger.error(f"Error en generación en lote: {e}")
             raise
     
+    def _create_batch_transport(self) -> BatchTransport:
+        """Transporte de lotes según la configuración"""
+        if self.config.ai.batch_transport == "openai":
+            api_key = self.config.ai.openai_api_key or os.getenv("OPENAI_API_KEY")
+            client = shared_client_pool.get_openai_client(api_key, OPENAI_BASE_URL)
+            return OpenAIBatchTransport(client, self.config.ai.batch_completion_window)
+        
+        return FileDropTransport(self.config.ai.batch_file_drop_path)
+    
+    def get_batch_runner(self) -> BatchJobRunner:
+        """Ejecutor de trabajos por lotes (persistidos en ai.batch_jobs_path)"""
+        if self._batch_runner is None:
+            self._batch_runner = BatchJobRunner(
+                BatchJobStore(self.config.ai.batch_jobs_path),
+                self._create_batch_transport(),
+                max_requests=self.config.ai.batch_max_requests
+            )
+        return self._batch_runner
+    
+    def set_batch_transport(self, transport: BatchTransport, jobs_path: Optional[str] = None):
+        """Usar otro transporte de lotes (p. ej. FileDropTransport en pruebas)"""
+        self._batch_runner = BatchJobRunner(
+            BatchJobStore(jobs_path or self.config.ai.batch_jobs_path), transport,
+            max_requests=self.config.ai.batch_max_requests
+        )
+    
+    def submit_batch_job(self, items: List[Tuple[Any, str]], llm_type: str = "primary",
+                         llm: Optional[Any] = None) -> List[BatchJob]:
+        """Empaquetar prompts (AgentTask o task_id, prompt) en trabajos por lotes y enviarlos
+        
+        La latencia no importa: el proveedor los procesa dentro de su ventana
+        de finalización a menor costo. Devuelve un trabajo por archivo de lote.
+        """
+        try:
+            llm = llm or self.get_llm(llm_type)
+            provider = get_llm_provider(llm)
+            runner = self.get_batch_runner()
+            if not runner.transport.supports(provider):
+                raise ValueError(
+                    f"El transporte de lotes {type(runner.transport).__name__} "
+                    f"no admite modelos del proveedor {provider}"
+                )
+            
+            requests = runner.build_requests(items)
+            jobs = runner.create_jobs(
+                requests,
+                provider=provider,
+                model=get_llm_model_name(llm),
+                temperature=getattr(llm, 'temperature', None) or 0.0,
+                max_tokens=getattr(llm, 'max_tokens', None) or self.config.ai.max_tokens
+            )
+            for job in jobs:
+                runner.submit(job)
+            
+            self.logger.info(f"{len(requests)} prompts enviados en {len(jobs)} trabajos por lotes")
+            return jobs
+            
+        except Exception as e:
+            self.logger.error(f"Error al enviar trabajos por lotes: {e}")
+            raise
+    
+    def _load_batch_job(self, job_id: str) -> BatchJob:
+        """Cargar un trabajo por lotes guardado"""
+        job = self.get_batch_runner().store.load(job_id)
+        if job is None:
+            raise KeyError(f"Trabajo por lotes no encontrado: {job_id}")
+        return job
+    
+    def poll_batch_job(self, job_id: str) -> BatchJob:
+        """Consultar (y avanzar) el estado de un trabajo por lotes"""
+        return self.get_batch_runner().poll(self._load_batch_job(job_id))
+    
+    def get_batch_job_results(self, job_id: str, use_cache: bool = True) -> List[BatchJobResult]:
+        """Resultados de un trabajo completado, guardándolos en el caché de respuestas"""
+        runner = self.get_batch_runner()
+        job = self._load_batch_job(job_id)
+        results = runner.results(job)
+        
+        if use_cache and self.response_cache.enabled and results:
+            prompts = runner.prompts(job)
+            for result in results:
+                if result.success and result.custom_id in prompts:
+                    cache_key = ResponseCache.make_key(
+                        job.provider, job.model, job.temperature, job.max_tokens, prompts[result.custom_id]
+                    )
+                    self.response_cache.put(cache_key, result.content, provider=job.provider, model=job.model)
+        
+        return results
+    
+    def wait_for_batch_job(self, job_id: str, poll_interval: Optional[float] = None,
+                           timeout: Optional[float] = None) -> List[BatchJobResult]:
+        """Sondear un trabajo hasta que termine y devolver sus resultados"""
+        runner = self.get_batch_runner()
+        job = runner.wait(
+            self._load_batch_job(job_id),
+            poll_interval=self.config.ai.batch_poll_interval if poll_interval is None else poll_interval,
+            timeout=timeout
+        )
+        if job.state != JOB_COMPLETED:
+            raise RuntimeError(job.error or f"Trabajo por lotes {job_id} en estado {job.state}")
+        return self.get_batch_job_results(job_id)
+    
+    def resume_batch_jobs(self) -> List[BatchJob]:
+        """Reanudar tras un reinicio: enviar o sondear los trabajos pendientes"""
+        runner = self.get_batch_runner()
+        jobs = []
+        for job in runner.store.list_jobs(pending_only=True):
+            try:
+                jobs.append(runner.poll(job))
+            except Exception as e:
+                self.logger.error(f"Error al reanudar trabajo por lotes {job.job_id}: {e}")
+                jobs.append(job)
+        
+        if jobs:
+            self.logger.info(f"{len(jobs)} trabajos por lotes reanudados")
+        return jobs
+    
+    def _run_sync(self, coroutine: Any) -> Any:
+        """Ejecutar una corrutina desde código síncrono en el loop de fondo compartido
+        
+        Todas las llamadas síncronas comparten loop, así que el límite por
+        proveedor se respeta entre hilos y los clientes asíncronos se reutilizan.
+        """
+        return shared_client_pool.run(coroutine)
+    
     def get_available_llms(self) -> List[str]:
         """Obtener LLMs disponibles"""
         return list(self.llms.keys())
@@ -342,3 +1985,17 @@ class LLMManager:
             "max_tokens": getattr(llm, 'max_tokens', 4000),
             "timeout": getattr(llm, 'timeout', 30)
         }
+
+
+_llm_manager: Optional[LLMManager] = None
+_llm_manager_lock = threading.Lock()
+
+
+def get_llm_manager() -> LLMManager:
+    """Obtener el gestor de LLMs compartido (creado bajo demanda)"""
+    global _llm_manager
+    if _llm_manager is None:
+        with _llm_manager_lock:
+            if _llm_manager is None:
+                _llm_manager = LLMManager()
+    return _llm_manager
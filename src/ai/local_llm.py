@@ -0,0 +1,315 @@
+"""
+LLM local determinista para pruebas de carga sin red
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import Dict, List, Any, Optional, AsyncIterator, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+
+from utils.logging import get_logger
+from ai.llm_manager import LLMResponse
+from ai.token_budget import tokenizer_registry
+
+logger = get_logger("local-llm")
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+
+# Fragmentos de texto entregados en streaming (palabra + espacios)
+STREAM_CHUNK_PATTERN = re.compile(r"\S+\s*|\s+")
+
+
+class LocalLLMError(Exception):
+    """Error simulado del proveedor local"""
+    
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LocalRateLimitError(LocalLLMError):
+    """429 simulado; retry_delay imita el retraso que informan los proveedores"""
+    
+    def __init__(self, message: str, retry_delay: float = 1.0):
+        super().__init__(message, status_code=429)
+        self.retry_delay = retry_delay
+
+
+def prompt_key(prompt: str) -> str:
+    """Clave estable de un prompt"""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class FixtureStore:
+    """Respuestas grabadas por prompt en un archivo JSON Lines
+    
+    Cada línea es {"key": sha256(prompt), "completion": "..."}; las líneas
+    posteriores reemplazan a las anteriores, así que grabar es solo añadir.
+    """
+    
+    def __init__(self, path: Optional[str] = None):
+        self.logger = logger
+        self.path = Path(path) if path else None
+        self.completions: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        self.load()
+    
+    def load(self):
+        """Cargar las respuestas grabadas"""
+        if self.path is None or not self.path.exists():
+            return
+        
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    self.completions[entry["key"]] = entry["completion"]
+                except (ValueError, KeyError) as e:
+                    self.logger.warning(f"Fixture inválido en {self.path}:{line_number}: {e}")
+        
+        self.logger.info(f"{len(self.completions)} respuestas grabadas cargadas de {self.path}")
+    
+    def get(self, prompt: str) -> Optional[str]:
+        """Respuesta grabada para el prompt"""
+        with self.lock:
+            return self.completions.get(prompt_key(prompt))
+    
+    def add(self, prompt: str, completion: str):
+        """Grabar la respuesta de un prompt"""
+        key = prompt_key(prompt)
+        with self.lock:
+            self.completions[key] = completion
+            if self.path is not None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"key": key, "completion": completion}, ensure_ascii=False) + "\n")
+    
+    def record(self, llm: Any, prompts: List[str]) -> int:
+        """Grabar las respuestas de un LLM real para reproducirlas después"""
+        recorded = 0
+        for prompt in prompts:
+            response = llm.invoke(prompt)
+            self.add(prompt, getattr(response, "content", str(response)))
+            recorded += 1
+        return recorded
+    
+    def __len__(self) -> int:
+        return len(self.completions)
+
+
+class CSharpTestSynthesizer:
+    """Genera código de pruebas C# plausible y determinista a partir del prompt"""
+    
+    FRAMEWORKS = {
+        "xunit": {"usings": ["Xunit"], "class_attr": "", "test_attr": "[Fact]"},
+        "nunit": {"usings": ["NUnit.Framework"], "class_attr": "[TestFixture]\n", "test_attr": "[Test]"},
+        "mstest": {"usings": ["Microsoft.VisualStudio.TestTools.UnitTesting"],
+                   "class_attr": "[TestClass]\n", "test_attr": "[TestMethod]"},
+    }
+    
+    SCENARIOS = [
+        ("ReturnsExpectedResult_WhenInputIsValid", "Assert.NotNull(result);"),
+        ("ThrowsArgumentException_WhenInputIsInvalid", "Assert.Throws<ArgumentException>(act);"),
+        ("HandlesNullInput", "Assert.NotNull(sut);"),
+        ("CallsDependencyOnce", "dependency.Verify(d => d.Execute(), Times.Once());"),
+    ]
+    
+    def _target(self, prompt: str) -> str:
+        """Nombre del método o componente bajo prueba mencionado en el prompt"""
+        for pattern in (r"Método:\s*(\w+)", r"Componente:\s*(\w+)", r"class\s+(\w+)",
+                        r"public\s+[\w<>\[\],]+\s+(\w+)\s*\("):
+            match = re.search(pattern, prompt)
+            if match:
+                return match.group(1)
+        return "Component"
+    
+    def _framework(self, prompt: str) -> str:
+        """Framework de pruebas pedido (xunit por defecto)"""
+        match = re.search(r"\b(xunit|nunit|mstest)\b", prompt, re.IGNORECASE)
+        return match.group(1).lower() if match else "xunit"
+    
+    def synthesize(self, prompt: str) -> str:
+        """Código de pruebas para el prompt; el mismo prompt produce siempre el mismo código"""
+        rng = random.Random(prompt_key(prompt))
+        target = self._target(prompt)
+        framework = self._framework(prompt)
+        spec = self.FRAMEWORKS[framework]
+        scenarios = rng.sample(self.SCENARIOS, rng.randint(2, len(self.SCENARIOS)))
+        
+        methods = []
+        for name, assertion in scenarios:
+            value = rng.randint(1, 100)
+            methods.append(
+                f"    {spec['test_attr']}\n"
+                f"    public void {target}_{name}()\n"
+                f"    {{\n"
+                f"        // Arrange\n"
+                f"        var dependency = new Mock<IDependency>();\n"
+                f"        var sut = new {target}Service(dependency.Object);\n"
+                f"        var input = {value};\n"
+                f"        Action act = () => sut.{target}(-input);\n"
+                f"\n"
+                f"        // Act\n"
+                f"        var result = sut.{target}(input);\n"
+                f"\n"
+                f"        // Assert\n"
+                f"        {assertion}\n"
+                f"    }}"
+            )
+        
+        usings = "\n".join(f"using {namespace};" for namespace in ["System", "Moq"] + spec["usings"])
+        body = "\n\n".join(methods)
+        return (
+            f"```csharp\n{usings}\n\nnamespace Generated.Tests;\n\n"
+            f"{spec['class_attr']}public class {target}Tests\n{{\n{body}\n}}\n```"
+        )
+
+
+@dataclass
+class LocalLLMProfile:
+    """Comportamiento simulado: latencia, velocidad de generación y errores"""
+    latency_distribution: str = "lognormal"
+    latency_mean: float = 0.5            # Tiempo hasta el primer token (segundos)
+    latency_stddev: float = 0.2
+    tokens_per_second: float = 50.0      # 0 = sin demora de generación
+    error_rate: float = 0.0              # Fracción de llamadas con error 500
+    rate_limit_rate: float = 0.0         # Fracción de llamadas con 429
+    retry_after: float = 1.0
+    seed: int = 0
+
+
+class LocalLLM:
+    """LLM local con la misma interfaz que los wrappers remotos
+    
+    Reproduce respuestas grabadas si existen y, si no, sintetiza código de
+    pruebas C#. La latencia, la velocidad de tokens y los errores siguen el
+    perfil configurado con un generador aleatorio con semilla, de modo que
+    una misma ejecución de carga se puede repetir.
+    """
+    
+    provider = "local"
+    
+    def __init__(self, model: str = "local-test-model", profile: Optional[LocalLLMProfile] = None,
+                 fixtures: Optional[FixtureStore] = None,
+                 synthesizer: Optional[CSharpTestSynthesizer] = None):
+        self.model = model
+        self.profile = profile or LocalLLMProfile()
+        if self.profile.latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Distribución de latencia no soportada: {self.profile.latency_distribution}")
+        
+        self.fixtures = fixtures or FixtureStore()
+        self.synthesizer = synthesizer or CSharpTestSynthesizer()
+        self.tokenizer = tokenizer_registry.get(model)
+        self._rng = random.Random(self.profile.seed)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "fixture_hits": 0, "synthesized": 0, "errors": 0, "rate_limited": 0}
+    
+    def _sample_latency(self) -> float:
+        """Tiempo hasta el primer token según la distribución configurada"""
+        profile = self.profile
+        mean, stddev = profile.latency_mean, profile.latency_stddev
+        if mean <= 0:
+            return 0.0
+        
+        with self._lock:
+            if profile.latency_distribution == "fixed":
+                return mean
+            if profile.latency_distribution == "uniform":
+                return self._rng.uniform(max(0.0, mean - stddev), mean + stddev)
+            if profile.latency_distribution == "normal":
+                return max(0.0, self._rng.gauss(mean, stddev))
+            
+            # Lognormal con la media y desviación pedidas (colas largas como las APIs reales)
+            sigma_squared = math.log(1 + (stddev / mean) ** 2)
+            return self._rng.lognormvariate(math.log(mean) - sigma_squared / 2, math.sqrt(sigma_squared))
+    
+    def _maybe_fail(self):
+        """Inyectar errores según el perfil"""
+        with self._lock:
+            roll = self._rng.random()
+        
+        if roll < self.profile.rate_limit_rate:
+            self._count("rate_limited")
+            raise LocalRateLimitError(f"Límite de peticiones simulado ({self.model})", self.profile.retry_after)
+        if roll < self.profile.rate_limit_rate + self.profile.error_rate:
+            self._count("errors")
+            raise LocalLLMError(f"Error simulado del proveedor ({self.model})")
+    
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+    
+    def _completion(self, prompt: str) -> str:
+        """Respuesta grabada o sintetizada"""
+        self._count("calls")
+        completion = self.fixtures.get(prompt)
+        if completion is not None:
+            self._count("fixture_hits")
+            return completion
+        
+        self._count("synthesized")
+        return self.synthesizer.synthesize(prompt)
+    
+    def _generation_time(self, tokens: int) -> float:
+        """Tiempo de generación de los tokens al ritmo configurado"""
+        rate = self.profile.tokens_per_second
+        return tokens / rate if rate > 0 else 0.0
+    
+    def _to_response(self, prompt: str, completion: str) -> LLMResponse:
+        prompt_tokens = self.tokenizer.count(prompt)
+        completion_tokens = self.tokenizer.count(completion)
+        return LLMResponse(
+            completion,
+            total_tokens=prompt_tokens + completion_tokens,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens
+        )
+    
+    def invoke(self, prompt: str) -> Any:
+        """Invocar modelo de forma síncrona"""
+        time.sleep(self._sample_latency())
+        self._maybe_fail()
+        completion = self._completion(prompt)
+        response = self._to_response(prompt, completion)
+        time.sleep(self._generation_time(response.completion_tokens))
+        return response
+    
+    async def ainvoke(self, prompt: str) -> Any:
+        """Invocar modelo de forma asíncrona"""
+        await asyncio.sleep(self._sample_latency())
+        self._maybe_fail()
+        completion = self._completion(prompt)
+        response = self._to_response(prompt, completion)
+        await asyncio.sleep(self._generation_time(response.completion_tokens))
+        return response
+    
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Invocar modelo entregando fragmentos de texto a medida que se generan"""
+        time.sleep(self._sample_latency())
+        self._maybe_fail()
+        for chunk in STREAM_CHUNK_PATTERN.findall(self._completion(prompt)):
+            yield chunk
+            time.sleep(self._generation_time(self.tokenizer.count(chunk)))
+    
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Invocar modelo en streaming de forma asíncrona"""
+        await asyncio.sleep(self._sample_latency())
+        self._maybe_fail()
+        for chunk in STREAM_CHUNK_PATTERN.findall(self._completion(prompt)):
+            yield chunk
+            await asyncio.sleep(self._generation_time(self.tokenizer.count(chunk)))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas de llamadas simuladas"""
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,289 @@
+"""
+Compresión de código C# para prompts
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import Dict, List, Any, Optional
+from dataclasses import dataclass, field
+import json
+import re
+import threading
+
+from utils.logging import get_logger
+from utils.config import get_config
+from ai.token_budget import tokenizer_registry
+
+logger = get_logger("prompt-compression")
+
+# Directivas using (no sentencias using (...) ni using var)
+USING_DIRECTIVE_PATTERN = re.compile(r"^\s*(global\s+)?using\s+(static\s+)?[\w.]+(\s*=\s*[\w.<>, ]+)?\s*;\s*$")
+
+# Palabras clave cuyo bloque no es el cuerpo de un miembro
+BLOCK_KEYWORDS = {
+    "if", "else", "for", "foreach", "while", "do", "switch", "case", "try", "catch", "finally",
+    "using", "lock", "fixed", "checked", "unchecked", "unsafe", "return", "yield", "await",
+    "namespace", "class", "struct", "interface", "enum", "record", "delegate", "new"
+}
+
+COLLAPSED_BODY = "{ ... }"
+
+# Prefijos de cadenas interpoladas, verbatim y sin formato ($@", @$", $$""")
+LITERAL_PREFIX_PATTERN = re.compile(r"[$@]+\"")
+QUOTE_RUN_PATTERN = re.compile(r"\"+")
+
+
+@dataclass
+class CompressionResult:
+    """Resultado de comprimir código para un prompt"""
+    text: str
+    original_chars: int
+    compressed_chars: int
+    original_tokens: int
+    compressed_tokens: int
+    steps: List[str] = field(default_factory=list)
+    
+    @property
+    def saved_tokens(self) -> int:
+        """Tokens ahorrados"""
+        return self.original_tokens - self.compressed_tokens
+    
+    @property
+    def reduction(self) -> float:
+        """Reducción relativa de tokens (0-1)"""
+        return self.saved_tokens / self.original_tokens if self.original_tokens else 0.0
+
+
+def scan_literal(code: str, index: int) -> int:
+    """Índice justo después del literal de cadena o carácter que empieza en index"""
+    verbatim = False
+    while code[index] in "$@":
+        verbatim = verbatim or code[index] == "@"
+        index += 1
+    
+    quote = code[index]
+    
+    # Literal sin formato de C# 11: se cierra con la misma cantidad (3 o más) de comillas.
+    # En verbatim @""" es una comilla escapada al inicio, no un literal sin formato
+    quote_run = len(QUOTE_RUN_PATTERN.match(code, index).group()) if quote == '"' else 1
+    if quote_run >= 3 and not verbatim:
+        delimiter = quote * quote_run
+        end = code.find(delimiter, index + quote_run)
+        return len(code) if end == -1 else end + quote_run
+    
+    index += 1
+    while index < len(code):
+        char = code[index]
+        if verbatim and char == quote:
+            # "" es una comilla escapada en cadenas verbatim
+            if index + 1 < len(code) and code[index + 1] == quote:
+                index += 2
+                continue
+            return index + 1
+        if not verbatim and char == "\\":
+            index += 2
+            continue
+        if char == quote or (not verbatim and char == "\n"):
+            return index + 1
+        index += 1
+    
+    return index
+
+
+def is_literal_start(code: str, index: int) -> bool:
+    """Indica si en index empieza un literal de cadena o carácter"""
+    char = code[index]
+    if char in "\"'":
+        return True
+    if char in "$@":
+        # $$""" admite tantos $ como llaves de interpolación
+        return bool(LITERAL_PREFIX_PATTERN.match(code, index))
+    return False
+
+
+class CSharpPromptCompressor:
+    """Compresor de código C# para reducir tokens de los prompts
+    
+    Elimina comentarios y líneas en blanco, deduplica directivas using y,
+    cuando solo interesa la superficie pública, reduce los cuerpos de los
+    métodos a su firma. Los literales de cadena se respetan.
+    """
+    
+    def __init__(self, model: Optional[str] = None):
+        self.logger = logger
+        self.model = model or get_config().ai.model
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "original_tokens": 0, "compressed_tokens": 0}
+    
+    def strip_comments(self, code: str) -> str:
+        """Eliminar comentarios de línea, de bloque y de documentación XML"""
+        output = []
+        index = 0
+        length = len(code)
+        
+        while index < length:
+            if is_literal_start(code, index):
+                end = scan_literal(code, index)
+                output.append(code[index:end])
+                index = end
+            elif code.startswith("//", index):
+                end = code.find("\n", index)
+                index = length if end == -1 else end
+            elif code.startswith("/*", index):
+                end = code.find("*/", index + 2)
+                index = length if end == -1 else end + 2
+            else:
+                output.append(code[index])
+                index += 1
+        
+        return "".join(output)
+    
+    @staticmethod
+    def remove_blank_lines(code: str) -> str:
+        """Eliminar líneas en blanco y espacios finales"""
+        return "\n".join(line.rstrip() for line in code.splitlines() if line.strip())
+    
+    @staticmethod
+    def dedupe_usings(code: str) -> str:
+        """Eliminar directivas using repetidas (p. ej. al concatenar varios archivos)"""
+        seen = set()
+        lines = []
+        for line in code.splitlines():
+            if USING_DIRECTIVE_PATTERN.match(line):
+                key = " ".join(line.split())
+                if key in seen:
+                    continue
+                seen.add(key)
+            lines.append(line)
+        
+        return "\n".join(lines)
+    
+    @staticmethod
+    def _is_member_header(header: str) -> bool:
+        """Indica si el texto previo a una llave es la firma de un método o constructor"""
+        # Quitar atributos [..] al inicio
+        header = re.sub(r"^(\s*\[[^\]]*\]\s*)+", "", header).strip()
+        if not header or "(" not in header:
+            return False
+        
+        first_word = re.match(r"[A-Za-z_]\w*", header)
+        if first_word is None or first_word.group() in BLOCK_KEYWORDS:
+            return False
+        
+        # Asignaciones e inicializadores (var x = new Foo() {) no son firmas
+        if "=" in header[:header.index("(")] or "=>" in header:
+            return False
+        
+        # Firma terminada en ')' con restricciones genéricas o inicializador base/this opcionales
+        return re.search(r"\)\s*(where\s+[^{]+)?$", header) is not None
+    
+    def collapse_method_bodies(self, code: str) -> str:
+        """Reducir los cuerpos de métodos y constructores a su firma"""
+        output = []
+        index = 0
+        length = len(code)
+        header_start = 0
+        
+        while index < length:
+            char = code[index]
+            if is_literal_start(code, index):
+                end = scan_literal(code, index)
+                output.append(code[index:end])
+                index = end
+                continue
+            
+            if char == "{" and self._is_member_header(code[header_start:index]):
+                end = self._find_block_end(code, index)
+                while output and output[-1].isspace():
+                    output.pop()
+                output.append(" " + COLLAPSED_BODY)
+                index = end
+                header_start = index
+                continue
+            
+            output.append(char)
+            if char in ";{}":
+                header_start = index + 1
+            index += 1
+        
+        return "".join(output)
+    
+    @staticmethod
+    def _find_block_end(code: str, start: int) -> int:
+        """Índice posterior a la llave que cierra el bloque abierto en start"""
+        depth = 0
+        index = start
+        while index < len(code):
+            if is_literal_start(code, index):
+                index = scan_literal(code, index)
+                continue
+            if code[index] == "{":
+                depth += 1
+            elif code[index] == "}":
+                depth -= 1
+                if depth == 0:
+                    return index + 1
+            index += 1
+        
+        return len(code)
+    
+    def compress(self, code: str, signatures_only: bool = False, strip_comments: bool = True,
+                 label: str = "código") -> CompressionResult:
+        """Comprimir código C# registrando el tamaño antes y después"""
+        steps = []
+        compressed = code
+        
+        if strip_comments:
+            compressed = self.strip_comments(compressed)
+            steps.append("comments")
+        if signatures_only:
+            compressed = self.collapse_method_bodies(compressed)
+            steps.append("signatures")
+        compressed = self.dedupe_usings(compressed)
+        steps.append("usings")
+        compressed = self.remove_blank_lines(compressed)
+        steps.append("blank_lines")
+        
+        return self._report(code, compressed, steps, label)
+    
+    def compact_data(self, data: Any, label: str = "datos") -> CompressionResult:
+        """Serializar datos de análisis como JSON compacto en lugar de su repr de Python"""
+        original = str(data)
+        compressed = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+        return self._report(original, compressed, ["compact_json"], label)
+    
+    def _report(self, original: str, compressed: str, steps: List[str], label: str) -> CompressionResult:
+        """Medir y registrar el resultado de la compresión"""
+        tokenizer = tokenizer_registry.get(self.model)
+        result = CompressionResult(
+            text=compressed,
+            original_chars=len(original),
+            compressed_chars=len(compressed),
+            original_tokens=tokenizer.count(original),
+            compressed_tokens=tokenizer.count(compressed),
+            steps=steps
+        )
+        
+        with self.lock:
+            self.stats["calls"] += 1
+            self.stats["original_tokens"] += result.original_tokens
+            self.stats["compressed_tokens"] += result.compressed_tokens
+        
+        self.logger.info(
+            f"Compresión de {label}: {result.original_chars} -> {result.compressed_chars} caracteres, "
+            f"{result.original_tokens} -> {result.compressed_tokens} tokens (-{result.reduction:.0%})"
+        )
+        return result
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas acumuladas de compresión"""
+        with self.lock:
+            stats = dict(self.stats)
+        
+        original = stats["original_tokens"]
+        stats["saved_tokens"] = original - stats["compressed_tokens"]
+        stats["reduction"] = f"{(stats['saved_tokens'] / original * 100) if original else 0:.2f}%"
+        return stats
+
+
+# Instancia global del compresor
+csharp_compressor = CSharpPromptCompressor()
@@ -9,6 +9,8 @@ from enum import Enum
 import json
 
 from utils.logging import get_logger
+from utils.templating import CompiledTemplate
+from ai.prompt_compression import csharp_compressor, CompressionResult
 
 logger = get_logger("prompt-engineer")
 
@@ -38,6 +40,8 @@ class PromptEngineer:
     def __init__(self):
         self.logger = logger
         self.templates = {}
+        self.compiled: Dict[str, CompiledTemplate] = {}
+        self.compressor = csharp_compressor
         self._setup_default_templates()
     
     def _setup_default_templates(self):
@@ -206,13 +210,13 @@ Eres un experto en optimización de código .NET. Optimiza el siguiente código
 **Formato de respuesta:**
 ```csharp
 // Código optimizado
-{optimized_code}
+{{optimized_code}}
 
 // Explicación de cambios:
-{explanation}
+{{explanation}}
 
 // Beneficios:
-{benefits}
+{{benefits}}
 ```
 
 Proporciona código optimizado con explicaciones detalladas.
@@ -221,6 +225,9 @@ Proporciona código optimizado con explicaciones detalladas.
                 description="Template para optimización de código"
             )
             
+            for template in self.templates.values():
+                self._compile_template(template)
+            
             self.logger.info("Templates de prompts configurados")
             
         except Exception as e:
@@ -231,20 +238,26 @@ Proporciona código optimizado con explicaciones detalladas.
         """Obtener template por nombre"""
         return self.templates.get(template_name)
     
-    def generate_prompt(self, template_name: str, variables: Dict[str, Any]) -> str:
-        """Generar prompt desde template"""
+    def generate_prompt(self, template_name: str, variables: Dict[str, Any],
+                        compress: bool = False, signatures_only: bool = False) -> str:
+        """Generar prompt desde template (opcionalmente comprimiendo el código C#)"""
         try:
             template = self.get_template(template_name)
             if not template:
                 raise ValueError(f"Template '{template_name}' no encontrado")
             
+            compiled = self.compiled[template_name]
+            
             # Verificar que todas las variables requeridas estén presentes
-            missing_vars = [var for var in template.variables if var not in variables]
+            missing_vars = compiled.missing(variables)
             if missing_vars:
                 raise ValueError(f"Variables faltantes: {missing_vars}")
             
-            # Generar prompt
-            prompt = template.template.format(**variables)
+            if compress:
+                variables = self.compress_variables(variables, signatures_only)
+            
+            # Generar prompt uniendo los segmentos precompilados
+            prompt = compiled.render(variables)
             
             self.logger.info(f"Prompt generado desde template: {template_name}")
             return prompt
@@ -253,15 +266,63 @@ Proporciona código optimizado con explicaciones detalladas.
             self.logger.error(f"Error al generar prompt: {e}")
             raise
     
+    def bind_template(self, template_name: str, context: Dict[str, Any],
+                      compress: bool = False) -> CompiledTemplate:
+        """Prefijar variables comunes (p. ej. el contexto del proyecto) en un template
+        
+        Devuelve un template compilado cuyo render() solo necesita las variables
+        restantes, útil al generar muchos prompts por método del mismo proyecto.
+        """
+        try:
+            if template_name not in self.compiled:
+                raise ValueError(f"Template '{template_name}' no encontrado")
+            
+            if compress:
+                context = self.compress_variables(context)
+            
+            bound = self.compiled[template_name].partial(**context)
+            self.logger.info(f"Template {template_name} prefijado con: {', '.join(context)}")
+            return bound
+            
+        except Exception as e:
+            self.logger.error(f"Error al prefijar template: {e}")
+            raise
+    
+    def compress_code(self, code: str, signatures_only: bool = False) -> CompressionResult:
+        """Comprimir código C# para incluirlo en un prompt"""
+        return self.compressor.compress(code, signatures_only=signatures_only)
+    
+    def compress_variables(self, variables: Dict[str, Any], signatures_only: bool = False) -> Dict[str, Any]:
+        """Comprimir el código y los datos estructurados de las variables de un template"""
+        compressed = dict(variables)
+        for name, value in variables.items():
+            if name == "code" and isinstance(value, str):
+                compressed[name] = self.compressor.compress(value, signatures_only=signatures_only).text
+            elif isinstance(value, (dict, list)):
+                compressed[name] = self.compressor.compact_data(value, label=name).text
+        
+        return compressed
+    
     def get_available_templates(self) -> List[str]:
         """Obtener templates disponibles"""
         return list(self.templates.keys())
     
     def add_custom_template(self, template: PromptTemplate):
         """Agregar template personalizado"""
+        # Compilar antes de registrar: un template inválido no queda a medias
+        self._compile_template(template)
         self.templates[template.name] = template
         self.logger.info(f"Template personalizado agregado: {template.name}")
     
+    def _compile_template(self, template: PromptTemplate):
+        """Compilar template una sola vez y validar sus variables declaradas"""
+        compiled = CompiledTemplate.compile(template.template, name=template.name)
+        undeclared = [var for var in compiled.variables if var not in template.variables]
+        if undeclared:
+            raise ValueError(f"Template '{template.name}' usa variables no declaradas: {undeclared}")
+        
+        self.compiled[template.name] = compiled
+    
     def optimize_prompt(self, prompt: str, context: Dict[str, Any]) -> str:
         """Optimizar prompt existente"""
         try:
@@ -0,0 +1,133 @@
+"""
+Agrupación de peticiones idénticas en vuelo (single-flight)
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import Dict, Any, Optional, Callable, Awaitable, Tuple
+from concurrent.futures import Future, CancelledError
+import asyncio
+import threading
+
+from utils.logging import get_logger
+
+logger = get_logger("request-coalescing")
+
+
+class SingleFlight:
+    """Ejecuta una sola vez las llamadas concurrentes con la misma clave
+    
+    La primera llamada (líder) ejecuta la función; las que llegan con la
+    misma clave mientras sigue en vuelo esperan su resultado o su excepción.
+    Al terminar la clave se libera: no es un caché, solo cubre peticiones
+    que todavía no han terminado.
+    """
+    
+    def __init__(self):
+        self.logger = logger
+        self._calls: Dict[str, Tuple[Future, Optional[asyncio.AbstractEventLoop]]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "coalesced": 0}
+    
+    def _join(self, key: str, loop: Optional[asyncio.AbstractEventLoop]) -> Tuple[Future, bool]:
+        """Obtener el futuro en vuelo de la clave o registrar uno nuevo; devuelve (futuro, es_líder)"""
+        with self._lock:
+            entry = self._calls.get(key)
+            if entry is not None:
+                future, owner_loop = entry
+                # Una llamada síncrona no puede esperar a un líder de su propio event loop
+                if not (loop is None and owner_loop is not None and owner_loop is _running_loop()):
+                    self.stats["coalesced"] += 1
+                    return future, False
+                self.stats["leaders"] += 1
+                return Future(), True
+            
+            future = Future()
+            self._calls[key] = (future, loop)
+            self.stats["leaders"] += 1
+            return future, True
+    
+    def _release(self, key: str, future: Future):
+        """Liberar la clave si sigue asociada al futuro del líder"""
+        with self._lock:
+            entry = self._calls.get(key)
+            if entry is not None and entry[0] is future:
+                del self._calls[key]
+    
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        """Ejecutar func o esperar el resultado de la llamada idéntica en vuelo"""
+        while True:
+            future, leader = self._join(key, None)
+            if leader:
+                return self._run_leader(key, future, func)
+            try:
+                return future.result()
+            except CancelledError:
+                # El líder se canceló: la siguiente llamada toma su lugar
+                continue
+    
+    def _run_leader(self, key: str, future: Future, func: Callable[[], Any]) -> Any:
+        """Ejecutar la llamada y publicar su resultado a los seguidores"""
+        try:
+            result = func()
+        except BaseException as e:
+            self._release(key, future)
+            future.set_exception(e)
+            raise
+        
+        self._release(key, future)
+        future.set_result(result)
+        return result
+    
+    async def ado(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Versión asíncrona de do()"""
+        while True:
+            future, leader = self._join(key, asyncio.get_running_loop())
+            if not leader:
+                try:
+                    # shield: cancelar a un seguidor no cancela la llamada compartida
+                    return await asyncio.shield(asyncio.wrap_future(future))
+                except asyncio.CancelledError:
+                    if future.cancelled():
+                        # El líder se canceló: la siguiente llamada toma su lugar
+                        continue
+                    raise
+            
+            try:
+                result = await func()
+            except asyncio.CancelledError:
+                # Los seguidores no heredan la cancelación del líder
+                self._release(key, future)
+                future.cancel()
+                raise
+            except BaseException as e:
+                self._release(key, future)
+                future.set_exception(e)
+                raise
+            
+            self._release(key, future)
+            future.set_result(result)
+            return result
+    
+    @property
+    def in_flight(self) -> int:
+        """Claves con una llamada en vuelo"""
+        with self._lock:
+            return len(self._calls)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas de agrupación"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._calls)
+        
+        total = stats["leaders"] + stats["coalesced"]
+        stats["coalesced_rate"] = f"{(stats['coalesced'] / total * 100) if total else 0:.2f}%"
+        return stats
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    """Event loop en ejecución en el hilo actual, si lo hay"""
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
@@ -0,0 +1,367 @@
+"""
+Caché persistente de respuestas de LLM
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import Dict, List, Any, Optional, Callable, Tuple
+from pathlib import Path
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from utils.logging import get_logger
+from utils.config import get_config
+
+logger = get_logger("response-cache")
+
+
+class ResponseCache:
+    """Caché de respuestas direccionada por contenido y respaldada por SQLite"""
+    
+    # Cada cuántas escrituras se purgan las entradas expiradas
+    PURGE_INTERVAL = 100
+    
+    def __init__(self, db_path: Optional[str] = None, ttl_seconds: Optional[int] = None,
+                 max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 enabled: Optional[bool] = None):
+        ai_config = get_config().ai
+        
+        self.logger = logger
+        self.db_path = Path(db_path or ai_config.response_cache_path)
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else ai_config.response_cache_ttl
+        self.max_entries = max_entries if max_entries is not None else ai_config.response_cache_max_entries
+        self.max_bytes = max_bytes if max_bytes is not None else ai_config.response_cache_max_bytes
+        self.enabled = enabled if enabled is not None else ai_config.response_cache_enabled
+        
+        self.lock = threading.RLock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._entry_count = 0
+        self._total_bytes = 0
+        self._writes_since_purge = 0
+        
+        # Estadísticas
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def make_key(provider: str, model: str, temperature: float, max_tokens: int, prompt: str) -> str:
+        """Generar clave de caché a partir de los parámetros de la petición"""
+        payload = json.dumps(
+            [provider, model, float(temperature), int(max_tokens), prompt],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Abrir la base de datos de forma diferida"""
+        if self._connection is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            
+            connection = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT,
+                    model TEXT,
+                    content TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL
+                )
+            """)
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_responses_last_accessed ON responses(last_accessed)"
+            )
+            connection.commit()
+            
+            row = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            self._entry_count, self._total_bytes = row[0], row[1]
+            self._connection = connection
+            
+            self.logger.debug(f"Caché de respuestas abierta: {self.db_path} ({self._entry_count} entradas)")
+        
+        return self._connection
+    
+    def get(self, key: str) -> Optional[str]:
+        """Obtener respuesta del caché"""
+        if not self.enabled:
+            return None
+        
+        try:
+            with self.lock:
+                connection = self._connect()
+                row = connection.execute(
+                    "SELECT content, size, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                
+                if row is None:
+                    self.misses += 1
+                    return None
+                
+                content, size, created_at = row
+                now = time.time()
+                
+                # Entrada expirada
+                if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                    connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    connection.commit()
+                    self._entry_count -= 1
+                    self._total_bytes -= size
+                    self.misses += 1
+                    return None
+                
+                connection.execute("UPDATE responses SET last_accessed = ? WHERE key = ?", (now, key))
+                connection.commit()
+                self.hits += 1
+                return content
+        
+        except Exception as e:
+            self.logger.error(f"Error al leer caché de respuestas: {e}")
+            return None
+    
+    def put(self, key: str, content: str, provider: str = "", model: str = "") -> None:
+        """Guardar respuesta en el caché"""
+        if not self.enabled or content is None:
+            return
+        
+        try:
+            with self.lock:
+                connection = self._connect()
+                size = len(content.encode("utf-8"))
+                now = time.time()
+                
+                previous = connection.execute(
+                    "SELECT size FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if previous is not None:
+                    self._entry_count -= 1
+                    self._total_bytes -= previous[0]
+                
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses "
+                    "(key, provider, model, content, size, created_at, last_accessed) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, provider, model, content, size, now, now)
+                )
+                self._entry_count += 1
+                self._total_bytes += size
+                
+                self._writes_since_purge += 1
+                if self._writes_since_purge >= self.PURGE_INTERVAL:
+                    self._purge_expired(connection, now)
+                
+                self._evict_lru(connection)
+                connection.commit()
+        
+        except Exception as e:
+            self.logger.error(f"Error al escribir caché de respuestas: {e}")
+    
+    def _purge_expired(self, connection: sqlite3.Connection, now: float):
+        """Eliminar entradas expiradas"""
+        self._writes_since_purge = 0
+        if not self.ttl_seconds:
+            return
+        
+        cutoff = now - self.ttl_seconds
+        row = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses WHERE created_at < ?", (cutoff,)
+        ).fetchone()
+        if row[0]:
+            connection.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,))
+            self._entry_count -= row[0]
+            self._total_bytes -= row[1]
+            self.logger.debug(f"Purgadas {row[0]} respuestas expiradas")
+    
+    def _evict_lru(self, connection: sqlite3.Connection):
+        """Expulsar las entradas menos usadas hasta respetar los límites de tamaño"""
+        while self._entry_count > self.max_entries or self._total_bytes > self.max_bytes:
+            # Expulsar en bloques para no recorrer la tabla entrada a entrada
+            excess = max(self._entry_count - self.max_entries, 1)
+            rows = connection.execute(
+                "SELECT key, size FROM responses ORDER BY last_accessed ASC LIMIT ?",
+                (min(excess, 500),)
+            ).fetchall()
+            if not rows:
+                break
+            
+            connection.executemany("DELETE FROM responses WHERE key = ?", [(r[0],) for r in rows])
+            self._entry_count -= len(rows)
+            self._total_bytes -= sum(r[1] for r in rows)
+            self.evictions += len(rows)
+    
+    def clear(self) -> None:
+        """Limpiar el caché"""
+        try:
+            with self.lock:
+                connection = self._connect()
+                connection.execute("DELETE FROM responses")
+                connection.commit()
+                self._entry_count = 0
+                self._total_bytes = 0
+                self.hits = 0
+                self.misses = 0
+                self.evictions = 0
+                self.logger.info("Caché de respuestas limpiado")
+        
+        except Exception as e:
+            self.logger.error(f"Error al limpiar caché de respuestas: {e}")
+    
+    def close(self) -> None:
+        """Cerrar la conexión a la base de datos"""
+        with self.lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas del caché"""
+        total = self.hits + self.misses
+        hit_rate = (self.hits / total * 100) if total > 0 else 0
+        
+        return {
+            "enabled": self.enabled,
+            "path": str(self.db_path),
+            "entries": self._entry_count,
+            "size_bytes": self._total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": f"{hit_rate:.2f}%"
+        }
+
+
+class SemanticResponseCache:
+    """Nivel semántico del caché: reutiliza respuestas de prompts casi idénticos"""
+    
+    def __init__(self, threshold: Optional[float] = None, max_entries: Optional[int] = None,
+                 encoder: Optional[Callable[[List[str]], np.ndarray]] = None):
+        ai_config = get_config().ai
+        
+        self.logger = logger
+        self.threshold = threshold if threshold is not None else ai_config.semantic_cache_threshold
+        self.max_entries = max_entries if max_entries is not None else ai_config.semantic_cache_max_entries
+        self._encoder = encoder
+        
+        self.lock = threading.RLock()
+        # Embeddings normalizados en un buffer circular de capacidad fija
+        self._embeddings: Optional[np.ndarray] = None
+        self._scopes: List[Optional[str]] = [None] * self.max_entries
+        self._contents: List[Optional[str]] = [None] * self.max_entries
+        self._next_slot = 0
+        self._size = 0
+        
+        # Estadísticas
+        self.lookups = 0
+        self.hits = 0
+        self.last_similarity: Optional[float] = None
+        self._hit_similarity_total = 0.0
+    
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        """Normalizar espacios en blanco del prompt antes de calcular su embedding"""
+        return re.sub(r"\s+", " ", prompt).strip()
+    
+    def _encode(self, text: str) -> np.ndarray:
+        """Calcular embedding normalizado del prompt"""
+        if self._encoder is None:
+            # Mismo modelo (y misma instancia) que usa la memoria vectorial de los agentes
+            from langchain_agents.memory.embedding_service import get_embedding_service
+            
+            self._encoder = get_embedding_service().encode
+        
+        vector = np.asarray(self._encoder([self.normalize_prompt(text)]), dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+    
+    def lookup(self, scope: str, prompt: str) -> Tuple[Optional[str], Optional[float]]:
+        """Buscar una respuesta cuyo prompt esté dentro del umbral de similitud coseno"""
+        embedding = self._encode(prompt)
+        
+        with self.lock:
+            self.lookups += 1
+            if self._size == 0:
+                self.last_similarity = None
+                return None, None
+            
+            # Similitud coseno contra todas las entradas del mismo ámbito
+            similarities = self._embeddings[:self._size] @ embedding
+            in_scope = np.fromiter(
+                (s == scope for s in self._scopes[:self._size]), dtype=bool, count=self._size
+            )
+            if not in_scope.any():
+                self.last_similarity = None
+                return None, None
+            
+            similarities = np.where(in_scope, similarities, -1.0)
+            best = int(np.argmax(similarities))
+            score = float(similarities[best])
+            self.last_similarity = score
+            
+            if score < self.threshold:
+                return None, score
+            
+            self.hits += 1
+            self._hit_similarity_total += score
+            self.logger.debug(f"Acierto semántico en caché (similitud {score:.4f} >= {self.threshold})")
+            return self._contents[best], score
+    
+    def add(self, scope: str, prompt: str, content: str) -> None:
+        """Agregar respuesta al nivel semántico"""
+        if content is None:
+            return
+        
+        embedding = self._encode(prompt)
+        
+        with self.lock:
+            if self._embeddings is None:
+                self._embeddings = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.float32)
+            
+            slot = self._next_slot
+            self._embeddings[slot] = embedding
+            self._scopes[slot] = scope
+            self._contents[slot] = content
+            
+            self._next_slot = (slot + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+    
+    def clear(self) -> None:
+        """Limpiar el nivel semántico"""
+        with self.lock:
+            self._scopes = [None] * self.max_entries
+            self._contents = [None] * self.max_entries
+            self._next_slot = 0
+            self._size = 0
+            self.lookups = 0
+            self.hits = 0
+            self.last_similarity = None
+            self._hit_similarity_total = 0.0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas del nivel semántico"""
+        hit_rate = (self.hits / self.lookups * 100) if self.lookups > 0 else 0
+        
+        return {
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": f"{hit_rate:.2f}%",
+            "last_similarity": self.last_similarity,
+            "average_hit_similarity": (self._hit_similarity_total / self.hits) if self.hits else None
+        }
+
+
+# Instancia global del caché de respuestas
+response_cache = ResponseCache()
@@ -0,0 +1,168 @@
+"""
+Puntuación de respuestas de LLM en una sola pasada
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import Dict, List, Any, Optional, FrozenSet
+from dataclasses import dataclass
+from concurrent.futures import Executor, ProcessPoolExecutor
+import os
+import re
+
+from utils.logging import get_logger
+
+logger = get_logger("response-scoring")
+
+# Palabras y marcas que activa cada característica (coincidencia de subcadena, sin mayúsculas)
+FEATURE_KEYWORDS: Dict[str, List[str]] = {
+    "code": ["```"],
+    "explanation": ["explicación", "explanation"],
+    "reasoning": ["porque", "because"],
+    "markup": ["**", "##"],
+    "example": ["ejemplo", "example", "caso"],
+    "conclusion": ["conclusión", "conclusion", "resumen", "summary"],
+    "problem": ["error", "undefined", "null"],
+    "usefulness": ["código", "code", "ejemplo", "example"],
+}
+
+
+def _build_matcher(feature_keywords: Dict[str, List[str]]):
+    """Compilar todas las palabras en un único patrón y su mapa palabra -> características"""
+    keyword_features: Dict[str, set] = {}
+    for feature, keywords in feature_keywords.items():
+        for keyword in keywords:
+            keyword_features.setdefault(keyword.lower(), set()).add(feature)
+    
+    alternatives = "|".join(re.escape(k) for k in sorted(keyword_features, key=len, reverse=True))
+    pattern = re.compile(alternatives)
+    return pattern, {keyword: frozenset(features) for keyword, features in keyword_features.items()}
+
+
+FEATURE_PATTERN, KEYWORD_FEATURES = _build_matcher(FEATURE_KEYWORDS)
+ALL_FEATURES = frozenset(FEATURE_KEYWORDS)
+
+
+@dataclass
+class ResponseScore:
+    """Características y puntuaciones de una respuesta"""
+    length: int
+    word_count: int
+    features: FrozenSet[str]
+    structure_score: float
+    quality_score: float
+    
+    @property
+    def has_code(self) -> bool:
+        """Indica si la respuesta incluye bloques de código"""
+        return "code" in self.features
+    
+    @property
+    def has_explanations(self) -> bool:
+        """Indica si la respuesta incluye explicaciones"""
+        return "explanation" in self.features or "reasoning" in self.features
+    
+    def to_analysis(self) -> Dict[str, Any]:
+        """Formato de análisis usado por AIOptimizer"""
+        return {
+            "length": self.length,
+            "word_count": self.word_count,
+            "has_code": self.has_code,
+            "has_explanations": self.has_explanations,
+            "structure_score": self.structure_score
+        }
+
+
+def extract_features(text: str) -> FrozenSet[str]:
+    """Características presentes en el texto (una sola pasada con el patrón compilado)"""
+    lowered = text.lower()
+    search = FEATURE_PATTERN.search
+    found = set()
+    position = 0
+    
+    while len(found) < len(ALL_FEATURES):
+        match = search(lowered, position)
+        if match is None:
+            break
+        found.update(KEYWORD_FEATURES[match.group()])
+        # Avanzar un solo carácter para no perder palabras solapadas (p. ej. "codexample")
+        position = match.start() + 1
+    
+    return frozenset(found)
+
+
+def structure_score(features: FrozenSet[str]) -> float:
+    """Puntuación de estructura: código, explicaciones, formato, ejemplos y conclusiones"""
+    score = 0.0
+    if "code" in features:
+        score += 0.3
+    if "explanation" in features:
+        score += 0.2
+    if "markup" in features:
+        score += 0.2
+    if "example" in features:
+        score += 0.2
+    if "conclusion" in features:
+        score += 0.1
+    
+    return min(score, 1.0)
+
+
+def quality_score(features: FrozenSet[str], length: int) -> float:
+    """Puntuación de calidad: estructura, completitud, claridad y utilidad"""
+    score = structure_score(features)
+    if length > 100:
+        score += 0.2
+    if "problem" not in features:
+        score += 0.1
+    if "usefulness" in features:
+        score += 0.2
+    
+    return min(score, 1.0)
+
+
+def score_response(text: str) -> ResponseScore:
+    """Calcular características y puntuaciones de una respuesta"""
+    features = extract_features(text)
+    return ResponseScore(
+        length=len(text),
+        word_count=len(text.split()),
+        features=features,
+        structure_score=structure_score(features),
+        quality_score=quality_score(features, len(text))
+    )
+
+
+def _score_chunk(texts: List[str]) -> List[ResponseScore]:
+    """Puntuar un bloque de respuestas (se ejecuta en un proceso del pool)"""
+    return [score_response(text) for text in texts]
+
+
+def _map_chunks(pool: Executor, chunks: List[List[str]]) -> List[ResponseScore]:
+    """Puntuar los bloques en el pool conservando el orden"""
+    scores: List[ResponseScore] = []
+    for chunk_scores in pool.map(_score_chunk, chunks):
+        scores.extend(chunk_scores)
+    return scores
+
+
+def score_responses(texts: List[str], max_workers: Optional[int] = None, parallel_threshold: int = 256,
+                    chunk_size: int = 64, pool: Optional[Executor] = None) -> List[ResponseScore]:
+    """Puntuar muchas respuestas; los lotes grandes se reparten en un pool de procesos
+    
+    pool permite reutilizar un pool existente en lugar de crear uno por
+    llamada. Si el pool no se puede usar (p. ej. en entornos sin fork) se
+    puntúa en el proceso actual.
+    """
+    workers = max_workers or os.cpu_count() or 1
+    if len(texts) < parallel_threshold or workers < 2:
+        return _score_chunk(texts)
+    
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    try:
+        if pool is not None:
+            return _map_chunks(pool, chunks)
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as own_pool:
+            return _map_chunks(own_pool, chunks)
+    except Exception as e:
+        logger.warning(f"Pool de procesos no disponible, puntuando en serie: {e}")
+        return _score_chunk(texts)
@@ -0,0 +1,253 @@
+"""
+Generación especulativa: borrador con el LLM rápido y verificación local
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import Dict, List, Any, Optional, Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+import re
+import threading
+import time
+
+from utils.logging import get_logger
+from ai.prompt_compression import is_literal_start, scan_literal
+
+logger = get_logger("speculative-generation")
+
+# Bloque de código markdown (```csharp ... ```)
+CODE_BLOCK_PATTERN = re.compile(r"```[\w#+-]*\s*\n(.*?)```", re.DOTALL)
+
+# Atributos de prueba por framework
+TEST_ATTRIBUTES = {
+    "xunit": ("[Fact", "[Theory"),
+    "nunit": ("[Test", "[TestCase"),
+    "mstest": ("[TestMethod", "[DataTestMethod"),
+}
+
+# Formas de afirmar resultados (Assert clásico, FluentAssertions, Moq)
+ASSERTION_PATTERN = re.compile(r"\bAssert\.\w+|\.Should\(\)|\.Verify\w*\(")
+
+DRAFT_FILE_NAME = "SpeculativeDraft.cs"
+
+
+def extract_code(text: str) -> str:
+    """Código de la respuesta: el contenido de los bloques markdown o el texto completo"""
+    blocks = CODE_BLOCK_PATTERN.findall(text)
+    return "\n".join(block.strip() for block in blocks) if blocks else text.strip()
+
+
+@dataclass
+class DraftVerification:
+    """Resultado de las comprobaciones locales de un borrador"""
+    checks: Dict[str, bool] = field(default_factory=dict)
+    
+    @property
+    def passed(self) -> bool:
+        """Indica si el borrador pasó todas las comprobaciones"""
+        return all(self.checks.values())
+    
+    @property
+    def issues(self) -> List[str]:
+        """Comprobaciones fallidas"""
+        return [name for name, ok in self.checks.items() if not ok]
+
+
+@dataclass
+class SpeculativeResult:
+    """Resultado de una generación especulativa"""
+    code: str
+    tier: str  # "draft" si se aceptó el borrador, "primary" si se escaló
+    verification: Optional[DraftVerification]
+    draft_latency: float
+    total_latency: float
+    draft_error: Optional[str] = None
+    
+    @property
+    def escalated(self) -> bool:
+        """Indica si la generación se escaló al LLM principal"""
+        return self.tier == "primary"
+
+
+class DraftVerifier:
+    """Comprobaciones baratas sobre un método de prueba generado
+    
+    Llaves, paréntesis y corchetes balanceados (ignorando literales y
+    comentarios), presencia de atributo de prueba y de aserciones y, si se
+    configura un proyecto de pruebas auxiliar, compilación con dotnet build.
+    """
+    
+    def __init__(self, compile_check: bool = False, scratch_project: Optional[str] = None):
+        self.logger = logger
+        self.compile_check = compile_check and bool(scratch_project)
+        self.scratch_project = Path(scratch_project) if scratch_project else None
+        # El proyecto auxiliar se comparte: una compilación a la vez
+        self._build_lock = threading.Lock()
+    
+    @staticmethod
+    def is_balanced(code: str) -> bool:
+        """Indica si llaves, paréntesis y corchetes están balanceados"""
+        pairs = {")": "(", "]": "[", "}": "{"}
+        stack = []
+        index = 0
+        length = len(code)
+        
+        while index < length:
+            if is_literal_start(code, index):
+                index = scan_literal(code, index)
+                continue
+            if code.startswith("//", index):
+                end = code.find("\n", index)
+                index = length if end == -1 else end
+                continue
+            if code.startswith("/*", index):
+                end = code.find("*/", index + 2)
+                index = length if end == -1 else end + 2
+                continue
+            
+            char = code[index]
+            if char in "([{":
+                stack.append(char)
+            elif char in pairs:
+                if not stack or stack.pop() != pairs[char]:
+                    return False
+            index += 1
+        
+        return not stack
+    
+    @staticmethod
+    def has_test_attribute(code: str, framework: str) -> bool:
+        """Indica si el código declara un atributo de prueba del framework"""
+        attributes = TEST_ATTRIBUTES.get(framework.lower())
+        if attributes is None:
+            attributes = tuple(attr for attrs in TEST_ATTRIBUTES.values() for attr in attrs)
+        return any(re.search(re.escape(attr) + r"\b", code) for attr in attributes)
+    
+    @staticmethod
+    def has_assertions(code: str) -> bool:
+        """Indica si el código contiene aserciones"""
+        return ASSERTION_PATTERN.search(code) is not None
+    
+    def compiles(self, code: str) -> bool:
+        """Compilar el borrador dentro del proyecto auxiliar"""
+        from tools.dotnet_tools import command_executor
+        
+        if "class " not in code:
+            code = f"public class {Path(DRAFT_FILE_NAME).stem}Tests\n{{\n{code}\n}}\n"
+        
+        with self._build_lock:
+            draft_file = self.scratch_project / DRAFT_FILE_NAME
+            try:
+                draft_file.write_text(code, encoding="utf-8")
+                result = command_executor.build_project(str(self.scratch_project))
+                return bool(result.get("success"))
+            finally:
+                draft_file.unlink(missing_ok=True)
+    
+    def verify(self, text: str, framework: str) -> DraftVerification:
+        """Ejecutar las comprobaciones sobre la respuesta del LLM"""
+        code = extract_code(text)
+        verification = DraftVerification()
+        checks = verification.checks
+        
+        checks["not_empty"] = bool(code)
+        checks["balanced"] = self.is_balanced(code)
+        checks["test_attribute"] = self.has_test_attribute(code, framework)
+        checks["assertions"] = self.has_assertions(code)
+        
+        # Compilar solo si lo barato ya pasó
+        if self.compile_check and verification.passed:
+            try:
+                checks["compiles"] = self.compiles(code)
+            except Exception as e:
+                self.logger.warning(f"No se pudo compilar el borrador: {e}")
+                checks["compiles"] = False
+        
+        return verification
+
+
+class SpeculativeGenerator:
+    """Genera con un LLM rápido y escala al principal solo si el borrador falla
+    
+    Registra cuántos borradores se aceptan y cuántos se escalan; la tasa de
+    escalado indica cuánta latencia y costo del LLM principal se ahorra.
+    """
+    
+    def __init__(self, verifier: Optional[DraftVerifier] = None):
+        self.logger = logger
+        self.verifier = verifier or DraftVerifier()
+        self.lock = threading.Lock()
+        self.stats = {
+            "generations": 0,
+            "accepted_drafts": 0,
+            "escalations": 0,
+            "draft_errors": 0,
+            "draft_time": 0.0,
+            "escalation_time": 0.0
+        }
+        self.failed_checks: Dict[str, int] = {}
+    
+    def generate(self, prompt: str, draft: Callable[[str], str], escalate: Callable[[str], str],
+                 framework: str = "xunit") -> SpeculativeResult:
+        """Generar un borrador, verificarlo y escalar si no pasa las comprobaciones"""
+        start_time = time.time()
+        verification = None
+        draft_error = None
+        
+        try:
+            draft_code = draft(prompt)
+            verification = self.verifier.verify(draft_code, framework)
+        except Exception as e:
+            self.logger.warning(f"Error del LLM rápido, escalando al principal: {e}")
+            draft_error = str(e)
+        
+        draft_latency = time.time() - start_time
+        
+        if verification is not None and verification.passed:
+            self._record(draft_latency, 0.0, verification, draft_error)
+            return SpeculativeResult(draft_code, "draft", verification, draft_latency, draft_latency)
+        
+        if verification is not None:
+            self.logger.info(f"Borrador rechazado ({', '.join(verification.issues)}), escalando al LLM principal")
+        
+        code = escalate(prompt)
+        total_latency = time.time() - start_time
+        self._record(draft_latency, total_latency - draft_latency, verification, draft_error)
+        return SpeculativeResult(code, "primary", verification, draft_latency, total_latency, draft_error)
+    
+    def _record(self, draft_latency: float, escalation_latency: float,
+                verification: Optional[DraftVerification], draft_error: Optional[str]):
+        """Actualizar estadísticas de aceptación y escalado"""
+        with self.lock:
+            self.stats["generations"] += 1
+            self.stats["draft_time"] += draft_latency
+            if draft_error is not None:
+                self.stats["draft_errors"] += 1
+            if verification is not None and verification.passed:
+                self.stats["accepted_drafts"] += 1
+                return
+            
+            self.stats["escalations"] += 1
+            self.stats["escalation_time"] += escalation_latency
+            for issue in verification.issues if verification else []:
+                self.failed_checks[issue] = self.failed_checks.get(issue, 0) + 1
+    
+    @property
+    def escalation_rate(self) -> float:
+        """Fracción de generaciones escaladas al LLM principal (0-1)"""
+        with self.lock:
+            total = self.stats["generations"]
+            return self.stats["escalations"] / total if total else 0.0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas de generación especulativa"""
+        rate = self.escalation_rate
+        with self.lock:
+            stats = dict(self.stats)
+            stats["failed_checks"] = dict(self.failed_checks)
+        
+        stats["escalation_rate"] = f"{rate * 100:.2f}%"
+        stats["average_escalation_time"] = (
+            stats["escalation_time"] / stats["escalations"] if stats["escalations"] else 0.0
+        )
+        return stats
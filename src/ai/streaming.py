@@ -0,0 +1,104 @@
+"""
+Procesamiento incremental de respuestas en streaming
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import List, Optional, Iterable, Iterator
+
+from utils.logging import get_logger
+
+logger = get_logger("streaming")
+
+CODE_FENCE = "```"
+
+
+class CodeBlockStreamParser:
+    """Extrae bloques de código de una respuesta a medida que llegan los fragmentos"""
+    
+    def __init__(self):
+        self.logger = logger
+        self._pending = ""
+        self._current: List[str] = []
+        self._raw: List[str] = []
+        self.in_block = False
+        self.language: Optional[str] = None
+        self.blocks: List[str] = []
+        self.fences_seen = False
+    
+    def feed(self, chunk: str) -> List[str]:
+        """Procesar un fragmento; devuelve las líneas de código completadas en él"""
+        self._raw.append(chunk)
+        self._pending += chunk
+        
+        lines = []
+        while "\n" in self._pending:
+            line, self._pending = self._pending.split("\n", 1)
+            code_line = self._process_line(line)
+            if code_line is not None:
+                lines.append(code_line)
+        
+        return lines
+    
+    def _process_line(self, line: str) -> Optional[str]:
+        """Procesar una línea completa de la respuesta"""
+        stripped = line.strip()
+        if stripped.startswith(CODE_FENCE):
+            self.fences_seen = True
+            if self.in_block:
+                self._close_block()
+            else:
+                self.in_block = True
+                self.language = stripped[len(CODE_FENCE):].strip() or None
+            return None
+        
+        if self.in_block:
+            self._current.append(line)
+            return line
+        
+        return None
+    
+    def _close_block(self):
+        """Cerrar el bloque de código actual"""
+        self.blocks.append("\n".join(self._current))
+        self._current = []
+        self.in_block = False
+    
+    def close(self) -> List[str]:
+        """Procesar el resto pendiente al terminar el stream"""
+        lines = []
+        if self._pending:
+            code_line = self._process_line(self._pending)
+            self._pending = ""
+            if code_line is not None:
+                lines.append(code_line)
+        
+        # Bloque sin cerrar por respuesta truncada
+        if self.in_block:
+            self._close_block()
+        
+        return lines
+    
+    def get_text(self) -> str:
+        """Respuesta completa recibida hasta ahora"""
+        return "".join(self._raw)
+    
+    def get_code(self) -> str:
+        """Código extraído; si la respuesta no tiene bloques se devuelve completa"""
+        if not self.fences_seen:
+            return self.get_text().strip()
+        
+        return "\n\n".join(self.blocks)
+
+
+def iter_code_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Entregar las líneas de código de los bloques de una respuesta en streaming
+    
+    Si la respuesta no trae bloques de código se entrega completa al terminar,
+    igual que CodeBlockStreamParser.get_code().
+    """
+    parser = CodeBlockStreamParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+    if not parser.fences_seen:
+        yield from parser.get_code().splitlines()
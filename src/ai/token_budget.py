@@ -0,0 +1,367 @@
+"""
+Conteo de tokens y presupuesto de prompts por modelo
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import Dict, List, Any, Optional, Callable
+from dataclasses import dataclass, field
+from abc import ABC, abstractmethod
+import hashlib
+import math
+import os
+import re
+import tempfile
+import threading
+
+from utils.logging import get_logger
+from utils.config import get_config
+
+logger = get_logger("token-budget")
+
+# Palabras, números y signos de puntuación sueltos
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+TRUNCATION_MARKER = "\n[... recortado por presupuesto de tokens ...]"
+
+# Archivos BPE de las codificaciones de tiktoken que usan los perfiles
+TIKTOKEN_ENCODING_URLS = {
+    "cl100k_base": "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken",
+    "o200k_base": "https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken",
+}
+
+
+def tiktoken_cache_dir() -> str:
+    """Directorio del caché de tiktoken (misma resolución que tiktoken)"""
+    if "TIKTOKEN_CACHE_DIR" in os.environ:
+        return os.environ["TIKTOKEN_CACHE_DIR"]
+    if "DATA_GYM_CACHE_DIR" in os.environ:
+        return os.environ["DATA_GYM_CACHE_DIR"]
+    return os.path.join(tempfile.gettempdir(), "data-gym-cache")
+
+
+def is_encoding_cached(encoding_name: str) -> bool:
+    """Indica si la codificación se puede cargar sin red"""
+    url = TIKTOKEN_ENCODING_URLS.get(encoding_name)
+    cache_dir = tiktoken_cache_dir()
+    if url is None or not cache_dir:
+        return False
+    return os.path.exists(os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest()))
+
+
+class Tokenizer(ABC):
+    """Interfaz de tokenizador"""
+    
+    name = "base"
+    
+    @abstractmethod
+    def count(self, text: str) -> int:
+        """Contar tokens del texto"""
+        pass
+    
+    @abstractmethod
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Recortar el texto a un máximo de tokens"""
+        pass
+
+
+class HeuristicTokenizer(Tokenizer):
+    """Tokenizador local aproximado para modelos sin tokenizador disponible
+    
+    Cada palabra cuenta como ceil(longitud / chars_per_token) tokens y cada signo
+    de puntuación como uno, lo que se aproxima a BPE en código C# mucho mejor que
+    contar palabras separadas por espacios.
+    """
+    
+    def __init__(self, chars_per_token: float = 4.0):
+        self.chars_per_token = chars_per_token
+        self.name = f"heuristic-{chars_per_token}"
+    
+    def _token_cost(self, piece: str) -> int:
+        """Tokens de una palabra o signo"""
+        return max(1, math.ceil(len(piece) / self.chars_per_token))
+    
+    def count(self, text: str) -> int:
+        """Contar tokens del texto"""
+        return sum(self._token_cost(piece) for piece in TOKEN_PATTERN.findall(text))
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Recortar el texto a un máximo de tokens"""
+        if max_tokens <= 0:
+            return ""
+        
+        used = 0
+        for match in TOKEN_PATTERN.finditer(text):
+            used += self._token_cost(match.group())
+            if used > max_tokens:
+                return text[:match.start()]
+        
+        return text
+
+
+class TiktokenTokenizer(Tokenizer):
+    """Tokenizador exacto de OpenAI basado en tiktoken"""
+    
+    def __init__(self, encoding: Any):
+        self.encoding = encoding
+        self.name = encoding.name
+    
+    def count(self, text: str) -> int:
+        """Contar tokens del texto"""
+        return len(self.encoding.encode(text, disallowed_special=()))
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Recortar el texto a un máximo de tokens"""
+        if max_tokens <= 0:
+            return ""
+        
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        
+        return self.encoding.decode(tokens[:max_tokens])
+
+
+@dataclass
+class ModelProfile:
+    """Tokenizador, precios y rendimiento de una familia de modelos"""
+    encoding: Optional[str]
+    chars_per_token: float
+    input_cost_per_1k: float
+    output_cost_per_1k: float
+    output_tokens_per_second: float
+    request_overhead: float = 0.5
+
+
+# Perfiles por prefijo de nombre de modelo (gana el prefijo más largo)
+DEFAULT_MODEL_PROFILES: Dict[str, ModelProfile] = {
+    "gpt-4o": ModelProfile("o200k_base", 4.0, 0.0025, 0.01, 60.0),
+    "gpt-4": ModelProfile("cl100k_base", 4.0, 0.03, 0.06, 20.0),
+    "gpt-3.5": ModelProfile("cl100k_base", 4.0, 0.0005, 0.0015, 80.0),
+    "deepseek": ModelProfile(None, 3.5, 0.00027, 0.0011, 40.0),
+    "gemini": ModelProfile(None, 4.0, 0.0005, 0.0015, 50.0),
+    "local": ModelProfile(None, 4.0, 0.0, 0.0, 50.0),
+}
+
+DEFAULT_PROFILE = ModelProfile(None, 4.0, 0.001, 0.002, 40.0)
+
+
+class TokenizerRegistry:
+    """Registro de tokenizadores por modelo con respaldo local
+    
+    Los tokenizadores exactos (tiktoken) se cargan una sola vez y solo desde el
+    caché local, salvo que allow_download (o ai.tokenizer_allow_download) lo
+    permita. La carga se hace fuera del lock del registro: mientras otro hilo
+    carga una codificación, o si no está disponible, se usa el tokenizador
+    heurístico sin esperar.
+    """
+    
+    def __init__(self, profiles: Optional[Dict[str, ModelProfile]] = None,
+                 allow_download: Optional[bool] = None):
+        self.logger = logger
+        self.profiles: Dict[str, ModelProfile] = dict(profiles or DEFAULT_MODEL_PROFILES)
+        self._factories: Dict[str, Callable[[], Tokenizer]] = {}
+        self._tokenizers: Dict[str, Tokenizer] = {}
+        self._encodings: Dict[str, Optional[Tokenizer]] = {}
+        self._encoding_guards: Dict[str, threading.Lock] = {}
+        self.allow_download = allow_download
+        self._lock = threading.Lock()
+    
+    def register(self, model_prefix: str, factory: Callable[[], Tokenizer]):
+        """Registrar un tokenizador para los modelos con el prefijo indicado"""
+        with self._lock:
+            self._factories[model_prefix] = factory
+            self._tokenizers.clear()
+    
+    def register_profile(self, model_prefix: str, profile: ModelProfile):
+        """Registrar perfil de precios y rendimiento de una familia de modelos"""
+        with self._lock:
+            self.profiles[model_prefix] = profile
+            self._tokenizers.clear()
+    
+    @staticmethod
+    def _match(model: str, prefixes: List[str]) -> Optional[str]:
+        """Prefijo más largo que coincide con el modelo"""
+        model = (model or "").lower()
+        matches = [prefix for prefix in prefixes if model.startswith(prefix.lower())]
+        return max(matches, key=len) if matches else None
+    
+    def get_profile(self, model: str) -> ModelProfile:
+        """Obtener perfil del modelo"""
+        prefix = self._match(model, list(self.profiles))
+        return self.profiles[prefix] if prefix else DEFAULT_PROFILE
+    
+    def _download_allowed(self) -> bool:
+        """Indica si se pueden descargar codificaciones que no están en caché"""
+        if self.allow_download is not None:
+            return self.allow_download
+        return get_config().ai.tokenizer_allow_download
+    
+    def _load_encoding(self, encoding_name: str) -> Optional[Tokenizer]:
+        """Cargar codificación de tiktoken una sola vez (None mientras no esté disponible)"""
+        with self._lock:
+            if encoding_name in self._encodings:
+                return self._encodings[encoding_name]
+            guard = self._encoding_guards.setdefault(encoding_name, threading.Lock())
+        
+        # Otro hilo la está cargando: no esperar
+        if not guard.acquire(blocking=False):
+            return None
+        
+        try:
+            with self._lock:
+                if encoding_name in self._encodings:
+                    return self._encodings[encoding_name]
+            
+            tokenizer = None
+            if is_encoding_cached(encoding_name) or self._download_allowed():
+                try:
+                    import tiktoken
+                    tokenizer = TiktokenTokenizer(tiktoken.get_encoding(encoding_name))
+                except Exception as e:
+                    self.logger.warning(f"Tokenizador {encoding_name} no disponible, usando estimación local: {e}")
+            else:
+                self.logger.info(f"Tokenizador {encoding_name} no está en el caché local, usando estimación local")
+            
+            with self._lock:
+                self._encodings[encoding_name] = tokenizer
+            return tokenizer
+        
+        finally:
+            guard.release()
+    
+    def get(self, model: str) -> Tokenizer:
+        """Obtener tokenizador del modelo"""
+        key = model or ""
+        with self._lock:
+            tokenizer = self._tokenizers.get(key)
+            if tokenizer is not None:
+                return tokenizer
+            
+            factory_prefix = self._match(key, list(self._factories))
+            factory = self._factories[factory_prefix] if factory_prefix is not None else None
+            profile_prefix = self._match(key, list(self.profiles))
+            profile = self.profiles[profile_prefix] if profile_prefix else DEFAULT_PROFILE
+            
+        final = True
+        if factory is not None:
+            tokenizer = factory()
+        elif profile.encoding:
+            tokenizer = self._load_encoding(profile.encoding)
+            with self._lock:
+                # Carga en curso en otro hilo: estimar ahora y volver a intentarlo después
+                final = profile.encoding in self._encodings
+            
+        if tokenizer is None:
+            tokenizer = HeuristicTokenizer(profile.chars_per_token)
+        if not final:
+            return tokenizer
+            
+        with self._lock:
+            return self._tokenizers.setdefault(key, tokenizer)
+    
+    def count_tokens(self, text: str, model: str) -> int:
+        """Contar tokens de un texto para un modelo"""
+        return self.get(model).count(text)
+    
+    def estimate_cost(self, model: str, input_tokens: int, output_tokens: int = 0) -> float:
+        """Estimar costo en USD a partir de los tokens de entrada y salida"""
+        profile = self.get_profile(model)
+        return (input_tokens * profile.input_cost_per_1k + output_tokens * profile.output_cost_per_1k) / 1000.0
+    
+    def estimate_latency(self, model: str, output_tokens: int) -> float:
+        """Estimar latencia en segundos a partir de los tokens generados"""
+        profile = self.get_profile(model)
+        return profile.request_overhead + output_tokens / profile.output_tokens_per_second
+
+
+# Prioridades por defecto de las secciones del prompt (mayor = se recorta al final)
+SECTION_PRIORITIES = {
+    "instructions": 100,
+    "code": 90,
+    "analysis": 50,
+    "template": 30,
+    "context": 20,
+    "example": 10,
+}
+
+
+@dataclass
+class PromptSection:
+    """Sección de un prompt con prioridad de recorte"""
+    name: str
+    content: str
+    priority: int = 0
+    min_tokens: int = 0
+
+
+@dataclass
+class BudgetResult:
+    """Resultado de ajustar un prompt a un presupuesto de tokens"""
+    prompt: str
+    total_tokens: int
+    max_tokens: int
+    section_tokens: Dict[str, int] = field(default_factory=dict)
+    trimmed_sections: List[str] = field(default_factory=list)
+    dropped_sections: List[str] = field(default_factory=list)
+    
+    @property
+    def within_budget(self) -> bool:
+        """Indica si el prompt cabe en el presupuesto"""
+        return self.total_tokens <= self.max_tokens
+
+
+def fit_sections(sections: List[PromptSection], max_tokens: int, tokenizer: Tokenizer,
+                 separator: str = "\n\n") -> BudgetResult:
+    """Ajustar secciones a un presupuesto de tokens recortando primero las de menor prioridad
+    
+    Las secciones conservan su orden original. Una sección se recorta hasta su
+    min_tokens y, si aún no cabe, se elimina; las de mayor prioridad solo se
+    tocan cuando las de menor prioridad ya no liberan más tokens.
+    """
+    contents = {id(section): section.content for section in sections}
+    counts = {id(section): tokenizer.count(section.content) for section in sections}
+    separator_tokens = tokenizer.count(separator)
+    marker_tokens = tokenizer.count(TRUNCATION_MARKER)
+    trimmed: List[str] = []
+    dropped: List[str] = []
+    
+    def total() -> int:
+        present = [key for key, content in contents.items() if content]
+        return sum(counts[key] for key in present) + separator_tokens * max(0, len(present) - 1)
+    
+    for section in sorted(sections, key=lambda s: s.priority):
+        excess = total() - max_tokens
+        if excess <= 0:
+            break
+        
+        key = id(section)
+        if not contents[key]:
+            continue
+        
+        keep = counts[key] - excess
+        if keep > marker_tokens and keep >= section.min_tokens:
+            contents[key] = tokenizer.truncate(contents[key], keep - marker_tokens) + TRUNCATION_MARKER
+            counts[key] = tokenizer.count(contents[key])
+            trimmed.append(section.name)
+        elif section.min_tokens > 0 and counts[key] > section.min_tokens:
+            contents[key] = tokenizer.truncate(contents[key], section.min_tokens)
+            counts[key] = tokenizer.count(contents[key])
+            trimmed.append(section.name)
+        else:
+            contents[key] = ""
+            counts[key] = 0
+            dropped.append(section.name)
+    
+    prompt = separator.join(contents[id(s)] for s in sections if contents[id(s)])
+    return BudgetResult(
+        prompt=prompt,
+        total_tokens=tokenizer.count(prompt),
+        max_tokens=max_tokens,
+        section_tokens={s.name: counts[id(s)] for s in sections},
+        trimmed_sections=trimmed,
+        dropped_sections=dropped
+    )
+
+
+# Instancia global del registro de tokenizadores
+tokenizer_registry = TokenizerRegistry()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+CLI de mantenimiento de la memoria vectorial
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+import sys
+from pathlib import Path
+
+import click
+from rich.console import Console
+from rich.table import Table
+
+# Agregar el directorio src al path para imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.chromadb_singleton import chromadb_singleton
+
+console = Console()
+
+
+@click.command()
+@click.option('--path', '-p', 'root', default='./memory', show_default=True,
+              help='Directorio de memoria a revisar')
+@click.option('--dry-run', is_flag=True, help='Mostrar lo que se eliminaría sin borrar nada')
+@click.option('--compact', is_flag=True, help='Compactar (VACUUM) las bases ChromaDB vigentes')
+def main(root: str, dry_run: bool, compact: bool):
+    """Eliminar directorios ChromaDB huérfanos de agentes y compactar los vigentes"""
+    result = chromadb_singleton.collect_garbage(Path(root), dry_run=dry_run, compact=compact)
+    
+    table = Table(title="Limpieza de memoria vectorial")
+    table.add_column("Acción", style="cyan")
+    table.add_column("Directorio", style="white")
+    
+    action = "Se eliminaría" if dry_run else "Eliminado"
+    for directory in result["removed"]:
+        table.add_row(action, directory)
+    for directory in result["compacted"]:
+        table.add_row("Compactado", directory)
+    for error in result["errors"]:
+        table.add_row("[red]Error[/red]", error)
+    
+    console.print(table)
+    freed = "se liberarían" if dry_run else "liberados"
+    console.print(f"[green]{result['bytes_freed'] / 1024 / 1024:.2f} MB {freed}[/green]")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,8 @@ from rich.console import Console
 from rich.panel import Panel
 from rich.prompt import Prompt, Confirm
 from rich.syntax import Syntax
+from rich.live import Live
+from rich.text import Text
 
 from agents.analysis_agent import analysis_agent
 from agents.generation_agent import generation_agent
@@ -20,6 +22,7 @@ from agents.validation_agent import validation_agent
 from agents.optimization_agent import optimization_agent
 from agents.coordinator_agent import coordinator_agent
 from tools.file_tools import file_manager
+from ai.streaming import CodeBlockStreamParser
 from tools.dotnet_tools import dotnet_manager, project_discovery, ProjectInfo, ProjectType
 from utils.config import get_config
 from utils.logging import get_logger, setup_logging
@@ -27,6 +30,9 @@ from utils.logging import get_logger, setup_logging
 logger = get_logger("simple-cli")
 console = Console()
 
+# Líneas visibles mientras se recibe la respuesta en streaming
+STREAM_PREVIEW_LINES = 30
+
 
 class SimpleCLI:
     """CLI simplificado para el sistema de agentes"""
@@ -72,7 +78,7 @@ Comandos disponibles:
 📖 Comandos disponibles:
 
 1. analyze <archivo> - Analizar archivo de código .NET
-2. generate <archivo> - Generar pruebas unitarias para un archivo
+2. generate <archivo> [--output <ruta>] - Generar pruebas unitarias (y guardarlas mientras se generan)
 3. validate <archivo> - Validar código y pruebas
 4. optimize <archivo> - Optimizar código
 5. project <ruta> - Establecer proyecto actual
@@ -84,6 +90,7 @@ Comandos disponibles:
 Ejemplos:
 - analyze Calculator.cs
 - generate Calculator.cs
+- generate Calculator.cs --output Tests/CalculatorTests.cs
 - project ./mi_proyecto
 - discover
 - status
@@ -244,8 +251,8 @@ Configuración:
         except Exception as e:
             self.console.print(f"❌ Error al analizar archivo: {e}")
     
-    def generate_tests(self, file_path: str):
-        """Generar pruebas unitarias"""
+    def generate_tests(self, file_path: str, output_path: Optional[str] = None):
+        """Generar pruebas unitarias (y escribirlas en output_path a medida que llegan)"""
         try:
             if not self.current_project_path:
                 self.console.print("❌ Error: No hay proyecto establecido. Use 'project <ruta>' primero")
@@ -261,15 +268,27 @@ Configuración:
             # Leer código
             code = file_manager.read_file(str(full_path))
             
-            # Analizar primero
-            analysis = analysis_agent.analyze_code(code)
-            
-            # Generar pruebas
-            tests = generation_agent.generate_tests(code, analysis, "xunit")
+            # Contexto de análisis del archivo
+            analysis = {"file_path": file_path, "project_path": self.current_project_path}
+            output_full_path = Path(self.current_project_path) / output_path if output_path else None
+            
+            # Generar pruebas mostrando la respuesta a medida que llega
+            parser = CodeBlockStreamParser()
+            with Live(console=self.console, refresh_per_second=8, transient=True) as live:
+                def render_chunk(chunk: str):
+                    parser.feed(chunk)
+                    preview = "\n".join(parser.get_text().splitlines()[-STREAM_PREVIEW_LINES:])
+                    live.update(Panel(Text(preview), title="Generando pruebas...", border_style="cyan"))
+                
+                generation_agent.generate_tests(code, analysis, "xunit", on_chunk=render_chunk,
+                                                output_path=output_full_path)
+            parser.close()
             
             # Mostrar resultado
-            syntax = Syntax(tests, "csharp", theme="monokai", line_numbers=True)
+            syntax = Syntax(parser.get_code(), "csharp", theme="monokai", line_numbers=True)
             self.console.print(Panel(syntax, title="Pruebas Generadas", border_style="green"))
+            if output_full_path:
+                self.console.print(f"💾 Pruebas guardadas en: {output_full_path}")
             
         except Exception as e:
             self.console.print(f"❌ Error al generar pruebas: {e}")
@@ -357,8 +376,8 @@ Configuración:
                     self.analyze_file(file_path)
                 
                 elif command.startswith('generate '):
-                    file_path = command[9:].strip()
-                    self.generate_tests(file_path)
+                    file_path, _, output_path = command[9:].partition(' --output ')
+                    self.generate_tests(file_path.strip(), output_path.strip() or None)
                 
                 elif command.startswith('validate '):
                     file_path = command[9:].strip()
@@ -8,6 +8,7 @@ from pathlib import Path
 import os
 
 from utils.logging import get_logger
+from utils.templating import CompiledTemplate, MUSTACHE_STYLE
 
 logger = get_logger("template-generator")
 
@@ -18,6 +19,7 @@ class TemplateGenerator:
     def __init__(self, templates_path: Path = Path("templates")):
         self.templates_path = templates_path
         self.logger = logger
+        self.compiled: Dict[tuple, CompiledTemplate] = {}
     
     def load_template(self, template_name: str, framework: str = "xunit") -> str:
         """Cargar template desde archivo"""
@@ -39,20 +41,35 @@ class TemplateGenerator:
     def generate_from_template(self, template_name: str, variables: Dict[str, Any], framework: str = "xunit") -> str:
         """Generar código desde template con variables"""
         try:
-            template = self.load_template(template_name, framework)
-            
-            # Reemplazar variables en el template
-            for key, value in variables.items():
-                placeholder = f"{{{{{key}}}}}"
-                template = template.replace(placeholder, str(value))
+            # Reemplazar variables {{key}} en una sola pasada sobre el template compilado
+            code = self.get_compiled_template(template_name, framework).render(variables)
             
             self.logger.info(f"Código generado desde template: {template_name}")
-            return template
+            return code
             
         except Exception as e:
             self.logger.error(f"Error al generar desde template {template_name}: {e}")
             raise
     
+    def get_compiled_template(self, template_name: str, framework: str = "xunit") -> CompiledTemplate:
+        """Obtener template compilado (se carga y parsea una sola vez)"""
+        key = (framework, template_name)
+        compiled = self.compiled.get(key)
+        if compiled is None:
+            template = self.load_template(template_name, framework)
+            compiled = CompiledTemplate.compile(template, style=MUSTACHE_STYLE, name=template_name)
+            self.compiled[key] = compiled
+        
+        return compiled
+    
+    def bind_template(self, template_name: str, variables: Dict[str, Any], framework: str = "xunit") -> CompiledTemplate:
+        """Prefijar variables comunes a todas las pruebas de un proyecto"""
+        return self.get_compiled_template(template_name, framework).partial(**variables)
+    
+    def clear_cache(self):
+        """Descartar templates compilados (p. ej. tras editar los archivos)"""
+        self.compiled.clear()
+    
     def _get_default_template(self, template_name: str, framework: str) -> str:
         """Obtener template por defecto"""
         if template_name == "test_class":
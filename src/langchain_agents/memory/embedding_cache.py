@@ -0,0 +1,296 @@
+"""
+Caché persistente de embeddings con memoria acotada
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import Callable, Dict, List, Any, Optional, Sequence
+from collections import OrderedDict
+from pathlib import Path
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import weakref
+
+import numpy as np
+
+from utils.logging import get_logger
+
+logger = get_logger("embedding-cache")
+
+# Capacidad por defecto (10.000 vectores de 384 dimensiones ≈ 15 MB en disco)
+DEFAULT_CAPACITY = 10000
+
+# Vectores nuevos tras los que el índice se escribe a disco automáticamente
+DEFAULT_FLUSH_EVERY = 64
+
+VECTORS_FILE = "vectors.f32"
+KEYS_FILE = "keys.u8"
+INDEX_FILE = "index.json"
+
+# Bytes de la clave (sha256) guardados junto a cada vector
+KEY_BYTES = 32
+EMPTY_KEY = bytes(KEY_BYTES)
+
+# Cachés abiertos, para escribir sus índices al salir del proceso
+_open_caches: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def content_key(model_name: str, text: str) -> str:
+    """Clave estable entre procesos: hash del modelo y del texto"""
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Caché de embeddings por contenido, persistido en un archivo float32 mapeado en memoria
+    
+    Los vectores ocupan posiciones fijas de un archivo binario (capacity x
+    dimension) que se abre con np.memmap, de modo que solo se cargan en RAM
+    las páginas que se leen. El índice clave -> posición se guarda en JSON en
+    orden LRU; al llenarse, la entrada menos usada cede su posición.
+    
+    Cada posición guarda también la clave de su vector en un segundo archivo.
+    El sistema operativo escribe los vectores aunque no se llame a flush(), así
+    que un índice antiguo puede apuntar a una posición ya reutilizada: al leer
+    se comprueba la clave y una discrepancia cuenta como fallo.
+    """
+    
+    def __init__(self, path: str, model_name: str, capacity: int = DEFAULT_CAPACITY,
+                 flush_every: int = DEFAULT_FLUSH_EVERY):
+        if capacity <= 0:
+            raise ValueError("La capacidad debe ser mayor que cero")
+        
+        self.logger = logger
+        self.model_name = model_name
+        self.capacity = capacity
+        self.flush_every = flush_every
+        self.path = Path(path) / re.sub(r"[^\w.-]", "_", model_name)
+        self.path.mkdir(parents=True, exist_ok=True)
+        
+        self.dimension: Optional[int] = None
+        self._vectors: Optional[np.memmap] = None
+        self._keys: Optional[np.memmap] = None
+        self._slots: "OrderedDict[str, int]" = OrderedDict()
+        self._free: List[int] = []
+        self._dirty = False
+        self._pending_writes = 0
+        self._lock = threading.RLock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        
+        self._load()
+        _open_caches.add(self)
+    
+    def _load(self):
+        """Abrir el archivo de vectores y su índice si existen"""
+        index_path = self.path / INDEX_FILE
+        vectors_path = self.path / VECTORS_FILE
+        keys_path = self.path / KEYS_FILE
+        if not index_path.exists() or not vectors_path.exists() or not keys_path.exists():
+            return
+        
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            
+            if index.get("model") != self.model_name:
+                self.logger.warning(f"Caché de embeddings de otro modelo en {self.path}, se descarta")
+                return
+            
+            stored_capacity = index["capacity"]
+            self.dimension = index["dimension"]
+            stored = np.memmap(vectors_path, dtype=np.float32, mode="r+",
+                               shape=(stored_capacity, self.dimension))
+            stored_keys = np.memmap(keys_path, dtype=np.uint8, mode="r+", shape=(stored_capacity, KEY_BYTES))
+            
+            # [clave, posición] del menos al más reciente; se descartan las posiciones
+            # reutilizadas después de escribir el índice
+            entries = [(key, slot) for key, slot in index["entries"]
+                       if stored_keys[slot].tobytes() == bytes.fromhex(key)]
+            if len(entries) != len(index["entries"]):
+                self.logger.warning(
+                    f"{len(index['entries']) - len(entries)} entradas del índice de embeddings "
+                    f"apuntaban a vectores reemplazados, se descartan"
+                )
+                self._dirty = True
+            
+            if stored_capacity == self.capacity:
+                self._vectors = stored
+                self._keys = stored_keys
+                self._slots = OrderedDict(entries)
+            else:
+                # Capacidad distinta: copiar las entradas más recientes a un archivo nuevo
+                kept = entries[-self.capacity:]
+                data = {key: np.array(stored[slot]) for key, slot in kept}
+                del stored, stored_keys
+                self._create_vectors(self.dimension)
+                for new_slot, (key, _) in enumerate(kept):
+                    self._write_slot(new_slot, key, data[key])
+                    self._slots[key] = new_slot
+                self._dirty = True
+            
+            used = set(self._slots.values())
+            self._free = [slot for slot in range(self.capacity - 1, -1, -1) if slot not in used]
+            self.logger.info(f"Caché de embeddings cargado: {len(self._slots)} vectores de {self.model_name}")
+        
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.logger.warning(f"Caché de embeddings ilegible en {self.path}, se descarta: {e}")
+            self._vectors = None
+            self._keys = None
+            self._slots.clear()
+            self.dimension = None
+    
+    def _create_vectors(self, dimension: int):
+        """Crear los archivos de vectores y claves vacíos"""
+        self.dimension = dimension
+        self._vectors = np.memmap(self.path / VECTORS_FILE, dtype=np.float32, mode="w+",
+                                  shape=(self.capacity, dimension))
+        self._keys = np.memmap(self.path / KEYS_FILE, dtype=np.uint8, mode="w+",
+                               shape=(self.capacity, KEY_BYTES))
+        self._slots = OrderedDict()
+        self._free = list(range(self.capacity - 1, -1, -1))
+    
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """Embedding del texto si está en caché"""
+        return self.get_many([text])[0]
+    
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Embeddings de varios textos (None en los que faltan)"""
+        keys = [content_key(self.model_name, text) for text in texts]
+        results: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for key in keys:
+                slot = self._slots.get(key)
+                if slot is not None and self._keys[slot].tobytes() != bytes.fromhex(key):
+                    # La posición guarda el vector de otro texto
+                    del self._slots[key]
+                    slot = None
+                if slot is None:
+                    self.stats["misses"] += 1
+                    results.append(None)
+                    continue
+                self._slots.move_to_end(key)
+                self.stats["hits"] += 1
+                results.append(np.array(self._vectors[slot]))
+        return results
+    
+    def get_or_compute(self, texts: Sequence[str],
+                       compute: Callable[[List[str]], Sequence[Any]]) -> List[np.ndarray]:
+        """Embeddings de varios textos; los que faltan se calculan con una sola llamada a compute"""
+        embeddings = self.get_many(texts)
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if not missing:
+            return embeddings
+        
+        encoded = np.asarray(compute(missing), dtype=np.float32)
+        self.put_many(missing, encoded)
+        by_text = dict(zip(missing, encoded))
+        return [by_text[text] if embedding is None else embedding for text, embedding in zip(texts, embeddings)]
+    
+    def put(self, text: str, embedding: Any):
+        """Guardar el embedding de un texto"""
+        self.put_many([text], [embedding])
+    
+    def put_many(self, texts: Sequence[str], embeddings: Sequence[Any]):
+        """Guardar embeddings de varios textos"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError("Se espera un embedding por texto")
+        
+        with self._lock:
+            if self._vectors is None:
+                self._create_vectors(vectors.shape[1])
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"Dimensión {vectors.shape[1]} distinta de la del caché ({self.dimension})")
+            
+            for text, vector in zip(texts, vectors):
+                key = content_key(self.model_name, text)
+                slot = self._slots.get(key)
+                if slot is None:
+                    slot = self._allocate()
+                self._write_slot(slot, key, vector)
+                self._slots[key] = slot
+                self._slots.move_to_end(key)
+            self._dirty = True
+            self._pending_writes += len(texts)
+            if self.flush_every and self._pending_writes >= self.flush_every:
+                self.flush()
+    
+    def _write_slot(self, slot: int, key: str, vector: np.ndarray):
+        """Escribir vector y clave en una posición; la clave se invalida mientras cambia el vector"""
+        self._keys[slot] = np.frombuffer(EMPTY_KEY, dtype=np.uint8)
+        self._vectors[slot] = vector
+        self._keys[slot] = np.frombuffer(bytes.fromhex(key), dtype=np.uint8)
+    
+    def _allocate(self) -> int:
+        """Posición libre, expulsando la entrada menos usada si el caché está lleno"""
+        if self._free:
+            return self._free.pop()
+        _, slot = self._slots.popitem(last=False)
+        self.stats["evictions"] += 1
+        return slot
+    
+    def __contains__(self, text: str) -> bool:
+        with self._lock:
+            return content_key(self.model_name, text) in self._slots
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._slots)
+    
+    def flush(self):
+        """Escribir vectores e índice en disco (el índice de forma atómica)"""
+        with self._lock:
+            if not self._dirty or self._vectors is None:
+                return
+            self._vectors.flush()
+            self._keys.flush()
+            index = {
+                "model": self.model_name,
+                "dimension": self.dimension,
+                "capacity": self.capacity,
+                "entries": [[key, slot] for key, slot in self._slots.items()]
+            }
+            temp_path = self.path / f"{INDEX_FILE}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f, separators=(",", ":"))
+            os.replace(temp_path, self.path / INDEX_FILE)
+            self._dirty = False
+            self._pending_writes = 0
+    
+    def close(self):
+        """Escribir el índice a disco y dejar de seguir el caché al salir del proceso"""
+        self.flush()
+        _open_caches.discard(self)
+    
+    def clear(self):
+        """Vaciar el caché (el archivo de vectores se reutiliza)"""
+        with self._lock:
+            self._slots.clear()
+            self._free = list(range(self.capacity - 1, -1, -1))
+            self._dirty = True
+        self.flush()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas del caché"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._slots)
+        stats["capacity"] = self.capacity
+        stats["dimension"] = self.dimension
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = f"{(stats['hits'] / lookups * 100) if lookups else 0:.2f}%"
+        return stats
+
+
+def flush_embedding_caches():
+    """Escribir los índices de los cachés abiertos (al salir del proceso)"""
+    for cache in list(_open_caches):
+        try:
+            cache.flush()
+        except Exception as e:
+            logger.warning(f"Error al guardar caché de embeddings {cache.path}: {e}")
+
+
+atexit.register(flush_embedding_caches)
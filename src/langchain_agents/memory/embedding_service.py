@@ -0,0 +1,225 @@
+"""
+Servicio de embeddings compartido por todo el proceso
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import Dict, List, Any, Optional, Sequence
+from abc import ABC, abstractmethod
+import atexit
+import multiprocessing
+import threading
+import time
+
+import numpy as np
+
+from utils.logging import get_logger
+from utils.config import get_config
+
+logger = get_logger("embedding-service")
+
+# Modelo de embeddings usado por la memoria vectorial
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+
+class EmbeddingService(ABC):
+    """Interfaz mínima para calcular embeddings"""
+    
+    def __init__(self, model_name: str):
+        self.logger = logger
+        self.model_name = model_name
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "texts": 0, "encode_time": 0.0}
+    
+    @abstractmethod
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Calcular embeddings de un lote de textos"""
+        pass
+    
+    def encode(self, texts: Sequence[str], batch_size: int = 32) -> np.ndarray:
+        """Embeddings float32 de los textos, una fila por texto"""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        
+        start_time = time.time()
+        embeddings = np.asarray(self._encode(texts, batch_size), dtype=np.float32)
+        with self._stats_lock:
+            self.stats["calls"] += 1
+            self.stats["texts"] += len(texts)
+            self.stats["encode_time"] += time.time() - start_time
+        return embeddings
+    
+    def close(self):
+        """Liberar el modelo o el proceso auxiliar"""
+        pass
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas del servicio"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["model"] = self.model_name
+        stats["mode"] = self.mode
+        stats["average_batch"] = stats["texts"] / stats["calls"] if stats["calls"] else 0.0
+        return stats
+
+
+class LocalEmbeddingService(EmbeddingService):
+    """Modelo SentenceTransformer cargado una sola vez en el proceso actual"""
+    
+    mode = "local"
+    
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME):
+        super().__init__(model_name)
+        self._model = None
+        self._load_lock = threading.Lock()
+        # Una inferencia a la vez: los hilos concurrentes ya llegan agrupados en lotes
+        self._encode_lock = threading.Lock()
+    
+    @property
+    def model(self):
+        """Modelo cargado al primer uso"""
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    
+                    start_time = time.time()
+                    self._model = SentenceTransformer(self.model_name)
+                    self.logger.info(f"Modelo de embeddings {self.model_name} cargado en {time.time() - start_time:.2f}s")
+        return self._model
+    
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        model = self.model
+        with self._encode_lock:
+            return model.encode(texts, batch_size=batch_size)
+    
+    def close(self):
+        with self._load_lock:
+            self._model = None
+
+
+def _embedding_worker(model_name: str, connection):
+    """Proceso auxiliar: carga el modelo y responde peticiones de encode"""
+    service = LocalEmbeddingService(model_name)
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        
+        texts, batch_size = request
+        try:
+            connection.send(("ok", service.encode(texts, batch_size)))
+        except Exception as e:
+            connection.send(("error", f"{type(e).__name__}: {e}"))
+    connection.close()
+
+
+class ProcessEmbeddingService(EmbeddingService):
+    """Modelo cargado en un proceso auxiliar dedicado
+    
+    La inferencia no compite por el GIL con los agentes y la memoria del
+    modelo queda fuera del proceso principal. El proceso arranca al primer
+    encode y atiende las peticiones de una en una.
+    """
+    
+    mode = "process"
+    
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME):
+        super().__init__(model_name)
+        self._process = None
+        self._connection = None
+        self._lock = threading.Lock()
+    
+    def _ensure_process(self):
+        """Arrancar el proceso auxiliar si no está vivo"""
+        if self._process is not None and self._process.is_alive():
+            return
+        
+        context = multiprocessing.get_context("spawn")
+        parent_connection, child_connection = context.Pipe()
+        self._process = context.Process(
+            target=_embedding_worker, args=(self.model_name, child_connection),
+            name=f"embedding-{self.model_name}", daemon=True
+        )
+        self._process.start()
+        child_connection.close()
+        self._connection = parent_connection
+        self.logger.info(f"Proceso de embeddings iniciado (pid {self._process.pid})")
+    
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        with self._lock:
+            self._ensure_process()
+            try:
+                self._connection.send((texts, batch_size))
+                status, payload = self._connection.recv()
+            except (EOFError, OSError) as e:
+                self._process = None
+                raise RuntimeError(f"El proceso de embeddings terminó inesperadamente: {e}")
+        
+        if status != "ok":
+            raise RuntimeError(f"Error en el proceso de embeddings: {payload}")
+        return payload
+    
+    def close(self):
+        with self._lock:
+            if self._process is None:
+                return
+            try:
+                self._connection.send(None)
+                self._connection.close()
+            except (OSError, ValueError):
+                pass
+            self._process.join(timeout=5)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process = None
+            self._connection = None
+
+
+_services: Dict[str, EmbeddingService] = {}
+_services_lock = threading.Lock()
+
+
+def create_embedding_service(model_name: str = EMBEDDING_MODEL_NAME,
+                             mode: Optional[str] = None) -> EmbeddingService:
+    """Crear un servicio de embeddings según el modo configurado"""
+    mode = mode or get_config().memory.embedding_service_mode
+    if mode == "process":
+        return ProcessEmbeddingService(model_name)
+    if mode == "local":
+        return LocalEmbeddingService(model_name)
+    raise ValueError(f"Modo de servicio de embeddings no soportado: {mode}")
+
+
+def get_embedding_service(model_name: str = EMBEDDING_MODEL_NAME) -> EmbeddingService:
+    """Servicio de embeddings compartido del proceso para el modelo"""
+    with _services_lock:
+        service = _services.get(model_name)
+        if service is None:
+            service = create_embedding_service(model_name)
+            _services[model_name] = service
+        return service
+
+
+def set_embedding_service(service: EmbeddingService, model_name: Optional[str] = None):
+    """Registrar el servicio compartido de un modelo (por ejemplo, uno de pruebas)"""
+    with _services_lock:
+        _services[model_name or service.model_name] = service
+
+
+def shutdown_embedding_services():
+    """Cerrar los servicios de embeddings del proceso"""
+    with _services_lock:
+        services = list(_services.values())
+        _services.clear()
+    for service in services:
+        try:
+            service.close()
+        except Exception as e:
+            logger.warning(f"Error al cerrar servicio de embeddings {service.model_name}: {e}")
+
+
+atexit.register(shutdown_embedding_services)
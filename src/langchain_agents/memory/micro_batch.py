@@ -0,0 +1,148 @@
+"""
+Agrupación en micro-lotes de llamadas concurrentes
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import Dict, List, Any, Optional, Callable, Sequence
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+from utils.logging import get_logger
+
+logger = get_logger("micro-batch")
+
+# Tamaño máximo de lote y espera para completarlo por defecto
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT = 0.005
+
+
+class MicroBatcher:
+    """Junta los elementos que envían varios hilos y los procesa en un solo lote
+    
+    Un hilo de fondo toma el primer elemento de la cola, espera hasta
+    max_wait segundos (o hasta max_batch_size elementos) a que lleguen más y
+    llama a process una vez con todos. process recibe la lista de elementos y
+    devuelve un resultado por elemento; si lanza una excepción, la reciben
+    todos los llamadores del lote.
+    """
+    
+    def __init__(self, process: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait: float = DEFAULT_MAX_WAIT, name: str = "micro-batcher"):
+        if max_batch_size <= 0:
+            raise ValueError("El tamaño de lote debe ser mayor que cero")
+        
+        self.logger = logger
+        self.process = process
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"batches": 0, "items": 0, "max_batch": 0, "errors": 0}
+    
+    def _ensure_worker(self):
+        """Arrancar el hilo de fondo la primera vez que se usa (con self._lock tomado)"""
+        if self._closed:
+            raise RuntimeError(f"{self.name} está cerrado")
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+    
+    def submit_many(self, items: Sequence[Any]) -> List[Future]:
+        """Encolar elementos; cada futuro se resuelve con el resultado de su elemento"""
+        futures = [Future() for _ in items]
+        if not futures:
+            return futures
+        
+        if threading.current_thread() is self._thread:
+            # Llamada desde process: procesar en línea para no bloquear al propio hilo
+            self._process_batch(list(zip(items, futures)))
+            return futures
+        
+        # close() encola su centinela con el mismo lock: ningún elemento queda detrás de él
+        with self._lock:
+            self._ensure_worker()
+            for item, future in zip(items, futures):
+                self._queue.put((item, future))
+        return futures
+    
+    def submit(self, item: Any) -> Future:
+        """Encolar un elemento"""
+        return self.submit_many([item])[0]
+    
+    def call_many(self, items: Sequence[Any]) -> List[Any]:
+        """Procesar elementos esperando sus resultados"""
+        return [future.result() for future in self.submit_many(items)]
+    
+    def call(self, item: Any) -> Any:
+        """Procesar un elemento esperando su resultado"""
+        return self.submit(item).result()
+    
+    def _run(self):
+        """Bucle del hilo de fondo"""
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    pending = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if pending is None:
+                    stop = True
+                    break
+                batch.append(pending)
+            
+            self._process_batch(batch)
+            if stop:
+                return
+    
+    def _process_batch(self, batch: List[Any]):
+        """Procesar un lote y resolver los futuros de sus elementos"""
+        items = [item for item, _ in batch]
+        try:
+            results = self.process(items)
+            if len(results) != len(items):
+                raise ValueError(f"{self.name}: se esperaban {len(items)} resultados, se obtuvieron {len(results)}")
+        except Exception as e:
+            self.logger.error(f"Error al procesar lote de {len(items)} elementos en {self.name}: {e}")
+            with self._lock:
+                self.stats["errors"] += 1
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["items"] += len(items)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(items))
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+    
+    def close(self, timeout: Optional[float] = None):
+        """Procesar lo pendiente y detener el hilo de fondo"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return
+            self._queue.put(None)
+        thread.join(timeout)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas de los lotes"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["average_batch"] = stats["items"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
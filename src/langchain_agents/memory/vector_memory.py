@@ -12,15 +12,20 @@ from pathlib import Path
 
 import chromadb
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
-import numpy as np
 
-from utils.helpers import file_helper, json_helper
 from utils.logging import get_logger
+from utils.config import get_config
 from utils.chromadb_singleton import chromadb_singleton
+from .embedding_cache import EmbeddingCache
+from .embedding_service import EMBEDDING_MODEL_NAME, EmbeddingService, get_embedding_service
+from .micro_batch import MicroBatcher
+from .vector_store import VECTOR_STORE_BACKENDS, VectorStore, create_faiss_vector_store
 
 logger = get_logger("vector-memory")
 
+# Entradas por llamada a collection.add en add_entries
+BULK_WRITE_SIZE = 512
+
 
 @dataclass
 class VectorEntry:
@@ -44,7 +49,8 @@ class VectorMemory:
     """Memoria vectorial para búsqueda semántica"""
     
     def __init__(self, agent_name: str, storage_path: str = "./memory/individual", 
-                 collection_name: Optional[str] = None):
+                 collection_name: Optional[str] = None, embedding_cache_size: Optional[int] = None,
+                 embedding_service: Optional[EmbeddingService] = None, vector_store: Optional[str] = None):
         self.agent_name = agent_name
         self.storage_path = Path(storage_path) / agent_name / "vector"
         self.storage_path.mkdir(parents=True, exist_ok=True)
@@ -52,14 +58,45 @@ class VectorMemory:
         self.collection_name = collection_name or f"{agent_name}_memory"
         self.logger = logger
         
-        # Configurar modelo de embeddings
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Modelo de embeddings compartido por todas las memorias del proceso
+        self.embedding_service = embedding_service or get_embedding_service(EMBEDDING_MODEL_NAME)
         
-        # Configurar ChromaDB
-        self._setup_chromadb()
+        memory_config = get_config().memory
+        
+        # Configurar backend vectorial (ChromaDB o índice FAISS en proceso)
+        self.vector_store_backend = vector_store or memory_config.individual_vector_store
+        self._setup_vector_store()
+        
+        # Cache de embeddings por contenido, acotado y persistente entre reinicios
+        self.embedding_cache = EmbeddingCache(
+            self.storage_path / "embeddings",
+            self.embedding_service.model_name,
+            capacity=embedding_cache_size or memory_config.embedding_cache_size
+        )
+        self.load_cache()
+        
+        # Micro-lotes: las llamadas concurrentes se codifican y escriben juntas
+        self.embedding_batch_size = memory_config.embedding_batch_size
+        batch_wait = memory_config.embedding_batch_wait_ms / 1000
+        self.entry_writer = MicroBatcher(
+            self._write_entries, self.embedding_batch_size, batch_wait, name=f"{agent_name}-vector-writer"
+        )
+        self.query_encoder = MicroBatcher(
+            self._generate_embeddings, self.embedding_batch_size, batch_wait, name=f"{agent_name}-query-encoder"
+        )
+    
+    def _setup_vector_store(self):
+        """Configurar el backend vectorial"""
+        if self.vector_store_backend not in VECTOR_STORE_BACKENDS:
+            raise ValueError(f"Backend vectorial no soportado: {self.vector_store_backend}")
+        
+        if self.vector_store_backend == "faiss":
+            self.chroma_client = None
+            self.collection = create_faiss_vector_store(self.storage_path / "faiss" / self.collection_name)
+            self.logger.info(f"Índice FAISS en proceso para: {self.collection_name}")
+            return
         
-        # Cache de embeddings
-        self.embedding_cache: Dict[str, List[float]] = {}
+        self._setup_chromadb()
     
     def _setup_chromadb(self):
         """Configurar ChromaDB usando singleton"""
@@ -98,28 +135,8 @@ class VectorMemory:
             if not entry_id:
                 entry_id = f"{self.agent_name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
             
-            # Generar embedding
-            embedding = self._generate_embedding(content)
-            
-            # Crear entrada
-            entry = VectorEntry(
-                id=entry_id,
-                content=content,
-                metadata=metadata or {},
-                embedding=embedding
-            )
-            
-            # Agregar a ChromaDB si está disponible
-            if self.collection is not None:
-                self.collection.add(
-                    ids=[entry_id],
-                    documents=[content],
-                    embeddings=[embedding],
-                    metadatas=[metadata or {}]
-                )
-            
-            # Agregar al cache
-            self.embedding_cache[entry_id] = embedding
+            # Embedding y escritura en ChromaDB junto con otras llamadas concurrentes
+            self.entry_writer.call((entry_id, content, metadata or {}))
             
             self.logger.debug(f"Entrada agregada a memoria vectorial: {entry_id}")
             return entry_id
@@ -128,6 +145,56 @@ class VectorMemory:
             self.logger.error(f"Error al agregar entrada: {e}")
             raise
     
+    def add_entries(self, contents: List[str], metadatas: Optional[List[Dict[str, Any]]] = None,
+                    entry_ids: Optional[List[str]] = None) -> List[str]:
+        """Agregar varias entradas codificándolas por lotes"""
+        try:
+            if metadatas is not None and len(metadatas) != len(contents):
+                raise ValueError("Se espera un metadata por entrada")
+            if entry_ids is not None and len(entry_ids) != len(contents):
+                raise ValueError("Se espera un ID por entrada")
+            
+            if entry_ids is None:
+                prefix = f"{self.agent_name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+                entry_ids = [f"{prefix}_{index}" for index in range(len(contents))]
+            
+            items = [
+                (entry_id, content, (metadatas[index] if metadatas else None) or {})
+                for index, (entry_id, content) in enumerate(zip(entry_ids, contents))
+            ]
+            for start in range(0, len(items), BULK_WRITE_SIZE):
+                self._write_entries(items[start:start + BULK_WRITE_SIZE])
+            
+            self.logger.debug(f"{len(items)} entradas agregadas a memoria vectorial")
+            return list(entry_ids)
+            
+        except Exception as e:
+            self.logger.error(f"Error al agregar entradas: {e}")
+            raise
+    
+    def _write_entries(self, items: List[Tuple[str, str, Dict[str, Any]]]) -> List[str]:
+        """Codificar un lote de entradas y escribirlo con un solo collection.add"""
+        # IDs repetidos en el lote: se conserva el primero, como hace ChromaDB con los existentes
+        unique: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        for entry_id, content, metadata in items:
+            unique.setdefault(entry_id, (content, metadata))
+        
+        ids = list(unique)
+        documents = [content for content, _ in unique.values()]
+        embeddings = self._generate_embeddings(documents)
+        
+        # Agregar a ChromaDB si está disponible
+        if self.collection is not None and ids:
+            self.collection.add(
+                ids=ids,
+                documents=documents,
+                embeddings=embeddings,
+                # ChromaDB rechaza metadata vacía; None evita que una entrada falle el lote completo
+                metadatas=[metadata or None for _, metadata in unique.values()]
+            )
+        
+        return [entry_id for entry_id, _, _ in items]
+    
     def search(self, query: str, limit: int = 5, 
                similarity_threshold: float = 0.7) -> List[SearchResult]:
         """Buscar entradas similares"""
@@ -137,8 +204,8 @@ class VectorMemory:
                 self.logger.warning("ChromaDB no disponible, búsqueda no posible")
                 return []
             
-            # Generar embedding de la consulta
-            query_embedding = self._generate_embedding(query)
+            # Generar embedding de la consulta (agrupado con consultas concurrentes)
+            query_embedding = self.query_encoder.call(query)
             
             # Buscar en ChromaDB
             results = self.collection.query(
@@ -153,7 +220,7 @@ class VectorMemory:
             if results['ids'] and results['ids'][0]:
                 for i, entry_id in enumerate(results['ids'][0]):
                     content = results['documents'][0][i]
-                    metadata = results['metadatas'][0][i]
+                    metadata = results['metadatas'][0][i] or {}
                     distance = results['distances'][0][i]
                     
                     # Convertir distancia a similitud (ChromaDB usa distancia coseno)
@@ -192,7 +259,7 @@ class VectorMemory:
             
             if results['ids'] and results['ids'][0]:
                 content = results['documents'][0][0]
-                metadata = results['metadatas'][0][0]
+                metadata = results['metadatas'][0][0] or {}
                 
                 return VectorEntry(
                     id=entry_id,
@@ -232,10 +299,6 @@ class VectorMemory:
                 metadatas=[new_metadata]
             )
             
-            # Actualizar cache
-            if new_embedding:
-                self.embedding_cache[entry_id] = new_embedding
-            
             self.logger.debug(f"Entrada actualizada: {entry_id}")
             return True
             
@@ -248,10 +311,6 @@ class VectorMemory:
         try:
             self.collection.delete(ids=[entry_id])
             
-            # Remover del cache
-            if entry_id in self.embedding_cache:
-                del self.embedding_cache[entry_id]
-            
             self.logger.debug(f"Entrada eliminada: {entry_id}")
             return True
             
@@ -271,7 +330,7 @@ class VectorMemory:
             if results['ids']:
                 for i, entry_id in enumerate(results['ids']):
                     content = results['documents'][i]
-                    metadata = results['metadatas'][i]
+                    metadata = results['metadatas'][i] or {}
                     
                     entry = VectorEntry(
                         id=entry_id,
@@ -296,6 +355,7 @@ class VectorMemory:
                 'agent_name': self.agent_name,
                 'total_entries': count,
                 'cache_size': len(self.embedding_cache),
+                'write_batches': self.entry_writer.get_stats(),
                 'storage_path': str(self.storage_path)
             }
             
@@ -306,14 +366,17 @@ class VectorMemory:
     def clear_memory(self) -> bool:
         """Limpiar toda la memoria"""
         try:
-            # Eliminar colección
-            self.chroma_client.delete_collection(self.collection_name)
+            if isinstance(self.collection, VectorStore):
+                self.collection.clear()
+            else:
+                # Eliminar colección
+                self.chroma_client.delete_collection(self.collection_name)
             
-            # Recrear colección vacía
-            self.collection = self.chroma_client.create_collection(
-                name=self.collection_name,
-                metadata={"agent": self.agent_name}
-            )
+                # Recrear colección vacía
+                self.collection = self.chroma_client.create_collection(
+                    name=self.collection_name,
+                    metadata={"agent": self.agent_name}
+                )
             
             # Limpiar cache
             self.embedding_cache.clear()
@@ -327,35 +390,42 @@ class VectorMemory:
     
     def _generate_embedding(self, text: str) -> List[float]:
         """Generar embedding para texto"""
+        return self._generate_embeddings([text])[0]
+    
+    def _generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generar embeddings para varios textos con una sola llamada al modelo"""
         try:
-            # Verificar cache
-            text_hash = hash(text)
-            if text_hash in self.embedding_cache:
-                return self.embedding_cache[text_hash]
-            
-            # Generar embedding
-            embedding = self.embedding_model.encode(text).tolist()
-            
-            # Agregar al cache
-            self.embedding_cache[text_hash] = embedding
-            
-            return embedding
+            # Cache por contenido; los textos que faltan se codifican en un solo lote
+            embeddings = self.embedding_cache.get_or_compute(
+                texts, lambda missing: self.embedding_service.encode(missing, batch_size=self.embedding_batch_size)
+            )
+            return [embedding.tolist() for embedding in embeddings]
             
         except Exception as e:
             self.logger.error(f"Error al generar embedding: {e}")
             raise
     
+    def close(self):
+        """Terminar los lotes pendientes, guardar el cache de embeddings y liberar el backend vectorial"""
+        self.entry_writer.close()
+        self.query_encoder.close()
+        self.save_cache()
+        self.embedding_cache.close()
+        
+        if self.chroma_client is not None:
+            chromadb_singleton.release_client(self.agent_name, self.storage_path)
+            self.chroma_client = None
+            self.collection = None
+        elif isinstance(self.collection, VectorStore):
+            self.collection.close()
+            self.collection = None
+    
     def save_cache(self) -> bool:
         """Guardar cache de embeddings"""
         try:
-            cache_file = self.storage_path / "embedding_cache.json"
-            
-            # Convertir cache a formato serializable
-            cache_data = {
-                str(k): v for k, v in self.embedding_cache.items()
-            }
-            
-            json_helper.save_json(cache_data, cache_file)
+            self.embedding_cache.flush()
+            if isinstance(self.collection, VectorStore):
+                self.collection.persist()
             self.logger.debug("Cache de embeddings guardado")
             return True
             
@@ -364,24 +434,19 @@ class VectorMemory:
             return False
     
     def load_cache(self) -> bool:
-        """Cargar cache de embeddings"""
+        """Cargar cache de embeddings
+        
+        El caché se abre al crear la memoria. El antiguo embedding_cache.json
+        usaba claves hash() que cambian entre procesos, así que no se puede
+        migrar y se elimina.
+        """
+        legacy_file = self.storage_path / "embedding_cache.json"
         try:
-            cache_file = self.storage_path / "embedding_cache.json"
-            
-            if not cache_file.exists():
-                return True
-            
-            cache_data = json_helper.load_json(cache_file)
-            
-            # Restaurar cache
-            self.embedding_cache = {
-                int(k) if k.isdigit() else k: v 
-                for k, v in cache_data.items()
-            }
-            
-            self.logger.debug("Cache de embeddings cargado")
+            if legacy_file.exists():
+                legacy_file.unlink()
+                self.logger.info(f"Cache de embeddings antiguo eliminado: {legacy_file}")
             return True
             
         except Exception as e:
-            self.logger.error(f"Error al cargar cache: {e}")
+            self.logger.error(f"Error al eliminar cache antiguo: {e}")
             return False
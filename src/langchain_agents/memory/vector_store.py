@@ -0,0 +1,598 @@
+"""
+Backends de almacenamiento vectorial para las memorias
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import Dict, List, Any, Optional, Sequence
+from abc import ABC, abstractmethod
+from pathlib import Path
+import json
+import os
+import threading
+
+import numpy as np
+
+from utils.logging import get_logger
+from utils.config import get_config
+
+logger = get_logger("vector-store")
+
+VECTOR_STORE_BACKENDS = ("chroma", "faiss")
+FAISS_INDEX_TYPES = ("flat", "hnsw", "ivf")
+
+VECTORS_FILE_PATTERN = "vectors.{generation}.f32"
+RECORDS_FILE = "records.jsonl"
+INDEX_FILE = "index.faiss"
+INDEX_META_FILE = "index.json"
+
+# Filas reservadas al crear el archivo de vectores (crece duplicándose)
+INITIAL_CAPACITY = 1024
+
+# Compactar cuando las filas borradas superan esta fracción
+COMPACT_DELETED_RATIO = 0.25
+COMPACT_MIN_ROWS = 1024
+
+# Vectores por lista que necesita IVF para entrenar sus centroides
+IVF_POINTS_PER_LIST = 39
+
+# Filas por llamada al añadir al índice durante una reconstrucción
+REBUILD_CHUNK_SIZE = 65536
+
+DEFAULT_INCLUDE = ("documents", "metadatas", "distances")
+INCLUDE_FIELDS = ("documents", "metadatas", "embeddings", "distances")
+
+
+class VectorStore(ABC):
+    """Colección de vectores con la interfaz de colección de ChromaDB que usan las memorias
+    
+    Las colecciones de ChromaDB ya cumplen esta interfaz; los demás backends
+    la implementan para sustituirlas sin cambiar el código que las consulta.
+    Las distancias son de coseno (1 - similitud).
+    """
+    
+    @abstractmethod
+    def add(self, ids: List[str], documents: Optional[List[str]] = None,
+            embeddings: Optional[Sequence[Sequence[float]]] = None,
+            metadatas: Optional[List[Optional[Dict[str, Any]]]] = None):
+        """Agregar entradas (los IDs existentes se ignoran)"""
+        pass
+    
+    @abstractmethod
+    def query(self, query_embeddings: Sequence[Sequence[float]], n_results: int = 10,
+              include: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """Vecinos más cercanos de cada consulta"""
+        pass
+    
+    @abstractmethod
+    def get(self, ids: Optional[List[str]] = None, include: Optional[Sequence[str]] = None,
+            limit: Optional[int] = None) -> Dict[str, Any]:
+        """Entradas por ID (o todas)"""
+        pass
+    
+    @abstractmethod
+    def update(self, ids: List[str], documents: Optional[List[str]] = None,
+               embeddings: Optional[Sequence[Sequence[float]]] = None,
+               metadatas: Optional[List[Optional[Dict[str, Any]]]] = None):
+        """Actualizar entradas existentes"""
+        pass
+    
+    @abstractmethod
+    def delete(self, ids: List[str]):
+        """Eliminar entradas"""
+        pass
+    
+    @abstractmethod
+    def count(self) -> int:
+        """Número de entradas"""
+        pass
+    
+    @abstractmethod
+    def clear(self):
+        """Eliminar todas las entradas"""
+        pass
+    
+    def persist(self):
+        """Escribir a disco lo que esté solo en memoria"""
+        pass
+    
+    def close(self):
+        """Persistir y liberar recursos"""
+        self.persist()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Normalizar filas para que el producto interno sea la similitud coseno"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class FaissVectorStore(VectorStore):
+    """Índice FAISS en proceso con vectores float32 en un archivo mapeado en memoria
+    
+    Los vectores se escriben en filas de vectors.<generación>.f32 (np.memmap)
+    y cada alta o baja se añade a records.jsonl, así que ambos archivos
+    reflejan siempre el estado actual. El índice FAISS (flat, HNSW o IVF) usa
+    el número de fila como ID; las bajas solo marcan la fila y se filtran al
+    buscar, y cuando superan COMPACT_DELETED_RATIO se compacta: las filas
+    vigentes se copian a un archivo de vectores de la siguiente generación y
+    el reemplazo atómico de records.jsonl confirma el cambio.
+    """
+    
+    def __init__(self, path: str, index_type: str = "hnsw", hnsw_m: int = 32, ef_search: int = 64,
+                 ivf_lists: int = 1024, ivf_probes: int = 16):
+        if index_type not in FAISS_INDEX_TYPES:
+            raise ValueError(f"Tipo de índice FAISS no soportado: {index_type}")
+        
+        import faiss
+        
+        self.logger = logger
+        self._faiss = faiss
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
+        
+        self.dimension: Optional[int] = None
+        self._generation = 0
+        self._vectors: Optional[np.memmap] = None
+        self._row_ids: List[Optional[str]] = []
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[Optional[Dict[str, Any]]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._deleted = 0
+        self._index = None
+        self._index_trained_ivf = False
+        self._index_dirty = False
+        self._log = None
+        self.lock = threading.RLock()
+        
+        self._load()
+    
+    # Persistencia
+    
+    def _load(self):
+        """Reconstruir el estado a partir de records.jsonl y vectors.f32"""
+        records_path = self.path / RECORDS_FILE
+        if not records_path.exists():
+            return
+        
+        with open(records_path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Última línea incompleta tras una caída: lo anterior es válido
+                    self.logger.warning(f"Registro incompleto en {records_path}:{line_number}, se ignora el resto")
+                    break
+                self._apply_record(record)
+        
+        if self.dimension is None:
+            return
+        
+        vectors_path = self._vectors_path()
+        capacity = vectors_path.stat().st_size // (4 * self.dimension) if vectors_path.exists() else 0
+        if capacity < len(self._row_ids):
+            raise ValueError(f"{vectors_path} tiene {capacity} filas y el registro {len(self._row_ids)}")
+        self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dimension))
+        
+        if not self._load_index():
+            self._rebuild_index()
+        self.logger.info(f"Índice FAISS cargado de {self.path}: {self.count()} entradas")
+    
+    def _apply_record(self, record: Dict[str, Any]):
+        """Aplicar una línea del registro al estado en memoria"""
+        operation = record["op"]
+        if operation == "init":
+            self.dimension = record["dimension"]
+            self._generation = record.get("generation", 0)
+        elif operation == "add":
+            row = record["row"]
+            self._row_ids.append(record["id"])
+            self._documents.append(record.get("document"))
+            self._metadatas.append(record.get("metadata"))
+            self._id_to_row[record["id"]] = row
+        elif operation == "delete":
+            row = record["row"]
+            entry_id = self._row_ids[row]
+            if entry_id is not None:
+                self._id_to_row.pop(entry_id, None)
+                self._row_ids[row] = None
+                self._documents[row] = None
+                self._metadatas[row] = None
+                self._deleted += 1
+    
+    def _vectors_path(self, generation: Optional[int] = None) -> Path:
+        """Archivo de vectores de una generación (la actual por defecto)"""
+        generation = self._generation if generation is None else generation
+        return self.path / VECTORS_FILE_PATTERN.format(generation=generation)
+    
+    def _write_records(self, records: List[Dict[str, Any]]):
+        """Añadir líneas al registro"""
+        if self._log is None:
+            self._log = open(self.path / RECORDS_FILE, "a", encoding="utf-8")
+        self._log.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+        self._log.flush()
+    
+    def _load_index(self) -> bool:
+        """Leer el índice guardado si corresponde a las filas actuales"""
+        index_path = self.path / INDEX_FILE
+        meta_path = self.path / INDEX_META_FILE
+        if not index_path.exists() or not meta_path.exists():
+            return False
+        
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("rows") != len(self._row_ids) or meta.get("index_type") != self.index_type:
+                return False
+            self._index = self._faiss.read_index(str(index_path))
+            self._index_trained_ivf = bool(meta.get("trained_ivf"))
+            self._configure_search()
+            return True
+        except Exception as e:
+            self.logger.warning(f"Índice FAISS ilegible en {index_path}, se reconstruye: {e}")
+            return False
+    
+    def persist(self):
+        """Escribir vectores e índice a disco"""
+        with self.lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            if self._index is None or not self._index_dirty:
+                return
+            
+            temp_path = self.path / f"{INDEX_FILE}.tmp"
+            self._faiss.write_index(self._index, str(temp_path))
+            os.replace(temp_path, self.path / INDEX_FILE)
+            meta = {"rows": len(self._row_ids), "index_type": self.index_type,
+                    "trained_ivf": self._index_trained_ivf}
+            with open(self.path / INDEX_META_FILE, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            self._index_dirty = False
+    
+    def close(self):
+        with self.lock:
+            self.persist()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+    
+    # Índice
+    
+    def _new_index(self, sample: np.ndarray):
+        """Crear un índice vacío del tipo configurado"""
+        faiss = self._faiss
+        self._index_trained_ivf = False
+        if self.index_type == "hnsw":
+            base = faiss.IndexHNSWFlat(self.dimension, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        elif self.index_type == "ivf" and len(sample) >= self.ivf_lists * IVF_POINTS_PER_LIST:
+            quantizer = faiss.IndexFlatIP(self.dimension)
+            base = faiss.IndexIVFFlat(quantizer, self.dimension, self.ivf_lists, faiss.METRIC_INNER_PRODUCT)
+            base.train(sample)
+            self._index_trained_ivf = True
+        else:
+            # IVF necesita datos para entrenar: hasta tenerlos se busca de forma exacta
+            base = faiss.IndexFlatIP(self.dimension)
+        self._index = faiss.IndexIDMap(base)
+        self._configure_search()
+    
+    def _configure_search(self):
+        """Aplicar los parámetros de búsqueda del índice"""
+        base = self._faiss.downcast_index(self._index.index)
+        if hasattr(base, "hnsw"):
+            base.hnsw.efSearch = self.ef_search
+        if hasattr(base, "nprobe"):
+            base.nprobe = self.ivf_probes
+    
+    def _live_rows(self) -> np.ndarray:
+        return np.array([row for row, entry_id in enumerate(self._row_ids) if entry_id is not None], dtype=np.int64)
+    
+    def _rebuild_index(self):
+        """Reconstruir el índice a partir de las filas vigentes"""
+        live_rows = self._live_rows()
+        sample_size = min(len(live_rows), self.ivf_lists * 256)
+        sample_rows = np.sort(np.random.default_rng(0).choice(live_rows, sample_size, replace=False)) \
+            if self.index_type == "ivf" and sample_size else live_rows[:0]
+        self._new_index(np.ascontiguousarray(self._vectors[sample_rows]))
+        
+        for start in range(0, len(live_rows), REBUILD_CHUNK_SIZE):
+            rows = live_rows[start:start + REBUILD_CHUNK_SIZE]
+            self._index.add_with_ids(np.ascontiguousarray(self._vectors[rows]), rows)
+        self._index_dirty = True
+    
+    def _ensure_capacity(self, rows: int):
+        """Agrandar el archivo de vectores si hace falta"""
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        if rows <= capacity:
+            return
+        
+        new_capacity = max(INITIAL_CAPACITY, capacity * 2, rows)
+        vectors_path = self._vectors_path()
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(vectors_path, "r+b" if vectors_path.exists() else "w+b") as f:
+            f.truncate(new_capacity * self.dimension * 4)
+        self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+",
+                                  shape=(new_capacity, self.dimension))
+    
+    def _append(self, ids: List[str], vectors: np.ndarray, documents: List[Optional[str]],
+                metadatas: List[Optional[Dict[str, Any]]]):
+        """Escribir filas nuevas en el archivo, el registro y el índice"""
+        first_row = len(self._row_ids)
+        rows = np.arange(first_row, first_row + len(ids), dtype=np.int64)
+        self._ensure_capacity(first_row + len(ids))
+        self._vectors[first_row:first_row + len(ids)] = vectors
+        self._vectors.flush()
+        
+        self._write_records([
+            {"op": "add", "row": int(row), "id": entry_id, "document": document, "metadata": metadata}
+            for row, entry_id, document, metadata in zip(rows, ids, documents, metadatas)
+        ])
+        for row, entry_id, document, metadata in zip(rows, ids, documents, metadatas):
+            self._row_ids.append(entry_id)
+            self._documents.append(document)
+            self._metadatas.append(metadata)
+            self._id_to_row[entry_id] = int(row)
+        
+        if self.index_type == "ivf" and not self._index_trained_ivf \
+                and self.count() >= self.ivf_lists * IVF_POINTS_PER_LIST:
+            self._rebuild_index()
+        else:
+            self._index.add_with_ids(vectors, rows)
+            self._index_dirty = True
+    
+    def _remove_rows(self, rows: List[int]):
+        """Marcar filas como borradas"""
+        if not rows:
+            return
+        self._write_records([{"op": "delete", "row": row} for row in rows])
+        for row in rows:
+            self._apply_record({"op": "delete", "row": row})
+        self._maybe_compact()
+    
+    def _maybe_compact(self):
+        """Reescribir archivos e índice si hay demasiadas filas borradas"""
+        total = len(self._row_ids)
+        if total < COMPACT_MIN_ROWS or self._deleted / total < COMPACT_DELETED_RATIO:
+            return
+        
+        live_rows = self._live_rows()
+        old_vectors_path = self._vectors_path()
+        generation = self._generation + 1
+        
+        # Copiar las filas vigentes al archivo de la siguiente generación
+        vectors_path = self._vectors_path(generation)
+        capacity = max(INITIAL_CAPACITY, len(live_rows))
+        vectors = np.memmap(vectors_path, dtype=np.float32, mode="w+", shape=(capacity, self.dimension))
+        for start in range(0, len(live_rows), REBUILD_CHUNK_SIZE):
+            rows = live_rows[start:start + REBUILD_CHUNK_SIZE]
+            vectors[start:start + len(rows)] = self._vectors[rows]
+        vectors.flush()
+        
+        # Registro nuevo; su reemplazo atómico confirma la compactación
+        records_path = self.path / RECORDS_FILE
+        temp_path = self.path / f"{RECORDS_FILE}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"op": "init", "dimension": self.dimension, "generation": generation}) + "\n")
+            for new_row, row in enumerate(live_rows):
+                record = {"op": "add", "row": new_row, "id": self._row_ids[row],
+                          "document": self._documents[row], "metadata": self._metadatas[row]}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        os.replace(temp_path, records_path)
+        
+        self._generation = generation
+        self._vectors = vectors
+        self._row_ids = [self._row_ids[row] for row in live_rows]
+        self._documents = [self._documents[row] for row in live_rows]
+        self._metadatas = [self._metadatas[row] for row in live_rows]
+        self._id_to_row = {entry_id: row for row, entry_id in enumerate(self._row_ids)}
+        self._deleted = 0
+        old_vectors_path.unlink(missing_ok=True)
+        
+        self._rebuild_index()
+        self.persist()
+        self.logger.info(f"Índice FAISS compactado: {len(live_rows)} de {total} filas vigentes")
+    
+    def _initialize(self, dimension: int):
+        """Fijar la dimensión y crear el índice vacío"""
+        self.dimension = dimension
+        self._write_records([{"op": "init", "dimension": dimension, "generation": self._generation}])
+        self._new_index(np.zeros((0, dimension), dtype=np.float32))
+    
+    def _prepare(self, embeddings: Sequence[Sequence[float]], expected: int) -> np.ndarray:
+        """Validar y normalizar un lote de embeddings"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != expected:
+            raise ValueError("Se espera un embedding por entrada")
+        if self.dimension is not None and vectors.shape[1] != self.dimension:
+            raise ValueError(f"Dimensión {vectors.shape[1]} distinta de la del índice ({self.dimension})")
+        return np.ascontiguousarray(_normalize(vectors))
+    
+    # Interfaz de colección
+    
+    def add(self, ids: List[str], documents: Optional[List[str]] = None,
+            embeddings: Optional[Sequence[Sequence[float]]] = None,
+            metadatas: Optional[List[Optional[Dict[str, Any]]]] = None):
+        if embeddings is None:
+            raise ValueError("FaissVectorStore necesita embeddings precalculados")
+        vectors = self._prepare(embeddings, len(ids))
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [None] * len(ids)
+        
+        with self.lock:
+            if self.dimension is None:
+                self._initialize(vectors.shape[1])
+            
+            # Como ChromaDB: los IDs existentes (o repetidos en el lote) se ignoran
+            seen = set()
+            keep = []
+            for position, entry_id in enumerate(ids):
+                if entry_id in self._id_to_row or entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                keep.append(position)
+            if not keep:
+                return
+            
+            self._append([ids[i] for i in keep], vectors[keep],
+                         [documents[i] for i in keep], [metadatas[i] for i in keep])
+    
+    def query(self, query_embeddings: Sequence[Sequence[float]], n_results: int = 10,
+              include: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        include = include or DEFAULT_INCLUDE
+        with self.lock:
+            queries = np.asarray(query_embeddings, dtype=np.float32)
+            result: Dict[str, Any] = {"ids": [[] for _ in queries]}
+            for key in include:
+                if key in INCLUDE_FIELDS:
+                    result[key] = [[] for _ in queries]
+            
+            limit = min(n_results, self.count())
+            if limit <= 0:
+                return result
+            queries = self._prepare(queries, len(queries))
+            
+            # Pedir de más para compensar las filas borradas que siguen en el índice
+            fetch = min(len(self._row_ids), limit + self._deleted)
+            scores, rows = self._index.search(queries, fetch)
+            
+            for position in range(len(queries)):
+                found = 0
+                for score, row in zip(scores[position], rows[position]):
+                    if found == limit:
+                        break
+                    if row < 0 or self._row_ids[row] is None:
+                        continue
+                    found += 1
+                    result["ids"][position].append(self._row_ids[row])
+                    self._fill(result, include, position, int(row), distance=1.0 - float(score))
+            return result
+    
+    def _fill(self, result: Dict[str, Any], include: Sequence[str], position: Optional[int], row: int,
+              distance: Optional[float] = None):
+        """Agregar los campos pedidos de una fila al resultado"""
+        include = [key for key in include if key in INCLUDE_FIELDS]
+        values = {
+            "documents": lambda: self._documents[row],
+            "metadatas": lambda: self._metadatas[row],
+            "embeddings": lambda: self._vectors[row].tolist(),
+            "distances": lambda: distance,
+        }
+        for key in include:
+            target = result[key] if position is None else result[key][position]
+            target.append(values[key]())
+    
+    def get(self, ids: Optional[List[str]] = None, include: Optional[Sequence[str]] = None,
+            limit: Optional[int] = None) -> Dict[str, Any]:
+        include = [key for key in (include or ("documents", "metadatas")) if key != "distances"]
+        with self.lock:
+            if ids is None:
+                rows = [row for row, entry_id in enumerate(self._row_ids) if entry_id is not None]
+            else:
+                rows = [self._id_to_row[entry_id] for entry_id in ids if entry_id in self._id_to_row]
+            if limit is not None:
+                rows = rows[:limit]
+            
+            result: Dict[str, Any] = {"ids": [self._row_ids[row] for row in rows]}
+            for key in include:
+                if key in INCLUDE_FIELDS:
+                    result[key] = []
+            for row in rows:
+                self._fill(result, include, None, row)
+            return result
+    
+    def update(self, ids: List[str], documents: Optional[List[str]] = None,
+               embeddings: Optional[Sequence[Sequence[float]]] = None,
+               metadatas: Optional[List[Optional[Dict[str, Any]]]] = None):
+        with self.lock:
+            vectors = self._prepare(embeddings, len(ids)) if embeddings is not None else None
+            positions = [position for position, entry_id in enumerate(ids) if entry_id in self._id_to_row]
+            if not positions:
+                return
+            
+            old_rows = [self._id_to_row[ids[position]] for position in positions]
+            new_vectors = np.array([
+                vectors[position] if vectors is not None else self._vectors[row]
+                for position, row in zip(positions, old_rows)
+            ], dtype=np.float32)
+            new_documents = [
+                documents[position] if documents is not None and documents[position] is not None
+                else self._documents[row]
+                for position, row in zip(positions, old_rows)
+            ]
+            new_metadatas = [
+                metadatas[position] if metadatas is not None else self._metadatas[row]
+                for position, row in zip(positions, old_rows)
+            ]
+            
+            # Una actualización es baja de la fila anterior y alta de una nueva
+            self._write_records([{"op": "delete", "row": row} for row in old_rows])
+            for row in old_rows:
+                self._apply_record({"op": "delete", "row": row})
+            self._append([ids[position] for position in positions], new_vectors, new_documents, new_metadatas)
+            self._maybe_compact()
+    
+    def delete(self, ids: List[str]):
+        with self.lock:
+            self._remove_rows([self._id_to_row[entry_id] for entry_id in ids if entry_id in self._id_to_row])
+    
+    def count(self) -> int:
+        with self.lock:
+            return len(self._id_to_row)
+    
+    def clear(self):
+        with self.lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            self._vectors = None
+            self._index = None
+            for name in (RECORDS_FILE, INDEX_FILE, INDEX_META_FILE):
+                (self.path / name).unlink(missing_ok=True)
+            for vectors_path in self.path.glob(VECTORS_FILE_PATTERN.format(generation="*")):
+                vectors_path.unlink()
+            
+            self.dimension = None
+            self._generation = 0
+            self._row_ids = []
+            self._documents = []
+            self._metadatas = []
+            self._id_to_row = {}
+            self._deleted = 0
+            self._index_trained_ivf = False
+            self._index_dirty = False
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas del índice"""
+        with self.lock:
+            return {
+                "backend": "faiss",
+                "index_type": self.index_type,
+                "trained_ivf": self._index_trained_ivf,
+                "entries": self.count(),
+                "rows": len(self._row_ids),
+                "deleted_rows": self._deleted,
+                "dimension": self.dimension,
+                "path": str(self.path)
+            }
+
+
+def create_faiss_vector_store(path: str) -> FaissVectorStore:
+    """Crear un índice FAISS con los parámetros de la configuración de memoria"""
+    memory_config = get_config().memory
+    return FaissVectorStore(
+        path,
+        index_type=memory_config.faiss_index_type,
+        hnsw_m=memory_config.faiss_hnsw_m,
+        ef_search=memory_config.faiss_ef_search,
+        ivf_lists=memory_config.faiss_ivf_lists,
+        ivf_probes=memory_config.faiss_ivf_probes
+    )
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark de backends vectoriales: ChromaDB frente a FAISS en proceso
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import Dict, List, Any, Iterator, Sequence, Tuple
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import time
+
+import click
+import numpy as np
+
+# Agregar el directorio src al path para imports
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from langchain_agents.memory.vector_store import FaissVectorStore, _normalize
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+DEFAULT_DIMENSION = 384  # Dimensión de all-MiniLM-L6-v2
+INSERT_BATCH_SIZE = 5000  # Por debajo del máximo por llamada de ChromaDB
+
+
+def generate_chunks(size: int, dimension: int, seed: int = 0) -> Iterator[Tuple[int, np.ndarray]]:
+    """Vectores aleatorios normalizados por bloques, reproducibles sin tenerlos todos en RAM"""
+    for start in range(0, size, INSERT_BATCH_SIZE):
+        count = min(INSERT_BATCH_SIZE, size - start)
+        rng = np.random.default_rng((seed, start))
+        yield start, _normalize(rng.standard_normal((count, dimension), dtype=np.float32))
+
+
+def exact_neighbors(size: int, dimension: int, queries: np.ndarray, k: int) -> List[set]:
+    """Vecinos exactos por fuerza bruta recorriendo los bloques"""
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+    for start, chunk in generate_chunks(size, dimension):
+        scores = queries @ chunk.T
+        rows = np.broadcast_to(np.arange(start, start + len(chunk)), scores.shape)
+        all_scores = np.concatenate([best_scores, scores], axis=1)
+        all_rows = np.concatenate([best_rows, rows], axis=1)
+        top = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(all_scores, top, axis=1)
+        best_rows = np.take_along_axis(all_rows, top, axis=1)
+    return [set(f"id{row}" for row in rows) for rows in best_rows]
+
+
+def _open_backend(backend: str, path: Path):
+    """Colección vacía del backend en el directorio indicado"""
+    if backend == "chroma":
+        import chromadb
+        from chromadb.config import Settings
+        
+        client = chromadb.PersistentClient(path=str(path), settings=Settings(anonymized_telemetry=False))
+        return client.create_collection("benchmark", metadata={"hnsw:space": "cosine"})
+    
+    index_type = backend.split(":", 1)[1] if ":" in backend else "hnsw"
+    return FaissVectorStore(path, index_type=index_type)
+
+
+def run_benchmark(sizes: Sequence[int] = DEFAULT_SIZES, backends: Sequence[str] = ("chroma", "faiss:hnsw"),
+                  dimension: int = DEFAULT_DIMENSION, queries: int = 100, k: int = 10,
+                  measure_recall: bool = True) -> List[Dict[str, Any]]:
+    """Medir inserción, latencia de consulta y recall@k de cada backend y tamaño"""
+    results = []
+    query_vectors = _normalize(np.random.default_rng(12345).standard_normal((queries, dimension), dtype=np.float32))
+    
+    for size in sizes:
+        truth = exact_neighbors(size, dimension, query_vectors, k) if measure_recall else None
+        
+        for backend in backends:
+            work_dir = Path(tempfile.mkdtemp(prefix="vector_benchmark_"))
+            try:
+                store = _open_backend(backend, work_dir)
+                
+                start_time = time.perf_counter()
+                for start, chunk in generate_chunks(size, dimension):
+                    ids = [f"id{row}" for row in range(start, start + len(chunk))]
+                    store.add(ids=ids, documents=[f"documento {row}" for row in range(start, start + len(chunk))],
+                              embeddings=chunk.tolist() if backend == "chroma" else chunk)
+                insert_time = time.perf_counter() - start_time
+                
+                latencies = []
+                hits = 0
+                for position, query in enumerate(query_vectors):
+                    start_time = time.perf_counter()
+                    found = store.query(query_embeddings=[query.tolist()], n_results=k,
+                                        include=["documents", "metadatas", "distances"])
+                    latencies.append(time.perf_counter() - start_time)
+                    if truth is not None:
+                        hits += len(truth[position] & set(found["ids"][0]))
+                
+                if hasattr(store, "close"):
+                    store.close()
+                
+                results.append({
+                    "backend": backend,
+                    "size": size,
+                    "insert_seconds": insert_time,
+                    "inserts_per_second": size / insert_time if insert_time else 0.0,
+                    "query_p50_ms": float(np.percentile(latencies, 50) * 1000),
+                    "query_p95_ms": float(np.percentile(latencies, 95) * 1000),
+                    "recall": hits / (queries * k) if truth is not None else None
+                })
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+    
+    return results
+
+
+@click.command()
+@click.option('--sizes', '-s', multiple=True, type=int, default=DEFAULT_SIZES, show_default=True,
+              help='Número de entradas (se puede repetir)')
+@click.option('--backend', '-b', 'backends', multiple=True, default=("chroma", "faiss:hnsw"), show_default=True,
+              help='chroma, faiss:flat, faiss:hnsw o faiss:ivf (se puede repetir)')
+@click.option('--dimension', '-d', default=DEFAULT_DIMENSION, show_default=True, help='Dimensión de los vectores')
+@click.option('--queries', '-q', default=100, show_default=True, help='Consultas por medición')
+@click.option('--k', default=10, show_default=True, help='Vecinos por consulta')
+@click.option('--no-recall', is_flag=True, help='No calcular recall@k (evita la búsqueda exacta)')
+def main(sizes: Tuple[int, ...], backends: Tuple[str, ...], dimension: int, queries: int, k: int, no_recall: bool):
+    """Comparar ChromaDB y FAISS en inserción, latencia de consulta y recall"""
+    from rich.console import Console
+    from rich.table import Table
+    
+    results = run_benchmark(sizes, backends, dimension, queries, k, measure_recall=not no_recall)
+    
+    table = Table(title=f"Backends vectoriales (dimensión {dimension}, k={k})")
+    for column in ("Backend", "Entradas", "Inserción (s)", "Inserciones/s", "p50 (ms)", "p95 (ms)", "Recall@k"):
+        table.add_column(column)
+    for row in results:
+        table.add_row(
+            row["backend"], f"{row['size']:,}", f"{row['insert_seconds']:.2f}", f"{row['inserts_per_second']:,.0f}",
+            f"{row['query_p50_ms']:.3f}", f"{row['query_p95_ms']:.3f}",
+            "-" if row["recall"] is None else f"{row['recall']:.3f}"
+        )
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    main()
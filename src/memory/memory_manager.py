@@ -13,6 +13,7 @@ from collections import OrderedDict
 import logging
 
 from langchain_agents.memory.vector_memory import VectorMemory
+from langchain_agents.memory.embedding_service import get_embedding_service
 from multi_agent.shared_memory import SharedMemory
 from config.environment import environment_manager
 
@@ -82,7 +83,8 @@ class MemoryManager:
         # Cache de memoria
         self.cache = MemoryCache(self.config.memory_cache_size)
         
-        # Instancias de memoria por agente
+        # Instancias de memoria por agente (comparten un único modelo de embeddings)
+        self.embedding_service = get_embedding_service()
         self.agent_memories: Dict[str, VectorMemory] = {}
         self.shared_memory: Optional[SharedMemory] = None
         
@@ -103,7 +105,7 @@ class MemoryManager:
         """Inicializar memorias de agentes"""
         try:
             # Memoria compartida
-            self.shared_memory = SharedMemory()
+            self.shared_memory = SharedMemory(embedding_service=self.embedding_service)
             self.logger.info("Memoria compartida inicializada")
             
             # Memorias de agentes (lazy loading)
@@ -119,7 +121,8 @@ class MemoryManager:
                 try:
                     self.agent_memories[agent_name] = VectorMemory(
                         agent_name=agent_name,
-                        storage_path=Path(self.config.chromadb_persist_directory)
+                        storage_path=Path(self.config.chromadb_persist_directory),
+                        embedding_service=self.embedding_service
                     )
                     self.logger.info(f"Memoria del agente {agent_name} inicializada")
                 except Exception as e:
@@ -127,7 +130,8 @@ class MemoryManager:
                     # Crear memoria temporal
                     self.agent_memories[agent_name] = VectorMemory(
                         agent_name=agent_name,
-                        storage_path=None
+                        storage_path=None,
+                        embedding_service=self.embedding_service
                     )
             
             return self.agent_memories[agent_name]
@@ -218,6 +222,7 @@ class MemoryManager:
             "cache": cache_stats,
             "agent_memories": len(self.agent_memories),
             "shared_memory": self.shared_memory is not None,
+            "embeddings": self.embedding_service.get_stats(),
             "stats": self.stats.copy(),
             "config": {
                 "cache_size": self.config.memory_cache_size,
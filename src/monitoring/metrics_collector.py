@@ -11,6 +11,7 @@ import threading
 from pathlib import Path
 
 from utils.logging import get_logger
+from utils.config import get_config
 
 logger = get_logger("metrics-collector")
 
@@ -151,6 +152,7 @@ class MetricsCollector:
                 return {"error": "No hay métricas disponibles"}
             
             values = [m.value for m in metrics]
+            percentiles = self.calculate_percentiles(values)
             
             return {
                 "name": name,
@@ -159,6 +161,9 @@ class MetricsCollector:
                 "min": min(values),
                 "max": max(values),
                 "avg": sum(values) / len(values),
+                "p50": percentiles[50],
+                "p95": percentiles[95],
+                "p99": percentiles[99],
                 "latest": values[-1] if values else None,
                 "trend": self._calculate_trend(values)
             }
@@ -167,6 +172,54 @@ class MetricsCollector:
             self.logger.error(f"Error al obtener resumen de métrica: {e}")
             return {"error": str(e)}
     
+    def get_metric_breakdown(self, name: str, group_by: str, period_hours: int = 24,
+                             tags: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """Resumen de una métrica agrupado por el valor de un tag, ordenado por total descendente
+        
+        Permite ver, por ejemplo, qué agente o qué prompt acumula más latencia.
+        """
+        try:
+            start_time = datetime.now() - timedelta(hours=period_hours)
+            groups: Dict[str, List[float]] = {}
+            for metric in self.get_metrics(name=name, tags=tags, start_time=start_time):
+                groups.setdefault(metric.tags.get(group_by, "unknown"), []).append(metric.value)
+            
+            breakdown = []
+            for group, values in groups.items():
+                percentiles = self.calculate_percentiles(values)
+                breakdown.append({
+                    group_by: group,
+                    "count": len(values),
+                    "total": sum(values),
+                    "avg": sum(values) / len(values),
+                    "p50": percentiles[50],
+                    "p95": percentiles[95],
+                    "p99": percentiles[99],
+                    "max": max(values)
+                })
+            
+            return sorted(breakdown, key=lambda item: item["total"], reverse=True)
+            
+        except Exception as e:
+            self.logger.error(f"Error al obtener desglose de métrica: {e}")
+            return []
+    
+    @staticmethod
+    def calculate_percentiles(values: List[float], percentiles: tuple = (50, 95, 99)) -> Dict[int, float]:
+        """Calcular percentiles con interpolación lineal"""
+        if not values:
+            return {p: 0.0 for p in percentiles}
+        
+        ordered = sorted(values)
+        result = {}
+        for p in percentiles:
+            rank = (len(ordered) - 1) * p / 100.0
+            lower = int(rank)
+            upper = min(lower + 1, len(ordered) - 1)
+            result[p] = ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+        
+        return result
+    
     def _calculate_trend(self, values: List[float]) -> str:
         """Calcular tendencia de valores"""
         if len(values) < 2:
@@ -299,3 +352,18 @@ class MetricsCollector:
         except Exception as e:
             self.logger.error(f"Error al obtener datos del dashboard: {e}")
             return {"error": str(e)}
+
+
+# Recolector compartido (creado bajo demanda)
+_metrics_collector: Optional[MetricsCollector] = None
+_metrics_collector_lock = threading.Lock()
+
+
+def get_metrics_collector() -> MetricsCollector:
+    """Obtener el recolector de métricas compartido"""
+    global _metrics_collector
+    if _metrics_collector is None:
+        with _metrics_collector_lock:
+            if _metrics_collector is None:
+                _metrics_collector = MetricsCollector(storage_path=get_config().ai.llm_metrics_path)
+    return _metrics_collector
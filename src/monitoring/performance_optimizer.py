@@ -9,10 +9,11 @@ import psutil
 import threading
 from typing import Dict, List, Optional, Any, Callable
 from dataclasses import dataclass, field
-from collections import defaultdict, deque
+from collections import deque
 import logging
 
 from config.environment import environment_manager
+from utils.rolling_metrics import RollingMetricSet
 
 
 @dataclass
@@ -43,8 +44,9 @@ class PerformanceOptimizer:
         self.logger = logging.getLogger(__name__)
         self.config = environment_manager.get_config()
         
-        # Métricas de rendimiento
-        self.metrics: Dict[str, deque] = defaultdict(lambda: deque(maxlen=1000))
+        # Métricas de rendimiento en buffers circulares con agregados incrementales
+        self.metrics = RollingMetricSet(capacity=1000, time_windows=(300,))
+        self.last_metrics: Dict[str, PerformanceMetric] = {}
         self.resource_history: deque = deque(maxlen=100)
         
         # Locks para thread safety
@@ -171,23 +173,29 @@ class PerformanceOptimizer:
         )
         
         with self.metrics_lock:
-            self.metrics[name].append(metric)
+            self.metrics.add(name, value, metric.timestamp)
+            self.last_metrics[name] = metric
     
     def get_metric_stats(self, name: str) -> Optional[Dict[str, Any]]:
         """Obtener estadísticas de una métrica"""
         with self.metrics_lock:
-            if name not in self.metrics or not self.metrics[name]:
+            if name not in self.metrics or not self.metrics.get(name).count():
                 return None
             
-            values = [m.value for m in self.metrics[name]]
+            series = self.metrics.get(name)
+            stats = series.get_stats()
             
             return {
-                "count": len(values),
-                "min": min(values),
-                "max": max(values),
-                "avg": sum(values) / len(values),
-                "latest": values[-1],
-                "unit": self.metrics[name][-1].unit
+                "count": stats["count"],
+                "min": stats["min"],
+                "max": stats["max"],
+                "avg": stats["avg"],
+                "p50": stats["p50"],
+                "p95": stats["p95"],
+                "p99": stats["p99"],
+                "avg_5m": series.mean("300s"),
+                "latest": stats["latest"],
+                "unit": self.last_metrics[name].unit
             }
     
     def get_all_metrics(self) -> Dict[str, Dict[str, Any]]:
@@ -195,7 +203,7 @@ class PerformanceOptimizer:
         with self.metrics_lock:
             return {
                 name: self.get_metric_stats(name)
-                for name in self.metrics.keys()
+                for name in self.metrics.names()
             }
     
     def get_system_resources(self) -> Optional[SystemResource]:
@@ -266,7 +274,7 @@ class PerformanceOptimizer:
         all_metrics = self.get_all_metrics()
         
         # Calcular métricas agregadas
-        total_metrics = sum(len(metrics) for metrics in self.metrics.values())
+        total_metrics = sum(series.count() for _, series in self.metrics.items())
         active_optimization = self.optimization_active
         
         return {
@@ -292,6 +300,7 @@ class PerformanceOptimizer:
         """Resetear métricas"""
         with self.metrics_lock:
             self.metrics.clear()
+            self.last_metrics.clear()
         
         with self.resource_lock:
             self.resource_history.clear()
@@ -0,0 +1,404 @@
+"""
+Diario de entradas de la memoria compartida
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import Dict, Any, Optional, Sequence, Tuple
+from pathlib import Path
+import json
+import os
+import threading
+
+from utils.logging import get_logger
+
+logger = get_logger("entry-journal")
+
+SEGMENT_FILE_PATTERN = "segment_{number:08d}.jsonl"
+INDEX_FILE = "index.json"
+
+# Tamaño a partir del cual se abre un segmento nuevo
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+
+# Espera del escritor para agrupar registros en un mismo lote (segundos)
+DEFAULT_FLUSH_INTERVAL = 0.05
+
+# Fracción de bytes obsoletos en los segmentos cerrados que dispara la compactación
+DEFAULT_COMPACT_RATIO = 0.5
+
+# Registros pendientes a partir de los cuales put() espera al escritor
+DEFAULT_MAX_PENDING = 10000
+
+# Bytes obsoletos mínimos para compactar (evita reescribir segmentos pequeños)
+COMPACT_MIN_DEAD_BYTES = 1024 * 1024
+
+# Registros escritos tras los que se guarda el índice
+CHECKPOINT_EVERY = 1000
+
+# (segmento, offset, longitud) de la última versión de cada registro
+Location = Tuple[int, int, int]
+
+
+class EntryJournal:
+    """Diario append-only por segmentos con escritura diferida
+    
+    put() deja el registro en una cola en memoria y vuelve enseguida; un hilo
+    escritor lo añade como una línea JSON al segmento activo
+    (segment_<n>.jsonl), con un flush/fsync por lote, y anota en el índice
+    id -> (segmento, offset, longitud). get() consulta primero la cola y si no
+    hace una sola lectura posicional del registro.
+    
+    index.json es un checkpoint que se reemplaza de forma atómica junto con el
+    tamaño confirmado de cada segmento. Al abrir, lo escrito después del
+    checkpoint se vuelve a leer del propio segmento y una línea incompleta al
+    final (escritura interrumpida) se descarta. Cuando las versiones obsoletas
+    de los segmentos cerrados superan compact_ratio, los registros vigentes se
+    copian a un segmento nuevo y los antiguos se borran.
+    """
+    
+    def __init__(self, path: str, segment_size: int = DEFAULT_SEGMENT_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, fsync: bool = True,
+                 compact_ratio: float = DEFAULT_COMPACT_RATIO, max_pending: int = DEFAULT_MAX_PENDING):
+        self.logger = logger
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.compact_ratio = compact_ratio
+        self.max_pending = max_pending
+        
+        self._index: Dict[str, Location] = {}
+        self._segment_bytes: Dict[int, int] = {}
+        self._live_bytes: Dict[int, int] = {}
+        # Registros ya serializados (línea JSON) pendientes de escribir, por ID
+        self._pending: Dict[str, bytes] = {}
+        self._readers: Dict[int, int] = {}
+        self._active = None
+        self._active_number = 0
+        self._active_size = 0
+        self._writes_since_checkpoint = 0
+        self._closed = False
+        self.stats = {"writes": 0, "batches": 0, "compactions": 0, "bytes_reclaimed": 0}
+        
+        # _lock protege índice y cola; _write_lock serializa escritor, flush y compactación
+        self._lock = threading.Lock()
+        self._pending_changed = threading.Condition(self._lock)
+        self._write_lock = threading.RLock()
+        self._close_event = threading.Event()
+        
+        self._load()
+        
+        self._writer = threading.Thread(target=self._run, name=f"entry-journal-{self.path.name}", daemon=True)
+        self._writer.start()
+    
+    # Persistencia
+    
+    def _segment_path(self, number: int) -> Path:
+        return self.path / SEGMENT_FILE_PATTERN.format(number=number)
+    
+    def _load(self):
+        """Reconstruir el índice a partir del checkpoint y de lo escrito después"""
+        segments = sorted(int(path.stem.split("_", 1)[1]) for path in self.path.glob("segment_*.jsonl"))
+        
+        confirmed: Dict[int, int] = {}
+        index_path = self.path / INDEX_FILE
+        if index_path.exists():
+            try:
+                with open(index_path, "r", encoding="utf-8") as f:
+                    checkpoint = json.load(f)
+                confirmed = {int(number): size for number, size in checkpoint["segments"].items()
+                             if int(number) in segments}
+                for entry_id, location in checkpoint["entries"].items():
+                    if location[0] in confirmed:
+                        self._set_location(entry_id, tuple(location))
+            except (OSError, ValueError, KeyError) as e:
+                self.logger.warning(f"Índice del diario ilegible, se reconstruye desde los segmentos: {e}")
+                self._index, self._live_bytes, confirmed = {}, {}, {}
+        
+        for number in segments:
+            self._replay(number, confirmed.get(number, 0))
+        
+        self._open_segment(segments[-1] if segments else 0)
+        if segments:
+            self.logger.info(f"Diario cargado: {len(self._index)} entradas en {len(segments)} segmentos")
+    
+    def _replay(self, number: int, start: int):
+        """Indexar los registros de un segmento a partir de start"""
+        path = self._segment_path(number)
+        offset = start
+        with open(path, "rb") as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self._set_location(record["id"], (number, offset, len(line)))
+                offset += len(line)
+        
+        size = path.stat().st_size
+        if offset < size:
+            # Escritura interrumpida: se descarta la cola incompleta del segmento
+            self.logger.warning(f"Descartados {size - offset} bytes incompletos al final de {path.name}")
+            os.truncate(path, offset)
+        self._segment_bytes[number] = offset
+    
+    def _open_segment(self, number: int):
+        """Usar un segmento como destino de las escrituras"""
+        if self._active is not None:
+            self._active.close()
+        path = self._segment_path(number)
+        self._active = open(path, "ab")
+        self._active_number = number
+        self._active_size = path.stat().st_size
+        with self._lock:
+            self._segment_bytes.setdefault(number, self._active_size)
+    
+    def _sync_active(self):
+        """Llevar a disco lo escrito en el segmento activo"""
+        self._active.flush()
+        if self.fsync:
+            os.fsync(self._active.fileno())
+    
+    def _checkpoint(self):
+        """Guardar el índice de forma atómica"""
+        with self._lock:
+            checkpoint = {
+                "segments": {str(number): size for number, size in self._segment_bytes.items()},
+                "entries": {entry_id: list(location) for entry_id, location in self._index.items()}
+            }
+        temp_path = self.path / f"{INDEX_FILE}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f, separators=(",", ":"))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(temp_path, self.path / INDEX_FILE)
+        self._writes_since_checkpoint = 0
+    
+    def _set_location(self, entry_id: str, location: Location):
+        """Apuntar un ID a su última versión (con _lock tomado)"""
+        previous = self._index.get(entry_id)
+        if previous is not None:
+            self._live_bytes[previous[0]] -= previous[2]
+        self._index[entry_id] = location
+        self._live_bytes[location[0]] = self._live_bytes.get(location[0], 0) + location[2]
+    
+    def _read(self, location: Location) -> bytes:
+        """Leer un registro con un único pread (con _lock tomado)"""
+        number, offset, length = location
+        descriptor = self._readers.get(number)
+        if descriptor is None:
+            descriptor = os.open(self._segment_path(number), os.O_RDONLY)
+            self._readers[number] = descriptor
+        return os.pread(descriptor, length, offset)
+    
+    # Escritura diferida
+    
+    def put(self, record: Dict[str, Any]):
+        """Encolar un registro (con clave 'id'); la última versión de cada ID prevalece"""
+        self.put_many([record])
+    
+    def put_many(self, records: Sequence[Dict[str, Any]]):
+        """Encolar varios registros sin esperar al disco
+        
+        Se serializan en el hilo que llama: un registro que no es JSON falla
+        aquí y no bloquea la escritura de los demás.
+        """
+        lines = [
+            (record["id"], (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8"))
+            for record in records
+        ]
+        
+        with self._pending_changed:
+            # Solo se espera si el disco lleva max_pending registros de retraso
+            while len(self._pending) >= self.max_pending and not self._closed:
+                self._pending_changed.wait()
+            if self._closed:
+                raise RuntimeError("El diario de entradas está cerrado")
+            for entry_id, line in lines:
+                self._pending.pop(entry_id, None)
+                self._pending[entry_id] = line
+            self._pending_changed.notify_all()
+    
+    def get(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        """Última versión de un registro, incluida la que aún no está en disco"""
+        with self._lock:
+            data = self._pending.get(entry_id)
+            if data is None:
+                location = self._index.get(entry_id)
+                if location is None:
+                    return None
+                data = self._read(location)
+        return json.loads(data)
+    
+    def __contains__(self, entry_id: str) -> bool:
+        with self._lock:
+            return entry_id in self._pending or entry_id in self._index
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._index) + sum(1 for entry_id in self._pending if entry_id not in self._index)
+    
+    def _run(self):
+        """Hilo escritor: vacía la cola por lotes y compacta cuando conviene"""
+        while True:
+            with self._pending_changed:
+                while not self._pending and not self._closed:
+                    self._pending_changed.wait()
+                if self._closed and not self._pending:
+                    return
+                closed = self._closed
+            
+            # Dar tiempo a que lleguen más registros para escribirlos juntos
+            if not closed:
+                self._close_event.wait(self.flush_interval)
+            
+            try:
+                self._write_pending()
+                self._maybe_compact()
+            except Exception as e:
+                self.logger.error(f"Error al escribir el diario de entradas: {e}")
+                if closed:
+                    return
+                self._close_event.wait(self.flush_interval)
+    
+    def _write_pending(self) -> int:
+        """Añadir los registros encolados al segmento activo"""
+        with self._write_lock:
+            with self._lock:
+                batch = list(self._pending.items())
+            if not batch:
+                return 0
+            
+            locations = []
+            for entry_id, line in batch:
+                if self._active_size and self._active_size + len(line) > self.segment_size:
+                    self._sync_active()
+                    self._open_segment(self._active_number + 1)
+                self._active.write(line)
+                locations.append((entry_id, line, (self._active_number, self._active_size, len(line))))
+                self._active_size += len(line)
+            self._sync_active()
+            
+            with self._pending_changed:
+                for entry_id, line, location in locations:
+                    self._set_location(entry_id, location)
+                    self._segment_bytes[location[0]] = location[1] + location[2]
+                    # Si el ID se volvió a escribir mientras tanto, la versión nueva sigue en cola
+                    if self._pending.get(entry_id) is line:
+                        del self._pending[entry_id]
+                self._pending_changed.notify_all()
+            
+            self.stats["writes"] += len(batch)
+            self.stats["batches"] += 1
+            self._writes_since_checkpoint += len(batch)
+            if self._writes_since_checkpoint >= CHECKPOINT_EVERY:
+                self._checkpoint()
+            return len(batch)
+    
+    def flush(self):
+        """Escribir ya los registros encolados y guardar el índice"""
+        with self._write_lock:
+            self._write_pending()
+            self._checkpoint()
+    
+    # Compactación
+    
+    def _maybe_compact(self):
+        """Compactar si los segmentos cerrados acumulan demasiadas versiones obsoletas"""
+        with self._lock:
+            sealed = [number for number in self._segment_bytes if number != self._active_number]
+            total = sum(self._segment_bytes[number] for number in sealed)
+            dead = total - sum(self._live_bytes.get(number, 0) for number in sealed)
+        if sealed and dead >= COMPACT_MIN_DEAD_BYTES and dead >= self.compact_ratio * total:
+            self.compact()
+    
+    def compact(self) -> int:
+        """Copiar los registros vigentes de los segmentos cerrados a uno nuevo; devuelve los bytes liberados
+        
+        El segmento activo también se cierra: el compactado toma el número
+        siguiente y las escrituras continúan en otro posterior, de modo que el
+        orden de los segmentos sigue siendo el orden de escritura.
+        """
+        with self._write_lock:
+            self._sync_active()
+            with self._lock:
+                sealed = sorted(self._segment_bytes)
+                live = sorted(
+                    ((entry_id, location) for entry_id, location in self._index.items() if location[0] in sealed),
+                    key=lambda item: item[1][:2]
+                )
+            
+            target = self._active_number + 1
+            locations = []
+            offset = 0
+            with open(self._segment_path(target), "wb") as f:
+                for entry_id, location in live:
+                    with self._lock:
+                        data = self._read(location)
+                    f.write(data)
+                    locations.append((entry_id, (target, offset, len(data))))
+                    offset += len(data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            
+            with self._lock:
+                reclaimed = sum(self._segment_bytes[number] for number in sealed) - offset
+                for entry_id, location in locations:
+                    self._set_location(entry_id, location)
+                for number in sealed:
+                    self._segment_bytes.pop(number, None)
+                    self._live_bytes.pop(number, None)
+                    descriptor = self._readers.pop(number, None)
+                    if descriptor is not None:
+                        os.close(descriptor)
+                self._segment_bytes[target] = offset
+            
+            # El índice nuevo se confirma antes de borrar los segmentos antiguos
+            self._open_segment(target + 1)
+            self._checkpoint()
+            for number in sealed:
+                self._segment_path(number).unlink(missing_ok=True)
+            
+            self.stats["compactions"] += 1
+            self.stats["bytes_reclaimed"] += reclaimed
+            self.logger.info(f"Diario compactado: {len(sealed)} segmentos, {reclaimed / 1024 / 1024:.2f} MB liberados")
+            return reclaimed
+    
+    def close(self):
+        """Escribir lo pendiente, guardar el índice y cerrar los archivos"""
+        with self._pending_changed:
+            if self._closed:
+                return
+            self._closed = True
+            self._pending_changed.notify_all()
+        self._close_event.set()
+        self._writer.join()
+        
+        with self._write_lock:
+            self._write_pending()
+            self._checkpoint()
+            self._active.close()
+            with self._lock:
+                for descriptor in self._readers.values():
+                    os.close(descriptor)
+                self._readers.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas del diario"""
+        with self._lock:
+            total = sum(self._segment_bytes.values())
+            live = sum(self._live_bytes.values())
+            stats = {
+                "entries": len(self._index),
+                "pending": len(self._pending),
+                "segments": len(self._segment_bytes),
+                "bytes": total,
+                "dead_bytes": total - live
+            }
+        stats.update(self.stats)
+        return stats
@@ -6,7 +6,12 @@ IA Agent para Generación de Pruebas Unitarias .NET
 from typing import Dict, List, Any, Optional, Union
 from datetime import datetime
 from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import itertools
 import json
+import re
+import shutil
 import threading
 from pathlib import Path
 
@@ -15,9 +20,32 @@ from chromadb.config import Settings
 
 from utils.helpers import file_helper, json_helper
 from utils.logging import get_logger
+from utils.config import get_config
+from langchain_agents.memory.embedding_cache import EmbeddingCache
+from langchain_agents.memory.embedding_service import EMBEDDING_MODEL_NAME, EmbeddingService, get_embedding_service
+from langchain_agents.memory.micro_batch import MicroBatcher
+from langchain_agents.memory.vector_store import VectorStore, create_faiss_vector_store
+from multi_agent.entry_journal import EntryJournal
 
 logger = get_logger("shared-memory")
 
+# Colecciones para diferentes tipos de memoria
+SHARED_COLLECTIONS = {
+    'conversations': 'Conversaciones entre agentes',
+    'project_context': 'Contexto de proyectos',
+    'learned_patterns': 'Patrones aprendidos',
+    'user_preferences': 'Preferencias del usuario'
+}
+
+
+def collection_name_for_model(collection_name: str, model_name: str) -> str:
+    """Nombre físico de una colección compartida para un modelo de embeddings
+    
+    Las colecciones sin sufijo son las de versiones anteriores, que guardaban
+    pseudo-embeddings MD5 de 8 dimensiones.
+    """
+    return f"{collection_name}-{re.sub(r'[^a-zA-Z0-9_-]', '-', model_name).strip('-_')}"
+
 
 @dataclass
 class SharedEntry:
@@ -47,13 +75,49 @@ class SharedContext:
 class SharedMemory:
     """Memoria compartida entre agentes"""
     
-    def __init__(self, storage_path: str = "./memory/shared"):
+    def __init__(self, storage_path: str = "./memory/shared",
+                 embedding_service: Optional[EmbeddingService] = None, reembed_on_start: Optional[bool] = None):
         self.storage_path = Path(storage_path)
         self.storage_path.mkdir(parents=True, exist_ok=True)
         
         self.logger = logger
         self.lock = threading.Lock()
         
+        memory_config = get_config().memory
+        
+        # Modelo de embeddings compartido por todas las memorias del proceso
+        self.embedding_service = embedding_service or get_embedding_service(EMBEDDING_MODEL_NAME)
+        self.embedding_cache = EmbeddingCache(
+            self.storage_path / "embeddings",
+            self.embedding_service.model_name,
+            capacity=memory_config.embedding_cache_size
+        )
+        
+        # Micro-lotes: escrituras y consultas concurrentes se codifican juntas
+        self.embedding_batch_size = memory_config.embedding_batch_size
+        self.embedding_encoder = MicroBatcher(
+            self._generate_embeddings, self.embedding_batch_size,
+            memory_config.embedding_batch_wait_ms / 1000, name="shared-memory-encoder"
+        )
+        
+        # Colecciones de embeddings anteriores pendientes de re-codificar
+        self.legacy_collections: Dict[str, List[str]] = {}
+        self.reembed_stats = {"pending": 0, "migrated": 0, "errors": 0}
+        self._reembed_thread: Optional[threading.Thread] = None
+        self._reembed_stop = threading.Event()
+        
+        # Diario de entradas con escritura diferida (sustituye a un JSON por entrada)
+        self.entry_journal = EntryJournal(
+            self.storage_path / "journal",
+            segment_size=memory_config.shared_journal_segment_mb * 1024 * 1024,
+            flush_interval=memory_config.shared_journal_flush_ms / 1000,
+            fsync=memory_config.shared_journal_fsync,
+            compact_ratio=memory_config.shared_journal_compact_ratio
+        )
+        
+        # Executor para consultar las colecciones en paralelo (se crea al primer uso)
+        self._search_executor: Optional[ThreadPoolExecutor] = None
+        
         # Configurar ChromaDB para memoria compartida
         self._setup_chromadb()
         
@@ -63,8 +127,22 @@ class SharedMemory:
         # Cache de entradas frecuentemente accedidas
         self.access_cache: Dict[str, SharedEntry] = {}
     
+        if memory_config.shared_reembed_on_start if reembed_on_start is None else reembed_on_start:
+            self.start_reembedding()
+    
     def _setup_chromadb(self):
-        """Configurar ChromaDB para memoria compartida"""
+        """Configurar ChromaDB (o índices FAISS en proceso) para memoria compartida"""
+        self.vector_store_backend = get_config().memory.shared_vector_store
+        if self.vector_store_backend == "faiss":
+            self.chroma_client = None
+            self.collections = {
+                collection_name: self._open_collection(self._physical_name(collection_name), description)
+                for collection_name, description in SHARED_COLLECTIONS.items()
+            }
+            self.legacy_collections = self._find_legacy_collections()
+            self.logger.info("Índices FAISS en proceso para memoria compartida")
+            return
+        
         try:
             # Usar singleton para evitar conflictos
             from utils.chromadb_singleton import chromadb_singleton
@@ -80,76 +158,228 @@ class SharedMemory:
             # Colecciones para diferentes tipos de memoria
             self.collections = {}
             
-            collection_configs = {
-                'conversations': 'Conversaciones entre agentes',
-                'project_context': 'Contexto de proyectos',
-                'learned_patterns': 'Patrones aprendidos',
-                'user_preferences': 'Preferencias del usuario'
-            }
+            for collection_name, description in SHARED_COLLECTIONS.items():
+                self.collections[collection_name] = self._open_collection(self._physical_name(collection_name),
+                                                                          description)
             
-            for collection_name, description in collection_configs.items():
-                try:
-                    self.collections[collection_name] = self.chroma_client.get_collection(collection_name)
-                    self.logger.info(f"Colección existente cargada: {collection_name}")
-                except Exception:
-                    self.collections[collection_name] = self.chroma_client.create_collection(
-                        name=collection_name,
-                        metadata={"description": description}
-                    )
-                    self.logger.info(f"Nueva colección creada: {collection_name}")
+            self.legacy_collections = self._find_legacy_collections()
             
         except Exception as e:
             self.logger.error(f"Error al configurar ChromaDB compartido: {e}")
             raise
     
+    def _physical_name(self, collection_name: str) -> str:
+        """Nombre de la colección para el modelo de embeddings actual"""
+        return collection_name_for_model(collection_name, self.embedding_service.model_name)
+    
+    def _open_collection(self, physical_name: str, description: Optional[str] = None):
+        """Abrir (o crear) una colección ChromaDB o índice FAISS por su nombre físico"""
+        if self.vector_store_backend == "faiss":
+            return create_faiss_vector_store(self.storage_path / "faiss" / physical_name)
+        
+        try:
+            collection = self.chroma_client.get_collection(physical_name)
+            self.logger.info(f"Colección existente cargada: {physical_name}")
+        except Exception:
+            collection = self.chroma_client.create_collection(
+                name=physical_name,
+                metadata={"description": description or physical_name,
+                          "embedding_model": self.embedding_service.model_name}
+            )
+            self.logger.info(f"Nueva colección creada: {physical_name}")
+        return collection
+    
+    def _drop_collection(self, physical_name: str, collection):
+        """Eliminar una colección ChromaDB o índice FAISS"""
+        if isinstance(collection, VectorStore):
+            collection.close()
+            shutil.rmtree(self.storage_path / "faiss" / physical_name, ignore_errors=True)
+        else:
+            self.chroma_client.delete_collection(physical_name)
+    
+    def _find_legacy_collections(self) -> Dict[str, List[str]]:
+        """Colecciones de otro modelo (o de los embeddings MD5 anteriores) por tipo de entrada"""
+        if self.vector_store_backend == "faiss":
+            faiss_path = self.storage_path / "faiss"
+            existing = [path.name for path in faiss_path.iterdir() if path.is_dir()] if faiss_path.exists() else []
+        elif self.chroma_client is not None:
+            existing = [getattr(collection, "name", collection) for collection in self.chroma_client.list_collections()]
+        else:
+            return {}
+        
+        legacy_collections = {}
+        for collection_name in SHARED_COLLECTIONS:
+            current = self._physical_name(collection_name)
+            names = sorted(
+                name for name in existing
+                if name != current and (name == collection_name or name.startswith(f"{collection_name}-"))
+            )
+            if names:
+                legacy_collections[collection_name] = names
+        return legacy_collections
+    
+    def start_reembedding(self) -> bool:
+        """Re-codificar en segundo plano las colecciones anteriores con el modelo actual
+        
+        Las escrituras nuevas van ya a las colecciones del modelo actual, así
+        que el hilo solo toma el lock para copiar cada lote. Las entradas aún
+        no copiadas no aparecen en las búsquedas hasta que se re-codifican.
+        """
+        if not self.legacy_collections:
+            return False
+        if self._reembed_thread is not None and self._reembed_thread.is_alive():
+            return True
+        
+        self._reembed_stop.clear()
+        self._reembed_thread = threading.Thread(
+            target=self._reembed_legacy_collections, name="shared-memory-reembed", daemon=True
+        )
+        self._reembed_thread.start()
+        self.logger.info(f"Re-codificación de colecciones compartidas iniciada: {self.legacy_collections}")
+        return True
+    
+    def wait_for_reembedding(self, timeout: Optional[float] = None) -> bool:
+        """Esperar a que termine la re-codificación; True si no queda nada en curso"""
+        thread = self._reembed_thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+    
+    def get_reembedding_status(self) -> Dict[str, Any]:
+        """Estado de la re-codificación en segundo plano"""
+        thread = self._reembed_thread
+        return {
+            'running': thread is not None and thread.is_alive(),
+            'legacy_collections': {name: list(names) for name, names in self.legacy_collections.items()},
+            **self.reembed_stats
+        }
+    
+    def _reembed_legacy_collections(self):
+        """Hilo de re-codificación: vacía cada colección anterior en la del modelo actual"""
+        for collection_name, legacy_names in list(self.legacy_collections.items()):
+            for legacy_name in list(legacy_names):
+                try:
+                    if not self._reembed_collection(collection_name, legacy_name):
+                        return
+                except Exception as e:
+                    self.reembed_stats["errors"] += 1
+                    self.logger.error(f"Error al re-codificar la colección {legacy_name}: {e}")
+        self.logger.info(f"Re-codificación de memoria compartida terminada: {self.reembed_stats}")
+    
+    def _reembed_collection(self, collection_name: str, legacy_name: str) -> bool:
+        """Copiar por lotes una colección anterior; False si se detuvo antes de terminar"""
+        legacy = self._open_collection(legacy_name)
+        self.reembed_stats["pending"] += legacy.count()
+        
+        while True:
+            if self._reembed_stop.is_set():
+                return False
+            if legacy_name not in self.legacy_collections.get(collection_name, []):
+                # clear_memory ya la eliminó
+                return True
+            
+            batch = legacy.get(include=['documents', 'metadatas'], limit=self.embedding_batch_size)
+            if not batch['ids']:
+                break
+            
+            # Codificar fuera del lock: los escritores no esperan al modelo
+            documents = [document or "" for document in batch['documents']]
+            embeddings = self._generate_embeddings(documents)
+            
+            with self.lock:
+                target = self.collections.get(collection_name)
+                if target is None:
+                    return False
+                
+                # Una escritura nueva con el mismo ID tiene prioridad sobre la copia
+                existing = set(target.get(ids=batch['ids'], include=[])['ids'])
+                positions = [position for position, entry_id in enumerate(batch['ids']) if entry_id not in existing]
+                if positions:
+                    target.add(
+                        ids=[batch['ids'][position] for position in positions],
+                        documents=[documents[position] for position in positions],
+                        embeddings=[embeddings[position] for position in positions],
+                        metadatas=[batch['metadatas'][position] or None for position in positions]
+                    )
+                legacy.delete(ids=batch['ids'])
+            
+            self.reembed_stats["migrated"] += len(positions)
+            self.reembed_stats["pending"] -= len(batch['ids'])
+        
+        with self.lock:
+            if legacy_name in self.legacy_collections.get(collection_name, []):
+                self._drop_collection(legacy_name, legacy)
+                self._forget_legacy_collection(collection_name, legacy_name)
+        self.logger.info(f"Colección {legacy_name} re-codificada en {self._physical_name(collection_name)}")
+        return True
+    
+    def _forget_legacy_collection(self, collection_name: str, legacy_name: str):
+        """Quitar una colección anterior de la lista de pendientes"""
+        legacy_names = self.legacy_collections.get(collection_name, [])
+        if legacy_name in legacy_names:
+            legacy_names.remove(legacy_name)
+        if not legacy_names:
+            self.legacy_collections.pop(collection_name, None)
+    
     def add_entry(self, agent_name: str, content: str, entry_type: str, 
                   metadata: Optional[Dict[str, Any]] = None, entry_id: Optional[str] = None) -> str:
         """Agregar entrada a memoria compartida"""
+        return self.add_entries(
+            agent_name, [content], entry_type,
+            metadatas=[metadata] if metadata else None,
+            entry_ids=[entry_id] if entry_id else None
+        )[0]
+    
+    def add_entries(self, agent_name: str, contents: List[str], entry_type: str,
+                    metadatas: Optional[List[Optional[Dict[str, Any]]]] = None,
+                    entry_ids: Optional[List[Optional[str]]] = None) -> List[str]:
+        """Agregar varias entradas del mismo tipo con una sola codificación y una sola escritura"""
+        if not contents:
+            return []
+        
         try:
-            with self.lock:
-                # Generar ID si no se proporciona
-                if not entry_id:
-                    entry_id = f"shared_{entry_type}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+            metadatas = metadatas or [None] * len(contents)
+            entry_ids = entry_ids or [None] * len(contents)
                 
-                # Crear entrada
-                entry = SharedEntry(
-                    id=entry_id,
+            # Crear entradas (ID generado si no se proporciona, con la posición si es un lote)
+            id_prefix = f"shared_{entry_type}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+            entries = [
+                SharedEntry(
+                    id=entry_id or (id_prefix if len(contents) == 1 else f"{id_prefix}_{position}"),
                     agent_name=agent_name,
                     content=content,
                     entry_type=entry_type,
                     metadata=metadata or {}
                 )
+                for position, (content, metadata, entry_id) in enumerate(zip(contents, metadatas, entry_ids))
+            ]
                 
+            # Codificar antes de tomar el lock, en micro-lotes con otras llamadas concurrentes
+            embeddings = self.embedding_encoder.call_many(contents) if entry_type in self.collections else None
+            
+            with self.lock:
                 # Agregar a colección correspondiente
-                if entry_type in self.collections:
-                    collection = self.collections[entry_type]
-                    
-                    # Generar embedding simple (en implementación real usar modelo de embeddings)
-                    embedding = self._generate_simple_embedding(content)
-                    
-                    # Preparar metadatos
-                    entry_metadata = {
-                        'agent_name': agent_name,
-                        'timestamp': entry.timestamp.isoformat()
-                    }
-                    if metadata:
-                        entry_metadata.update(metadata)
-                    
-                    collection.add(
-                        ids=[entry_id],
-                        documents=[content],
-                        embeddings=[embedding],
-                        metadatas=[entry_metadata]
+                if embeddings is not None and entry_type in self.collections:
+                    self.collections[entry_type].add(
+                        ids=[entry.id for entry in entries],
+                        documents=[entry.content for entry in entries],
+                        embeddings=embeddings,
+                        metadatas=[
+                            {'agent_name': agent_name, 'timestamp': entry.timestamp.isoformat(), **entry.metadata}
+                            for entry in entries
+                        ]
                     )
                 
-                # Guardar en archivo JSON para persistencia
-                self._save_entry_to_file(entry)
-                
                 # Agregar al cache
-                self.access_cache[entry_id] = entry
+                for entry in entries:
+                    self.access_cache[entry.id] = entry
                 
-                self.logger.debug(f"Entrada agregada a memoria compartida: {entry_id}")
-                return entry_id
+            # Encolar en el diario para persistencia, fuera del lock (no espera al disco)
+            self._save_entries_to_journal(entries)
+            
+            self.logger.debug(f"{len(entries)} entradas agregadas a memoria compartida ({entry_type})")
+            return [entry.id for entry in entries]
                 
         except Exception as e:
             self.logger.error(f"Error al agregar entrada compartida: {e}")
@@ -182,54 +412,81 @@ class SharedMemory:
     
     def search_entries(self, query: str, entry_type: Optional[str] = None, 
                       limit: int = 10) -> List[SharedEntry]:
-        """Buscar entradas en memoria compartida"""
+        """Buscar entradas en memoria compartida
+        
+        El embedding de la consulta se calcula una vez, las colecciones se
+        consultan en paralelo sin el lock global y los resultados se combinan
+        por distancia (disponible en metadata['distance']).
+        """
         try:
+            # Generar embedding de consulta una sola vez, fuera del lock
+            query_embedding = self.embedding_encoder.call(query)
+            
+            # El lock solo protege la lectura de las colecciones, no las consultas
             with self.lock:
-                results = []
-                
-                # Buscar en colecciones específicas o todas
-                collections_to_search = [entry_type] if entry_type else list(self.collections.keys())
+                collections_to_search = [
+                    (collection_name, self.collections[collection_name])
+                    for collection_name in ([entry_type] if entry_type else list(self.collections))
+                    if collection_name in self.collections
+                ]
                 
-                for collection_name in collections_to_search:
-                    if collection_name in self.collections:
-                        collection = self.collections[collection_name]
-                        
-                        # Generar embedding de consulta
-                        query_embedding = self._generate_simple_embedding(query)
-                        
-                        # Buscar en ChromaDB
-                        search_results = collection.query(
-                            query_embeddings=[query_embedding],
-                            n_results=limit,
-                            include=['documents', 'metadatas', 'distances']
-                        )
-                        
-                        # Procesar resultados
-                        if search_results['ids'] and search_results['ids'][0]:
-                            for i, entry_id in enumerate(search_results['ids'][0]):
-                                content = search_results['documents'][0][i]
-                                metadata = search_results['metadatas'][0][i]
-                                distance = search_results['distances'][0][i]
-                                
-                                entry = SharedEntry(
-                                    id=entry_id,
-                                    agent_name=metadata.get('agent_name', 'unknown'),
-                                    content=content,
-                                    entry_type=collection_name,
-                                    metadata=metadata
-                                )
-                                
-                                results.append(entry)
+            if len(collections_to_search) > 1:
+                partial_results = list(self._get_search_executor().map(
+                    lambda item: self._query_collection(item[0], item[1], query_embedding, limit),
+                    collections_to_search
+                ))
+            else:
+                partial_results = [
+                    self._query_collection(collection_name, collection, query_embedding, limit)
+                    for collection_name, collection in collections_to_search
+                ]
                 
-                # Ordenar por relevancia (distancia)
-                results.sort(key=lambda x: x.metadata.get('distance', 1.0))
-                
-                return results[:limit]
+            # Top-k por distancia sobre los resultados de todas las colecciones
+            return heapq.nsmallest(limit, itertools.chain.from_iterable(partial_results),
+                                   key=lambda entry: entry.metadata['distance'])
                 
         except Exception as e:
             self.logger.error(f"Error en búsqueda compartida: {e}")
             return []
     
+    def _get_search_executor(self) -> ThreadPoolExecutor:
+        """Executor compartido para las consultas en paralelo"""
+        with self.lock:
+            if self._search_executor is None:
+                self._search_executor = ThreadPoolExecutor(
+                    max_workers=len(SHARED_COLLECTIONS),
+                    thread_name_prefix="shared-memory-search"
+                )
+            return self._search_executor
+    
+    def _query_collection(self, collection_name: str, collection, query_embedding: List[float],
+                          limit: int) -> List[SharedEntry]:
+        """Consultar una colección; un fallo solo descarta sus resultados"""
+        try:
+            search_results = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=limit,
+                include=['documents', 'metadatas', 'distances']
+            )
+        except Exception as e:
+            self.logger.warning(f"Error al consultar la colección {collection_name}: {e}")
+            return []
+        
+        # Procesar resultados
+        entries = []
+        if search_results['ids'] and search_results['ids'][0]:
+            for i, entry_id in enumerate(search_results['ids'][0]):
+                metadata = {**(search_results['metadatas'][0][i] or {}),
+                            'distance': search_results['distances'][0][i]}
+                entries.append(SharedEntry(
+                    id=entry_id,
+                    agent_name=metadata.get('agent_name', 'unknown'),
+                    content=search_results['documents'][0][i],
+                    entry_type=collection_name,
+                    metadata=metadata
+                ))
+        return entries
+    
     def set_project_context(self, project_id: str, project_name: str, 
                            project_path: str, framework: str) -> bool:
         """Establecer contexto del proyecto actual"""
@@ -324,18 +581,16 @@ class SharedMemory:
     def sync_agent_memory(self, agent_name: str, memory_data: Dict[str, Any]) -> bool:
         """Sincronizar memoria de un agente con memoria compartida"""
         try:
-            with self.lock:
-                # Agregar datos de memoria del agente
-                for key, value in memory_data.items():
-                    self.add_entry(
-                        agent_name=agent_name,
-                        content=str(value),
-                        entry_type='conversations',
-                        metadata={'memory_key': key}
-                    )
+            # Agregar datos de memoria del agente en un solo lote
+            self.add_entries(
+                agent_name=agent_name,
+                contents=[str(value) for value in memory_data.values()],
+                entry_type='conversations',
+                metadatas=[{'memory_key': key} for key in memory_data]
+            )
                 
-                self.logger.info(f"Memoria sincronizada para agente: {agent_name}")
-                return True
+            self.logger.info(f"Memoria sincronizada para agente: {agent_name}")
+            return True
                 
         except Exception as e:
             self.logger.error(f"Error al sincronizar memoria del agente {agent_name}: {e}")
@@ -348,7 +603,11 @@ class SharedMemory:
                 'total_entries': 0,
                 'entries_by_type': {},
                 'cache_size': len(self.access_cache),
-                'project_context': self.current_context is not None
+                'project_context': self.current_context is not None,
+                'embeddings': self.embedding_service.get_stats(),
+                'embedding_cache': self.embedding_cache.get_stats(),
+                'journal': self.entry_journal.get_stats(),
+                'reembedding': self.get_reembedding_status()
             }
             
             # Contar entradas por tipo
@@ -367,22 +626,25 @@ class SharedMemory:
         """Limpiar memoria compartida"""
         try:
             with self.lock:
-                if entry_type:
-                    # Limpiar tipo específico
-                    if entry_type in self.collections:
-                        self.chroma_client.delete_collection(entry_type)
-                        self.collections[entry_type] = self.chroma_client.create_collection(
-                            name=entry_type,
-                            metadata={"description": f"Memoria compartida - {entry_type}"}
-                        )
-                else:
-                    # Limpiar toda la memoria
-                    for collection_name in list(self.collections.keys()):
-                        self.chroma_client.delete_collection(collection_name)
-                        self.collections[collection_name] = self.chroma_client.create_collection(
-                            name=collection_name,
-                            metadata={"description": f"Memoria compartida - {collection_name}"}
-                        )
+                # Limpiar tipo específico o toda la memoria
+                collection_names = [entry_type] if entry_type else list(self.collections.keys())
+                for collection_name in collection_names:
+                    if collection_name not in self.collections:
+                        continue
+                    
+                    # Las entradas anteriores aún sin re-codificar también se descartan
+                    for legacy_name in list(self.legacy_collections.get(collection_name, [])):
+                        self._drop_collection(legacy_name, self._open_collection(legacy_name))
+                        self._forget_legacy_collection(collection_name, legacy_name)
+                    
+                    if isinstance(self.collections[collection_name], VectorStore):
+                        self.collections[collection_name].clear()
+                        continue
+                    physical_name = self._physical_name(collection_name)
+                    self.chroma_client.delete_collection(physical_name)
+                    self.collections[collection_name] = self._open_collection(
+                        physical_name, f"Memoria compartida - {collection_name}"
+                    )
                 
                 # Limpiar cache
                 self.access_cache.clear()
@@ -397,44 +659,70 @@ class SharedMemory:
             self.logger.error(f"Error al limpiar memoria: {e}")
             return False
     
-    def _generate_simple_embedding(self, text: str) -> List[float]:
-        """Generar embedding simple (placeholder)"""
-        # En implementación real, usar modelo de embeddings
-        import hashlib
-        hash_obj = hashlib.md5(text.encode())
-        hash_bytes = hash_obj.digest()
-        return [float(b) / 255.0 for b in hash_bytes[:8]]  # Embedding de 8 dimensiones
+    def close(self):
+        """Detener la re-codificación, terminar los lotes pendientes y liberar el backend vectorial"""
+        from utils.chromadb_singleton import chromadb_singleton
+        
+        self._reembed_stop.set()
+        self.wait_for_reembedding()
+        self.embedding_encoder.close()
+        self.embedding_cache.close()
+        self.entry_journal.close()
+        
+        with self.lock:
+            if self._search_executor is not None:
+                self._search_executor.shutdown(wait=True)
+                self._search_executor = None
+            for collection in self.collections.values():
+                if isinstance(collection, VectorStore):
+                    collection.close()
+            if self.chroma_client is not None:
+                chromadb_singleton.release_client("shared_memory", self.storage_path)
+                self.chroma_client = None
+            self.collections = {}
     
-    def _save_entry_to_file(self, entry: SharedEntry):
-        """Guardar entrada en archivo JSON"""
+    def _generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generar embeddings con el modelo compartido, reutilizando el cache por contenido"""
         try:
-            entry_file = self.storage_path / f"entry_{entry.id}.json"
-            
-            entry_data = {
-                'id': entry.id,
-                'agent_name': entry.agent_name,
-                'content': entry.content,
-                'entry_type': entry.entry_type,
-                'metadata': entry.metadata,
-                'timestamp': entry.timestamp.isoformat(),
-                'access_count': entry.access_count,
-                'last_accessed': entry.last_accessed.isoformat() if entry.last_accessed else None
-            }
+            embeddings = self.embedding_cache.get_or_compute(
+                texts, lambda missing: self.embedding_service.encode(missing, batch_size=self.embedding_batch_size)
+            )
+            return [embedding.tolist() for embedding in embeddings]
             
-            json_helper.save_json(entry_data, entry_file)
+        except Exception as e:
+            self.logger.error(f"Error al generar embeddings compartidos: {e}")
+            raise
+    
+    def _save_entries_to_journal(self, entries: List[SharedEntry]):
+        """Encolar entradas en el diario de la memoria compartida"""
+        try:
+            self.entry_journal.put_many([
+                {
+                    'id': entry.id,
+                    'agent_name': entry.agent_name,
+                    'content': entry.content,
+                    'entry_type': entry.entry_type,
+                    'metadata': entry.metadata,
+                    'timestamp': entry.timestamp.isoformat(),
+                    'access_count': entry.access_count,
+                    'last_accessed': entry.last_accessed.isoformat() if entry.last_accessed else None
+                }
+                for entry in entries
+            ])
             
         except Exception as e:
-            self.logger.error(f"Error al guardar entrada en archivo: {e}")
+            self.logger.error(f"Error al guardar entradas en el diario: {e}")
     
     def _load_entry_from_file(self, entry_id: str) -> Optional[SharedEntry]:
-        """Cargar entrada desde archivo JSON"""
+        """Cargar entrada desde el diario (o desde el JSON por entrada de versiones anteriores)"""
         try:
-            entry_file = self.storage_path / f"entry_{entry_id}.json"
-            
-            if not entry_file.exists():
-                return None
+            entry_data = self.entry_journal.get(entry_id)
             
-            entry_data = json_helper.load_json(entry_file)
+            if entry_data is None:
+                entry_file = self.storage_path / f"entry_{entry_id}.json"
+                if not entry_file.exists():
+                    return None
+                entry_data = json_helper.load_json(entry_file)
             
             return SharedEntry(
                 id=entry_data['id'],
@@ -6,7 +6,7 @@ IA Agent para Generación de Pruebas Unitarias .NET
 import os
 import shutil
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, Iterable
 from dataclasses import dataclass
 
 from utils.helpers import file_helper, validation_helper
@@ -104,6 +104,51 @@ class FileManager:
             
             raise
     
+    def write_stream(self, file_path: Union[str, Path], chunks: Iterable[str],
+                     backup: bool = True) -> bool:
+        """Escribir archivo a medida que llegan los fragmentos (p. ej. respuesta del LLM en streaming)"""
+        written = []
+        try:
+            full_path = self._resolve_path(file_path)
+            self.logger.info(f"Escribiendo archivo en streaming: {full_path}")
+            
+            if backup and full_path.exists():
+                backup_path = file_helper.backup_file(full_path)
+                self.logger.info(f"Backup creado: {backup_path}")
+            
+            full_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(full_path, 'w', encoding='utf-8') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    f.flush()
+                    written.append(chunk)
+            
+            content = "".join(written)
+            operation = FileOperation(
+                operation_type='write',
+                target_path=str(full_path),
+                content=content[:100] + "..." if len(content) > 100 else content,
+                success=True
+            )
+            self.operations_history.append(operation)
+            
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"Error al escribir archivo {file_path} en streaming: {e}")
+            
+            content = "".join(written)
+            operation = FileOperation(
+                operation_type='write',
+                target_path=str(file_path),
+                content=content[:100] + "..." if len(content) > 100 else content,
+                success=False,
+                error_message=str(e)
+            )
+            self.operations_history.append(operation)
+            
+            raise
+    
     def copy_file(self, source_path: Union[str, Path], 
                   target_path: Union[str, Path]) -> bool:
         """Copiar archivo"""
@@ -4,9 +4,12 @@ IA Agent para Generación de Pruebas Unitarias .NET
 """
 
 import os
+import re
+import shutil
+import sqlite3
 import threading
-import uuid
-from typing import Optional, Dict, Any
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Set
 from pathlib import Path
 
 import chromadb
@@ -16,9 +19,34 @@ from utils.logging import get_logger
 
 logger = get_logger("chromadb-singleton")
 
+# Directorios por agente con sufijo aleatorio que creaban versiones anteriores
+LEGACY_AGENT_DIR_PATTERN = re.compile(r"^agent_.+_[0-9a-f]{8}$")
+
+CHROMA_DATABASE_FILE = "chroma.sqlite3"
+
+
+@dataclass
+class PooledClient:
+    """Cliente ChromaDB compartido por todos los que usan la misma ruta"""
+    client: Any
+    path: Path
+    persistent: bool
+    refcount: int = 0
+    agents: Set[str] = field(default_factory=set)
+
+
+def _directory_size(path: Path) -> int:
+    """Tamaño total en bytes de los archivos de un directorio"""
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
 
 class ChromaDBSingleton:
-    """Singleton para ChromaDB"""
+    """Singleton para ChromaDB
+    
+    Mantiene un cliente por directorio de persistencia (base_path/agent_<nombre>)
+    con conteo de referencias: get_client suma una, release_client la resta y
+    el cliente se cierra cuando nadie lo usa.
+    """
     
     _instance: Optional['ChromaDBSingleton'] = None
     _lock = threading.Lock()
@@ -33,56 +61,165 @@ class ChromaDBSingleton:
     
     def __init__(self):
         if not self._initialized:
-            self._clients: Dict[str, chromadb.Client] = {}
+            self._clients: Dict[str, PooledClient] = {}
+            self._pool_lock = threading.RLock()
             self._initialized = True
     
-    def get_client(self, agent_name: str, base_path: Optional[Path] = None) -> chromadb.Client:
-        """Obtener cliente ChromaDB para un agente específico"""
+    @staticmethod
+    def get_client_path(agent_name: str, base_path: Optional[Path] = None) -> Path:
+        """Directorio de persistencia del agente"""
         if base_path is None:
             base_path = Path("./memory/vector")
+        return Path(base_path) / f"agent_{agent_name}"
+    
+    def get_client(self, agent_name: str, base_path: Optional[Path] = None) -> chromadb.Client:
+        """Obtener cliente ChromaDB para un agente específico"""
+        agent_path = self.get_client_path(agent_name, base_path)
+        client_key = str(agent_path.resolve())
         
-        # Crear identificador único para el agente
-        client_key = f"{agent_name}_{uuid.uuid4().hex[:8]}"
-        
-        # Si ya tenemos un cliente para este agente, reutilizarlo
-        if client_key in self._clients:
-            return self._clients[client_key]
-        
+        with self._pool_lock:
+            # Si ya hay un cliente para esta ruta, reutilizarlo
+            pooled = self._clients.get(client_key)
+            if pooled is None:
+                pooled = self._create_client(agent_name, agent_path)
+                if pooled is None:
+                    # Último recurso: retornar None y manejar en el código que lo usa
+                    return None
+                self._clients[client_key] = pooled
+            
+            pooled.refcount += 1
+            pooled.agents.add(agent_name)
+            return pooled.client
+    
+    def _create_client(self, agent_name: str, agent_path: Path) -> Optional[PooledClient]:
+        """Crear el cliente persistente de una ruta (o uno en memoria si falla)"""
+        settings = Settings(anonymized_telemetry=False)
         try:
-            # Crear path único para el agente
-            agent_path = base_path / f"agent_{agent_name}_{uuid.uuid4().hex[:8]}"
             agent_path.mkdir(parents=True, exist_ok=True)
-            
-            # Configuración única para el agente
-            settings = Settings(
-                persist_directory=str(agent_path),
-                anonymized_telemetry=False
-            )
-            
-            # Crear nuevo cliente
-            client = chromadb.Client(settings)
-            self._clients[client_key] = client
-            
-            logger.info(f"Cliente ChromaDB creado para agente: {agent_name}")
-            return client
-            
+            client = chromadb.PersistentClient(path=str(agent_path), settings=settings)
+            logger.info(f"Cliente ChromaDB creado para agente: {agent_name} ({agent_path})")
+            return PooledClient(client, agent_path, persistent=True)
+        
         except Exception as e:
             logger.warning(f"Error al crear cliente ChromaDB para {agent_name}: {e}")
             # Fallback: usar cliente en memoria sin persistencia
             try:
-                client = chromadb.Client()
-                self._clients[client_key] = client
+                client = chromadb.EphemeralClient(settings=settings)
                 logger.warning(f"Usando cliente ChromaDB en memoria para {agent_name}")
-                return client
+                return PooledClient(client, agent_path, persistent=False)
             except Exception as e2:
                 logger.error(f"Error crítico al crear cliente en memoria: {e2}")
-                # Último recurso: retornar None y manejar en el código que lo usa
                 return None
     
+    def release_client(self, agent_name: str, base_path: Optional[Path] = None) -> bool:
+        """Liberar una referencia al cliente; se cierra al llegar a cero"""
+        client_key = str(self.get_client_path(agent_name, base_path).resolve())
+        
+        with self._pool_lock:
+            pooled = self._clients.get(client_key)
+            if pooled is None:
+                return False
+            
+            pooled.refcount -= 1
+            if pooled.refcount > 0:
+                return True
+            
+            del self._clients[client_key]
+        
+        self._close_client(pooled)
+        return True
+    
+    def _close_client(self, pooled: PooledClient):
+        """Cerrar un cliente y liberar sus archivos"""
+        close = getattr(pooled.client, "close", None)
+        if close is None:
+            return
+        try:
+            close()
+            logger.debug(f"Cliente ChromaDB cerrado: {pooled.path}")
+        except Exception as e:
+            logger.warning(f"Error al cerrar cliente ChromaDB {pooled.path}: {e}")
+    
+    def close_all(self):
+        """Cerrar todos los clientes abiertos"""
+        with self._pool_lock:
+            pooled_clients = list(self._clients.values())
+            self._clients.clear()
+        
+        for pooled in pooled_clients:
+            self._close_client(pooled)
+    
+    def get_open_paths(self) -> List[Path]:
+        """Directorios con un cliente abierto"""
+        with self._pool_lock:
+            return [pooled.path.resolve() for pooled in self._clients.values()]
+    
+    def collect_garbage(self, root: Path, dry_run: bool = False, compact: bool = False) -> Dict[str, Any]:
+        """Eliminar directorios huérfanos de agentes y, opcionalmente, compactar los vigentes
+        
+        Son huérfanos los directorios agent_<nombre>_<hex> que creaban las versiones
+        que generaban una ruta aleatoria por cliente. Los directorios con un cliente
+        abierto no se tocan.
+        """
+        root = Path(root)
+        open_paths = set(self.get_open_paths())
+        result = {"removed": [], "compacted": [], "bytes_freed": 0, "errors": []}
+        if not root.exists():
+            return result
+        
+        for directory in sorted(path for path in root.rglob("agent_*") if path.is_dir()):
+            if directory.resolve() in open_paths or not directory.exists():
+                continue
+            
+            try:
+                if LEGACY_AGENT_DIR_PATTERN.match(directory.name):
+                    size = _directory_size(directory)
+                    if not dry_run:
+                        shutil.rmtree(directory)
+                    result["removed"].append(str(directory))
+                    result["bytes_freed"] += size
+                
+                elif compact and (directory / CHROMA_DATABASE_FILE).exists() and not dry_run:
+                    database = directory / CHROMA_DATABASE_FILE
+                    size_before = database.stat().st_size
+                    connection = sqlite3.connect(str(database))
+                    try:
+                        connection.execute("VACUUM")
+                    finally:
+                        connection.close()
+                    result["compacted"].append(str(directory))
+                    result["bytes_freed"] += max(0, size_before - database.stat().st_size)
+            
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"No se pudo limpiar {directory}: {e}")
+                result["errors"].append(f"{directory}: {e}")
+        
+        action = "Se eliminarían" if dry_run else "Eliminados"
+        logger.info(
+            f"{action} {len(result['removed'])} directorios huérfanos de ChromaDB "
+            f"({result['bytes_freed'] / 1024 / 1024:.2f} MB)"
+        )
+        return result
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas del pool de clientes"""
+        with self._pool_lock:
+            return {
+                "clients": len(self._clients),
+                "references": sum(pooled.refcount for pooled in self._clients.values()),
+                "paths": {
+                    str(pooled.path): {
+                        "refcount": pooled.refcount,
+                        "persistent": pooled.persistent,
+                        "agents": sorted(pooled.agents)
+                    }
+                    for pooled in self._clients.values()
+                }
+            }
+    
     def reset(self):
         """Resetear el singleton (para pruebas)"""
-        with self._lock:
-            self._clients.clear()
+        self.close_all()
 
 
 # Instancia global
@@ -19,6 +19,82 @@ class AIConfig(BaseModel):
     max_tokens: int = Field(default=4000, description="Máximo de tokens")
     timeout: int = Field(default=30, description="Timeout en segundos")
     
+    # Concurrencia de peticiones
+    max_concurrent_requests: int = Field(default=8, description="Máximo de peticiones simultáneas por proveedor")
+    provider_concurrency: Dict[str, int] = Field(default_factory=dict, 
+                                                 description="Límite de peticiones simultáneas por proveedor")
+    
+    # Caché persistente de respuestas
+    response_cache_enabled: bool = Field(default=True, description="Caché de respuestas habilitado")
+    response_cache_path: str = Field(default="./memory/llm_cache/responses.db", 
+                                     description="Ruta de la base de datos del caché de respuestas")
+    response_cache_ttl: int = Field(default=7 * 24 * 3600, description="Tiempo de vida de respuestas en segundos")
+    response_cache_max_entries: int = Field(default=10000, description="Máximo de respuestas en caché")
+    response_cache_max_bytes: int = Field(default=256 * 1024 * 1024, description="Tamaño máximo del caché en bytes")
+    
+    # Planificador de peticiones por proveedor (0 = sin límite)
+    rate_limit_rpm: int = Field(default=0, description="Peticiones por minuto por defecto de cada proveedor")
+    rate_limit_tpm: int = Field(default=0, description="Tokens por minuto por defecto de cada proveedor")
+    provider_rate_limits: Dict[str, Dict[str, int]] = Field(
+        default_factory=dict,
+        description="Límites por proveedor, p. ej. {'openai': {'rpm': 500, 'tpm': 90000}}"
+    )
+    rate_limit_headroom: float = Field(default=0.9, description="Fracción del límite usada como ritmo sostenido")
+    rate_limit_max_retries: int = Field(default=3, description="Reintentos ante respuestas 429")
+    
+    # Peticiones cubiertas (hedging) y failover entre LLM principal y secundario
+    hedging_enabled: bool = Field(default=False, description="Cubrir peticiones lentas del LLM principal")
+    hedge_llm_type: str = Field(default="fast", description="LLM secundario para cobertura y failover")
+    hedge_latency_percentile: float = Field(default=95.0, description="Percentil de latencia que dispara la cobertura")
+    hedge_latency_window: int = Field(default=200, description="Latencias recientes consideradas")
+    hedge_min_samples: int = Field(default=20, description="Muestras mínimas para usar el percentil")
+    hedge_default_delay: float = Field(default=10.0, description="Espera de cobertura sin muestras suficientes (segundos)")
+    hedge_min_delay: float = Field(default=1.0, description="Espera mínima de cobertura (segundos)")
+    
+    # Generación especulativa: borrador con el LLM rápido, escalado al principal si falla
+    speculative_generation_enabled: bool = Field(default=False, description="Generar borradores con el LLM rápido")
+    speculative_draft_llm_type: str = Field(default="fast", description="LLM que genera los borradores")
+    speculative_compile_check: bool = Field(default=False, description="Compilar los borradores antes de aceptarlos")
+    speculative_scratch_project: Optional[str] = Field(default=None,
+                                                       description="Proyecto de pruebas auxiliar para compilar borradores")
+    
+    # LLM local simulado (provider="local") para pruebas de carga sin red
+    local_llm_fixtures_path: Optional[str] = Field(default=None, description="Respuestas grabadas (JSON Lines)")
+    local_llm_latency_distribution: str = Field(default="lognormal",
+                                                description="Distribución de latencia: fixed, uniform, normal, lognormal")
+    local_llm_latency_mean: float = Field(default=0.5, description="Latencia media hasta el primer token (segundos)")
+    local_llm_latency_stddev: float = Field(default=0.2, description="Desviación de la latencia (segundos)")
+    local_llm_tokens_per_second: float = Field(default=50.0, description="Velocidad de generación simulada")
+    local_llm_error_rate: float = Field(default=0.0, description="Fracción de llamadas con error simulado")
+    local_llm_rate_limit_rate: float = Field(default=0.0, description="Fracción de llamadas con 429 simulado")
+    local_llm_seed: int = Field(default=0, description="Semilla de latencias y errores simulados")
+    
+    # Trabajos por lotes con la API batch del proveedor (regeneración nocturna)
+    batch_jobs_path: str = Field(default="./memory/batch_jobs", description="Directorio de trabajos por lotes")
+    batch_transport: str = Field(default="file_drop", description="Transporte de lotes: file_drop u openai")
+    batch_file_drop_path: str = Field(default="./memory/batch_jobs/file_drop",
+                                      description="Carpetas inbox/outbox del transporte local")
+    batch_max_requests: int = Field(default=50000, description="Máximo de prompts por archivo de lote")
+    batch_poll_interval: float = Field(default=60.0, description="Intervalo de sondeo de lotes (segundos)")
+    batch_completion_window: str = Field(default="24h", description="Ventana de finalización pedida al proveedor")
+    
+    # Agrupación de prompts idénticos en vuelo (single-flight)
+    request_coalescing_enabled: bool = Field(default=True,
+                                             description="Compartir una sola petición entre prompts idénticos en vuelo")
+    
+    # Instrumentación de llamadas a LLMs
+    llm_metrics_enabled: bool = Field(default=True, description="Registrar latencia, tokens y costo de cada llamada")
+    llm_metrics_path: str = Field(default="./metrics", description="Directorio del recolector de métricas")
+    
+    # Tokenizadores exactos: por defecto solo desde el caché local de tiktoken
+    tokenizer_allow_download: bool = Field(default=False,
+                                           description="Descargar codificaciones de tiktoken que no estén en caché")
+    
+    # Nivel semántico del caché (opcional)
+    semantic_cache_enabled: bool = Field(default=False, description="Caché semántico de prompts habilitado")
+    semantic_cache_threshold: float = Field(default=0.97, description="Similitud coseno mínima para reutilizar respuesta")
+    semantic_cache_max_entries: int = Field(default=5000, description="Máximo de prompts en caché semántico")
+    
     # Configuración específica por proveedor
     openai_api_key: Optional[str] = Field(default=None, description="API Key de OpenAI")
     openai_organization: Optional[str] = Field(default=None, description="Organización de OpenAI")
@@ -36,12 +112,35 @@ class MemoryConfig(BaseModel):
     # Memoria individual
     individual_buffer_size: int = Field(default=1000, description="Tamaño del buffer individual")
     individual_summary_threshold: int = Field(default=50, description="Umbral para resumen")
-    individual_vector_store: str = Field(default="chroma", description="Vector store individual")
+    individual_vector_store: str = Field(default="chroma", description="Vector store individual (chroma o faiss)")
+    embedding_cache_size: int = Field(default=10000, description="Máximo de embeddings en caché por agente")
+    embedding_batch_size: int = Field(default=64, description="Textos por lote del codificador de embeddings")
+    embedding_batch_wait_ms: float = Field(default=5.0,
+                                           description="Espera para completar un lote de embeddings (ms)")
+    embedding_service_mode: str = Field(default="local",
+                                        description="Dónde se ejecuta el modelo de embeddings: local o process")
     
     # Memoria compartida
     shared_enabled: bool = Field(default=False, description="Memoria compartida habilitada")
     shared_storage_path: str = Field(default="./memory/shared", description="Ruta de memoria compartida")
     shared_sync_interval: int = Field(default=60, description="Intervalo de sincronización")
+    shared_vector_store: str = Field(default="chroma", description="Vector store compartido (chroma o faiss)")
+    shared_reembed_on_start: bool = Field(default=True,
+                                          description="Re-codificar en segundo plano las colecciones compartidas "
+                                                      "de embeddings anteriores")
+    shared_journal_segment_mb: int = Field(default=64, description="Tamaño de cada segmento del diario compartido (MB)")
+    shared_journal_flush_ms: float = Field(default=50.0,
+                                           description="Espera para agrupar escrituras del diario compartido (ms)")
+    shared_journal_fsync: bool = Field(default=True, description="fsync por lote de escrituras del diario compartido")
+    shared_journal_compact_ratio: float = Field(default=0.5,
+                                                description="Fracción de bytes obsoletos que dispara la compactación")
+    
+    # Índice FAISS en proceso
+    faiss_index_type: str = Field(default="hnsw", description="Tipo de índice FAISS: flat, hnsw o ivf")
+    faiss_hnsw_m: int = Field(default=32, description="Vecinos por nodo del grafo HNSW")
+    faiss_ef_search: int = Field(default=64, description="Candidatos explorados por búsqueda HNSW")
+    faiss_ivf_lists: int = Field(default=1024, description="Listas (centroides) del índice IVF")
+    faiss_ivf_probes: int = Field(default=16, description="Listas revisadas por búsqueda IVF")
 
 
 class TestingConfig(BaseModel):
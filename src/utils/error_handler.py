@@ -11,9 +11,11 @@ from typing import Dict, List, Optional, Any, Callable, Type
 from dataclasses import dataclass, field
 from enum import Enum
 from functools import wraps
+from collections import deque
 import json
 
 from config.environment import environment_manager
+from utils.rolling_metrics import RollingMetricSet
 
 
 class ErrorSeverity(Enum):
@@ -57,17 +59,21 @@ class ErrorHandler:
         self.logger = logging.getLogger(__name__)
         self.config = environment_manager.get_config()
         
-        # Almacenamiento de errores
-        self.errors: List[ErrorInfo] = []
+        # Almacenamiento de errores (buffer circular de los más recientes)
+        self.max_errors = 1000
+        self.errors: deque = deque(maxlen=self.max_errors)
         self.error_counts: Dict[str, int] = {}
         
+        # Tasa de errores por ventana de tiempo (total y por categoría)
+        self.error_windows = (60, 300, 3600)
+        self.error_rates = RollingMetricSet(capacity=self.max_errors, time_windows=self.error_windows)
+        
         # Callbacks de manejo de errores
         self.error_callbacks: Dict[ErrorCategory, List[Callable]] = {
             category: [] for category in ErrorCategory
         }
         
         # Configuración de manejo
-        self.max_errors = 1000
         self.auto_retry_enabled = True
         self.max_retries = 3
         self.retry_delay = 1.0
@@ -131,6 +137,8 @@ class ErrorHandler:
         self.stats["errors_by_category"][error_info.category.value] += 1
         self.stats["errors_by_severity"][error_info.severity.value] += 1
         self.stats["last_error_time"] = error_info.timestamp
+        self.error_rates.add("total", 1.0, error_info.timestamp)
+        self.error_rates.add(error_info.category.value, 1.0, error_info.timestamp)
         
         # Contar errores por tipo
         error_key = f"{error_info.category.value}_{error_info.exception_type}"
@@ -181,9 +189,9 @@ class ErrorHandler:
     
     def _cleanup_old_errors(self):
         """Limpiar errores antiguos"""
-        if len(self.errors) > self.max_errors:
-            # Mantener solo los errores más recientes
-            self.errors = self.errors[-self.max_errors:]
+        if self.errors.maxlen != self.max_errors:
+            # Límite modificado: mantener solo los errores más recientes
+            self.errors = deque(self.errors, maxlen=self.max_errors)
     
     def add_error_callback(self, category: ErrorCategory, callback: Callable):
         """Agregar callback de manejo de errores"""
@@ -225,6 +233,13 @@ class ErrorHandler:
         """Obtener errores no resueltos"""
         return [error for error in self.errors if not error.resolved]
     
+    def get_error_rate(self, window: str = "60s", category: Optional[ErrorCategory] = None) -> int:
+        """Cantidad de errores en una ventana de tiempo ("60s", "300s", "3600s")"""
+        name = category.value if category else "total"
+        if name not in self.error_rates:
+            return 0
+        return self.error_rates.get(name).count(window)
+    
     def get_error_stats(self) -> Dict[str, Any]:
         """Obtener estadísticas de errores"""
         return {
@@ -232,6 +247,9 @@ class ErrorHandler:
             "error_counts": self.error_counts.copy(),
             "total_errors_stored": len(self.errors),
             "unresolved_errors": len(self.get_unresolved_errors()),
+            "recent_errors": {
+                f"{seconds}s": self.get_error_rate(f"{seconds}s") for seconds in self.error_windows
+            },
             "callbacks_registered": {
                 category.value: len(callbacks) 
                 for category, callbacks in self.error_callbacks.items()
@@ -242,6 +260,7 @@ class ErrorHandler:
         """Limpiar todos los errores"""
         self.errors.clear()
         self.error_counts.clear()
+        self.error_rates.clear()
         self.stats = {
             "total_errors": 0,
             "errors_by_category": {category.value: 0 for category in ErrorCategory},
@@ -0,0 +1,309 @@
+"""
+Métricas en ventana deslizante con memoria acotada
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+from array import array
+import math
+import threading
+import time
+
+DEFAULT_PERCENTILES = (50, 95, 99)
+
+
+class QuantileSketch:
+    """Sketch de cuantiles con error relativo acotado (buckets logarítmicos)
+    
+    Admite altas y bajas, por lo que puede seguir el contenido exacto de una
+    ventana deslizante. La memoria depende del rango de valores, no de su número.
+    """
+    
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self._positive: Dict[int, int] = {}
+        self._negative: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+    
+    def _key(self, value: float) -> int:
+        """Bucket de un valor positivo"""
+        return math.ceil(math.log(value) / self._log_gamma)
+    
+    def _value(self, key: int) -> float:
+        """Valor representativo de un bucket"""
+        return 2 * self.gamma ** key / (self.gamma + 1)
+    
+    def _update(self, value: float, delta: int):
+        """Sumar o restar una ocurrencia de un valor"""
+        self.count += delta
+        if value == 0:
+            self.zero_count += delta
+            return
+        
+        buckets = self._positive if value > 0 else self._negative
+        key = self._key(abs(value))
+        remaining = buckets.get(key, 0) + delta
+        if remaining > 0:
+            buckets[key] = remaining
+        else:
+            buckets.pop(key, None)
+    
+    def add(self, value: float):
+        """Agregar un valor"""
+        self._update(value, 1)
+    
+    def remove(self, value: float):
+        """Quitar un valor agregado previamente"""
+        self._update(value, -1)
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Cuantil q (0-1) aproximado; None si el sketch está vacío"""
+        if self.count <= 0:
+            return None
+        
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self._negative, reverse=True):
+            seen += self._negative[key]
+            if seen > rank:
+                return -self._value(key)
+        
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        
+        for key in sorted(self._positive):
+            seen += self._positive[key]
+            if seen > rank:
+                return self._value(key)
+        
+        return self._value(max(self._positive)) if self._positive else 0.0
+    
+    def clear(self):
+        """Vaciar el sketch"""
+        self._positive.clear()
+        self._negative.clear()
+        self.zero_count = 0
+        self.count = 0
+
+
+class _Window:
+    """Agregados de una ventana (por cantidad o por tiempo) sobre el buffer circular"""
+    
+    def __init__(self, name: str, size: Optional[int], seconds: Optional[float], relative_accuracy: float):
+        self.name = name
+        self.size = size
+        self.seconds = seconds
+        self.tail = 0  # Secuencia del valor más antiguo incluido
+        self.count = 0
+        self.total = 0.0
+        self.sketch = QuantileSketch(relative_accuracy)
+    
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.sketch.add(value)
+    
+    def evict(self, value: float):
+        self.count -= 1
+        self.total -= value
+        self.sketch.remove(value)
+        self.tail += 1
+        if self.count == 0:
+            # Evitar que el error de redondeo se acumule
+            self.total = 0.0
+
+
+class RollingMetric:
+    """Serie de valores en un buffer circular de capacidad fija con agregados incrementales
+    
+    Los valores y marcas de tiempo se guardan en arrays compactos. Cada ventana
+    configurada (últimos N valores o últimos T segundos) mantiene su suma,
+    cantidad y sketch de percentiles al agregar y expulsar valores, por lo que
+    registrar un valor es O(1) amortizado y la memoria no crece con el tiempo.
+    La ventana "all" cubre todo el buffer.
+    """
+    
+    def __init__(self, capacity: int = 1000, count_windows: Sequence[int] = (),
+                 time_windows: Sequence[float] = (), relative_accuracy: float = 0.01):
+        if capacity <= 0:
+            raise ValueError("La capacidad debe ser mayor que cero")
+        
+        self.capacity = capacity
+        self._values = array('d', [0.0]) * capacity
+        self._timestamps = array('d', [0.0]) * capacity
+        self._next = 0  # Secuencia del próximo valor
+        self._lock = threading.Lock()
+        
+        self.lifetime_count = 0
+        self.lifetime_total = 0.0
+        
+        self._windows: Dict[str, _Window] = {"all": _Window("all", capacity, None, relative_accuracy)}
+        for size in count_windows:
+            size = min(int(size), capacity)
+            self._windows[f"last_{size}"] = _Window(f"last_{size}", size, None, relative_accuracy)
+        for seconds in time_windows:
+            name = f"{seconds:g}s"
+            self._windows[name] = _Window(name, capacity, float(seconds), relative_accuracy)
+    
+    @property
+    def windows(self) -> List[str]:
+        """Nombres de las ventanas configuradas"""
+        return list(self._windows)
+    
+    def _slot(self, sequence: int) -> int:
+        return sequence % self.capacity
+    
+    def _expire(self, window: _Window, now: float, incoming: int = 0):
+        """Expulsar de una ventana los valores que ya no le corresponden (dejando sitio a incoming)"""
+        oldest_allowed = self._next + incoming - min(window.size or self.capacity, self.capacity)
+        while window.tail < self._next:
+            slot = self._slot(window.tail)
+            too_old = window.seconds is not None and self._timestamps[slot] < now - window.seconds
+            if window.tail >= oldest_allowed and not too_old:
+                break
+            window.evict(self._values[slot])
+    
+    def add(self, value: float, timestamp: Optional[float] = None):
+        """Registrar un valor"""
+        value = float(value)
+        timestamp = time.time() if timestamp is None else timestamp
+        
+        with self._lock:
+            # Expulsar el valor que se va a sobrescribir antes de reutilizar su posición
+            for window in self._windows.values():
+                self._expire(window, timestamp, incoming=1)
+            
+            slot = self._slot(self._next)
+            self._values[slot] = value
+            self._timestamps[slot] = timestamp
+            self._next += 1
+            for window in self._windows.values():
+                window.add(value)
+            
+            self.lifetime_count += 1
+            self.lifetime_total += value
+    
+    def _window(self, window: Optional[str]) -> _Window:
+        """Ventana por nombre, expulsando valores caducados"""
+        selected = self._windows.get(window or "all")
+        if selected is None:
+            raise KeyError(f"Ventana no configurada: {window}")
+        if selected.seconds is not None:
+            self._expire(selected, time.time())
+        return selected
+    
+    def count(self, window: Optional[str] = None) -> int:
+        """Cantidad de valores en la ventana"""
+        with self._lock:
+            return self._window(window).count
+    
+    def total(self, window: Optional[str] = None) -> float:
+        """Suma de los valores de la ventana"""
+        with self._lock:
+            return self._window(window).total
+    
+    def mean(self, window: Optional[str] = None) -> float:
+        """Media de la ventana (0 si está vacía)"""
+        with self._lock:
+            selected = self._window(window)
+            return selected.total / selected.count if selected.count else 0.0
+    
+    def percentile(self, percentile: float, window: Optional[str] = None) -> Optional[float]:
+        """Percentil aproximado (0-100) de la ventana"""
+        with self._lock:
+            return self._window(window).sketch.quantile(percentile / 100.0)
+    
+    def values(self, window: Optional[str] = None) -> List[float]:
+        """Valores de la ventana, del más antiguo al más reciente"""
+        with self._lock:
+            selected = self._window(window)
+            return [self._values[self._slot(seq)] for seq in range(selected.tail, self._next)]
+    
+    @property
+    def latest(self) -> Optional[float]:
+        """Último valor registrado"""
+        with self._lock:
+            if self._next == 0:
+                return None
+            return self._values[self._slot(self._next - 1)]
+    
+    def get_stats(self, window: Optional[str] = None,
+                  percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> Dict[str, Any]:
+        """Resumen de la ventana: cantidad, suma, media, mínimo, máximo, último y percentiles"""
+        with self._lock:
+            selected = self._window(window)
+            values = [self._values[self._slot(seq)] for seq in range(selected.tail, self._next)]
+            stats: Dict[str, Any] = {
+                "window": selected.name,
+                "count": selected.count,
+                "total": selected.total,
+                "avg": selected.total / selected.count if selected.count else 0.0,
+                "min": min(values) if values else None,
+                "max": max(values) if values else None,
+                "latest": values[-1] if values else None
+            }
+            for p in percentiles:
+                stats[f"p{p:g}"] = selected.sketch.quantile(p / 100.0)
+        return stats
+    
+    def __len__(self) -> int:
+        return self.count()
+    
+    def clear(self):
+        """Vaciar la serie (los totales históricos se conservan)"""
+        with self._lock:
+            self._next = 0
+            for window in self._windows.values():
+                window.tail = 0
+                window.count = 0
+                window.total = 0.0
+                window.sketch.clear()
+
+
+class RollingMetricSet:
+    """Conjunto de series con nombre que comparten capacidad y ventanas"""
+    
+    def __init__(self, capacity: int = 1000, count_windows: Sequence[int] = (),
+                 time_windows: Sequence[float] = (), relative_accuracy: float = 0.01):
+        self.capacity = capacity
+        self.count_windows = tuple(count_windows)
+        self.time_windows = tuple(time_windows)
+        self.relative_accuracy = relative_accuracy
+        self._metrics: Dict[str, RollingMetric] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, name: str) -> RollingMetric:
+        """Obtener (o crear) la serie de una métrica"""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = RollingMetric(self.capacity, self.count_windows, self.time_windows, self.relative_accuracy)
+                self._metrics[name] = metric
+            return metric
+    
+    def add(self, name: str, value: float, timestamp: Optional[float] = None):
+        """Registrar un valor de una métrica"""
+        self.get(name).add(value, timestamp)
+    
+    def names(self) -> List[str]:
+        """Nombres de las métricas registradas"""
+        with self._lock:
+            return list(self._metrics)
+    
+    def items(self) -> List[Tuple[str, RollingMetric]]:
+        """Pares nombre / serie"""
+        with self._lock:
+            return list(self._metrics.items())
+    
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self._metrics
+    
+    def clear(self):
+        """Eliminar todas las series"""
+        with self._lock:
+            self._metrics.clear()
@@ -0,0 +1,251 @@
+"""
+Templates compilados con renderizado en caché
+IA Agent para Generación de Pruebas Unitarias .NET
+"""
+
+from typing import Dict, List, Any, Optional, Tuple
+from collections import OrderedDict
+from functools import lru_cache
+from string import Formatter
+import re
+import threading
+
+from utils.logging import get_logger
+
+logger = get_logger("templating")
+
+# Sintaxis de huecos soportadas
+FORMAT_STYLE = "format"      # {name} con {{ }} como llaves literales (str.format)
+MUSTACHE_STYLE = "mustache"  # {{name}}, el resto del texto es literal
+
+MUSTACHE_PATTERN = re.compile(r"\{\{(\w+)\}\}")
+
+_formatter = Formatter()
+
+
+class Slot:
+    """Hueco de un template compilado"""
+    
+    __slots__ = ("name", "field", "conversion", "format_spec", "placeholder")
+    
+    def __init__(self, name: str, field: Optional[str] = None, conversion: Optional[str] = None,
+                 format_spec: str = "", placeholder: Optional[str] = None):
+        self.name = name
+        self.field = field or name
+        self.conversion = conversion
+        self.format_spec = format_spec
+        self.placeholder = placeholder
+    
+    @property
+    def is_simple(self) -> bool:
+        """Indica si el hueco es una sustitución directa con str()"""
+        return self.field == self.name and not self.conversion and not self.format_spec
+    
+    def render(self, variables: Dict[str, Any]) -> str:
+        """Renderizar el hueco con las variables"""
+        if self.is_simple:
+            return str(variables[self.name])
+        
+        value, _ = _formatter.get_field(self.field, (), variables)
+        value = _formatter.convert_field(value, self.conversion)
+        return _formatter.format_field(value, self.format_spec)
+
+
+class CompiledTemplate:
+    """Template parseado una sola vez en segmentos literales y huecos
+    
+    Renderizar consiste en unir los segmentos; los resultados se memorizan por
+    la tupla de valores de las variables y partial() permite fijar de antemano
+    las variables comunes (p. ej. el contexto del proyecto), que quedan
+    convertidas en texto literal.
+    """
+    
+    def __init__(self, segments: List[Any], style: str = FORMAT_STYLE, name: str = "",
+                 cache_size: int = 256, bound: Optional[Dict[str, Any]] = None):
+        self.logger = logger
+        self.style = style
+        self.name = name
+        self.segments = self._merge_literals(segments)
+        self.bound = dict(bound or {})
+        self.variables: Tuple[str, ...] = tuple(dict.fromkeys(
+            segment.name for segment in self.segments if isinstance(segment, Slot)
+        ))
+        self.required = frozenset(self.variables)
+        # Variables que solo se sustituyen con str(): su texto sirve como clave de caché
+        self._text_keyed = frozenset(self.variables) - {
+            segment.name for segment in self.segments if isinstance(segment, Slot) and not segment.is_simple
+        }
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[Any, ...], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"renders": 0, "hits": 0, "misses": 0, "uncacheable": 0}
+    
+    @classmethod
+    def compile(cls, source: str, style: str = FORMAT_STYLE, name: str = "",
+                cache_size: int = 256) -> "CompiledTemplate":
+        """Compilar el texto de un template"""
+        if style == FORMAT_STYLE:
+            segments = cls._parse_format(source)
+        elif style == MUSTACHE_STYLE:
+            segments = cls._parse_mustache(source)
+        else:
+            raise ValueError(f"Sintaxis de template no soportada: {style}")
+        
+        return cls(segments, style=style, name=name, cache_size=cache_size)
+    
+    @staticmethod
+    def _parse_format(source: str) -> List[Any]:
+        """Parsear sintaxis de str.format"""
+        segments: List[Any] = []
+        for literal, field, format_spec, conversion in _formatter.parse(source):
+            if literal:
+                segments.append(literal)
+            if field is None:
+                continue
+            if not field or field.isdigit():
+                raise ValueError("Los templates solo admiten campos con nombre")
+            
+            name = re.split(r"[.\[]", field, maxsplit=1)[0]
+            segments.append(Slot(name, field, conversion, format_spec or ""))
+        
+        return segments
+    
+    @staticmethod
+    def _parse_mustache(source: str) -> List[Any]:
+        """Parsear huecos {{name}}"""
+        segments: List[Any] = []
+        position = 0
+        for match in MUSTACHE_PATTERN.finditer(source):
+            if match.start() > position:
+                segments.append(source[position:match.start()])
+            segments.append(Slot(match.group(1), placeholder=match.group()))
+            position = match.end()
+        
+        if position < len(source):
+            segments.append(source[position:])
+        
+        return segments
+    
+    @staticmethod
+    def _merge_literals(segments: List[Any]) -> List[Any]:
+        """Unir segmentos literales consecutivos"""
+        merged: List[Any] = []
+        for segment in segments:
+            if isinstance(segment, str) and merged and isinstance(merged[-1], str):
+                merged[-1] += segment
+            elif not (isinstance(segment, str) and not segment):
+                merged.append(segment)
+        
+        return merged
+    
+    def missing(self, variables: Dict[str, Any]) -> List[str]:
+        """Variables requeridas que faltan"""
+        return [name for name in self.variables if name not in variables]
+    
+    def partial(self, **bound: Any) -> "CompiledTemplate":
+        """Nuevo template con algunas variables fijadas como texto literal"""
+        segments: List[Any] = []
+        for segment in self.segments:
+            if isinstance(segment, Slot) and segment.name in bound:
+                segments.append(segment.render(bound))
+            else:
+                segments.append(segment)
+        
+        return CompiledTemplate(
+            segments, style=self.style, name=self.name, cache_size=self.cache_size,
+            bound={**self.bound, **bound}
+        )
+    
+    def _render_segments(self, variables: Dict[str, Any]) -> str:
+        """Unir segmentos sustituyendo los huecos"""
+        parts = []
+        for segment in self.segments:
+            if isinstance(segment, str):
+                parts.append(segment)
+            elif segment.placeholder is not None and segment.name not in variables:
+                # En sintaxis mustache los huecos sin valor se conservan
+                parts.append(segment.placeholder)
+            else:
+                parts.append(segment.render(variables))
+        
+        return "".join(parts)
+    
+    def _cache_key(self, values: Dict[str, Any]) -> Optional[Tuple[Any, ...]]:
+        """Clave de memorización a partir de los valores de las variables"""
+        # El tipo forma parte de la clave para no confundir 1, 1.0 y True
+        key = tuple((type(values.get(name, Slot)), values.get(name, Slot)) for name in self.variables)
+        try:
+            hash(key)
+            return key
+        except TypeError:
+            pass
+        
+        # Valores no hashables (dict, list): se usa su texto si solo se sustituyen con str()
+        parts = []
+        for name in self.variables:
+            value = values.get(name, Slot)
+            try:
+                hash(value)
+                parts.append((type(value), value))
+            except TypeError:
+                if name not in self._text_keyed:
+                    return None
+                parts.append((type(value), str(value)))
+        
+        return tuple(parts)
+    
+    def render(self, variables: Optional[Dict[str, Any]] = None, **kwargs: Any) -> str:
+        """Renderizar el template; lanza KeyError si falta una variable (sintaxis format)"""
+        values = {**(variables or {}), **kwargs}
+        if self.style == FORMAT_STYLE:
+            missing = self.missing(values)
+            if missing:
+                raise KeyError(missing[0])
+        
+        key = self._cache_key(values)
+        if key is None:
+            with self._lock:
+                self.stats["renders"] += 1
+                self.stats["uncacheable"] += 1
+            return self._render_segments(values)
+        
+        with self._lock:
+            self.stats["renders"] += 1
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.stats["hits"] += 1
+                return cached
+            self.stats["misses"] += 1
+        
+        rendered = self._render_segments(values)
+        
+        with self._lock:
+            self._cache[key] = rendered
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        
+        return rendered
+    
+    def clear_cache(self):
+        """Limpiar renders memorizados"""
+        with self._lock:
+            self._cache.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas de renderizado"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["cached_renders"] = len(self._cache)
+        
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = f"{(stats['hits'] / lookups * 100) if lookups else 0:.2f}%"
+        stats["segments"] = len(self.segments)
+        stats["variables"] = list(self.variables)
+        return stats
+
+
+@lru_cache(maxsize=128)
+def compile_template(source: str, style: str = FORMAT_STYLE) -> CompiledTemplate:
+    """Compilar un template reutilizando la compilación previa del mismo texto"""
+    return CompiledTemplate.compile(source, style=style)
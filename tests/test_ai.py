@@ -5,15 +5,132 @@ IA Agent para Generación de Pruebas Unitarias .NET
 
 import unittest
 import sys
+import asyncio
+import tempfile
+import threading
+import shutil
+import time
+import hashlib
+import os
 from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
 
 # Agregar src al path
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
-from ai.llm_manager import LLMManager, LLMProvider
-from ai.prompt_engineer import PromptEngineer, PromptType
+from ai.llm_manager import (
+    LLMManager, LLMProvider, DeepSeekLLM, GeminiLLM, LLMResponse,
+    ProviderRateLimiter, RequestScheduler, RequestPriority, get_retry_after, llm_call_context,
+    shared_client_pool, OPENAI_BASE_URL
+)
+from monitoring.metrics_collector import MetricsCollector
+from utils.config import get_config
+from ai.response_cache import ResponseCache, SemanticResponseCache
+from ai.streaming import CodeBlockStreamParser, iter_code_lines
+from ai.prompt_engineer import PromptEngineer, PromptType, PromptTemplate
+from utils.templating import CompiledTemplate, MUSTACHE_STYLE
+from generators.template_generator import TemplateGenerator
 from ai.context_manager import ContextManager
 from ai.ai_optimizer import AIOptimizer
+from ai.prompt_compression import CSharpPromptCompressor
+from ai.response_scoring import score_response, score_responses
+from ai.speculative_generation import SpeculativeGenerator, DraftVerifier
+from ai.local_llm import LocalLLM, LocalLLMProfile, FixtureStore, LocalRateLimitError
+from ai.batch_jobs import FileDropTransport, OpenAIBatchTransport, apply_results_to_tasks, JOB_SUBMITTING
+from ai.token_budget import (
+    Tokenizer, TokenizerRegistry, HeuristicTokenizer, PromptSection, fit_sections, tokenizer_registry
+)
+
+
+class FakeAsyncLLM:
+    """LLM simulado que registra cuántas peticiones hay en vuelo"""
+    
+    def __init__(self, delay: float = 0.01, fail_on: str = None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.in_flight = 0
+        self.max_in_flight = 0
+    
+    async def ainvoke(self, prompt: str):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail_on and self.fail_on in prompt:
+                raise RuntimeError("fallo simulado")
+            return SimpleNamespace(content=f"respuesta: {prompt}")
+        finally:
+            self.in_flight -= 1
+    
+    def invoke(self, prompt: str):
+        self.calls = getattr(self, "calls", 0) + 1
+        return SimpleNamespace(content=f"respuesta: {prompt}")
+
+
+class FakeStreamingLLM(FakeAsyncLLM):
+    """LLM simulado que entrega la respuesta en fragmentos"""
+    
+    def __init__(self, chunks):
+        super().__init__()
+        self.chunks = chunks
+        self.stream_calls = 0
+    
+    def stream(self, prompt: str):
+        self.stream_calls += 1
+        for chunk in self.chunks:
+            yield SimpleNamespace(content=chunk)
+    
+    async def astream(self, prompt: str):
+        self.stream_calls += 1
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            yield chunk
+
+
+class FakeHedgeLLM:
+    """LLM simulado con latencia fija para pruebas de hedging"""
+    
+    def __init__(self, model: str, delay: float, fail: bool = False):
+        self.model = model
+        self.delay = delay
+        self.fail = fail
+        self.cancelled = False
+    
+    def invoke(self, prompt: str):
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("proveedor caído")
+        return SimpleNamespace(content=f"{self.model}: {prompt}")
+    
+    async def ainvoke(self, prompt: str):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise RuntimeError("proveedor caído")
+        return SimpleNamespace(content=f"{self.model}: {prompt}")
+
+
+def bag_of_words_encoder(texts):
+    """Encoder determinista de bolsa de palabras para pruebas del caché semántico"""
+    vectors = np.zeros((len(texts), 256), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in text.lower().split():
+            vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % 256] += 1.0
+    return vectors
+
+
+def create_local_manager() -> LLMManager:
+    """LLMManager con el proveedor local simulado: sin red ni API keys"""
+    with mock.patch.object(get_config().ai, "provider", LLMProvider.LOCAL.value):
+        manager = LLMManager()
+    manager.use_local_llms(latency_mean=0.0, tokens_per_second=0.0)
+    return manager
 
 
 class TestAI(unittest.TestCase):
@@ -22,6 +139,11 @@ class TestAI(unittest.TestCase):
     def setUp(self):
         """Configuración inicial"""
         self.test_session_id = "test_session_123"
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        """Limpieza"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
     
     def test_llm_manager_creation(self):
         """Test creación de LLM manager"""
@@ -79,6 +201,590 @@ class TestAI(unittest.TestCase):
         except Exception as e:
             self.skipTest(f"Test de LLMs disponibles no disponible: {e}")
     
+    def test_llm_manager_generate_batch_concurrent(self):
+        """Test generación en lote concurrente con límite por proveedor"""
+        manager = create_local_manager()
+        
+        fake_llm = FakeAsyncLLM(fail_on="prompt 4")
+        manager.llms["primary"] = fake_llm
+        manager.response_cache = ResponseCache(enabled=False)
+        manager.set_concurrency_limit(manager.get_provider("primary"), 3)
+        
+        prompts = [f"prompt {i}" for i in range(10)]
+        responses = manager.generate_batch(prompts)
+        
+        # Orden de entrada conservado y errores aislados por prompt
+        self.assertEqual(len(responses), 10)
+        self.assertEqual(responses[0], "respuesta: prompt 0")
+        self.assertEqual(responses[9], "respuesta: prompt 9")
+        self.assertIsNone(responses[4])
+        
+        # Concurrencia real pero acotada
+        self.assertGreater(fake_llm.max_in_flight, 1)
+        self.assertLessEqual(fake_llm.max_in_flight, 3)
+        
+        # Varios hilos síncronos comparten el loop de fondo y el límite del proveedor
+        fake_llm.max_in_flight = 0
+        threads = [threading.Thread(target=manager.generate_batch, args=(prompts,)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(fake_llm.max_in_flight, 3)
+        
+        # Los clientes asíncronos del loop se reutilizan entre llamadas
+        async def get_client():
+            return shared_client_pool.get_async_openai_client("sk-test", OPENAI_BASE_URL)
+        
+        self.assertIs(manager._run_sync(get_client()), manager._run_sync(get_client()))
+    
+    def test_llm_manager_generate_batch_stream(self):
+        """Test generación en lote entregando resultados al completarse"""
+        manager = create_local_manager()
+        
+        manager.llms["primary"] = FakeAsyncLLM(fail_on="prompt 2")
+        manager.response_cache = ResponseCache(enabled=False)
+        
+        async def collect():
+            return [r async for r in manager.agenerate_batch_stream([f"prompt {i}" for i in range(5)])]
+        
+        results = asyncio.run(collect())
+        
+        self.assertEqual(sorted(r.index for r in results), list(range(5)))
+        failed = [r for r in results if not r.success]
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(failed[0].index, 2)
+    
+    def test_response_cache_hit_miss_and_ttl(self):
+        """Test caché de respuestas con expiración"""
+        cache = ResponseCache(db_path=str(Path(self.temp_dir) / "cache.db"), ttl_seconds=1,
+                              max_entries=100, max_bytes=1024 * 1024, enabled=True)
+        key = ResponseCache.make_key("deepseek", "deepseek-coder", 0.1, 4000, "prompt")
+        
+        self.assertIsNone(cache.get(key))
+        cache.put(key, "respuesta", provider="deepseek", model="deepseek-coder")
+        self.assertEqual(cache.get(key), "respuesta")
+        
+        stats = cache.get_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        
+        # La clave depende de todos los parámetros
+        self.assertNotEqual(key, ResponseCache.make_key("deepseek", "deepseek-coder", 0.2, 4000, "prompt"))
+        
+        # Expiración por TTL
+        time.sleep(1.1)
+        self.assertIsNone(cache.get(key))
+        cache.close()
+    
+    def test_response_cache_lru_eviction(self):
+        """Test expulsión LRU por número de entradas"""
+        cache = ResponseCache(db_path=str(Path(self.temp_dir) / "cache.db"), ttl_seconds=0,
+                              max_entries=2, max_bytes=1024 * 1024, enabled=True)
+        
+        cache.put("a", "A")
+        cache.put("b", "B")
+        cache.get("a")  # "a" pasa a ser la más reciente
+        cache.put("c", "C")
+        
+        self.assertEqual(cache.get("a"), "A")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "C")
+        self.assertEqual(cache.get_stats()["evictions"], 1)
+        cache.close()
+    
+    def test_llm_manager_invoke_uses_cache(self):
+        """Test que LLMManager.invoke reutiliza respuestas cacheadas"""
+        manager = create_local_manager()
+        
+        fake_llm = FakeAsyncLLM()
+        manager.llms["primary"] = fake_llm
+        manager.response_cache = ResponseCache(db_path=str(Path(self.temp_dir) / "cache.db"), enabled=True)
+        
+        self.assertEqual(manager.invoke("hola"), "respuesta: hola")
+        self.assertEqual(manager.invoke("hola"), "respuesta: hola")
+        self.assertEqual(fake_llm.calls, 1)
+        
+        # Bypass explícito
+        manager.invoke("hola", use_cache=False)
+        self.assertEqual(fake_llm.calls, 2)
+        manager.response_cache.close()
+    
+    def test_semantic_cache_near_duplicate_hit(self):
+        """Test nivel semántico del caché con prompts casi idénticos"""
+        cache = SemanticResponseCache(threshold=0.9, max_entries=2, encoder=bag_of_words_encoder)
+        
+        cache.add("scope", "genera pruebas para la clase Calculator", "respuesta")
+        
+        # Solo cambian espacios y una palabra: similitud alta
+        content, similarity = cache.lookup("scope", "genera   pruebas para la clase  Calculator")
+        self.assertEqual(content, "respuesta")
+        self.assertGreaterEqual(similarity, 0.99)
+        
+        # Otro ámbito (modelo/parámetros) nunca reutiliza la respuesta
+        content, _ = cache.lookup("otro", "genera pruebas para la clase Calculator")
+        self.assertIsNone(content)
+        
+        # Prompt distinto por debajo del umbral
+        content, similarity = cache.lookup("scope", "analiza dependencias del proyecto")
+        self.assertIsNone(content)
+        self.assertLess(similarity, 0.9)
+        
+        stats = cache.get_stats()
+        self.assertEqual(stats["lookups"], 3)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["hit_rate"], "33.33%")
+        
+        # Buffer circular limitado a max_entries
+        cache.add("scope", "uno", "1")
+        cache.add("scope", "dos", "2")
+        self.assertEqual(cache.get_stats()["entries"], 2)
+        self.assertIsNone(cache.lookup("scope", "genera pruebas para la clase Calculator")[0])
+    
+    def test_llm_manager_semantic_cache_opt_in(self):
+        """Test que LLMManager usa el nivel semántico solo cuando se habilita"""
+        manager = create_local_manager()
+        
+        fake_llm = FakeAsyncLLM()
+        manager.llms["primary"] = fake_llm
+        manager.response_cache = ResponseCache(db_path=str(Path(self.temp_dir) / "cache.db"), enabled=True)
+        self.assertIsNone(manager.semantic_cache)
+        
+        manager.invoke("genera pruebas para Calculator")
+        manager.invoke("genera  pruebas para Calculator ")
+        self.assertEqual(fake_llm.calls, 2)
+        
+        manager.enable_semantic_cache(threshold=0.9, encoder=bag_of_words_encoder)
+        manager.invoke("genera pruebas para OrderService")
+        self.assertEqual(manager.invoke("genera pruebas  para OrderService"), "respuesta: genera pruebas para OrderService")
+        self.assertEqual(
+            asyncio.run(manager.generate_async("genera pruebas para OrderService\n")),
+            "respuesta: genera pruebas para OrderService"
+        )
+        self.assertEqual(fake_llm.calls, 3)
+        
+        semantic_stats = manager.get_cache_stats()["semantic"]
+        self.assertEqual(semantic_stats["hits"], 2)
+        self.assertIsNotNone(semantic_stats["last_similarity"])
+        manager.response_cache.close()
+    
+    def test_local_llm_provider(self):
+        """Test LLM local determinista con respuestas grabadas, latencia y errores simulados"""
+        instant = LocalLLMProfile(latency_mean=0.0, tokens_per_second=0.0)
+        fixtures = FixtureStore(str(Path(self.temp_dir) / "fixtures.jsonl"))
+        llm = LocalLLM("local-primary", instant, fixtures)
+        
+        # Código sintetizado determinista para el framework pedido
+        prompt = "Método: CalculateTotal\nFramework: nunit"
+        first = llm.invoke(prompt)
+        self.assertEqual(first.content, LocalLLM("local-primary", instant).invoke(prompt).content)
+        self.assertIn("public void CalculateTotal_", first.content)
+        self.assertIn("[Test]", first.content)
+        self.assertGreater(first.completion_tokens, 0)
+        self.assertEqual("".join(llm.stream(prompt)), first.content)
+        
+        # Respuestas grabadas persistentes
+        fixtures.add("prompt grabado", "respuesta grabada")
+        self.assertEqual(LocalLLM(profile=instant, fixtures=FixtureStore(fixtures.path)).invoke("prompt grabado").content,
+                         "respuesta grabada")
+        
+        # Inyección de errores reproducible con la misma semilla
+        def outcomes(seed):
+            failing = LocalLLM(profile=LocalLLMProfile(latency_mean=0.0, tokens_per_second=0.0,
+                                                       rate_limit_rate=0.3, seed=seed))
+            results = []
+            for _ in range(50):
+                try:
+                    failing.invoke("p")
+                    results.append(True)
+                except LocalRateLimitError as e:
+                    self.assertEqual(e.status_code, 429)
+                    results.append(False)
+            return results
+        
+        self.assertEqual(outcomes(7), outcomes(7))
+        self.assertTrue(5 < outcomes(7).count(False) < 25)
+        
+        # Latencia con la distribución configurada
+        slow = LocalLLM(profile=LocalLLMProfile(latency_distribution="fixed", latency_mean=0.05,
+                                                tokens_per_second=0.0))
+        start = time.time()
+        asyncio.run(slow.ainvoke("p"))
+        self.assertGreaterEqual(time.time() - start, 0.05)
+        with self.assertRaises(ValueError):
+            LocalLLM(profile=LocalLLMProfile(latency_distribution="pareto"))
+        
+        # Registrado en el gestor: los reintentos del planificador cubren los 429 simulados
+        manager = create_local_manager()
+        manager.response_cache = ResponseCache(enabled=False)
+        manager.use_local_llms(latency_mean=0.0, tokens_per_second=0.0)
+        self.assertEqual(manager.llms["fast"].provider, "local")
+        manager.llms["primary"].profile.rate_limit_rate = 0.5
+        manager.llms["primary"].profile.retry_after = 0.0
+        response = manager.invoke("Método: Save\nFramework: xunit", use_cache=False)
+        self.assertIn("[Fact]", response)
+    
+    def test_request_coalescing(self):
+        """Test prompts idénticos en vuelo comparten una sola petición"""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        manager = create_local_manager()
+        manager.response_cache = ResponseCache(enabled=False)
+        profile = LocalLLMProfile(latency_distribution="fixed", latency_mean=0.1, tokens_per_second=0.0)
+        llm = LocalLLM("local-primary", profile)
+        
+        # Hilos concurrentes con el mismo prompt (salvo espacios) y un prompt distinto
+        prompts = ["Método: Save\nFramework: xunit"] * 4 + ["Método:  Save \nFramework: xunit", "Método: Load"]
+        with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+            results = list(pool.map(lambda p: manager.invoke(p, llm=llm), prompts))
+        
+        self.assertEqual(llm.get_stats()["calls"], 2)
+        self.assertEqual(len(set(results[:5])), 1)
+        self.assertEqual(manager.get_coalescing_stats()["coalesced"], 4)
+        self.assertEqual(manager.get_coalescing_stats()["in_flight"], 0)
+        
+        # Asíncrono: los errores también se comparten
+        failing = LocalLLM("local-primary", LocalLLMProfile(latency_distribution="fixed", latency_mean=0.05,
+                                                           tokens_per_second=0.0, error_rate=1.0))
+        
+        async def run_async():
+            ok = await asyncio.gather(*[manager.generate_async("Método: Find", llm=llm) for _ in range(3)])
+            failed = await asyncio.gather(*[manager.generate_async("Método: Find", llm=failing) for _ in range(3)],
+                                          return_exceptions=True)
+            return ok, failed
+        
+        ok, failed = asyncio.run(run_async())
+        self.assertEqual(len(set(ok)), 1)
+        self.assertEqual(llm.get_stats()["calls"], 3)
+        self.assertEqual(failing.get_stats()["errors"], 1)
+        self.assertTrue(all(isinstance(error, Exception) for error in failed))
+        
+        # Sin caché cada llamada espera su propia respuesta
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            list(pool.map(lambda p: manager.invoke(p, llm=llm, use_cache=False), ["Método: Save"] * 2))
+        self.assertEqual(llm.get_stats()["calls"], 5)
+    
+    def test_batch_job_submission_and_resume(self):
+        """Test trabajos por lotes con transporte local, mapeo a AgentTask y reanudación"""
+        from datetime import datetime
+        from agents.base_agent import AgentTask
+        
+        manager = create_local_manager()
+        manager.response_cache = ResponseCache(db_path=str(Path(self.temp_dir) / "cache.db"))
+        jobs_path = str(Path(self.temp_dir) / "jobs")
+        drop_path = str(Path(self.temp_dir) / "drop")
+        manager.set_batch_transport(FileDropTransport(drop_path), jobs_path)
+        manager.get_batch_runner().max_requests = 3
+        
+        llm = LocalLLM("local-primary", LocalLLMProfile(latency_mean=0.0, tokens_per_second=0.0))
+        tasks = [AgentTask(f"task-{i}", "generar", 1, "pending", datetime.now()) for i in range(2)]
+        items = [(tasks[0], "Método: Save"), (tasks[0], "Método: Load"), (tasks[1], "Método: Find"),
+                 ("task-extra", "Método: Delete")]
+        jobs = manager.submit_batch_job(items, llm=llm)
+        self.assertEqual([job.request_count for job in jobs], [3, 1])
+        self.assertEqual(manager.poll_batch_job(jobs[0].job_id).provider_status, "in_progress")
+        
+        # Reinicio del proceso: otro gestor reanuda desde disco
+        restarted = create_local_manager()
+        restarted.response_cache = manager.response_cache
+        restarted.set_batch_transport(FileDropTransport(drop_path, responder=llm.invoke), jobs_path)
+        resumed = restarted.resume_batch_jobs()
+        self.assertEqual(sorted(job.state for job in resumed), ["completed", "completed"])
+        
+        results = restarted.wait_for_batch_job(jobs[0].job_id, poll_interval=0)
+        self.assertEqual([r.task_id for r in results], ["task-0", "task-0", "task-1"])
+        self.assertTrue(all(r.success for r in results))
+        apply_results_to_tasks(tasks, results)
+        self.assertEqual(tasks[0].status, "completed")
+        self.assertEqual(len(tasks[0].result), 2)
+        self.assertIn("Find", tasks[1].result)
+        
+        # Las respuestas quedan en el caché para las llamadas interactivas
+        self.assertEqual(restarted.invoke("Método: Find", llm=llm), results[2].content)
+        
+        # Envío interrumpido tras llegar al proveedor: se recupera sin reenviar
+        runner = restarted.get_batch_runner()
+        job = runner.create_jobs(runner.build_requests([("task-9", "Método: Count")]), "local", "local-primary", 0.0, 100)[0]
+        job.state = JOB_SUBMITTING
+        provider_batch_id = runner.transport.submit(job, runner.store.input_path(job.job_id))
+        runner.store.save(job)
+        job = restarted.resume_batch_jobs()[0]
+        self.assertEqual(job.provider_batch_id, provider_batch_id)
+        self.assertEqual(job.state, "completed")
+        
+        # La API batch de OpenAI no ejecuta modelos de otros proveedores
+        client = mock.Mock()
+        restarted.set_batch_transport(OpenAIBatchTransport(client), str(Path(self.temp_dir) / "openai-jobs"))
+        with self.assertRaises(ValueError):
+            restarted.submit_batch_job([("task-10", "Método: Sum")], llm=llm)
+        client.files.create.assert_not_called()
+    
+    def test_llm_call_instrumentation(self):
+        """Test métricas de latencia, tokens, costo y reintentos por llamada"""
+        manager = create_local_manager()
+        
+        class RateLimitError(Exception):
+            def __init__(self):
+                super().__init__("429")
+                self.response = SimpleNamespace(status_code=429, headers={"retry-after-ms": "1"})
+        
+        class UsageLLM:
+            model_name = "gpt-4o"
+            failures = 1
+            
+            def invoke(self, prompt):
+                if self.failures:
+                    self.failures -= 1
+                    raise RateLimitError()
+                return LLMResponse("public void Test() { }", prompt_tokens=120, completion_tokens=30)
+        
+        collector = MetricsCollector(storage_path=self.temp_dir)
+        manager.set_metrics_collector(collector)
+        manager.response_cache = ResponseCache(enabled=False)
+        
+        with llm_call_context(agent="generation", template="create_test_method"):
+            manager.invoke("prompt", llm=UsageLLM(), use_cache=False)
+        
+        tags = {"agent": "generation", "template": "create_test_method", "status": "success"}
+        self.assertEqual([m.value for m in collector.get_metrics("llm_prompt_tokens", tags=tags)], [120.0])
+        self.assertEqual([m.value for m in collector.get_metrics("llm_completion_tokens", tags=tags)], [30.0])
+        self.assertEqual([m.value for m in collector.get_metrics("llm_retries", tags=tags)], [1.0])
+        self.assertGreater(collector.get_metrics("llm_cost", tags=tags)[0].value, 0)
+        self.assertEqual(collector.get_metrics("llm_latency", tags=tags)[0].tags["model"], "gpt-4o")
+        
+        streaming_llm = FakeStreamingLLM(["hola ", "mundo"])
+        chunks = list(manager.stream("prompt", llm=streaming_llm, use_cache=False,
+                                     call_tags={"agent": "optimization", "template": "optimize"}))
+        self.assertEqual(chunks, ["hola ", "mundo"])
+        ttft = collector.get_metrics("llm_time_to_first_token", tags={"template": "optimize"})
+        self.assertEqual(len(ttft), 1)
+        self.assertTrue(ttft[0].metadata["streamed"])
+        self.assertGreater(collector.get_metrics("llm_completion_tokens", tags={"template": "optimize"})[0].value, 0)
+        
+        with self.assertRaises(RuntimeError):
+            asyncio.run(manager.generate_async("prompt 1", llm=FakeAsyncLLM(fail_on="1"), use_cache=False,
+                                               call_tags={"agent": "analysis"}))
+        failed = collector.get_metrics("llm_latency", tags={"agent": "analysis", "status": "error"})
+        self.assertEqual(len(failed), 1)
+        self.assertIn("fallo simulado", failed[0].metadata["error"])
+        
+        breakdown = manager.get_call_metrics(group_by="agent")
+        self.assertEqual({item["agent"] for item in breakdown}, {"generation", "optimization", "analysis"})
+        self.assertTrue(all("p95" in item and "p99" in item for item in breakdown))
+    
+    def test_rate_limiter_paces_requests(self):
+        """Test que el limitador mantiene el ritmo justo por debajo del RPM"""
+        limiter = ProviderRateLimiter("test", rpm=1200, headroom=1.0, burst_seconds=0)
+        
+        start = time.perf_counter()
+        for _ in range(6):
+            limiter.acquire(tokens=10)
+        elapsed = time.perf_counter() - start
+        
+        # 20 peticiones/s con ráfaga de 1: la primera es inmediata y el resto cada 50ms
+        self.assertGreaterEqual(elapsed, 0.2)
+        self.assertEqual(limiter.get_stats()["granted"], 6)
+    
+    def test_rate_limiter_priority_lanes(self):
+        """Test que las peticiones de coordinación adelantan a las de lote"""
+        limiter = ProviderRateLimiter("test", rpm=6000, headroom=1.0)
+        limiter.backoff(0.05)
+        order = []
+        
+        async def request(name, priority):
+            await limiter.acquire_async(tokens=1, priority=priority)
+            order.append(name)
+        
+        async def run():
+            bulk = [asyncio.create_task(request(f"bulk-{i}", RequestPriority.BULK)) for i in range(3)]
+            await asyncio.sleep(0.01)
+            high = asyncio.create_task(request("coordinator", RequestPriority.HIGH))
+            await asyncio.gather(*bulk, high)
+        
+        asyncio.run(run())
+        self.assertEqual(order[0], "coordinator")
+        self.assertEqual(limiter.get_stats()["throttled"], 1)
+    
+    def test_scheduler_honors_retry_after(self):
+        """Test reintento ante 429 respetando retry-after"""
+        class RateLimitError(Exception):
+            def __init__(self):
+                super().__init__("429")
+                self.status_code = 429
+                self.response = SimpleNamespace(status_code=429, headers={"retry-after-ms": "100"})
+        
+        self.assertAlmostEqual(get_retry_after(RateLimitError()), 0.1)
+        
+        calls = []
+        
+        def flaky():
+            calls.append(time.perf_counter())
+            if len(calls) == 1:
+                raise RateLimitError()
+            return LLMResponse("ok", total_tokens=5)
+        
+        scheduler = RequestScheduler(max_retries=2)
+        self.assertEqual(scheduler.call("test", flaky, tokens=10).content, "ok")
+        self.assertEqual(len(calls), 2)
+        self.assertGreaterEqual(calls[1] - calls[0], 0.1)
+        self.assertEqual(scheduler.get_stats()["test"]["throttled"], 1)
+        
+        # Los errores que no son 429 no se reintentan
+        def broken():
+            raise ValueError("fallo")
+        
+        with self.assertRaises(ValueError):
+            scheduler.call("test", broken, tokens=10)
+    
+    def test_deepseek_llm_shares_clients(self):
+        """Test clientes HTTP compartidos entre wrappers de DeepSeek"""
+        primary = DeepSeekLLM(api_key="sk-test", model="deepseek-coder")
+        fast = DeepSeekLLM(api_key="sk-test", model="deepseek-chat")
+        self.assertIs(primary.client, fast.client)
+        
+        async def get_clients():
+            from ai.llm_manager import shared_client_pool
+            first = shared_client_pool.get_async_openai_client(primary.api_key, primary.base_url)
+            second = shared_client_pool.get_async_openai_client(fast.api_key, fast.base_url)
+            await shared_client_pool.aclose_async_clients()
+            return first, second
+        
+        first, second = asyncio.run(get_clients())
+        self.assertIs(first, second)
+    
+    def test_gemini_llm_ainvoke_does_not_block_loop(self):
+        """Test que Gemini asíncrono no bloquea el event loop"""
+        import time
+        
+        llm = GeminiLLM.__new__(GeminiLLM)
+        
+        def slow_invoke(prompt):
+            time.sleep(0.2)
+            return LLMResponse(prompt)
+        
+        llm.invoke = slow_invoke
+        
+        async def run_concurrently():
+            return await asyncio.gather(llm.ainvoke("a"), llm.ainvoke("b"), llm.ainvoke("c"))
+        
+        start = time.perf_counter()
+        responses = asyncio.run(run_concurrently())
+        elapsed = time.perf_counter() - start
+        
+        self.assertEqual([r.content for r in responses], ["a", "b", "c"])
+        self.assertLess(elapsed, 0.5)
+    
+    def test_llm_manager_stream(self):
+        """Test streaming de fragmentos con guardado en caché de la respuesta completa"""
+        manager = create_local_manager()
+        
+        chunks = ["```csharp\n", "public class ", "Foo {}\n", "```"]
+        fake_llm = FakeStreamingLLM(chunks)
+        manager.llms["primary"] = fake_llm
+        manager.response_cache = ResponseCache(db_path=str(Path(self.temp_dir) / "cache.db"), enabled=True)
+        
+        self.assertEqual(list(manager.stream("genera")), chunks)
+        
+        async def collect():
+            return [chunk async for chunk in manager.astream("genera async")]
+        
+        self.assertEqual(asyncio.run(collect()), chunks)
+        self.assertEqual(fake_llm.stream_calls, 2)
+        
+        # Respuesta cacheada: un único fragmento con el contenido completo
+        self.assertEqual(list(manager.stream("genera")), ["".join(chunks)])
+        self.assertEqual(fake_llm.stream_calls, 2)
+        manager.response_cache.close()
+    
+    def test_code_block_stream_parser(self):
+        """Test extracción incremental de bloques de código"""
+        parser = CodeBlockStreamParser()
+        
+        self.assertEqual(parser.feed("Aquí están las pruebas:\n``"), [])
+        self.assertEqual(parser.feed("`csharp\npublic class FooTests\n{"), ["public class FooTests"])
+        self.assertEqual(parser.language, "csharp")
+        self.assertEqual(parser.feed("\n}\n```\nFin"), ["{", "}"])
+        self.assertEqual(parser.close(), [])
+        self.assertEqual(parser.get_code(), "public class FooTests\n{\n}")
+        
+        # Bloque truncado y respuesta sin bloques
+        self.assertEqual(list(iter_code_lines(["```\nvar x = 1;\nvar y"])), ["var x = 1;", "var y"])
+        plain = CodeBlockStreamParser()
+        plain.feed("public class Bar {}")
+        plain.close()
+        self.assertEqual(plain.get_code(), "public class Bar {}")
+    
+    def test_gemini_llm_astream(self):
+        """Test streaming asíncrono de Gemini sobre el executor compartido"""
+        llm = GeminiLLM.__new__(GeminiLLM)
+        llm.stream = lambda prompt: iter(["a", "b", "c"])
+        
+        async def collect():
+            return [chunk async for chunk in llm.astream("hola")]
+        
+        self.assertEqual(asyncio.run(collect()), ["a", "b", "c"])
+    
+    def test_llm_manager_hedged_request(self):
+        """Test cobertura con el LLM secundario y cancelación del perdedor"""
+        manager = create_local_manager()
+        
+        primary = FakeHedgeLLM("lento", delay=1.0)
+        secondary = FakeHedgeLLM("rapido", delay=0.01)
+        manager.llms["primary"] = primary
+        manager.llms["fast"] = secondary
+        manager.response_cache = ResponseCache(enabled=False)
+        manager.get_hedge_delay = lambda llm: 0.05
+        
+        start = time.perf_counter()
+        content = asyncio.run(manager.generate_async("hola", hedge=True))
+        self.assertEqual(content, "rapido: hola")
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertTrue(primary.cancelled)
+        
+        content = manager.invoke("hola", hedge=True)
+        self.assertEqual(content, "rapido: hola")
+        self.assertEqual(manager.get_hedging_stats()["secondary_wins"], 2)
+        
+        # Sin hedging se espera al principal
+        primary.delay = 0.01
+        self.assertEqual(manager.invoke("hola", hedge=False), "lento: hola")
+    
+    def test_llm_manager_failover(self):
+        """Test failover al LLM secundario cuando el principal falla"""
+        manager = create_local_manager()
+        
+        manager.llms["primary"] = FakeHedgeLLM("principal", delay=0.0, fail=True)
+        manager.llms["fast"] = FakeHedgeLLM("secundario", delay=0.0)
+        manager.response_cache = ResponseCache(enabled=False)
+        
+        self.assertEqual(manager.invoke("hola", hedge=True), "secundario: hola")
+        self.assertEqual(asyncio.run(manager.generate_async("hola", hedge=True)), "secundario: hola")
+        self.assertEqual(manager.get_hedging_stats()["failovers"], 2)
+    
+    def test_llm_manager_hedge_delay_from_percentile(self):
+        """Test umbral de cobertura a partir del percentil de latencia"""
+        manager = create_local_manager()
+        
+        llm = FakeHedgeLLM("modelo", delay=0.0)
+        self.assertEqual(manager.get_hedge_delay(llm), manager.config.ai.hedge_default_delay)
+        
+        for latency in range(1, 101):
+            manager._record_latency(llm, float(latency))
+        
+        self.assertEqual(manager.get_latency_percentile(llm, 95), 95.0)
+        self.assertEqual(manager.get_hedge_delay(llm), 95.0)
+    
+        # La espera en la cola del planificador no cuenta como latencia del proveedor
+        call = manager.scheduler.call
+        
+        def queued_call(provider, func, **kwargs):
+            time.sleep(0.2)
+            return call(provider, func, **kwargs)
+        
+        with mock.patch.object(manager.scheduler, "call", side_effect=queued_call):
+            manager._call_llm(llm, "hola", RequestPriority.NORMAL)
+        self.assertLess(manager._latencies[manager._latency_key(llm)][-1], 0.1)
+    
     def test_prompt_engineer_creation(self):
         """Test creación de prompt engineer"""
         try:
@@ -128,6 +834,72 @@ class TestAI(unittest.TestCase):
         except Exception as e:
             self.skipTest(f"Test de generación de prompt no disponible: {e}")
     
+    def test_compiled_template_render_and_partial(self):
+        """Test template compilado con memorización y variables prefijadas"""
+        template = CompiledTemplate.compile("Clase {class_name} ({framework}) {{literal}} {score:.1f} {data}")
+        self.assertEqual(template.variables, ("class_name", "framework", "score", "data"))
+        
+        variables = {"class_name": "Foo", "framework": "xunit", "score": 0.25, "data": {"a": 1}}
+        expected = "Clase {class_name} ({framework}) {{literal}} {score:.1f} {data}".format(**variables)
+        self.assertEqual(template.render(variables), expected)
+        self.assertEqual(template.render(variables), expected)
+        self.assertEqual(template.render(variables, score=1), expected.replace("0.2", "1.0"))
+        stats = template.get_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        
+        with self.assertRaises(KeyError):
+            template.render({"class_name": "Foo"})
+        
+        bound = template.partial(framework="nunit", data="{}")
+        self.assertEqual(bound.variables, ("class_name", "score"))
+        self.assertEqual(bound.render(class_name="Bar", score=2), "Clase Bar (nunit) {literal} 2.0 {}")
+        
+        mustache = CompiledTemplate.compile("namespace {{ns}} { class {{name}}Tests { } }", style=MUSTACHE_STYLE)
+        self.assertEqual(mustache.render({"name": "Foo"}), "namespace {{ns}} { class FooTests { } }")
+    
+    def test_prompt_engineer_bind_template(self):
+        """Test prompts por método con contexto de proyecto prefijado"""
+        engineer = PromptEngineer()
+        bound = engineer.bind_template("code_analysis", {"context": "Proyecto API .NET 8"})
+        
+        prompt = bound.render(code="public class Foo { }")
+        self.assertEqual(
+            prompt,
+            engineer.generate_prompt("code_analysis", {"code": "public class Foo { }", "context": "Proyecto API .NET 8"})
+        )
+        
+        optimization = engineer.generate_prompt("code_optimization", {"code": "class A { }", "analysis": "ok"})
+        self.assertIn("{optimized_code}", optimization)
+        
+        with self.assertRaises(ValueError):
+            engineer.generate_prompt("code_analysis", {"code": "class A { }"})
+    
+        # Un template con variables no declaradas no se registra
+        invalid = PromptTemplate("invalid", PromptType.CODE_ANALYSIS, "Analiza {code} con {extra}", ["code"], "inválido")
+        with self.assertRaises(ValueError):
+            engineer.add_custom_template(invalid)
+        self.assertNotIn("invalid", engineer.get_available_templates())
+    
+    def test_template_generator_compiled_templates(self):
+        """Test generación desde template compilado una sola vez"""
+        temp_dir = Path(tempfile.mkdtemp())
+        try:
+            (temp_dir / "xunit").mkdir()
+            (temp_dir / "xunit" / "test_method.cs").write_text(
+                "public void {{method_name}}_Works() { var sut = new {{class_name}}(); }", encoding="utf-8"
+            )
+            generator = TemplateGenerator(templates_path=temp_dir)
+            
+            code = generator.generate_from_template("test_method", {"method_name": "Add", "class_name": "Calculator"})
+            self.assertEqual(code, "public void Add_Works() { var sut = new Calculator(); }")
+            
+            bound = generator.bind_template("test_method", {"class_name": "Calculator"})
+            self.assertEqual(bound.render(method_name="Sub"), "public void Sub_Works() { var sut = new Calculator(); }")
+            self.assertIs(generator.get_compiled_template("test_method"), generator.compiled[("xunit", "test_method")])
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
     def test_prompt_engineer_get_available_templates(self):
         """Test obtener templates disponibles"""
         try:
@@ -299,6 +1071,294 @@ class TestAI(unittest.TestCase):
         except Exception as e:
             self.skipTest(f"Test de métricas de rendimiento no disponible: {e}")
 
+    def test_ai_optimizer_bounded_metrics_history(self):
+        """Test historial de métricas acotado con agregados por ventana"""
+        from datetime import datetime
+        from ai.ai_optimizer import OptimizationMetrics, METRICS_HISTORY_SIZE, RECENT_WINDOW
+        
+        optimizer = AIOptimizer()
+        for i in range(METRICS_HISTORY_SIZE + 20):
+            optimizer._record_metrics(OptimizationMetrics(
+                response_time=float(i), token_count=10, quality_score=0.5,
+                cost_estimate=0.01, timestamp=datetime.now(), estimated_latency=1.0
+            ))
+        
+        self.assertEqual(len(optimizer.metrics_history), METRICS_HISTORY_SIZE)
+        
+        metrics = optimizer.get_performance_metrics()
+        self.assertEqual(metrics["total_optimizations"], METRICS_HISTORY_SIZE + 20)
+        last = METRICS_HISTORY_SIZE + 20
+        expected = sum(range(last - RECENT_WINDOW, last)) / RECENT_WINDOW
+        self.assertAlmostEqual(metrics["average_response_time"], expected)
+        self.assertAlmostEqual(metrics["total_cost_estimate"], 0.01 * RECENT_WINDOW)
+        self.assertIn("p95", metrics["response_time_percentiles"])
+        
+        hourly = optimizer.get_performance_metrics(window="3600s")
+        self.assertAlmostEqual(hourly["total_cost_estimate"], 0.01 * (METRICS_HISTORY_SIZE + 20))
+    
+    def test_tokenizer_registry_local_fallback(self):
+        """Test registro de tokenizadores con respaldo local"""
+        registry = TokenizerRegistry()
+        
+        # La interfaz es abstracta
+        with self.assertRaises(TypeError):
+            Tokenizer()
+        
+        tokenizer = registry.get("deepseek-coder")
+        self.assertIsInstance(tokenizer, HeuristicTokenizer)
+        self.assertIs(registry.get("deepseek-coder"), tokenizer)
+        
+        # Código C#: los signos cuentan como tokens, no solo las palabras
+        code = "public int Add(int a, int b) { return a + b; }"
+        self.assertGreater(tokenizer.count(code), len(code.split()))
+        self.assertLessEqual(tokenizer.count(tokenizer.truncate(code, 5)), 5)
+        
+        # Tokenizador personalizado por prefijo
+        registry.register("custom", lambda: HeuristicTokenizer(2.0))
+        self.assertEqual(registry.get("custom-model").name, "heuristic-2.0")
+        
+        # Costo a partir de tokens reales de entrada y salida
+        self.assertAlmostEqual(registry.estimate_cost("gpt-4", 1000, 1000), 0.09)
+        self.assertGreater(registry.estimate_latency("gpt-4", 200), registry.estimate_latency("gpt-4", 20))
+    
+    def test_tokenizer_registry_loads_encodings_locally(self):
+        """Test codificaciones de tiktoken solo desde el caché local y sin bloquear el registro"""
+        import tiktoken
+        
+        encoding = SimpleNamespace(name="cl100k_base", encode=lambda text, **kwargs: text.split(),
+                                   decode=lambda tokens: " ".join(tokens))
+        with mock.patch.dict(os.environ, {"TIKTOKEN_CACHE_DIR": self.temp_dir}), \
+                mock.patch.object(tiktoken, "get_encoding", return_value=encoding) as get_encoding:
+            # Sin caché local no se descarga nada
+            offline = TokenizerRegistry(allow_download=False)
+            self.assertIsInstance(offline.get("gpt-4"), HeuristicTokenizer)
+            get_encoding.assert_not_called()
+            
+            # Mientras otro hilo carga la codificación se estima sin esperar ni fijar el resultado
+            registry = TokenizerRegistry(allow_download=True)
+            guard = registry._encoding_guards.setdefault("cl100k_base", threading.Lock())
+            with guard:
+                self.assertIsInstance(registry.get("gpt-4"), HeuristicTokenizer)
+            get_encoding.assert_not_called()
+            
+            tokenizer = registry.get("gpt-4")
+            self.assertEqual(tokenizer.name, "cl100k_base")
+            self.assertEqual(tokenizer.count("public void Test"), 3)
+            self.assertIs(registry.get("gpt-4"), tokenizer)
+            get_encoding.assert_called_once_with("cl100k_base")
+    
+    def test_fit_sections_trims_lowest_priority_first(self):
+        """Test presupuesto por secciones sin cortar el código bajo prueba"""
+        tokenizer = HeuristicTokenizer()
+        code = "public class Calculator { public int Add(int a, int b) { return a + b; } }"
+        sections = [
+            PromptSection("instructions", "Genera pruebas xUnit para la clase.", 100),
+            PromptSection("code", code, 90),
+            PromptSection("analysis", "métodos: Add " * 40, 50),
+            PromptSection("template", "using Xunit; " * 40, 30),
+        ]
+        budget = tokenizer.count(sections[0].content) + tokenizer.count(code) + 40
+        
+        result = fit_sections(sections, budget, tokenizer)
+        self.assertTrue(result.within_budget)
+        self.assertIn(code, result.prompt)
+        self.assertIn("template", result.dropped_sections)
+        self.assertEqual(result.section_tokens["template"], 0)
+        self.assertIn("analysis", result.trimmed_sections)
+    
+    def test_ai_optimizer_token_budget(self):
+        """Test que el optimizador presupuesta tokens en lugar de truncar caracteres"""
+        optimizer = AIOptimizer(model="deepseek-coder")
+        optimizer.optimization_rules["prompt_optimization"]["max_tokens"] = 200
+        
+        code = "public class Service { public void Run() { } }"
+        prompt = f"Genera pruebas para: {code}"
+        context = {"analysis": "dependencias: ILogger " * 200, "framework": "net8.0"}
+        
+        optimized = optimizer._apply_prompt_optimization(prompt, context)
+        self.assertIn(code, optimized)
+        self.assertLessEqual(optimizer.count_tokens(optimized), 200)
+        self.assertIn("analysis", optimizer.last_budget.trimmed_sections)
+        
+        expected_cost = tokenizer_registry.estimate_cost(
+            "deepseek-coder", optimizer.count_tokens(prompt), optimizer.count_tokens("respuesta")
+        )
+        self.assertAlmostEqual(optimizer._estimate_cost("respuesta", prompt), expected_cost)
+
+    def test_response_scoring_single_pass(self):
+        """Test puntuación de estructura y calidad con el patrón compilado"""
+        response = "## Resumen\n```csharp\nvar x = 1;\n```\nExplicación con un EJEMPLO de código"
+        score = score_response(response)
+        self.assertTrue(score.has_code)
+        self.assertTrue(score.has_explanations)
+        self.assertAlmostEqual(score.structure_score, 1.0)
+        self.assertAlmostEqual(score.quality_score, 1.0)
+        
+        plain = score_response("valor null")
+        self.assertEqual(plain.structure_score, 0.0)
+        self.assertEqual(plain.quality_score, 0.0)
+        
+        # Palabras solapadas se detectan igual que con búsquedas de subcadenas
+        overlapped = score_response("codexample")
+        self.assertIn("example", overlapped.features)
+        self.assertIn("usefulness", overlapped.features)
+        self.assertAlmostEqual(overlapped.structure_score, 0.2)
+        
+        optimizer = AIOptimizer()
+        self.assertEqual(optimizer._calculate_quality_score(response), score.quality_score)
+        self.assertEqual(optimizer._analyze_response(response)["has_explanations"], True)
+    
+    def test_ai_optimizer_parallel_batch(self):
+        """Test lotes repartidos en un pool de procesos con el mismo resultado que en serie"""
+        optimizer = AIOptimizer(model="deepseek-coder")
+        responses = [f"```csharp\npublic void Test{i}() {{ }}\n```\n" + ("ejemplo " * (i % 5)) for i in range(40)]
+        prompts = [f"Genera la prueba {i}" for i in range(40)]
+        
+        serial = optimizer.score_batch(responses)
+        optimizer.optimization_rules["performance_optimization"].update(
+            {"parallel_batch_threshold": 10, "batch_chunk_size": 8}
+        )
+        parallel = optimizer.score_batch(responses, max_workers=2)
+        self.assertEqual(parallel, serial)
+        self.assertEqual(score_responses(responses, max_workers=2, parallel_threshold=10, chunk_size=8), serial)
+        
+        results = optimizer.optimize_responses_batch(prompts, responses, max_workers=2)
+        self.assertEqual(len(results), 40)
+        expected = asyncio.run(optimizer.optimize_response(responses[7], prompts[7]))
+        self.assertEqual(results[7].optimized_response, expected.optimized_response)
+        self.assertEqual(results[7].metrics.quality_score, expected.metrics.quality_score)
+        self.assertEqual(results[7].metrics.token_count, expected.metrics.token_count)
+        
+        
+        # Un único pool reutilizado entre lotes
+        pool = optimizer._pool
+        self.assertIsNotNone(pool)
+        
+        # Los procesos usan las reglas personalizadas del optimizador
+        optimizer.optimization_rules["prompt_optimization"]["max_tokens"] = 20
+        contexts = [{"framework": "xunit"}] * 40
+        optimized_prompts = asyncio.run(optimizer.aoptimize_batch(prompts, contexts, max_workers=2))
+        self.assertEqual(optimized_prompts, [optimizer._apply_prompt_optimization(p, c) for p, c in zip(prompts, contexts)])
+        self.assertIs(optimizer._pool, pool)
+        
+        optimizer.close()
+        self.assertIsNone(optimizer._pool)
+    
+    def test_speculative_generation_escalation(self):
+        """Test borrador con LLM rápido y escalado al principal si falla la verificación"""
+        good_draft = """```csharp
+[Fact]
+public void Add_ReturnsSum()
+{
+    var result = new Calculator().Add(1, "}".Length);
+    Assert.Equal(2, result);
+}
+```"""
+        unbalanced = "[Fact]\npublic void Add_ReturnsSum() { Assert.True(true);"
+        no_assert = "[Fact]\npublic void Add_ReturnsSum() { var x = 1; }"
+        
+        verifier = DraftVerifier()
+        self.assertTrue(verifier.verify(good_draft, "xunit").passed)
+        self.assertEqual(verifier.verify(unbalanced, "xunit").issues, ["balanced"])
+        self.assertEqual(verifier.verify(no_assert, "xunit").issues, ["assertions"])
+        self.assertEqual(verifier.verify(good_draft, "mstest").issues, ["test_attribute"])
+        
+        generator = SpeculativeGenerator(verifier)
+        escalated = []
+        
+        def escalate(prompt):
+            escalated.append(prompt)
+            return "primary"
+        
+        def failing_draft(prompt):
+            raise RuntimeError("fast caído")
+        
+        drafts = [good_draft, unbalanced, good_draft, no_assert]
+        results = [generator.generate("p", lambda p, d=d: d, escalate, "xunit") for d in drafts]
+        results.append(generator.generate("p", failing_draft, escalate, "xunit"))
+        
+        self.assertEqual([r.tier for r in results], ["draft", "primary", "draft", "primary", "primary"])
+        self.assertEqual(results[0].code, good_draft)
+        self.assertEqual(results[1].code, "primary")
+        self.assertEqual(len(escalated), 3)
+        self.assertAlmostEqual(generator.escalation_rate, 0.6)
+        
+        stats = generator.get_stats()
+        self.assertEqual(stats["escalation_rate"], "60.00%")
+        self.assertEqual(stats["draft_errors"], 1)
+        self.assertEqual(stats["failed_checks"], {"balanced": 1, "assertions": 1})
+    
+    def test_csharp_prompt_compression(self):
+        """Test compresión de código C# respetando literales"""
+        compressor = CSharpPromptCompressor(model="deepseek-coder")
+        code = """using System;
+using System.Linq;
+using System;
+
+namespace Demo
+{
+    /// <summary>Calculadora</summary>
+    public class Calculator
+    {
+        private readonly string _url = "http://example.com/*no es comentario*/"; // comentario
+
+        public Calculator(ILogger log) : base(log)
+        {
+            var text = @"llave { dentro ""de"" cadena";
+            if (log != null) { log.LogInformation("{0}", text); }
+        }
+
+        /* comentario
+           de bloque */
+        public T Get<T>(int id = 5) where T : class
+        {
+            var item = new Foo() { Id = id };
+            return default(T);
+        }
+
+        public int Add(int a, int b) => a + b;
+    }
+}
+"""
+        result = compressor.compress(code)
+        self.assertNotIn("// comentario", result.text)
+        self.assertNotIn("<summary>", result.text)
+        self.assertNotIn("de bloque", result.text)
+        self.assertIn('"http://example.com/*no es comentario*/"', result.text)
+        self.assertEqual(result.text.count("using System;"), 1)
+        self.assertNotIn("\n\n", result.text)
+        self.assertLess(result.compressed_tokens, result.original_tokens)
+        
+        signatures = compressor.compress(code, signatures_only=True)
+        self.assertIn("public Calculator(ILogger log) : base(log) { ... }", signatures.text)
+        self.assertIn("public T Get<T>(int id = 5) where T : class { ... }", signatures.text)
+        self.assertIn("public int Add(int a, int b) => a + b;", signatures.text)
+        self.assertNotIn("LogInformation", signatures.text)
+        self.assertGreater(signatures.reduction, result.reduction)
+        
+        self.assertEqual(compressor.get_stats()["calls"], 2)
+    
+        # Literales sin formato de C# 11: las comillas internas no cierran la cadena
+        raw_code = 'namespace N { class K { public void A() { var r = """ a " b """; } public void B() { } } }'
+        self.assertEqual(
+            compressor.collapse_method_bodies(raw_code),
+            "namespace N { class K { public void A() { ... } public void B() { ... } } }"
+        )
+        self.assertTrue(DraftVerifier().is_balanced('var r = $$"""" a " { b """ c """";'))
+    
+    def test_prompt_engineer_compresses_variables(self):
+        """Test generación de prompt con compresión de código y datos"""
+        engineer = PromptEngineer()
+        code = "// comentario\npublic class Foo\n{\n\n    public void Bar() { Baz(); }\n}"
+        
+        prompt = engineer.generate_prompt(
+            "code_analysis", {"code": code, "context": {"methods": ["Bar"]}},
+            compress=True, signatures_only=True
+        )
+        self.assertIn("public void Bar() { ... }", prompt)
+        self.assertNotIn("comentario", prompt)
+        self.assertIn('{"methods":["Bar"]}', prompt)
+
 
 if __name__ == '__main__':
     unittest.main()
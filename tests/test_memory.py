@@ -7,14 +7,39 @@ import unittest
 import sys
 import tempfile
 import shutil
+import threading
+import time
+from datetime import datetime
 from pathlib import Path
+from unittest import mock
+
+import numpy as np
 
 # Agregar src al path
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from langchain_agents.memory.conversation_memory import ConversationMemory
 from langchain_agents.memory.vector_memory import VectorMemory
+from langchain_agents.memory.embedding_cache import EmbeddingCache
+from langchain_agents.memory.micro_batch import MicroBatcher
+from langchain_agents.memory.embedding_service import EmbeddingService, get_embedding_service
+from langchain_agents.memory.vector_store import FaissVectorStore
+from langchain_agents.memory.vector_store_benchmark import run_benchmark
+from multi_agent.entry_journal import EntryJournal
 from multi_agent.shared_memory import SharedMemory
+from utils.chromadb_singleton import chromadb_singleton
+
+
+class FakeEmbeddingService(EmbeddingService):
+    """Servicio de embeddings determinista para pruebas sin modelo"""
+    
+    mode = "fake"
+    
+    def __init__(self):
+        super().__init__("fake-model")
+    
+    def _encode(self, texts, batch_size):
+        return np.array([[len(text), text.count(" ") + 1.0, 1.0] for text in texts])
 
 
 class TestMemory(unittest.TestCase):
@@ -159,6 +184,380 @@ class TestMemory(unittest.TestCase):
         except Exception as e:
             self.skipTest(f"Test de búsqueda no disponible: {e}")
     
+    def test_vector_memory_add_entries(self):
+        """Test agregar entradas en lote a memoria vectorial"""
+        service = FakeEmbeddingService()
+        legacy_file = Path(self.temp_dir) / self.agent_name / "vector" / "embedding_cache.json"
+        legacy_file.parent.mkdir(parents=True)
+        legacy_file.write_text('{"123": [0.1]}', encoding="utf-8")
+        memory = VectorMemory(
+            agent_name=self.agent_name,
+            storage_path=self.temp_dir,
+            embedding_service=service
+        )
+        
+        # El cache JSON antiguo no se puede migrar y se elimina
+        self.assertFalse(legacy_file.exists())
+        
+        contents = [f"public void Method{index}()" for index in range(10)]
+        entry_ids = memory.add_entries(contents, [{"index": index} for index in range(10)])
+        
+        self.assertEqual(len(entry_ids), 10)
+        self.assertEqual(len(set(entry_ids)), 10)
+        self.assertEqual(len(memory.embedding_cache), 10)
+        self.assertEqual(service.get_stats()["calls"], 1)
+        if memory.collection is not None:
+            self.assertEqual(memory.collection.count(), 10)
+        memory.close()
+    
+    def test_vector_memories_share_embedding_service(self):
+        """Test las memorias vectoriales comparten un único modelo de embeddings"""
+        first = VectorMemory(agent_name="agent_a", storage_path=self.temp_dir)
+        second = VectorMemory(agent_name="agent_b", storage_path=self.temp_dir)
+        
+        self.assertIs(first.embedding_service, second.embedding_service)
+        self.assertIs(first.embedding_service, get_embedding_service())
+        self.assertEqual(first.embedding_cache.model_name, get_embedding_service().model_name)
+    
+    def test_micro_batcher_groups_concurrent_calls(self):
+        """Test agrupación de llamadas concurrentes en micro-lotes"""
+        batch_sizes = []
+        
+        def process(items):
+            batch_sizes.append(len(items))
+            return [item * 2 for item in items]
+        
+        batcher = MicroBatcher(process, max_batch_size=8, max_wait=0.05)
+        results = {}
+        start = threading.Barrier(16)
+        
+        def worker(value):
+            start.wait()
+            results[value] = batcher.call(value)
+        
+        threads = [threading.Thread(target=worker, args=(value,)) for value in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(results, {value: value * 2 for value in range(16)})
+        self.assertEqual(sum(batch_sizes), 16)
+        self.assertLess(len(batch_sizes), 16)
+        self.assertLessEqual(max(batch_sizes), 8)
+        
+        # Un error en el lote llega a todos sus llamadores
+        failing = MicroBatcher(lambda items: 1 / 0, max_wait=0.01)
+        futures = failing.submit_many([1, 2])
+        for future in futures:
+            self.assertRaises(ZeroDivisionError, future.result)
+        
+        batcher.close()
+        failing.close()
+        self.assertRaises(RuntimeError, batcher.call, 1)
+        
+        # Un cierre concurrente con el encolado no deja futuros sin resolver
+        racing = MicroBatcher(lambda items: items, max_wait=0.01)
+        racing.call(0)
+        enqueue = racing._queue.put
+        closer = threading.Thread(target=racing.close)
+        
+        def put_while_closing(entry):
+            if closer.ident is None:
+                closer.start()
+                time.sleep(0.05)
+            enqueue(entry)
+        
+        with mock.patch.object(racing._queue, "put", side_effect=put_while_closing):
+            futures = racing.submit_many([1, 2])
+            closer.join()
+        self.assertEqual([future.result(timeout=1) for future in futures], [1, 2])
+    
+    def test_faiss_vector_store_add_query_and_reload(self):
+        """Test índice FAISS: altas, búsquedas, actualizaciones, bajas y recarga"""
+        vectors = np.random.default_rng(0).standard_normal((50, 8)).astype(np.float32)
+        ids = [f"entry_{index}" for index in range(50)]
+        path = Path(self.temp_dir) / "faiss"
+        
+        for index_type in ("flat", "hnsw", "ivf"):
+            store = FaissVectorStore(path / index_type, index_type=index_type, ivf_lists=2)
+            store.add(ids=ids, documents=[f"doc {index}" for index in range(50)], embeddings=vectors,
+                      metadatas=[{"index": index} for index in range(50)])
+            store.add(ids=["entry_0"], documents=["duplicado"], embeddings=vectors[:1])
+            self.assertEqual(store.count(), 50)
+            
+            results = store.query(query_embeddings=[vectors[7]], n_results=3)
+            self.assertEqual(results["ids"][0][0], "entry_7")
+            self.assertAlmostEqual(results["distances"][0][0], 0.0, places=5)
+            self.assertEqual(results["metadatas"][0][0], {"index": 7})
+            
+            store.update(ids=["entry_7"], documents=["actualizado"])
+            store.delete(ids=["entry_8"])
+            self.assertNotIn("entry_8", store.query(query_embeddings=[vectors[8]], n_results=5)["ids"][0])
+            store.close()
+            
+            reopened = FaissVectorStore(path / index_type, index_type=index_type, ivf_lists=2)
+            self.assertEqual(reopened.count(), 49)
+            self.assertEqual(reopened.get(ids=["entry_7"])["documents"], ["actualizado"])
+            self.assertEqual(reopened.query(query_embeddings=[vectors[7]], n_results=1)["ids"], [["entry_7"]])
+            reopened.close()
+    
+    def test_faiss_vector_store_compacts_deleted_rows(self):
+        """Test compactación del índice FAISS tras muchas bajas"""
+        vectors = np.random.default_rng(1).standard_normal((1200, 4)).astype(np.float32)
+        ids = [f"entry_{index}" for index in range(1200)]
+        store = FaissVectorStore(Path(self.temp_dir) / "compact", index_type="flat")
+        store.add(ids=ids, embeddings=vectors)
+        
+        store.delete(ids=ids[:400])
+        stats = store.get_stats()
+        self.assertEqual(stats["entries"], 800)
+        self.assertEqual(stats["rows"], 800)
+        self.assertEqual(stats["deleted_rows"], 0)
+        self.assertEqual(store.query(query_embeddings=[vectors[900]], n_results=1)["ids"], [["entry_900"]])
+        store.close()
+        
+        reopened = FaissVectorStore(Path(self.temp_dir) / "compact", index_type="flat")
+        self.assertEqual(reopened.count(), 800)
+        self.assertEqual(len(list((Path(self.temp_dir) / "compact").glob("vectors.*.f32"))), 1)
+        reopened.close()
+    
+    def test_vector_memory_faiss_backend(self):
+        """Test memoria vectorial con índice FAISS en proceso"""
+        memory = VectorMemory(
+            agent_name=self.agent_name,
+            storage_path=self.temp_dir,
+            embedding_service=FakeEmbeddingService(),
+            vector_store="faiss"
+        )
+        self.assertIsNone(memory.chroma_client)
+        
+        memory.add_entries(["Python programming", "C# development", "Machine learning models"])
+        results = memory.search("C# development", limit=1, similarity_threshold=0.99)
+        self.assertEqual([result.entry.content for result in results], ["C# development"])
+        self.assertEqual(memory.get_collection_stats()["total_entries"], 3)
+        
+        self.assertTrue(memory.clear_memory())
+        self.assertEqual(memory.collection.count(), 0)
+        memory.close()
+    
+    def test_vector_store_benchmark_smoke(self):
+        """Test ejecución reducida del benchmark de backends vectoriales"""
+        results = run_benchmark(sizes=[300], backends=["faiss:flat"], dimension=8, queries=3, k=5)
+        
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["size"], 300)
+        self.assertEqual(results[0]["recall"], 1.0)
+        self.assertGreater(results[0]["inserts_per_second"], 0)
+    
+    def test_chromadb_client_pool_reuses_and_releases(self):
+        """Test reutilización y conteo de referencias de clientes ChromaDB"""
+        base_path = Path(self.temp_dir)
+        first = chromadb_singleton.get_client("pool_agent", base_path)
+        second = chromadb_singleton.get_client("pool_agent", base_path)
+        
+        self.assertIs(first, second)
+        agent_dirs = [path.name for path in base_path.iterdir()]
+        self.assertEqual(agent_dirs, ["agent_pool_agent"])
+        
+        pool_path = str(chromadb_singleton.get_client_path("pool_agent", base_path))
+        self.assertEqual(chromadb_singleton.get_stats()["paths"][pool_path]["refcount"], 2)
+        
+        chromadb_singleton.release_client("pool_agent", base_path)
+        self.assertIn(pool_path, chromadb_singleton.get_stats()["paths"])
+        chromadb_singleton.release_client("pool_agent", base_path)
+        self.assertNotIn(pool_path, chromadb_singleton.get_stats()["paths"])
+        self.assertFalse(chromadb_singleton.release_client("pool_agent", base_path))
+    
+    def test_chromadb_collect_garbage_removes_orphaned_dirs(self):
+        """Test limpieza de directorios huérfanos de ChromaDB"""
+        base_path = Path(self.temp_dir) / "agent_a" / "vector"
+        orphan = base_path / "agent_agent_a_1a2b3c4d"
+        orphan.mkdir(parents=True)
+        (orphan / "data.bin").write_bytes(b"x" * 1024)
+        
+        chromadb_singleton.get_client("agent_a", base_path)
+        try:
+            preview = chromadb_singleton.collect_garbage(Path(self.temp_dir), dry_run=True)
+            self.assertEqual(preview["removed"], [str(orphan)])
+            self.assertTrue(orphan.exists())
+            
+            result = chromadb_singleton.collect_garbage(Path(self.temp_dir), compact=True)
+            self.assertEqual(result["removed"], [str(orphan)])
+            self.assertGreaterEqual(result["bytes_freed"], 1024)
+            self.assertFalse(orphan.exists())
+            # El directorio en uso no se toca
+            self.assertTrue((base_path / "agent_agent_a").exists())
+            self.assertEqual(result["compacted"], [])
+        finally:
+            chromadb_singleton.release_client("agent_a", base_path)
+    
+    def test_embedding_cache_persists_across_instances(self):
+        """Test caché de embeddings persistente entre reinicios"""
+        cache = EmbeddingCache(self.temp_dir, "test-model", capacity=10)
+        cache.put("public int Add(int a, int b)", [0.1, 0.2, 0.3])
+        cache.put_many(["texto a", "texto b"], [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+        cache.flush()
+        
+        reopened = EmbeddingCache(self.temp_dir, "test-model", capacity=10)
+        self.assertEqual(len(reopened), 3)
+        self.assertEqual(reopened.dimension, 3)
+        self.assertAlmostEqual(float(reopened.get("public int Add(int a, int b)")[1]), 0.2, places=6)
+        self.assertIsNone(reopened.get("texto desconocido"))
+        
+        # Otro modelo no comparte vectores
+        other = EmbeddingCache(self.temp_dir, "other-model", capacity=10)
+        self.assertEqual(len(other), 0)
+    
+    def test_embedding_cache_evicts_least_recently_used(self):
+        """Test expulsión LRU y cambio de capacidad del caché de embeddings"""
+        cache = EmbeddingCache(self.temp_dir, "test-model", capacity=3)
+        for index in range(3):
+            cache.put(f"texto {index}", [float(index), 1.0])
+        
+        cache.get("texto 0")  # Usado recientemente: no debe expulsarse
+        cache.put("texto 3", [3.0, 1.0])
+        
+        self.assertEqual(len(cache), 3)
+        self.assertIn("texto 0", cache)
+        self.assertNotIn("texto 1", cache)
+        self.assertEqual(cache.get_stats()["evictions"], 1)
+        cache.flush()
+        
+        # Reducir la capacidad conserva las entradas más recientes
+        smaller = EmbeddingCache(self.temp_dir, "test-model", capacity=2)
+        self.assertEqual(len(smaller), 2)
+        self.assertIn("texto 3", smaller)
+        self.assertEqual(float(smaller.get("texto 0")[0]), 0.0)
+        
+        with self.assertRaises(ValueError):
+            smaller.put("texto 4", [1.0, 2.0, 3.0])
+    
+    def test_embedding_cache_restart_after_eviction(self):
+        """Test reinicio sin flush tras reutilizar una posición expulsada"""
+        cache = EmbeddingCache(self.temp_dir, "test-model", capacity=2)
+        cache.put("a", [1.0, 1.0])
+        cache.put("b", [2.0, 2.0])
+        cache.flush()
+        
+        # "c" reutiliza la posición de "a"; el índice en disco sigue apuntando a "a"
+        cache.put("c", [5.0, 5.0])
+        
+        reopened = EmbeddingCache(self.temp_dir, "test-model", capacity=2)
+        self.assertIsNone(reopened.get("a"))
+        self.assertEqual(reopened.get("b").tolist(), [2.0, 2.0])
+        self.assertEqual(len(reopened), 1)
+        
+        # close() deja el índice al día
+        cache.close()
+        reopened = EmbeddingCache(self.temp_dir, "test-model", capacity=2)
+        self.assertEqual(reopened.get("c").tolist(), [5.0, 5.0])
+        self.assertIsNone(reopened.get("a"))
+    
+    def test_entry_journal_write_behind_and_reopen(self):
+        """Test diario de entradas: lectura de lo encolado y reapertura"""
+        journal = EntryJournal(self.temp_dir, flush_interval=0.01)
+        journal.put_many([{"id": f"e{i}", "content": f"entrada {i}"} for i in range(100)])
+        journal.put({"id": "e0", "content": "entrada 0 actualizada"})
+        
+        # Lo encolado se lee antes de llegar a disco
+        self.assertEqual(journal.get("e0")["content"], "entrada 0 actualizada")
+        self.assertEqual(len(journal), 100)
+        journal.close()
+        
+        reopened = EntryJournal(self.temp_dir)
+        try:
+            self.assertEqual(len(reopened), 100)
+            self.assertEqual(reopened.get("e0")["content"], "entrada 0 actualizada")
+            self.assertEqual(reopened.get("e99")["content"], "entrada 99")
+            self.assertIsNone(reopened.get("e100"))
+        finally:
+            reopened.close()
+    
+    def test_entry_journal_rejects_unserializable_record(self):
+        """Test un registro que no es JSON falla al encolar y no bloquea a los demás"""
+        journal = EntryJournal(self.temp_dir, flush_interval=0.01)
+        with self.assertRaises(TypeError):
+            journal.put({"id": "bad", "metadata": {"when": datetime.now()}})
+        journal.put({"id": "good", "content": "válido"})
+        journal.close()
+        
+        reopened = EntryJournal(self.temp_dir)
+        try:
+            self.assertEqual(reopened.get("good")["content"], "válido")
+            self.assertIsNone(reopened.get("bad"))
+        finally:
+            reopened.close()
+    
+    def test_entry_journal_rotation_and_compaction(self):
+        """Test rotación de segmentos y compactación de versiones obsoletas"""
+        journal = EntryJournal(self.temp_dir, segment_size=256)
+        try:
+            for version in range(10):
+                journal.put_many([{"id": f"e{i}", "version": version} for i in range(5)])
+                journal.flush()
+            self.assertGreater(journal.get_stats()["segments"], 1)
+            
+            reclaimed = journal.compact()
+            stats = journal.get_stats()
+            self.assertGreater(reclaimed, 0)
+            self.assertEqual(stats["dead_bytes"], 0)
+            self.assertEqual(stats["segments"], 2)
+            self.assertEqual([journal.get(f"e{i}")["version"] for i in range(5)], [9] * 5)
+            
+            journal.put({"id": "e0", "version": 10})
+        finally:
+            journal.close()
+        
+        reopened = EntryJournal(self.temp_dir)
+        try:
+            self.assertEqual(reopened.get("e0")["version"], 10)
+            self.assertEqual(reopened.get("e4")["version"], 9)
+            self.assertEqual(len(list(Path(self.temp_dir).glob("segment_*.jsonl"))), 2)
+        finally:
+            reopened.close()
+    
+    def test_entry_journal_recovers_after_interrupted_write(self):
+        """Test recuperación de registros posteriores al índice y de una línea incompleta"""
+        journal = EntryJournal(self.temp_dir)
+        journal.put({"id": "a", "content": "antes del checkpoint"})
+        journal.close()
+        
+        # Registro escrito tras el último checkpoint y escritura cortada a la mitad
+        segment = sorted(Path(self.temp_dir).glob("segment_*.jsonl"))[-1]
+        with open(segment, "ab") as f:
+            f.write(b'{"id":"b","content":"tras el checkpoint"}\n{"id":"c","cont')
+        
+        reopened = EntryJournal(self.temp_dir)
+        try:
+            self.assertEqual(reopened.get("a")["content"], "antes del checkpoint")
+            self.assertEqual(reopened.get("b")["content"], "tras el checkpoint")
+            self.assertIsNone(reopened.get("c"))
+            self.assertTrue(segment.read_bytes().endswith(b"\n"))
+            
+            reopened.put({"id": "c", "content": "reescrito"})
+            reopened.flush()
+            self.assertEqual(reopened.get("c")["content"], "reescrito")
+        finally:
+            reopened.close()
+    
+    def test_shared_memory_entries_persist_in_journal(self):
+        """Test entradas compartidas persistidas en el diario en lugar de un JSON por entrada"""
+        memory = SharedMemory(storage_path=self.temp_dir, embedding_service=FakeEmbeddingService())
+        entry_id = memory.add_entry(self.agent_name, "Contenido persistido", "project_context")
+        memory.close()
+        
+        self.assertEqual(list(Path(self.temp_dir).glob("entry_*.json")), [])
+        
+        reopened = SharedMemory(storage_path=self.temp_dir, embedding_service=FakeEmbeddingService())
+        try:
+            entry = reopened.get_entry(entry_id)
+            self.assertEqual(entry.content, "Contenido persistido")
+            self.assertEqual(entry.agent_name, self.agent_name)
+            self.assertEqual(reopened.get_memory_stats()["journal"]["entries"], 1)
+        finally:
+            reopened.close()
+    
     def test_shared_memory_creation(self):
         """Test creación de memoria compartida"""
         try:
@@ -204,6 +603,92 @@ class TestMemory(unittest.TestCase):
         except Exception as e:
             self.skipTest(f"Test de búsqueda compartida no disponible: {e}")
 
+    def test_shared_memory_uses_embedding_service(self):
+        """Test memoria compartida con el servicio de embeddings compartido"""
+        service = FakeEmbeddingService()
+        memory = SharedMemory(storage_path=self.temp_dir, embedding_service=service)
+        try:
+            memory.add_entry(self.agent_name, "Patrón AAA en pruebas", "learned_patterns")
+            self.assertTrue(memory.sync_agent_memory(self.agent_name, {"a": "uno", "b": "dos tres"}))
+            
+            results = memory.search_entries("Patrón AAA en pruebas", "learned_patterns", limit=1)
+            self.assertEqual(results[0].content, "Patrón AAA en pruebas")
+            self.assertEqual(memory.collections['conversations'].count(), 2)
+            
+            # La consulta repetida sale del cache de embeddings
+            self.assertEqual(service.get_stats()["texts"], 3)
+            self.assertIn("fake-model", memory.collections['learned_patterns'].name)
+        finally:
+            memory.close()
+    
+    def test_shared_memory_search_merges_collections_by_distance(self):
+        """Test búsqueda paralela en todas las colecciones sin bloquear escrituras"""
+        memory = SharedMemory(storage_path=self.temp_dir, embedding_service=FakeEmbeddingService())
+        try:
+            memory.add_entry(self.agent_name, "uno dos tres", "conversations")
+            memory.add_entry(self.agent_name, "uno dos", "learned_patterns")
+            memory.add_entry(self.agent_name, "uno", "user_preferences")
+            
+            # Una consulta lenta no impide escribir mientras tanto
+            started, release = threading.Event(), threading.Event()
+            conversations = memory.collections['conversations']
+            
+            class SlowCollection:
+                def query(self, **kwargs):
+                    started.set()
+                    release.wait(10)
+                    return conversations.query(**kwargs)
+            
+            memory.collections['conversations'] = SlowCollection()
+            results = []
+            search = threading.Thread(target=lambda: results.extend(memory.search_entries("uno dos tres", limit=2)))
+            search.start()
+            self.assertTrue(started.wait(10))
+            memory.add_entry(self.agent_name, "cuatro", "learned_patterns")
+            release.set()
+            search.join(10)
+            
+            self.assertEqual([entry.content for entry in results], ["uno dos tres", "uno dos"])
+            self.assertEqual([entry.entry_type for entry in results], ["conversations", "learned_patterns"])
+            self.assertLess(results[0].metadata['distance'], results[1].metadata['distance'])
+        finally:
+            memory.close()
+    
+    def test_shared_memory_reembeds_legacy_collections(self):
+        """Test re-codificación en segundo plano de colecciones con embeddings MD5"""
+        legacy_client = chromadb_singleton.get_client("shared_memory", Path(self.temp_dir))
+        legacy = legacy_client.create_collection("conversations")
+        legacy.add(
+            ids=[f"old{i}" for i in range(5)],
+            documents=["conversación" + " antigua" * i for i in range(5)],
+            embeddings=[[i / 10.0] * 8 for i in range(5)],
+            metadatas=[{"agent_name": self.agent_name} for _ in range(5)]
+        )
+        
+        memory = SharedMemory(storage_path=self.temp_dir, embedding_service=FakeEmbeddingService(),
+                              reembed_on_start=False)
+        chromadb_singleton.release_client("shared_memory", Path(self.temp_dir))
+        try:
+            self.assertEqual(memory.legacy_collections, {"conversations": ["conversations"]})
+            
+            # Las escrituras no esperan a la migración y prevalecen sobre la copia
+            memory.add_entry(self.agent_name, "conversación nueva", "conversations", entry_id="old0")
+            self.assertTrue(memory.start_reembedding())
+            self.assertTrue(memory.wait_for_reembedding(timeout=30))
+            
+            status = memory.get_reembedding_status()
+            self.assertEqual(status["migrated"], 4)
+            self.assertEqual(status["pending"], 0)
+            self.assertEqual(status["legacy_collections"], {})
+            self.assertEqual(memory.collections['conversations'].count(), 5)
+            self.assertEqual(memory.collections['conversations'].get(ids=["old0"])['documents'], ["conversación nueva"])
+            self.assertNotIn("conversations", [c.name for c in memory.chroma_client.list_collections()])
+            
+            results = memory.search_entries("conversación antigua antigua antigua", "conversations", limit=1)
+            self.assertEqual(results[0].id, "old3")
+        finally:
+            memory.close()
+
 
 if __name__ == '__main__':
     unittest.main()
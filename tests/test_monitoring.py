@@ -14,6 +14,7 @@ from datetime import datetime, timedelta
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from monitoring.metrics_collector import MetricsCollector, Metric, SystemMetrics
+from utils.rolling_metrics import RollingMetric, RollingMetricSet
 
 
 class TestMonitoring(unittest.TestCase):
@@ -170,6 +171,86 @@ class TestMonitoring(unittest.TestCase):
         except Exception as e:
             self.skipTest(f"Test de resumen de métrica no disponible: {e}")
     
+    def test_get_metric_percentiles_and_breakdown(self):
+        """Test percentiles y desglose por tag"""
+        for value in range(1, 101):
+            self.collector.record_metric("latency", float(value), tags={"agent": "generation"})
+        self.collector.record_metric("latency", 500.0, tags={"agent": "analysis"})
+        
+        percentiles = MetricsCollector.calculate_percentiles([float(v) for v in range(1, 101)])
+        self.assertAlmostEqual(percentiles[50], 50.5)
+        self.assertAlmostEqual(percentiles[95], 95.05)
+        self.assertAlmostEqual(percentiles[99], 99.01)
+        
+        summary = self.collector.get_metric_summary("latency", period_hours=24)
+        self.assertIn("p95", summary)
+        self.assertIn("p99", summary)
+        
+        breakdown = self.collector.get_metric_breakdown("latency", group_by="agent")
+        self.assertEqual([item["agent"] for item in breakdown], ["generation", "analysis"])
+        self.assertEqual(breakdown[0]["count"], 100)
+        self.assertAlmostEqual(breakdown[0]["total"], 5050.0)
+        self.assertAlmostEqual(breakdown[1]["p99"], 500.0)
+    
+    def test_rolling_metric_windows(self):
+        """Test métricas en buffer circular con ventanas por cantidad y por tiempo"""
+        metric = RollingMetric(capacity=100, count_windows=(10,), time_windows=(60,))
+        start = datetime.now().timestamp() - 250
+        for i in range(250):
+            metric.add(float(i), timestamp=start + i)
+        
+        # Memoria acotada: solo los últimos 100 valores, sumas exactas por ventana
+        self.assertEqual(metric.count(), 100)
+        self.assertEqual(metric.lifetime_count, 250)
+        self.assertAlmostEqual(metric.total(), sum(range(150, 250)))
+        self.assertAlmostEqual(metric.mean("last_10"), sum(range(240, 250)) / 10)
+        self.assertEqual(metric.values("last_10"), [float(i) for i in range(240, 250)])
+        
+        # Ventana de 60 segundos: solo los valores del último minuto
+        metric.add(250.0, timestamp=start + 250)
+        self.assertIn(metric.count("60s"), (60, 61))
+        
+        # Percentiles con error relativo acotado
+        stats = metric.get_stats()
+        self.assertEqual(stats["min"], 151.0)
+        self.assertEqual(stats["max"], 250.0)
+        self.assertAlmostEqual(stats["p50"], 200.5, delta=200.5 * 0.02)
+        self.assertAlmostEqual(stats["p99"], 249.0, delta=249.0 * 0.02)
+        
+        with self.assertRaises(KeyError):
+            metric.mean("last_5")
+    
+    def test_rolling_metric_set(self):
+        """Test conjunto de series con nombre"""
+        metrics = RollingMetricSet(capacity=5)
+        for value in range(8):
+            metrics.add("latency", value)
+        metrics.add("tokens", 42)
+        
+        self.assertEqual(sorted(metrics.names()), ["latency", "tokens"])
+        self.assertIn("latency", metrics)
+        self.assertEqual(metrics.get("latency").values(), [3.0, 4.0, 5.0, 6.0, 7.0])
+        self.assertEqual(metrics.get("tokens").latest, 42.0)
+        
+        metrics.clear()
+        self.assertNotIn("latency", metrics)
+    
+    def test_error_handler_bounded_history(self):
+        """Test historial de errores acotado con tasas por ventana"""
+        from utils.error_handler import ErrorHandler, ErrorCategory
+        
+        handler = ErrorHandler()
+        handler.max_errors = 5
+        for i in range(8):
+            handler.handle_error(ValueError(f"error {i}"), category=ErrorCategory.AI, auto_retry=False)
+        
+        self.assertEqual(len(handler.errors), 5)
+        self.assertEqual(handler.errors[-1].message, "error 7")
+        self.assertEqual(handler.get_error_rate("60s"), 8)
+        self.assertEqual(handler.get_error_rate("60s", ErrorCategory.AI), 8)
+        self.assertEqual(handler.get_error_rate("60s", ErrorCategory.NETWORK), 0)
+        self.assertEqual(handler.get_error_stats()["recent_errors"]["300s"], 8)
+    
     def test_calculate_trend(self):
         """Test calcular tendencia"""
         try:
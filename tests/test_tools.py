@@ -13,6 +13,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from tools.file_tools import file_manager
+from ai.streaming import iter_code_lines
 from tools.dotnet_tools import dotnet_manager
 
 
@@ -119,6 +120,32 @@ class TestTools(unittest.TestCase):
         except Exception as e:
             self.skipTest(f"Test de versión .NET no disponible: {e}")
     
+    def test_write_stream_from_code_lines(self):
+        """Test escritura incremental del código recibido por streaming"""
+        output_file = Path(self.temp_dir) / "GeneratedTests.cs"
+        seen_on_disk = []
+        
+        def response_chunks():
+            yield "Aquí tienes las pruebas:\n```csharp\nusing Xunit;\n"
+            yield "public class CalculatorTests\n{\n"
+            # Antes del último fragmento el archivo ya contiene las primeras líneas
+            seen_on_disk.append(output_file.read_text(encoding="utf-8"))
+            yield "}\n```\nFin."
+        
+        lines = (f"{line}\n" for line in iter_code_lines(response_chunks()))
+        result = file_manager.write_stream(str(output_file), lines)
+        
+        self.assertTrue(result)
+        self.assertIn("using Xunit;", seen_on_disk[0])
+        self.assertEqual(
+            output_file.read_text(encoding="utf-8"),
+            "using Xunit;\npublic class CalculatorTests\n{\n}\n"
+        )
+        
+        # Respuestas sin bloque de código se entregan completas al final
+        self.assertEqual(list(iter_code_lines(iter(["var a = 1;\n", "var b = 2;"]))),
+                         ["var a = 1;", "var b = 2;"])
+    
     def test_dotnet_project_info(self):
         """Test información de proyecto .NET"""
         try: